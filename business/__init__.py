@@ -1,7 +1,22 @@
 """
 业务逻辑层
+
+子模块按需导入（numpy/cv2 等较重的依赖只在首次使用时加载，不拖慢程序启动）
 """
-from .category_manager import CategoryManager
-from .dataset_maker import DatasetMaker
+import importlib
+
+_EXPORTS = {
+    'CategoryManager': '.category_manager',
+    'DatasetMaker': '.dataset_maker',
+    'DatasetAnalyzer': '.dataset_stats',
+}
+
+__all__ = ['CategoryManager', 'DatasetMaker', 'DatasetAnalyzer']
+
 
-__all__ = ['CategoryManager', 'DatasetMaker']
\ No newline at end of file
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
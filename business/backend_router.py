@@ -0,0 +1,181 @@
+"""
+后端路由 - 按任务配置中的 backend 选择模型后端并分发 train/predict/export
+
+后端模块在首次选中时才导入，torch 等重依赖只有实际使用对应后端时才加载；
+healthcheck 只探测依赖是否安装（不导入），结果缓存
+"""
+import importlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .model_backends.base import (BackendError, Emit, ModelBackend, DATA_INVALID, ENV_MISSING, STATUS_FAILED, probe_modules)
+
+DEFAULT_BACKEND = 'yolo'
+# 输出检测框的后端（预测界面可用）
+DETECTION_BACKENDS = ('yolo', 'onnx', 'openvino')
+# 只用良品训练、输出异常分数与热力图的后端
+ANOMALY_BACKENDS = ('anomalib',)
+
+
+class BackendSpec:
+    """已登记的后端：模块路径、类名与各任务的必填参数"""
+
+    __slots__ = ('name', 'module', 'class_name', 'title', 'required')
+
+    def __init__(self, name: str, module: str, class_name: str, title: str,
+                 required: Optional[Dict[str, Sequence[str]]] = None):
+        self.name = name
+        self.module = module
+        self.class_name = class_name
+        self.title = title
+        self.required = {task: tuple(fields) for task, fields in (required or {}).items()}
+
+
+_REGISTRY: Dict[str, BackendSpec] = {}
+
+
+def register_backend(name: str, module: str, class_name: str, title: str = '',
+                     required: Optional[Dict[str, Sequence[str]]] = None):
+    """登记后端（只记录模块路径，不导入）"""
+    _REGISTRY[name] = BackendSpec(name, module, class_name, title or name, required)
+
+
+_YOLO_PREDICT = ('model', 'images', 'conf', 'iou', 'imgsz', 'max_det')
+register_backend('yolo', '.model_backends.yolo_backend', 'YoloBackend', 'YOLO 目标检测', {
+    'train': ('data', 'model', 'epochs', 'imgsz', 'batch', 'project', 'name'),
+    'predict': _YOLO_PREDICT,
+    'export': ('model',),
+})
+register_backend('onnx', '.model_backends.yolo_backend', 'OnnxBackend', 'YOLO ONNX 模型', {'predict': _YOLO_PREDICT})
+register_backend('openvino', '.model_backends.yolo_backend', 'OpenVinoBackend', 'YOLO OpenVINO 模型',
+                 {'predict': _YOLO_PREDICT})
+register_backend('anomalib', '.model_backends.anomalib_backend', 'AnomalibBackend', 'PatchCore 异常检测', {
+    'train': ('data_dir',),
+    'predict': ('model_dir',),
+})
+
+
+def backend_for_model(model_path: str) -> str:
+    """按模型文件推断后端：.onnx、*_openvino_model 目录（或 .xml）、PatchCore 模型目录，其余为 YOLO"""
+    path = (model_path or '').rstrip('/\\')
+    lower = path.lower()
+    if lower.endswith('.onnx'):
+        return 'onnx'
+    if lower.endswith('_openvino_model') or lower.endswith('.xml'):
+        return 'openvino'
+    meta_file = os.path.join(path, 'model.json')
+    if os.path.isdir(path) and os.path.exists(meta_file):
+        try:
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get('backend') or DEFAULT_BACKEND
+        except Exception as e:
+            print(f"读取模型信息失败: {e}")
+    return DEFAULT_BACKEND
+
+
+class BackendRouter:
+    """后端路由：后端实例按名称缓存（模型等可在多次任务间复用）"""
+
+    def __init__(self):
+        self._backends: Dict[str, ModelBackend] = {}
+        self._health: Dict[str, Tuple[bool, str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def names() -> List[str]:
+        return list(_REGISTRY)
+
+    @staticmethod
+    def title(name: str) -> str:
+        return _REGISTRY[name].title if name in _REGISTRY else name
+
+    @staticmethod
+    def _spec(name: str) -> BackendSpec:
+        spec = _REGISTRY.get(name)
+        if spec is None:
+            raise BackendError(DATA_INVALID, f"未知的模型后端: {name}", f"可用后端: {', '.join(_REGISTRY)}")
+        return spec
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._backends
+
+    def get(self, name: str) -> ModelBackend:
+        """取得后端实例（首次使用时导入后端模块）"""
+        with self._lock:
+            backend = self._backends.get(name)
+            if backend is None:
+                spec = self._spec(name)
+                module = importlib.import_module(spec.module, __package__)
+                backend = getattr(module, spec.class_name)()
+                self._backends[name] = backend
+            return backend
+
+    def healthcheck(self, name: str, refresh: bool = False) -> Tuple[bool, str]:
+        """检查后端运行环境（结果缓存，refresh=True 时重新探测，例如安装依赖后）"""
+        if not refresh and name in self._health:
+            return self._health[name]
+        try:
+            backend = self.get(name)
+            if refresh:
+                probe_modules(backend.requires, refresh=True)
+            result = backend.healthcheck()
+        except BackendError as e:
+            result = (False, e.message)
+        except Exception as e:
+            result = (False, f"后端加载失败: {e}")
+        self._health[name] = result
+        return result
+
+    def resolve(self, config: Dict) -> str:
+        """任务配置中的 backend；未指定时按模型文件推断"""
+        name = config.get('backend') or backend_for_model(config.get('model') or config.get('model_dir') or '')
+        self._spec(name)
+        return name
+
+    def validate(self, name: str, task: str, config: Dict):
+        """检查必填参数"""
+        missing = [field for field in self._spec(name).required.get(task, ())
+                   if config.get(field) in (None, '', [])]
+        if missing:
+            raise BackendError(DATA_INVALID, f"{self.title(name)} {task} 缺少参数: {', '.join(missing)}")
+
+    def run(self, task: str, config: Dict, emit: Emit) -> Dict:
+        """分发任务；参数或后端本身有问题时同样以一个 failed 状态事件结束，返回该事件"""
+        try:
+            name = self.resolve(config)
+            self.validate(name, task, config)
+            backend = self.get(name)
+        except BackendError as e:
+            return self._fail(e, task, config, emit)
+        except Exception as e:
+            import traceback
+
+            return self._fail(BackendError(ENV_MISSING, f"后端加载失败: {e}", traceback.format_exc()), task, config,
+                              emit)
+        return backend.run_task(task, config, emit)
+
+    @staticmethod
+    def _fail(error: BackendError, task: str, config: Dict, emit: Emit) -> Dict:
+        event = {'type': 'status', 'status': STATUS_FAILED, 'message': error.message, 'error': error.to_dict(),
+                 'backend': config.get('backend'), 'task': task, 'time_cost': 0.0}
+        emit(event)
+        return event
+
+    def stop(self, name: Optional[str] = None):
+        """请求停止指定后端（缺省为全部已加载的后端）的当前任务"""
+        for backend_name, backend in list(self._backends.items()):
+            if name is None or backend_name == name:
+                backend.request_stop()
+
+
+_router: Optional[BackendRouter] = None
+
+
+def get_router() -> BackendRouter:
+    """全局后端路由"""
+    global _router
+    if _router is None:
+        _router = BackendRouter()
+    return _router
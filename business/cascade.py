@@ -0,0 +1,133 @@
+"""
+级联推理 - 轻量门控模型先筛查全部图像，只有可疑图像才交给重模型复检
+
+门控可以是检测模型（取检测框的最高置信度）或分类模型（取非 OK 类别的概率之和），
+分数不低于 escalate_threshold 的图像升级到界面上选择的模型（可用更大的推理尺寸，也可叠加 TTA / 多模型集成）。
+OK 占绝大多数的产线上多数图像只经过门控模型，平均耗时 ≈ 门控耗时 + 升级比例 × 重模型耗时。
+设置按产品保存在 config/cascade.json
+"""
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .product_settings import read_product_settings, save_product_settings
+
+DEFAULT_CONFIG_FILE = os.path.join('config', 'cascade.json')
+# 分类门控中视为 OK 的类别名（不区分大小写）；都不存在时第 0 类视为 OK
+OK_CLASS_NAMES = ('ok', 'good', 'normal', 'pass', '合格', '良品')
+
+
+class CascadeConfig:
+    """级联设置
+
+    gate_model / gate_imgsz / gate_conf：门控模型、推理尺寸与检测框最低置信度
+    escalate_threshold：门控分数不低于该值即升级
+    gate_classes：检测门控只统计这些类别（为空时统计全部类别）
+    heavy_imgsz：升级后重模型的推理尺寸（为 None 时沿用界面上的图像尺寸）
+    batch：每次送入门控模型的图像数
+    """
+
+    FIELDS = ('enabled', 'gate_model', 'gate_imgsz', 'gate_conf', 'escalate_threshold', 'gate_classes',
+              'heavy_imgsz', 'batch')
+
+    def __init__(self, enabled: bool = False, gate_model: str = '', gate_imgsz: int = 320, gate_conf: float = 0.05,
+                 escalate_threshold: float = 0.15, gate_classes: Sequence[str] = (),
+                 heavy_imgsz: Optional[int] = None, batch: int = 32):
+        self.enabled = bool(enabled)
+        self.gate_model = gate_model or ''
+        self.gate_imgsz = int(gate_imgsz)
+        self.gate_conf = gate_conf
+        self.escalate_threshold = escalate_threshold
+        self.gate_classes = list(gate_classes)
+        self.heavy_imgsz = int(heavy_imgsz) if heavy_imgsz else None
+        self.batch = max(1, int(batch))
+
+    @property
+    def active(self) -> bool:
+        return self.enabled and bool(self.gate_model)
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'CascadeConfig':
+        return cls(**{name: data[name] for name in cls.FIELDS if name in data})
+
+    @classmethod
+    def load(cls, product_id, path: str = DEFAULT_CONFIG_FILE) -> 'CascadeConfig':
+        """读取产品的级联设置（未设置或读取失败时不启用）"""
+        try:
+            data = read_product_settings(path).get(str(product_id))
+            return cls.from_dict(data) if data else cls()
+        except Exception as e:
+            print(f"加载级联设置失败: {e}")
+            return cls()
+
+    def save(self, product_id, path: str = DEFAULT_CONFIG_FILE) -> bool:
+        """保存产品的级联设置"""
+        try:
+            save_product_settings(path, product_id, self.to_dict())
+            return True
+        except Exception as e:
+            print(f"保存级联设置失败: {e}")
+            return False
+
+
+def gate_score(result, gate_classes: Sequence[str] = ()) -> float:
+    """门控模型一张图像的可疑分数（ultralytics Results：分类取非 OK 概率之和，检测取最高置信度）"""
+    names = dict(getattr(result, 'names', None) or {})
+    probs = getattr(result, 'probs', None)
+    if probs is not None:
+        data = probs.data.cpu().numpy().astype(np.float64).reshape(-1)
+        ok = [i for i, name in names.items() if str(name).lower() in OK_CLASS_NAMES and i < len(data)]
+        return float(1.0 - data[ok].sum()) if ok else float(1.0 - data[0])
+    boxes = getattr(result, 'boxes', None)
+    if boxes is None or len(boxes) == 0:
+        return 0.0
+    scores = boxes.conf.cpu().numpy()
+    if gate_classes:
+        classes = boxes.cls.cpu().numpy().astype(np.int64)
+        wanted = np.array([str(names.get(int(c), int(c))) in gate_classes for c in classes], dtype=bool)
+        scores = scores[wanted]
+    return float(scores.max()) if len(scores) else 0.0
+
+
+class CascadeStats:
+    """级联统计：升级数量与每张图像耗时分布（毫秒）"""
+
+    def __init__(self):
+        self.gate_ms: List[float] = []
+        self.escalated_ms: List[float] = []
+
+    def add(self, inference_ms: float, escalated: bool):
+        (self.escalated_ms if escalated else self.gate_ms).append(inference_ms)
+
+    def summary(self) -> Dict:
+        latencies = np.asarray(self.gate_ms + self.escalated_ms, dtype=np.float64)
+        total = len(latencies)
+        if not total:
+            return {'images': 0, 'escalated': 0, 'escalation_rate': 0.0}
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {
+            'images': total,
+            'escalated': len(self.escalated_ms),
+            'escalation_rate': round(len(self.escalated_ms) / total, 4),
+            'mean_ms': round(float(latencies.mean()), 2),
+            'p50_ms': round(float(p50), 2),
+            'p95_ms': round(float(p95), 2),
+            'p99_ms': round(float(p99), 2),
+            'gate_mean_ms': round(float(np.mean(self.gate_ms)), 2) if self.gate_ms else None,
+            'escalated_mean_ms': round(float(np.mean(self.escalated_ms)), 2) if self.escalated_ms else None,
+        }
+
+    def describe(self) -> str:
+        """一行报告"""
+        summary = self.summary()
+        if not summary['images']:
+            return "级联：没有图像"
+        text = (f"级联：升级 {summary['escalated']}/{summary['images']} 张（{summary['escalation_rate']:.1%}），"
+                f"每张平均 {summary['mean_ms']:.1f} ms，P50 {summary['p50_ms']:.1f} ms，P95 {summary['p95_ms']:.1f} ms")
+        if summary['escalated_mean_ms'] is not None and summary['gate_mean_ms'] is not None:
+            text += f"（仅门控 {summary['gate_mean_ms']:.1f} ms，升级 {summary['escalated_mean_ms']:.1f} ms）"
+        return text
@@ -1,11 +1,13 @@
 """
 类别管理器 - 业务逻辑层
-管理产品类别，支持本地JSON存储
+管理产品类别，支持本地JSON存储（多进程共享时加文件锁并原子写入）
 """
 import json
 import os
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
+
+from .file_lock import FileLock
 
 
 class CategoryManager:
@@ -14,7 +16,9 @@ class CategoryManager:
     def __init__(self, config_file='config/categories.json'):
         self.config_file = config_file
         self.categories = []
+        self._signature = None  # 最近一次加载/保存时文件的 (mtime_ns, size)
         self._ensure_config_dir()
+        self._lock = FileLock(config_file + '.lock')
         self.load_categories()
 
     def _ensure_config_dir(self):
@@ -23,64 +27,102 @@ class CategoryManager:
         if config_dir and not os.path.exists(config_dir):
             os.makedirs(config_dir)
 
+    def _file_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.config_file)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
     def load_categories(self):
-        """加载类别"""
-        if os.path.exists(self.config_file):
+        """加载类别（读取失败时保留内存中的数据，避免下次保存把文件清空）"""
+        signature = self._file_signature()
+        if signature is None:
+            self.categories = []
+        else:
             try:
                 with open(self.config_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                     self.categories = data.get('categories', [])
             except Exception as e:
                 print(f"加载类别失败: {e}")
-                self.categories = []
-        else:
-            self.categories = []
+                return
+        self._signature = signature
+
+    def reload_if_changed(self) -> bool:
+        """文件被其他进程修改过时重新加载，返回是否重新加载"""
+        if self._file_signature() == self._signature:
+            return False
+        self.load_categories()
+        return True
 
     def save_categories(self):
-        """保存类别"""
+        """保存类别（先写临时文件再替换）"""
         try:
             data = {
                 'categories': self.categories,
                 'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
-            with open(self.config_file, 'w', encoding='utf-8') as f:
+            tmp_file = self.config_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.config_file)
+            self._signature = self._file_signature()
             return True
         except Exception as e:
             print(f"保存类别失败: {e}")
             return False
 
-    def add_category(self, name: str, description: str = '') -> bool:
-        """添加类别"""
-        if self.category_exists(name):
+    def _modify(self, change) -> bool:
+        """加锁后先合并其他进程的修改，再执行修改并保存"""
+        try:
+            with self._lock:
+                self.reload_if_changed()
+                if not change():
+                    return False
+                return self.save_categories()
+        except TimeoutError as e:
+            print(f"保存类别失败: {e}")
             return False
 
-        category = {
-            'id': len(self.categories),
-            'name': name,
-            'description': description,
-            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        self.categories.append(category)
-        return self.save_categories()
+    def add_category(self, name: str, description: str = '') -> bool:
+        """添加类别"""
+        def change():
+            if self.category_exists(name):
+                return False
+            category = {
+                'id': max((cat['id'] for cat in self.categories), default=-1) + 1,
+                'name': name,
+                'description': description,
+                'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+            self.categories.append(category)
+            return True
+        return self._modify(change)
 
     def update_category(self, category_id: int, name: str, description: str = '') -> bool:
         """更新类别"""
-        for cat in self.categories:
-            if cat['id'] == category_id:
-                # 检查新名称是否与其他类别重复
-                if name != cat['name'] and self.category_exists(name):
-                    return False
-                cat['name'] = name
-                cat['description'] = description
-                cat['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                return self.save_categories()
-        return False
+        def change():
+            for cat in self.categories:
+                if cat['id'] == category_id:
+                    # 检查新名称是否与其他类别重复
+                    if name != cat['name'] and self.category_exists(name):
+                        return False
+                    cat['name'] = name
+                    cat['description'] = description
+                    cat['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    return True
+            return False
+        return self._modify(change)
 
     def delete_category(self, category_id: int) -> bool:
         """删除类别"""
-        self.categories = [cat for cat in self.categories if cat['id'] != category_id]
-        return self.save_categories()
+        def change():
+            self.categories = [cat for cat in self.categories if cat['id'] != category_id]
+            return True
+        return self._modify(change)
 
     def get_categories(self) -> List[Dict]:
         """获取所有类别"""
@@ -5,20 +5,50 @@ import json
 import random
 import shutil
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 
-import cv2
 import numpy as np
 
+from . import metrics
+from .dedup import (DuplicateFinder, POLICY_GROUP, POLICY_REPRESENTATIVE, cluster_summary,
+                    pick_representatives, split_by_cluster)
+from .label_store import LabelStore, STORE_FILENAME
+from .label_table import SPLIT_TRAIN, SPLIT_VAL
+from .product_manager import class_names_from_map
+from .profiler import span
+from .resize_cache import ResizedDatasetCache
+from .shard_dataset import DEFAULT_SHARD_SIZE, SHARD_INDEX_FILENAME, export_shards
+
+FILES_PROCESSED = metrics.counter('sldmv_dataset_files_total', '数据集制作已处理的标注文件数')
+FILE_SECONDS = metrics.histogram('sldmv_dataset_file_seconds', '单个标注文件转换耗时（秒）')
+PENDING_FILES = metrics.gauge('sldmv_dataset_pending_files', '数据集制作待处理的标注文件数')
+
+
+def _count_error(reason: str):
+    metrics.counter('sldmv_dataset_errors_total', '数据集制作失败的标注文件数', {'reason': reason}).inc()
+
 
 class DatasetMaker:
     """YOLO数据集制作器"""
 
-    def __init__(self, source_dir: str, output_dir: str, categories: List[str]):
+    def __init__(self, source_dir: str, output_dir: str, categories: Union[List[str], Dict[str, int]],
+                 write_txt_labels: bool = True, label_map_version: Optional[int] = None):
+        """categories 为类别名称列表（按顺序编号），或产品的类别映射 {类别名: 类别编号}
+
+        使用类别映射时编号在多次制作间保持稳定，空缺编号在 data.yaml 中以占位名称保留
+        """
         self.source_dir = Path(source_dir)
         self.output_dir = Path(output_dir)
-        self.categories = categories
-        self.category_to_id = {cat: idx for idx, cat in enumerate(categories)}
+        if isinstance(categories, dict):
+            self.category_to_id = dict(categories)
+            self.categories = class_names_from_map(self.category_to_id)
+        else:
+            self.categories = list(dict.fromkeys(categories))
+            self.category_to_id = {cat: idx for idx, cat in enumerate(self.categories)}
+        self.label_map_version = label_map_version
+        # 关闭后只输出合并标注文件 labels.npz（及 ultralytics 标注缓存），txt 可按需由 LabelStore 生成
+        self.write_txt_labels = write_txt_labels
+        self.label_store_path = self.output_dir / STORE_FILENAME
 
         # 创建目录结构
         self.train_images_dir = self.output_dir / 'images' / 'train'
@@ -26,8 +56,13 @@ class DatasetMaker:
         self.val_images_dir = self.output_dir / 'images' / 'val'
         self.val_labels_dir = self.output_dir / 'labels' / 'val'
 
-    def prepare_dataset(self, train_ratio: float = 0.8) -> Tuple[bool, str]:
-        """准备数据集"""
+    def prepare_dataset(self, train_ratio: float = 0.8, dedup_threshold: Optional[int] = None,
+                        dedup_policy: str = POLICY_REPRESENTATIVE) -> Tuple[bool, str]:
+        """准备数据集
+
+        dedup_threshold 为 None 时不去重；否则按感知哈希汉明距离聚类近重复图像：
+        POLICY_REPRESENTATIVE 每簇只保留标注最多的一张，POLICY_GROUP 保留全部但同簇划入同一子集
+        """
         try:
             # 创建目录
             for dir_path in [self.train_images_dir, self.train_labels_dir,
@@ -35,45 +70,116 @@ class DatasetMaker:
                 dir_path.mkdir(parents=True, exist_ok=True)
 
             # 获取所有标注文件
-            json_files = list(self.source_dir.glob("*.json"))
+            with span("扫描标注文件", "scan", directory=str(self.source_dir)):
+                json_files = list(self.source_dir.glob("*.json"))
             if not json_files:
                 return False, "未找到标注文件"
 
-            # 随机划分训练集和验证集
-            random.shuffle(json_files)
-            split_idx = int(len(json_files) * train_ratio)
-            train_files = json_files[:split_idx]
-            val_files = json_files[split_idx:]
+            dedup_message = ''
+            if dedup_threshold is None:
+                # 随机划分训练集和验证集
+                random.shuffle(json_files)
+                split_idx = int(len(json_files) * train_ratio)
+                train_files = json_files[:split_idx]
+                val_files = json_files[split_idx:]
+            else:
+                train_files, val_files, dedup_message = self._dedup_split(
+                    json_files, train_ratio, dedup_threshold, dedup_policy
+                )
+
+            records = []
+            PENDING_FILES.set(len(train_files) + len(val_files))
 
             # 处理训练集
             for json_file in train_files:
-                self._process_file(json_file, self.train_images_dir, self.train_labels_dir)
+                with FILE_SECONDS.time():
+                    records.append(self._process_file(json_file, self.train_images_dir, self.train_labels_dir,
+                                                      SPLIT_TRAIN))
+                FILES_PROCESSED.inc()
+                PENDING_FILES.dec()
 
             # 处理验证集
             for json_file in val_files:
-                self._process_file(json_file, self.val_images_dir, self.val_labels_dir)
+                with FILE_SECONDS.time():
+                    records.append(self._process_file(json_file, self.val_images_dir, self.val_labels_dir,
+                                                      SPLIT_VAL))
+                FILES_PROCESSED.inc()
+                PENDING_FILES.dec()
+
+            # 合并标注文件
+            self._write_label_store([r for r in records if r is not None])
 
-            return True, f"成功处理 {len(train_files)} 个训练样本，{len(val_files)} 个验证样本"
+            return True, f"成功处理 {len(train_files)} 个训练样本，{len(val_files)} 个验证样本{dedup_message}"
 
         except Exception as e:
+            PENDING_FILES.set(0)
             return False, f"准备数据集时出错: {str(e)}"
 
-    def _process_file(self, json_file: Path, image_dir: Path, label_dir: Path):
-        """处理单个标注文件"""
+    def _dedup_split(self, json_files: List[Path], train_ratio: float, threshold: int,
+                     policy: str) -> Tuple[List[Path], List[Path], str]:
+        """近重复去重并按簇划分训练/验证集"""
+        pairs = [(json_file, self._find_image(json_file)) for json_file in json_files]
+        pairs = [(json_file, image_path) for json_file, image_path in pairs if image_path is not None]
+        if not pairs:
+            return [], [], ''
+        json_files = [json_file for json_file, _ in pairs]
+
+        clusters = DuplicateFinder(threshold).cluster_paths([str(p) for _, p in pairs])
+        summary = cluster_summary(clusters)
+
+        if policy == POLICY_REPRESENTATIVE:
+            keep = pick_representatives(clusters, [self._count_shapes(f) for f in json_files])
+            json_files = [f for f, k in zip(json_files, keep) if k]
+            clusters = clusters[keep]
+            message = f"（去重移除 {summary['redundant']} 张近重复图像）"
+        elif policy == POLICY_GROUP:
+            message = f"（{summary['redundant']} 张近重复图像按簇划入同一子集）"
+        else:
+            raise ValueError(f"未知的去重策略: {policy}")
+
+        in_train = split_by_cluster(clusters, train_ratio)
+        train_files = [f for f, t in zip(json_files, in_train) if t]
+        val_files = [f for f, t in zip(json_files, in_train) if not t]
+        return train_files, val_files, message
+
+    @staticmethod
+    def _count_shapes(json_file: Path) -> int:
+        """标注形状数量，读取失败为 0"""
+        try:
+            with open(json_file, 'r', encoding='utf-8') as f:
+                return len(json.load(f).get('shapes', []))
+        except Exception:
+            return 0
+
+    @staticmethod
+    def _find_image(json_file: Path) -> Optional[Path]:
+        """查找标注文件对应的图像文件"""
+        for suffix in ('.jpg', '.png', '.jpeg'):
+            image_path = json_file.with_suffix(suffix)
+            if image_path.exists():
+                return image_path
+        return None
+
+    def _write_label_store(self, records: List[tuple]):
+        """写出合并标注文件 labels.npz 与 ultralytics 标注缓存"""
+        store = LabelStore.from_records(records, self.categories)
+        store.save(str(self.label_store_path))
+        store.write_ultralytics_cache(str(self.output_dir))
+
+    def _process_file(self, json_file: Path, image_dir: Path, label_dir: Path,
+                      split_id: int = SPLIT_TRAIN) -> Optional[tuple]:
+        """处理单个标注文件，返回合并标注记录 (图像文件名, 划分, 高, 宽, 标注行)"""
         try:
             # 读取JSON
             with open(json_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
 
             # 查找对应的图像文件
-            image_path = json_file.with_suffix('.jpg')
-            if not image_path.exists():
-                image_path = json_file.with_suffix('.png')
-            if not image_path.exists():
-                image_path = json_file.with_suffix('.jpeg')
-            if not image_path.exists():
+            image_path = self._find_image(json_file)
+            if image_path is None:
                 print(f"警告: 找不到图像文件 {json_file.stem}")
-                return
+                _count_error('missing_image')
+                return None
 
             # 复制图像
             shutil.copy(image_path, image_dir / image_path.name)
@@ -84,12 +190,15 @@ class DatasetMaker:
 
             if img_height == 0 or img_width == 0:
                 # 尝试从图像文件读取尺寸
+                import cv2
+
                 img = cv2.imread(str(image_path))
                 if img is not None:
                     img_height, img_width = img.shape[:2]
                 else:
                     print(f"警告: 无法获取图像尺寸 {image_path.name}")
-                    return
+                    _count_error('unreadable_image')
+                    return None
 
             # 生成YOLO格式标注
             yolo_labels = []
@@ -113,7 +222,7 @@ class DatasetMaker:
                     width = abs(x2 - x1) / img_width
                     height = abs(y2 - y1) / img_height
 
-                    yolo_labels.append(f"{class_id} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}")
+                    yolo_labels.append((class_id, x_center, y_center, width, height))
 
                 elif shape_type == 'polygon' and len(points) >= 3:
                     # 多边形标注 - 转换为外接矩形
@@ -128,15 +237,37 @@ class DatasetMaker:
                     width = (x_max - x_min) / img_width
                     height = (y_max - y_min) / img_height
 
-                    yolo_labels.append(f"{class_id} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}")
+                    yolo_labels.append((class_id, x_center, y_center, width, height))
 
             # 保存YOLO标注文件
-            label_file = label_dir / f"{image_path.stem}.txt"
-            with open(label_file, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(yolo_labels))
+            if self.write_txt_labels:
+                label_file = label_dir / f"{image_path.stem}.txt"
+                with open(label_file, 'w', encoding='utf-8') as f:
+                    f.write('\n'.join(f"{c} {x:.6f} {y:.6f} {w:.6f} {h:.6f}" for c, x, y, w, h in yolo_labels))
+
+            return image_path.name, split_id, int(img_height), int(img_width), yolo_labels
 
         except Exception as e:
             print(f"处理文件 {json_file.name} 时出错: {str(e)}")
+            _count_error('exception')
+            return None
+
+    def create_resized_cache(self, imgsz: int, scale: int = 1, image_format: str = 'jpg') -> Tuple[str, dict]:
+        """生成按训练尺寸预缩放的图像缓存，返回 (缓存 data.yaml 路径, 统计)"""
+        cache = ResizedDatasetCache(str(self.output_dir), image_format=image_format)
+        return cache.ensure(imgsz, scale)
+
+    def export_shards(self, shard_dir: Optional[str] = None,
+                      shard_size: int = DEFAULT_SHARD_SIZE) -> Tuple[bool, str]:
+        """将已制作的数据集打包为分片（默认输出到 <输出目录>/shards），需先调用 prepare_dataset"""
+        if not self.label_store_path.exists():
+            return False, "未找到合并标注文件，请先制作数据集"
+        shard_dir = Path(shard_dir) if shard_dir else self.output_dir / 'shards'
+        try:
+            num_images, num_shards = export_shards(str(self.output_dir), str(shard_dir), shard_size)
+        except Exception as e:
+            return False, f"导出分片时出错: {str(e)}"
+        return True, f"已将 {num_images} 张图像打包为 {num_shards} 个分片: {shard_dir / SHARD_INDEX_FILENAME}"
 
     def convert_to_yolo(self):
         """转换为YOLO格式（已在_process_file中完成）"""
@@ -144,8 +275,9 @@ class DatasetMaker:
 
     def create_yaml_config(self):
         """创建YAML配置文件"""
+        version_line = f"# 类别映射版本: {self.label_map_version}\n" if self.label_map_version is not None else ""
         yaml_content = f"""# YOLO数据集配置文件
-path: {self.output_dir.absolute()}  # 数据集根目录
+{version_line}path: {self.output_dir.absolute()}  # 数据集根目录
 train: images/train  # 训练集图像目录（相对于path）
 val: images/val  # 验证集图像目录（相对于path）
 
@@ -0,0 +1,278 @@
+"""
+数据集统计与质量报告 - 基于列式标注表的向量化分析
+支持 labelme 标注目录与已生成的 YOLO 数据集
+"""
+import html
+import json
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .image_hash import compute_hashes
+from .label_table import LabelTable, SPLIT_NAMES
+
+# 归一化面积直方图区间（对数刻度，1e-6 ~ 1）
+AREA_BIN_EDGES = np.logspace(-6, 0, 13)
+# 宽高比直方图区间（log2 刻度，1/16 ~ 16）
+ASPECT_BIN_EDGES = np.power(2.0, np.arange(-4, 4.5, 0.5))
+# 越界容差
+BOUNDS_TOLERANCE = 1e-3
+# 报告中每类问题最多列出的样例数
+MAX_SAMPLES = 50
+
+
+class DatasetAnalyzer:
+    """数据集分析器"""
+
+    def __init__(self, path: str, known_categories: Optional[List[str]] = None,
+                 check_duplicates: bool = True, workers: int = 8):
+        self.path = path
+        self.known_categories = known_categories
+        self.check_duplicates = check_duplicates
+        self.workers = workers
+
+    def analyze(self, table: Optional[LabelTable] = None) -> Dict:
+        """执行分析，返回报告字典"""
+        start = time.perf_counter()
+        if table is None:
+            table = LabelTable.from_path(self.path)
+
+        report = {
+            'source': str(self.path),
+            'num_images': table.num_images,
+            'num_boxes': table.num_boxes,
+            'invalid_shapes': table.invalid_shapes,
+            'unreadable_files': table.unreadable_files[:MAX_SAMPLES],
+        }
+        report.update(self._class_stats(table))
+        report.update(self._box_stats(table))
+        report.update(self._density_stats(table))
+        report['splits'] = {
+            name: int((table.split == split_id).sum()) for split_id, name in SPLIT_NAMES.items()
+        }
+        if self.check_duplicates:
+            report['duplicates'] = self._duplicate_groups(table)
+        report['elapsed'] = round(time.perf_counter() - start, 3)
+        return report
+
+    # ------------------------------------------------------------------
+    # 分项统计
+    # ------------------------------------------------------------------
+    def _class_stats(self, table: LabelTable) -> Dict:
+        """类别实例数、出现图像数、面积中位数以及未登记类别"""
+        num_labels = len(table.label_names)
+        instances = np.bincount(table.label_idx, minlength=num_labels)
+
+        # (图像, 类别) 对去重后计数 = 每类出现的图像数
+        pair_keys = np.unique(table.image_idx.astype(np.int64) * max(num_labels, 1) + table.label_idx)
+        images_per_class = np.bincount(pair_keys % max(num_labels, 1), minlength=num_labels)
+
+        areas = _box_areas(table.boxes)
+        order = np.argsort(table.label_idx, kind='stable')
+        sorted_areas = areas[order]
+        bounds = np.concatenate(([0], np.cumsum(instances)))
+
+        known = set(self.known_categories) if self.known_categories is not None else None
+        classes = []
+        unknown = {}
+        for idx, name in enumerate(table.label_names):
+            segment = sorted_areas[bounds[idx]:bounds[idx + 1]]
+            segment = segment[np.isfinite(segment)]
+            is_known = known is None or name in known
+            classes.append({
+                'name': name,
+                'instances': int(instances[idx]),
+                'images': int(images_per_class[idx]),
+                'median_area': float(np.median(segment)) if segment.size else None,
+                'known': is_known,
+            })
+            if not is_known:
+                unknown[name] = int(instances[idx])
+
+        classes.sort(key=lambda c: c['instances'], reverse=True)
+        missing = []
+        if known is not None:
+            present = set(table.label_names)
+            missing = [name for name in self.known_categories if name not in present]
+        return {'classes': classes, 'unknown_labels': unknown, 'missing_categories': missing}
+
+    def _box_stats(self, table: LabelTable) -> Dict:
+        """面积/宽高比直方图、越界框、退化框"""
+        boxes = table.boxes.astype(np.float64)
+        unknown_size = ~np.isfinite(boxes).all(axis=1)
+        finite = ~unknown_size
+
+        widths = boxes[:, 2] - boxes[:, 0]
+        heights = boxes[:, 3] - boxes[:, 1]
+        areas = widths * heights
+
+        # 已知图像尺寸时以 1 像素为退化阈值，否则使用归一化下限
+        img_w = table.image_w[table.image_idx].astype(np.float64)
+        img_h = table.image_h[table.image_idx].astype(np.float64)
+        min_w = np.where(img_w > 0, 1.0 / np.maximum(img_w, 1), 1e-4)
+        min_h = np.where(img_h > 0, 1.0 / np.maximum(img_h, 1), 1e-4)
+        degenerate = finite & ((widths < min_w) | (heights < min_h))
+
+        out_of_bounds = finite & (
+            (boxes < -BOUNDS_TOLERANCE).any(axis=1) | (boxes > 1 + BOUNDS_TOLERANCE).any(axis=1)
+        )
+
+        valid = finite & ~degenerate
+        area_counts, _ = np.histogram(np.clip(areas[valid], AREA_BIN_EDGES[0], 1.0), bins=AREA_BIN_EDGES)
+        aspect = widths[valid] / heights[valid]
+        aspect_counts, _ = np.histogram(
+            np.clip(aspect, ASPECT_BIN_EDGES[0], ASPECT_BIN_EDGES[-1]), bins=ASPECT_BIN_EDGES)
+
+        return {
+            'area_hist': {'edges': AREA_BIN_EDGES.tolist(), 'counts': area_counts.tolist()},
+            'aspect_hist': {'edges': ASPECT_BIN_EDGES.tolist(), 'counts': aspect_counts.tolist()},
+            'out_of_bounds': _issue_summary(table, out_of_bounds),
+            'degenerate': _issue_summary(table, degenerate),
+            'unknown_size': _issue_summary(table, unknown_size),
+        }
+
+    def _density_stats(self, table: LabelTable) -> Dict:
+        """每图目标数分布"""
+        per_image = table.boxes_per_image()
+        if per_image.size == 0:
+            return {'density': {'mean': 0.0, 'max': 0, 'counts': []}, 'images_without_labels': 0}
+        return {
+            'density': {
+                'mean': float(per_image.mean()),
+                'max': int(per_image.max()),
+                # counts[k] = 含 k 个目标的图像数
+                'counts': np.bincount(per_image).tolist(),
+            },
+            'images_without_labels': int((per_image == 0).sum()),
+        }
+
+    def _duplicate_groups(self, table: LabelTable) -> Dict:
+        """基于感知哈希的重复图像分组（哈希完全一致）"""
+        hashes, valid = compute_hashes(table.images, self.workers)
+        index = np.flatnonzero(valid)
+        if index.size == 0:
+            return {'groups': [], 'duplicate_images': 0, 'missing_images': int((~valid).sum())}
+
+        values = hashes[index]
+        order = np.argsort(values, kind='stable')
+        sorted_values = values[order]
+        # 相邻相等的哈希段即为一组
+        boundaries = np.flatnonzero(np.diff(sorted_values) != 0) + 1
+        groups = [g for g in np.split(index[order], boundaries) if g.size > 1]
+
+        return {
+            'groups': [[table.images[i] for i in g] for g in groups[:MAX_SAMPLES]],
+            'num_groups': len(groups),
+            'duplicate_images': int(sum(g.size - 1 for g in groups)),
+            'missing_images': int((~valid).sum()),
+        }
+
+
+def _box_areas(boxes: np.ndarray) -> np.ndarray:
+    boxes = boxes.astype(np.float64)
+    return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+
+def _issue_summary(table: LabelTable, mask: np.ndarray) -> Dict:
+    """问题框计数及涉及的样例图像"""
+    image_ids = np.unique(table.image_idx[mask])
+    return {
+        'boxes': int(mask.sum()),
+        'images': int(image_ids.size),
+        'samples': [table.images[i] for i in image_ids[:MAX_SAMPLES]],
+    }
+
+
+# ----------------------------------------------------------------------
+# 报告输出
+# ----------------------------------------------------------------------
+def save_json_report(report: Dict, path: str):
+    """保存 JSON 报告"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def render_html_report(report: Dict) -> str:
+    """生成 HTML 报告（仅使用 QTextBrowser 支持的基础标签）"""
+    esc = html.escape
+    parts = [
+        '<html><head><meta charset="utf-8"><title>数据集质量报告</title></head><body>',
+        f'<h2>数据集质量报告</h2><p>{esc(report["source"])}</p>',
+        '<table border="0" cellspacing="4">',
+        _row('图像数', report['num_images']),
+        _row('标注框数', report['num_boxes']),
+        _row('无标注图像', report.get('images_without_labels', 0)),
+        _row('每图平均目标数', f"{report['density']['mean']:.2f}（最多 {report['density']['max']}）"),
+        _row('无效标注形状', report['invalid_shapes']),
+        _row('越界框', f"{report['out_of_bounds']['boxes']}（{report['out_of_bounds']['images']} 张图）"),
+        _row('退化框', f"{report['degenerate']['boxes']}（{report['degenerate']['images']} 张图）"),
+        _row('缺少图像尺寸', report['unknown_size']['boxes']),
+    ]
+    if 'duplicates' in report:
+        dup = report['duplicates']
+        parts.append(_row('重复图像', f"{dup['duplicate_images']}（{dup.get('num_groups', 0)} 组）"))
+    if any(report['splits'].values()):
+        parts.append(_row('训练/验证', f"{report['splits']['train']} / {report['splits']['val']}"))
+    parts.append(f'<tr><td>分析耗时</td><td>{report["elapsed"]} 秒</td></tr></table>')
+
+    # 类别分布
+    parts.append('<h3>类别分布</h3><table border="1" cellspacing="0" cellpadding="4">')
+    parts.append('<tr><th>类别</th><th>实例数</th><th>图像数</th><th>面积中位数</th><th></th></tr>')
+    max_instances = max([c['instances'] for c in report['classes']] or [1])
+    for cls_info in report['classes']:
+        color = '#3498db' if cls_info['known'] else '#e74c3c'
+        median = cls_info['median_area']
+        parts.append(
+            f'<tr><td>{esc(cls_info["name"])}{"" if cls_info["known"] else "（未登记）"}</td>'
+            f'<td>{cls_info["instances"]}</td><td>{cls_info["images"]}</td>'
+            f'<td>{"-" if median is None else f"{median:.5f}"}</td>'
+            f'<td>{_bar(cls_info["instances"], max_instances, color)}</td></tr>'
+        )
+    parts.append('</table>')
+    if report.get('missing_categories'):
+        parts.append(f'<p>未出现的已登记类别：{esc(", ".join(report["missing_categories"]))}</p>')
+
+    parts.append(_histogram_html('框面积分布（占图像比例）', report['area_hist'], '{:.0e}'))
+    parts.append(_histogram_html('宽高比分布', report['aspect_hist'], '{:.2f}'))
+
+    for key, title in (('out_of_bounds', '越界框样例'), ('degenerate', '退化框样例')):
+        samples = report[key]['samples']
+        if samples:
+            parts.append(f'<h3>{title}</h3><ul>')
+            parts.extend(f'<li>{esc(s)}</li>' for s in samples)
+            parts.append('</ul>')
+    if report.get('duplicates', {}).get('groups'):
+        parts.append('<h3>重复图像分组</h3><ol>')
+        for group in report['duplicates']['groups']:
+            parts.append(f'<li>{"<br>".join(esc(p) for p in group)}</li>')
+        parts.append('</ol>')
+
+    parts.append('</body></html>')
+    return '\n'.join(parts)
+
+
+def save_html_report(report: Dict, path: str):
+    """保存 HTML 报告"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(render_html_report(report))
+
+
+def _row(name, value) -> str:
+    return f'<tr><td>{name}</td><td><b>{html.escape(str(value))}</b></td></tr>'
+
+
+def _bar(value: int, max_value: int, color: str) -> str:
+    width = max(1, int(200 * value / max(max_value, 1)))
+    return f'<table cellspacing="0" cellpadding="0"><tr><td bgcolor="{color}" width="{width}" height="10"></td></tr></table>'
+
+
+def _histogram_html(title: str, hist: Dict, fmt: str) -> str:
+    edges, counts = hist['edges'], hist['counts']
+    max_count = max(counts or [1])
+    rows = [f'<h3>{title}</h3><table cellspacing="2">']
+    for i, count in enumerate(counts):
+        label = f'{fmt.format(edges[i])} ~ {fmt.format(edges[i + 1])}'
+        rows.append(f'<tr><td>{label}</td><td>{count}</td><td>{_bar(count, max_count, "#2ecc71")}</td></tr>')
+    rows.append('</table>')
+    return ''.join(rows)
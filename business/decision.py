@@ -0,0 +1,333 @@
+"""
+OK/NG 判定 - 将检测框与异常热力图转换为每张图像的 OK/NG 结论
+
+两种模式（见 docs/plans/2026-03-03-anomalib-plugin-design.md 第 6 节）：
+    score：检测框按类别置信度阈值/最小面积/ROI 筛选后有缺陷即 NG；异常分数 >= score_threshold 即 NG
+    area ：缺陷面积占比 >= area_threshold 即 NG（热力图二值化后的像素占比，或检测框并集的面积占比）
+
+全部规则在已有的检测框数组与热力图上向量化计算，不再读取或遍历图像
+"""
+import json
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .detections import Detections
+
+MODE_SCORE = 'score'
+MODE_AREA = 'area'
+MODES = (MODE_SCORE, MODE_AREA)
+
+LABEL_OK = 'OK'
+LABEL_NG = 'NG'
+
+DEFAULT_RULES_FILE = os.path.join('config', 'decision_rules.json')
+# 计算检测框并集面积时使用的栅格最长边（像素级精度对判定无意义，栅格化后一次累加即可）
+AREA_GRID = 512
+
+Polygon = Sequence[Tuple[float, float]]
+
+
+class DecisionRules:
+    """判定规则
+
+    conf / class_conf：缺陷框的置信度阈值（按类别覆盖）；conf 为 None 时沿用检测框已有的过滤结果
+    min_box_area / class_min_area：缺陷框最小面积（原图像素，按类别覆盖）
+    ignore_classes：不参与判定的类别
+    roi / exclude：归一化坐标 (0~1) 的多边形；检测框中心须落在 ROI 内且不在排除区内，
+                   面积占比也只在该区域内统计；roi 为空表示整幅图像
+    score_threshold：异常分数阈值（score 模式）
+    pixel_threshold / area_threshold：热力图二值化阈值与面积占比阈值（area 模式）
+    """
+
+    FIELDS = ('mode', 'conf', 'class_conf', 'min_box_area', 'class_min_area', 'ignore_classes', 'roi', 'exclude',
+              'score_threshold', 'pixel_threshold', 'area_threshold')
+
+    def __init__(self, mode: str = MODE_SCORE, conf: Optional[float] = None,
+                 class_conf: Optional[Dict[str, float]] = None, min_box_area: float = 0.0,
+                 class_min_area: Optional[Dict[str, float]] = None, ignore_classes: Sequence[str] = (),
+                 roi: Sequence[Polygon] = (), exclude: Sequence[Polygon] = (),
+                 score_threshold: float = 0.5, pixel_threshold: float = 0.5, area_threshold: float = 0.001):
+        if mode not in MODES:
+            raise ValueError(f"未知的判定模式: {mode}")
+        self.mode = mode
+        self.conf = conf
+        self.class_conf = dict(class_conf or {})
+        self.min_box_area = min_box_area
+        self.class_min_area = dict(class_min_area or {})
+        self.ignore_classes = list(ignore_classes)
+        self.roi = [list(map(tuple, polygon)) for polygon in roi]
+        self.exclude = [list(map(tuple, polygon)) for polygon in exclude]
+        self.score_threshold = score_threshold
+        self.pixel_threshold = pixel_threshold
+        self.area_threshold = area_threshold
+
+    def min_conf(self, default: float) -> float:
+        """各类别中最低的置信度阈值（决定判定前检测框至少要保留到多低的置信度）"""
+        base = default if self.conf is None else self.conf
+        return min([base, *self.class_conf.values()])
+
+    def to_dict(self) -> Dict:
+        data = {name: getattr(self, name) for name in self.FIELDS}
+        data['roi'] = [[list(p) for p in polygon] for polygon in self.roi]
+        data['exclude'] = [[list(p) for p in polygon] for polygon in self.exclude]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'DecisionRules':
+        return cls(**{name: data[name] for name in cls.FIELDS if name in data})
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_RULES_FILE) -> 'DecisionRules':
+        """读取规则文件（不存在或读取失败时返回默认规则）"""
+        if not os.path.exists(path):
+            return cls()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls.from_dict(json.load(f).get('rules', {}))
+        except Exception as e:
+            print(f"加载判定规则失败: {e}")
+            return cls()
+
+    def save(self, path: str = DEFAULT_RULES_FILE) -> bool:
+        """保存规则（先写临时文件再替换）"""
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            data = {'rules': self.to_dict(), 'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+            tmp_file = path + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, path)
+            return True
+        except Exception as e:
+            print(f"保存判定规则失败: {e}")
+            return False
+
+
+class Decision:
+    """一张图像的判定结果"""
+
+    __slots__ = ('label', 'mode', 'score', 'area_ratio', 'defects', 'defect_classes', 'reasons')
+
+    def __init__(self, label: str, mode: str, score: Optional[float] = None, area_ratio: Optional[float] = None,
+                 defects: Optional[np.ndarray] = None, defect_classes: Optional[Dict[str, int]] = None,
+                 reasons: Optional[List[str]] = None):
+        self.label = label
+        self.mode = mode
+        self.score = score
+        self.area_ratio = area_ratio
+        # 判为缺陷的检测框下标
+        self.defects = defects if defects is not None else np.zeros(0, dtype=np.int64)
+        self.defect_classes = defect_classes or {}
+        self.reasons = reasons or []
+
+    @property
+    def is_ng(self) -> bool:
+        return self.label == LABEL_NG
+
+    def summary(self) -> str:
+        """一行文字说明"""
+        if not self.reasons:
+            return self.label
+        return f"{self.label}（{'；'.join(self.reasons)}）"
+
+    def to_dict(self) -> Dict:
+        """清单/日志用（两种指标都记录，便于追溯）"""
+        return {
+            'label': self.label,
+            'threshold_mode': self.mode,
+            'score': self.score,
+            'area_ratio': self.area_ratio,
+            'defect_count': int(len(self.defects)),
+            'defect_classes': self.defect_classes,
+            'reasons': self.reasons,
+        }
+
+
+class DecisionEngine:
+    """OK/NG 判定引擎
+
+    类别阈值表按模型类别表缓存，ROI 掩码按尺寸缓存，同一产线上逐张判定只做数组运算
+    """
+
+    def __init__(self, rules: Optional[DecisionRules] = None):
+        self.rules = rules or DecisionRules()
+        self._class_tables: Dict[tuple, Tuple[np.ndarray, np.ndarray]] = {}
+        self._masks: Dict[tuple, Optional[np.ndarray]] = {}
+
+    def set_rules(self, rules: DecisionRules):
+        self.rules = rules
+        self._class_tables.clear()
+        self._masks.clear()
+
+    # ---------- 规则表 ----------
+    def _class_table(self, detections: Detections, default_conf: float) -> Tuple[np.ndarray, np.ndarray]:
+        """(各类别置信度阈值, 各类别最小面积)，按类别编号索引；忽略的类别阈值为无穷大"""
+        key = (tuple(detections.names.items()), default_conf)
+        table = self._class_tables.get(key)
+        size = int(max(detections.classes.max(initial=-1), max(detections.names, default=-1))) + 1
+        if table is None or len(table[0]) < size:
+            rules = self.rules
+            conf = np.empty(size, dtype=np.float32)
+            area = np.empty(size, dtype=np.float32)
+            for class_id in range(size):
+                name = detections.class_name(class_id)
+                conf[class_id] = np.inf if name in rules.ignore_classes else rules.class_conf.get(name, default_conf)
+                area[class_id] = rules.class_min_area.get(name, rules.min_box_area)
+            table = self._class_tables[key] = (conf, area)
+        return table
+
+    def region_mask(self, shape: Tuple[int, int]) -> Optional[np.ndarray]:
+        """(高, 宽) 尺寸下的判定区域掩码；未设置 ROI/排除区时返回 None（整幅图像）"""
+        shape = (int(shape[0]), int(shape[1]))
+        if shape not in self._masks:
+            rules = self.rules
+            if not rules.roi and not rules.exclude:
+                self._masks[shape] = None
+            else:
+                mask = _fill_polygons(shape, rules.roi) if rules.roi else np.ones(shape, dtype=bool)
+                if rules.exclude:
+                    mask &= ~_fill_polygons(shape, rules.exclude)
+                self._masks[shape] = mask
+        return self._masks[shape]
+
+    # ---------- 判定 ----------
+    def defect_boxes(self, detections: Detections, default_conf: float = 0.0) -> np.ndarray:
+        """满足类别置信度、最小面积与 ROI 规则的检测框下标"""
+        if len(detections) == 0:
+            return np.zeros(0, dtype=np.int64)
+        conf_table, area_table = self._class_table(detections, default_conf)
+        boxes = detections.boxes
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        keep = (detections.scores >= conf_table[detections.classes]) & (areas >= area_table[detections.classes])
+        if detections.image_shape is not None:
+            mask = self.region_mask(detections.image_shape)
+            if mask is not None:
+                h, w = mask.shape
+                cx = np.clip(((boxes[:, 0] + boxes[:, 2]) / 2).astype(np.int64), 0, w - 1)
+                cy = np.clip(((boxes[:, 1] + boxes[:, 3]) / 2).astype(np.int64), 0, h - 1)
+                keep &= mask[cy, cx]
+        return np.flatnonzero(keep)
+
+    def box_area_ratio(self, detections: Detections, index: np.ndarray) -> float:
+        """缺陷框并集占判定区域的面积比例（重叠部分只计一次）
+
+        框坐标缩放到最长边 AREA_GRID 的栅格后做坐标压缩：框的边界把平面切成至多 2n×2n 个单元，
+        二维差分得到每个单元是否被覆盖，再用判定区域掩码的积分图求各单元内的区域面积，与图像尺寸无关
+        """
+        if len(index) == 0 or detections.image_shape is None:
+            return 0.0
+        height, width = detections.image_shape
+        scale = min(1.0, AREA_GRID / max(height, width))
+        grid = (max(1, round(height * scale)), max(1, round(width * scale)))
+        boxes = np.round(detections.boxes[index] * scale).astype(np.int64)
+        x1, x2 = np.clip(boxes[:, 0], 0, grid[1]), np.clip(boxes[:, 2], 0, grid[1])
+        y1, y2 = np.clip(boxes[:, 1], 0, grid[0]), np.clip(boxes[:, 3], 0, grid[0])
+        xs, ys = np.unique(np.concatenate([x1, x2])), np.unique(np.concatenate([y1, y2]))
+        diff = np.zeros((len(ys), len(xs)), dtype=np.int32)
+        cx1, cx2 = np.searchsorted(xs, x1), np.searchsorted(xs, x2)
+        cy1, cy2 = np.searchsorted(ys, y1), np.searchsorted(ys, y2)
+        np.add.at(diff, (cy1, cx1), 1)
+        np.add.at(diff, (cy1, cx2), -1)
+        np.add.at(diff, (cy2, cx1), -1)
+        np.add.at(diff, (cy2, cx2), 1)
+        covered = diff.cumsum(axis=0).cumsum(axis=1)[:-1, :-1] > 0
+        integral = self._region_integral(grid)
+        if integral is None:
+            cell_area = np.diff(ys)[:, None] * np.diff(xs)[None, :]
+            region = grid[0] * grid[1]
+        else:
+            corners = integral[np.ix_(ys, xs)]
+            cell_area = corners[1:, 1:] - corners[:-1, 1:] - corners[1:, :-1] + corners[:-1, :-1]
+            region = integral[-1, -1]
+        return float(cell_area[covered].sum()) / region if region else 0.0
+
+    def _region_integral(self, shape: Tuple[int, int]) -> Optional[np.ndarray]:
+        """判定区域掩码的积分图（(高+1, 宽+1)），未设置区域时为 None"""
+        key = ('integral', int(shape[0]), int(shape[1]))
+        if key not in self._masks:
+            mask = self.region_mask(shape)
+            if mask is None:
+                self._masks[key] = None
+            else:
+                integral = np.zeros((mask.shape[0] + 1, mask.shape[1] + 1), dtype=np.int64)
+                integral[1:, 1:] = mask.cumsum(axis=0).cumsum(axis=1)
+                self._masks[key] = integral
+        return self._masks[key]
+
+    def area_ratios(self, anomaly_maps: np.ndarray) -> np.ndarray:
+        """热力图（(H, W) 或 (N, H, W)）二值化后在判定区域内的异常像素占比"""
+        maps = np.asarray(anomaly_maps)
+        binary = maps >= self.rules.pixel_threshold
+        mask = self.region_mask(maps.shape[-2:])
+        if mask is not None:
+            binary = binary & mask
+            region = max(int(np.count_nonzero(mask)), 1)
+        else:
+            region = maps.shape[-2] * maps.shape[-1]
+        return np.count_nonzero(binary, axis=(-2, -1)) / region
+
+    def decide(self, detections: Optional[Detections] = None, default_conf: float = 0.0,
+               anomaly_score: Optional[float] = None, anomaly_map: Optional[np.ndarray] = None) -> Decision:
+        """判定一张图像
+
+        detections：检测框（default_conf 为规则未设置 conf 时的置信度阈值）；
+        anomaly_score / anomaly_map：异常检测模型的图像分数与热力图（分数缺省时取热力图最大值）
+        两者同时给出时任一判为 NG 即 NG
+        """
+        rules = self.rules
+        reasons = []
+        score = None
+        ratios = []
+        defects = np.zeros(0, dtype=np.int64)
+        defect_classes: Dict[str, int] = {}
+
+        if detections is not None:
+            defects = self.defect_boxes(detections, default_conf if rules.conf is None else rules.conf)
+            if len(defects):
+                defect_classes = detections.subset(defects).class_counts()
+                score = float(detections.scores[defects].max())
+                if rules.mode == MODE_SCORE:
+                    reasons.append('，'.join(f"{name}×{count}" for name, count in defect_classes.items()))
+            if rules.mode == MODE_AREA:
+                ratios.append(self.box_area_ratio(detections, defects))
+
+        if anomaly_map is not None or anomaly_score is not None:
+            if anomaly_score is None:
+                anomaly_score = float(np.max(anomaly_map))
+            score = anomaly_score if score is None else max(score, anomaly_score)
+            if anomaly_map is not None:
+                ratios.append(float(self.area_ratios(anomaly_map)))
+            if rules.mode == MODE_SCORE and anomaly_score >= rules.score_threshold:
+                reasons.append(f"异常分数 {anomaly_score:.3f}")
+
+        area_ratio = max(ratios) if ratios else None
+        if rules.mode == MODE_AREA and area_ratio is not None and area_ratio >= rules.area_threshold:
+            reasons.append(f"缺陷面积占比 {area_ratio:.2%}")
+        ng = bool(reasons)
+        return Decision(LABEL_NG if ng else LABEL_OK, rules.mode, score, area_ratio, defects, defect_classes, reasons)
+
+
+def _fill_polygons(shape: Tuple[int, int], polygons: Sequence[Polygon]) -> np.ndarray:
+    """将归一化坐标的多边形栅格化为 (高, 宽) 布尔掩码（逐行扫描线，奇偶规则，按像素中心判断）"""
+    h, w = shape
+    mask = np.zeros((h, w), dtype=bool)
+    ys = np.arange(h) + 0.5
+    for polygon in polygons:
+        pts = np.asarray(polygon, dtype=np.float64).reshape(-1, 2) * (w, h)
+        if len(pts) < 3:
+            continue
+        x0, y0 = pts[:, 0], pts[:, 1]
+        x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+        # (行, 边)：该行扫描线是否与边相交及交点横坐标
+        crosses = (y0 <= ys[:, None]) != (y1 <= ys[:, None])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xs = x0 + (ys[:, None] - y0) * (x1 - x0) / (y1 - y0)
+        rows, edges = np.nonzero(crosses)
+        cols = np.clip(np.ceil(xs[rows, edges] - 0.5).astype(np.int64), 0, w)
+        toggles = np.zeros((h, w + 1), dtype=np.int32)
+        np.add.at(toggles, (rows, cols), 1)
+        mask |= (np.cumsum(toggles, axis=1)[:, :w] % 2).astype(bool)
+    return mask
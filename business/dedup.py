@@ -0,0 +1,158 @@
+"""
+近重复图像检测 - 感知哈希 + 多索引哈希，按汉明距离阈值聚类
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .image_hash import compute_hashes, popcount64
+
+# 去重策略
+POLICY_REPRESENTATIVE = 'representative'  # 每簇只保留一张代表图
+POLICY_GROUP = 'group'                    # 保留全部，但同簇图像划入同一子集
+
+
+class MultiIndexHash:
+    """多索引哈希（LSH 的精确变体）
+
+    将 64 位哈希切分为 threshold + 1 段，由抽屉原理，汉明距离不超过 threshold 的
+    两个哈希至少有一段完全相同；只需在同段桶内做向量化的汉明距离校验，
+    避免 O(n²) 的两两比较。
+    """
+
+    # 单桶内一次比较的行数，限制大桶的内存占用
+    BLOCK_SIZE = 2048
+
+    def __init__(self, hashes: np.ndarray, threshold: int):
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.threshold = int(threshold)
+
+    def pairs(self) -> Tuple[np.ndarray, np.ndarray]:
+        """返回所有距离不超过阈值的下标对 (i, j)，i < j"""
+        n = len(self.hashes)
+        if n < 2:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        found_i, found_j = [], []
+        bounds = np.linspace(0, 64, self.threshold + 2).astype(np.uint64)
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            mask = (np.uint64(1) << (hi - lo)) - np.uint64(1)
+            keys = (self.hashes >> lo) & mask
+            order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[order]
+            starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+            ends = np.r_[starts[1:], n]
+            for s, e in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+                bucket_i, bucket_j = self._bucket_pairs(np.sort(order[s:e]))
+                found_i.append(bucket_i)
+                found_j.append(bucket_j)
+
+        if not found_i:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        # 同一对可能在多个段中命中，去重
+        keys = np.unique(np.concatenate(found_i).astype(np.int64) * n + np.concatenate(found_j))
+        return keys // n, keys % n
+
+    def _bucket_pairs(self, members: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """桶内分块计算两两距离，返回满足阈值的下标对"""
+        values = self.hashes[members]
+        result_i, result_j = [], []
+        for start in range(0, len(members), self.BLOCK_SIZE):
+            block = values[start:start + self.BLOCK_SIZE]
+            dist = popcount64(np.bitwise_xor(block[:, None], values[None, :]))
+            rows, cols = np.nonzero(dist <= self.threshold)
+            rows = rows + start
+            keep = rows < cols
+            result_i.append(members[rows[keep]])
+            result_j.append(members[cols[keep]])
+        return np.concatenate(result_i), np.concatenate(result_j)
+
+
+class DuplicateFinder:
+    """近重复图像聚类"""
+
+    # 阈值上限：更大的阈值会使分段过短、桶过大，退化为两两比较
+    MAX_THRESHOLD = 12
+
+    def __init__(self, threshold: int = 4, workers: int = 8):
+        self.threshold = max(0, min(int(threshold), self.MAX_THRESHOLD))
+        self.workers = workers
+
+    def cluster_paths(self, paths: List[str]) -> np.ndarray:
+        """计算图像哈希并聚类，返回每张图的簇编号（读取失败的图像自成一簇）"""
+        hashes, valid = compute_hashes(paths, self.workers)
+        return self.cluster_hashes(hashes, valid)
+
+    def cluster_hashes(self, hashes: np.ndarray, valid: Optional[np.ndarray] = None) -> np.ndarray:
+        """对 uint64 哈希数组聚类（传递闭包），返回簇编号数组"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        n = len(hashes)
+        if valid is None:
+            valid = np.ones(n, dtype=bool)
+
+        # 完全相同的哈希先合并，仅对不同哈希做近邻搜索
+        index = np.flatnonzero(valid)
+        unique_values, inverse = np.unique(hashes[index], return_inverse=True)
+        parent = list(range(len(unique_values)))
+
+        def find(i):
+            root = i
+            while parent[root] != root:
+                root = parent[root]
+            while parent[i] != root:
+                parent[i], i = root, parent[i]
+            return root
+
+        if self.threshold > 0:
+            pair_i, pair_j = MultiIndexHash(unique_values, self.threshold).pairs()
+            for a, b in zip(pair_i.tolist(), pair_j.tolist()):
+                ra, rb = find(a), find(b)
+                if ra != rb:
+                    parent[max(ra, rb)] = min(ra, rb)
+
+        unique_labels = np.array([find(i) for i in range(len(unique_values))], dtype=np.int64)
+        # 无效图像使用独立的簇编号（排在有效簇之后）
+        clusters = np.arange(n, dtype=np.int64) + len(unique_values)
+        clusters[index] = unique_labels[inverse]
+        return clusters
+
+
+def pick_representatives(clusters: np.ndarray, scores: Optional[np.ndarray] = None) -> np.ndarray:
+    """每个簇选出一张代表图（score 最大者，相同则取编号最小者），返回布尔掩码"""
+    n = len(clusters)
+    if scores is None:
+        scores = np.zeros(n)
+    # 按 (簇, -score, 编号) 排序后每簇第一个即代表
+    order = np.lexsort((np.arange(n), -np.asarray(scores, dtype=np.float64), clusters))
+    first = np.ones(n, dtype=bool)
+    first[1:] = clusters[order][1:] != clusters[order][:-1]
+    keep = np.zeros(n, dtype=bool)
+    keep[order[first]] = True
+    return keep
+
+
+def split_by_cluster(clusters: np.ndarray, train_ratio: float, seed: Optional[int] = None) -> np.ndarray:
+    """按簇随机划分训练/验证集，同簇图像不跨子集；返回布尔数组（True = 训练集）"""
+    unique, inverse, counts = np.unique(clusters, return_inverse=True, return_counts=True)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(unique))
+    cumulative = np.cumsum(counts[order])
+    target = len(clusters) * train_ratio
+    in_train = np.zeros(len(unique), dtype=bool)
+    in_train[order[cumulative <= target]] = True
+    # 至少保证第一簇进入训练集
+    if len(unique) and not in_train.any():
+        in_train[order[0]] = True
+    return in_train[inverse]
+
+
+def cluster_summary(clusters: np.ndarray) -> Dict[str, int]:
+    """簇统计：图像数、簇数、冗余图像数"""
+    sizes = np.bincount(np.unique(clusters, return_inverse=True)[1])
+    return {
+        'images': int(len(clusters)),
+        'clusters': int(sizes.size),
+        'redundant': int(len(clusters) - sizes.size),
+        'largest': int(sizes.max()) if sizes.size else 0,
+    }
+
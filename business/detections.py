@@ -0,0 +1,205 @@
+"""
+检测结果 - 与模型框架无关的检测框数组（xyxy、置信度、类别），向量化 NMS 与阈值过滤、绘制
+
+预测时以低置信度、宽松 IoU 推理一次并缓存原始检测框，之后调整置信度/IoU/最大检测数只需在
+缓存上重新过滤（毫秒级），无需重新加载模型推理
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 缓存原始检测框时使用的推理参数：置信度足够低、IoU 足够宽松，之后可向更严格的方向任意调整
+RAW_CONF = 0.01
+RAW_IOU = 0.9
+RAW_MAX_DET = 3000
+
+
+class Detections:
+    """一张图像的检测框
+
+    boxes: (N, 4) float32 原图像素坐标 xyxy；scores: (N,) float32；classes: (N,) int32
+    """
+
+    __slots__ = ('boxes', 'scores', 'classes', 'names', 'image_shape')
+
+    def __init__(self, boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray,
+                 names: Optional[Dict[int, str]] = None, image_shape: Optional[Tuple[int, int]] = None):
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        self.classes = np.asarray(classes, dtype=np.int32).reshape(-1)
+        self.names = names or {}
+        self.image_shape = image_shape
+
+    def __len__(self):
+        return len(self.scores)
+
+    @classmethod
+    def empty(cls, names=None, image_shape=None) -> 'Detections':
+        return cls(np.zeros((0, 4)), np.zeros(0), np.zeros(0), names, image_shape)
+
+    @classmethod
+    def from_ultralytics(cls, result) -> 'Detections':
+        """从 ultralytics Results 转换（复制到 CPU，不再持有显存张量）"""
+        names = dict(getattr(result, 'names', None) or {})
+        shape = tuple(result.orig_shape[:2]) if getattr(result, 'orig_shape', None) is not None else None
+        boxes = getattr(result, 'boxes', None)
+        if boxes is None or len(boxes) == 0:
+            return cls.empty(names, shape)
+        return cls(boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy(), names, shape)
+
+    def subset(self, index) -> 'Detections':
+        return Detections(self.boxes[index], self.scores[index], self.classes[index], self.names, self.image_shape)
+
+    def class_name(self, class_id: int) -> str:
+        return str(self.names.get(int(class_id), int(class_id)))
+
+    def class_counts(self) -> Dict[str, int]:
+        """各类别检测数（按数量降序）"""
+        ids, counts = np.unique(self.classes, return_counts=True)
+        order = np.argsort(-counts, kind='stable')
+        return {self.class_name(ids[i]): int(counts[i]) for i in order}
+
+    def filter(self, conf: float, iou: float, max_det: int, agnostic: bool = False) -> 'Detections':
+        """按置信度过滤、NMS 并截取前 max_det 个（与 ultralytics 预测参数含义一致）"""
+        keep = np.flatnonzero(self.scores >= conf)
+        if len(keep) == 0:
+            return self.subset(keep)
+        kept = nms(self.boxes[keep], self.scores[keep], iou, None if agnostic else self.classes[keep])
+        return self.subset(keep[kept[:max_det]])
+
+
+def box_iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """一个框与一组框的 IoU"""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+# 框数不超过该值时一次算出 IoU 矩阵，否则逐框计算（框数多时矩阵运算反而更慢）
+NMS_MATRIX_LIMIT = 1000
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float,
+        classes: Optional[np.ndarray] = None) -> np.ndarray:
+    """贪心 NMS，返回保留框的下标（按置信度降序）
+
+    classes 不为 None 时按类别分别抑制（各类别坐标平移到互不重叠的区域，一次完成）
+    """
+    if len(scores) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if classes is not None:
+        offset = float(boxes.max()) + 1.0
+        boxes = boxes + (classes.astype(np.float32) * offset)[:, None]
+    order = np.argsort(-scores, kind='stable')
+    boxes = boxes[order]
+    n = len(order)
+    suppressed = np.zeros(n, dtype=bool)
+    keep: List[int] = []
+    if n <= NMS_MATRIX_LIMIT:
+        overlaps = np.triu(pairwise_iou(boxes) > iou_threshold, 1)
+        for i in range(n):
+            if not suppressed[i]:
+                keep.append(i)
+                suppressed |= overlaps[i]
+    else:
+        for i in range(n):
+            if suppressed[i]:
+                continue
+            keep.append(i)
+            rest = i + 1 + np.flatnonzero(~suppressed[i + 1:])
+            suppressed[rest[box_iou(boxes[i], boxes[rest]) > iou_threshold]] = True
+    return order[np.asarray(keep, dtype=np.int64)]
+
+
+def pairwise_iou(boxes: np.ndarray) -> np.ndarray:
+    """(N, N) IoU 矩阵"""
+    x1, y1, x2, y2 = (boxes[:, k] for k in range(4))
+    inter_w = np.clip(np.minimum(x2[:, None], x2) - np.maximum(x1[:, None], x1), 0, None)
+    inter_h = np.clip(np.minimum(y2[:, None], y2) - np.maximum(y1[:, None], y1), 0, None)
+    inter = inter_w * inter_h
+    areas = (x2 - x1) * (y2 - y1)
+    return inter / np.maximum(areas[:, None] + areas - inter, 1e-9)
+
+
+def class_color(class_id: int) -> Tuple[int, int, int]:
+    """类别对应的 BGR 颜色（固定调色板）"""
+    palette = ((56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207),
+               (10, 249, 72), (23, 204, 146), (134, 219, 61), (52, 147, 26), (187, 212, 0),
+               (168, 153, 44), (255, 194, 0), (147, 69, 52), (255, 115, 100), (236, 24, 0),
+               (255, 56, 132), (133, 0, 82), (255, 56, 203), (200, 149, 255), (199, 55, 255))
+    return palette[int(class_id) % len(palette)]
+
+
+# 含中文的类别名用 PIL 绘制（cv2.putText 只支持 ASCII），依次尝试的字体
+LABEL_FONTS = ('msyh.ttc', 'simhei.ttf', 'NotoSansCJK-Regular.ttc', 'wqy-microhei.ttc', 'DejaVuSans.ttf')
+_font_cache: Dict[int, object] = {}
+
+
+def _label_font(size: int):
+    if size not in _font_cache:
+        from PIL import ImageFont
+
+        font = None
+        for name in LABEL_FONTS:
+            try:
+                font = ImageFont.truetype(name, size)
+                break
+            except OSError:
+                continue
+        _font_cache[size] = font or ImageFont.load_default()
+    return _font_cache[size]
+
+
+def draw_detections(image: np.ndarray, detections: Detections, scale: float = 1.0,
+                    show_labels: bool = True) -> np.ndarray:
+    """在图像副本上绘制检测框；scale 为 image 相对原图的缩放比例（在缩小的预览图上绘制时使用）"""
+    import cv2
+
+    canvas = image.copy()
+    if len(detections) == 0:
+        return canvas
+    thickness = max(1, round(max(canvas.shape[:2]) / 500))
+    boxes = np.round(detections.boxes * scale).astype(np.int32)
+    for (x1, y1, x2, y2), class_id in zip(boxes, detections.classes):
+        cv2.rectangle(canvas, (int(x1), int(y1)), (int(x2), int(y2)), class_color(class_id), thickness, cv2.LINE_AA)
+    if show_labels:
+        texts = [f"{detections.class_name(c)} {s:.2f}" for c, s in zip(detections.classes, detections.scores)]
+        if all(text.isascii() for text in texts):
+            _put_labels_cv2(canvas, boxes, texts, detections.classes, thickness)
+        else:
+            canvas = _put_labels_pil(canvas, boxes, texts, detections.classes, thickness)
+    return canvas
+
+
+def _put_labels_cv2(canvas, boxes, texts, classes, thickness):
+    import cv2
+
+    font_scale = max(0.4, thickness / 3)
+    text_thickness = max(1, thickness - 1)
+    for (x1, y1, _, _), text, class_id in zip(boxes, texts, classes):
+        (tw, th), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_thickness)
+        top = max(int(y1) - th - baseline, 0)
+        cv2.rectangle(canvas, (int(x1), top), (int(x1) + tw, top + th + baseline), class_color(class_id), -1)
+        cv2.putText(canvas, text, (int(x1), top + th), cv2.FONT_HERSHEY_SIMPLEX, font_scale,
+                    (255, 255, 255), text_thickness, cv2.LINE_AA)
+
+
+def _put_labels_pil(canvas, boxes, texts, classes, thickness):
+    from PIL import Image, ImageDraw
+
+    font = _label_font(max(12, thickness * 8))
+    pil_image = Image.fromarray(canvas[..., ::-1])
+    draw = ImageDraw.Draw(pil_image)
+    for (x1, y1, _, _), text, class_id in zip(boxes, texts, classes):
+        left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+        tw, th = right - left, bottom - top + 2
+        y = max(int(y1) - th, 0)
+        b, g, r = class_color(class_id)
+        draw.rectangle((int(x1), y, int(x1) + tw, y + th), fill=(r, g, b))
+        draw.text((int(x1) - left, y - top), text, fill=(255, 255, 255), font=font)
+    return np.ascontiguousarray(np.asarray(pil_image)[..., ::-1])
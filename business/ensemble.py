@@ -0,0 +1,287 @@
+"""
+测试时增强（TTA）与多模型集成 - 多次推理的检测框按类别名用加权框融合（WBF）合并
+
+推理模式按产品保存在 config/inference_modes.json（模型列表与权重、翻转、尺度等直接编辑该文件）；
+每批图像的全部翻转视图一次送入模型，每个 (模型, 尺度) 只做一次批量前向，
+融合在全部检测框上完成：按 x 坐标扫描只计算可能重叠的框对，按置信度贪心选出簇首后加权平均
+"""
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .detections import Detections
+from .product_settings import read_product_settings, save_product_settings
+
+MODE_SINGLE = 'single'
+MODE_TTA = 'tta'
+MODE_ENSEMBLE = 'ensemble'
+MODE_ENSEMBLE_TTA = 'ensemble_tta'
+MODE_NAMES = {
+    MODE_SINGLE: '单模型',
+    MODE_TTA: '测试时增强 (TTA)',
+    MODE_ENSEMBLE: '多模型集成',
+    MODE_ENSEMBLE_TTA: '多模型集成 + TTA',
+}
+
+FLIP_NONE = 'none'
+FLIP_H = 'hflip'
+FLIP_V = 'vflip'
+FLIP_HV = 'hvflip'
+FLIPS = (FLIP_NONE, FLIP_H, FLIP_V, FLIP_HV)
+
+DEFAULT_CONFIG_FILE = os.path.join('config', 'inference_modes.json')
+# 参与融合的最低置信度：低于该值的框只会拉低融合分数（融合结果在界面上不能再放宽到该值以下）
+DEFAULT_SKIP_CONF = 0.05
+# 查找重叠框对时每块计算的候选框对数
+PAIR_BLOCK = 1 << 22
+
+
+class EnsembleConfig:
+    """推理模式
+
+    flips / scales：TTA 的翻转方式与推理尺寸倍数（相对界面上的图像尺寸，取 32 的倍数）
+    models：集成时附加的模型 [{'path': ..., 'weight': 1.0}]，界面上选择的模型权重为 main_weight
+    fusion_iou：每次推理的 NMS 与 WBF 归簇的 IoU 阈值；skip_conf：参与融合的最低置信度（同时作为推理置信度）
+    batch：每次送入模型的图像数（每张图像展开为 len(flips) 个视图）
+    """
+
+    FIELDS = ('mode', 'flips', 'scales', 'models', 'main_weight', 'fusion_iou', 'skip_conf', 'batch')
+
+    def __init__(self, mode: str = MODE_SINGLE, flips: Sequence[str] = (FLIP_NONE, FLIP_H),
+                 scales: Sequence[float] = (1.0,), models: Sequence[Dict] = (), main_weight: float = 1.0,
+                 fusion_iou: float = 0.55, skip_conf: float = DEFAULT_SKIP_CONF, batch: int = 8):
+        if mode not in MODE_NAMES:
+            raise ValueError(f"未知的推理模式: {mode}")
+        unknown = [flip for flip in flips if flip not in FLIPS]
+        if unknown:
+            raise ValueError(f"未知的翻转方式: {', '.join(unknown)}")
+        self.mode = mode
+        self.flips = list(flips) or [FLIP_NONE]
+        self.scales = [float(scale) for scale in scales] or [1.0]
+        self.models = [{'path': item['path'], 'weight': float(item.get('weight', 1.0))} for item in models]
+        self.main_weight = float(main_weight)
+        self.fusion_iou = fusion_iou
+        self.skip_conf = skip_conf
+        self.batch = max(1, int(batch))
+
+    @property
+    def use_tta(self) -> bool:
+        return self.mode in (MODE_TTA, MODE_ENSEMBLE_TTA)
+
+    @property
+    def use_ensemble(self) -> bool:
+        return self.mode in (MODE_ENSEMBLE, MODE_ENSEMBLE_TTA) and bool(self.models)
+
+    @property
+    def is_single(self) -> bool:
+        return not self.use_tta and not self.use_ensemble
+
+    def view_flips(self) -> List[str]:
+        """每张图像展开的视图"""
+        return list(self.flips) if self.use_tta else [FLIP_NONE]
+
+    def passes(self, model_path: str, imgsz: int) -> List[Tuple[str, float, int]]:
+        """(模型路径, 权重, 推理尺寸)：每项对应每批一次批量前向"""
+        models = [(model_path, self.main_weight)]
+        if self.use_ensemble:
+            models += [(item['path'], item['weight']) for item in self.models]
+        sizes = sorted({max(32, int(round(imgsz * scale / 32)) * 32) for scale in self.scales}) \
+            if self.use_tta else [imgsz]
+        return [(path, weight, size) for path, weight in models for size in sizes]
+
+    def describe(self, model_path: str, imgsz: int) -> str:
+        """一行说明：模式与每张图像的推理次数"""
+        views = len(self.view_flips()) * len(self.passes(model_path, imgsz))
+        return f"{MODE_NAMES[self.mode]}（每张图像 {views} 次推理）"
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'EnsembleConfig':
+        return cls(**{name: data[name] for name in cls.FIELDS if name in data})
+
+    @classmethod
+    def load(cls, product_id, path: str = DEFAULT_CONFIG_FILE) -> 'EnsembleConfig':
+        """读取产品的推理模式（未设置或读取失败时为单模型）"""
+        try:
+            data = read_product_settings(path).get(str(product_id))
+            return cls.from_dict(data) if data else cls()
+        except Exception as e:
+            print(f"加载推理模式失败: {e}")
+            return cls()
+
+    def save(self, product_id, path: str = DEFAULT_CONFIG_FILE) -> bool:
+        """保存产品的推理模式"""
+        try:
+            save_product_settings(path, product_id, self.to_dict())
+            return True
+        except Exception as e:
+            print(f"保存推理模式失败: {e}")
+            return False
+
+
+# ---------- 增强 ----------
+def flip_image(image: np.ndarray, flip: str) -> np.ndarray:
+    """翻转视图（连续内存，cv2 缩放需要）"""
+    if flip == FLIP_H:
+        return np.ascontiguousarray(image[:, ::-1])
+    if flip == FLIP_V:
+        return np.ascontiguousarray(image[::-1])
+    if flip == FLIP_HV:
+        return np.ascontiguousarray(image[::-1, ::-1])
+    return image
+
+
+def unflip_boxes(boxes: np.ndarray, flip: str, shape: Tuple[int, int]) -> np.ndarray:
+    """翻转视图上的 xyxy 框换回原图坐标"""
+    if flip == FLIP_NONE or len(boxes) == 0:
+        return boxes
+    height, width = shape[:2]
+    boxes = boxes.copy()
+    if flip in (FLIP_H, FLIP_HV):
+        boxes[:, [0, 2]] = width - boxes[:, [2, 0]]
+    if flip in (FLIP_V, FLIP_HV):
+        boxes[:, [1, 3]] = height - boxes[:, [3, 1]]
+    return boxes
+
+
+# ---------- 融合 ----------
+def _pair_iou(boxes: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """逐对 IoU"""
+    inter_w = np.clip(np.minimum(boxes[:, 2], others[:, 2]) - np.maximum(boxes[:, 0], others[:, 0]), 0, None)
+    inter_h = np.clip(np.minimum(boxes[:, 3], others[:, 3]) - np.maximum(boxes[:, 1], others[:, 1]), 0, None)
+    inter = inter_w * inter_h
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    other_areas = (others[:, 2] - others[:, 0]) * (others[:, 3] - others[:, 1])
+    return inter / np.maximum(areas + other_areas - inter, 1e-9)
+
+
+def overlap_pairs(boxes: np.ndarray, iou_threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """IoU 大于阈值的全部框对 (i, j)
+
+    IoU > t 时 x 方向交集宽度必大于 t 倍框宽，按 x1 排序后每个框只与 x1 落在
+    [x1, x2 - t·宽) 内的框组成候选对，框多且分散时远少于 N² 次计算
+    """
+    n = len(boxes)
+    order = np.argsort(boxes[:, 0], kind='stable')
+    sorted_boxes = boxes[order]
+    widths = sorted_boxes[:, 2] - sorted_boxes[:, 0]
+    ends = np.searchsorted(sorted_boxes[:, 0], sorted_boxes[:, 2] - iou_threshold * widths, side='left')
+    counts = np.maximum(ends - np.arange(n) - 1, 0)
+    cumulative = np.cumsum(counts)
+    firsts, seconds = [], []
+    start = 0
+    while start < n:
+        done = int(cumulative[start - 1]) if start else 0
+        stop = max(int(np.searchsorted(cumulative, done + PAIR_BLOCK, side='right')), start + 1)
+        block_counts = counts[start:stop]
+        total = int(block_counts.sum())
+        if total:
+            rows = np.repeat(np.arange(start, stop), block_counts)
+            cols = rows + 1 + np.arange(total) - np.repeat(np.cumsum(block_counts) - block_counts, block_counts)
+            hit = _pair_iou(sorted_boxes[rows], sorted_boxes[cols]) > iou_threshold
+            firsts.append(order[rows[hit]])
+            seconds.append(order[cols[hit]])
+        start = stop
+    if not firsts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(firsts), np.concatenate(seconds)
+
+
+def greedy_clusters(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """(簇首下标（置信度降序）, 每个框所属簇的编号)
+
+    簇首与 NMS 保留的框相同；其余框归入与其 IoU 大于阈值、置信度最高的簇首
+    """
+    n = len(scores)
+    order = np.argsort(-scores, kind='stable')
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+    first, second = overlap_pairs(boxes, iou_threshold)
+    # 边统一由置信度高的框指向低的框，按 rank 存为 CSR
+    swap = rank[first] > rank[second]
+    high = np.where(swap, second, first)
+    low = np.where(swap, first, second)
+    edge_order = np.argsort(rank[high], kind='stable')
+    children = low[edge_order]
+    pointers = np.searchsorted(rank[high][edge_order], np.arange(n + 1))
+    suppressed = np.zeros(n, dtype=bool)
+    is_leader = np.zeros(n, dtype=bool)
+    for r in range(n):
+        index = order[r]
+        if suppressed[index]:
+            continue
+        is_leader[index] = True
+        if pointers[r + 1] > pointers[r]:
+            suppressed[children[pointers[r]:pointers[r + 1]]] = True
+    leaders = order[is_leader[order]]
+    # 非簇首：在指向自己的簇首中取 rank 最小的
+    best = np.full(n, n, dtype=np.int64)
+    from_leader = is_leader[high]
+    np.minimum.at(best, low[from_leader], rank[high[from_leader]])
+    best[leaders] = rank[leaders]
+    cluster_of_rank = np.full(n, -1, dtype=np.int64)
+    cluster_of_rank[rank[leaders]] = np.arange(len(leaders))
+    return leaders, cluster_of_rank[best]
+
+
+def weighted_boxes_fusion(results: Sequence[Detections], weights: Sequence[float], iou_threshold: float = 0.55,
+                          skip_conf: float = DEFAULT_SKIP_CONF, total_weight: Optional[float] = None) -> Detections:
+    """多次推理结果的加权框融合（results 中每项为一次推理）
+
+    各结果先按 skip_conf 过滤并在 iou_threshold 下按类别 NMS，去掉同一次推理中的重复框；
+    类别按名称对齐（不同模型的类别表可以不同），同类别且 IoU 大于阈值的框归为一簇。
+    每簇中每次推理只取置信度最高的一个框：融合框为这些框按 置信度×权重 加权的平均框，
+    置信度为 置信度×权重 之和 / 总权重，只在部分推理中出现的框会相应降低置信度
+    """
+    names: Dict[int, str] = {}
+    name_ids: Dict[str, int] = {}
+
+    def class_id_for(name: str, preferred: int) -> int:
+        if name not in name_ids:
+            name_ids[name] = preferred if preferred not in names else max(names) + 1
+            names[name_ids[name]] = name
+        return name_ids[name]
+
+    # 第一个结果（界面上选择的模型）的类别编号保持不变
+    for detections in results:
+        for class_id in sorted(detections.names):
+            class_id_for(detections.names[class_id], int(class_id))
+    parts = []
+    for source, (detections, weight) in enumerate(zip(results, weights)):
+        detections = detections.filter(skip_conf, iou_threshold, len(detections))
+        if len(detections) == 0:
+            continue
+        table = np.zeros(int(detections.classes.max()) + 1, dtype=np.int32)
+        for class_id in np.unique(detections.classes):
+            table[class_id] = class_id_for(detections.class_name(class_id), int(class_id))
+        parts.append((detections.boxes, detections.scores, table[detections.classes],
+                      np.full(len(detections), weight, dtype=np.float32),
+                      np.full(len(detections), source, dtype=np.int64)))
+    image_shape = results[0].image_shape if results else None
+    if total_weight is None:
+        total_weight = float(sum(weights))
+    if not parts:
+        return Detections.empty(names, image_shape)
+
+    boxes, scores, classes, box_weights, sources = (np.concatenate(column) for column in zip(*parts))
+    # 各类别坐标平移到互不重叠的区域，一次完成按类别归簇
+    shifted = boxes + (classes.astype(np.float32) * (float(boxes.max()) + 1.0))[:, None]
+    leaders, cluster = greedy_clusters(shifted, scores, iou_threshold)
+
+    # 每簇每次推理只保留置信度最高的框
+    by_score = np.argsort(-scores, kind='stable')
+    _, first = np.unique(cluster[by_score] * len(results) + sources[by_score], return_index=True)
+    best = by_score[first]
+    cluster, boxes, scores, box_weights = cluster[best], boxes[best], scores[best], box_weights[best]
+
+    weighted = scores * box_weights
+    count = len(leaders)
+    score_sum = np.bincount(cluster, weighted, count)
+    fused_boxes = np.stack([np.bincount(cluster, weighted * boxes[:, k], count) for k in range(4)], axis=1)
+    fused_boxes /= np.maximum(score_sum, 1e-9)[:, None]
+    fused_scores = score_sum / max(total_weight, 1e-9)
+    order = np.argsort(-fused_scores, kind='stable')
+    return Detections(fused_boxes[order], fused_scores[order], classes[leaders][order], names, image_shape)
@@ -0,0 +1,469 @@
+"""
+模型评估 - 将预测结果与 labelme 标注对比，计算各类别 P/R/AP、混淆矩阵与逐图误检/漏检索引
+
+匹配在所有图像的 (预测, 标注) 候选对上一次性向量化完成（与 ultralytics val 相同的
+按 IoU 降序一对一匹配）；逐图缓存匹配结果，标注或预测只改动部分图像时只重新匹配这些图像
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .detections import Detections
+
+# AP 计算的 IoU 阈值（0.5:0.95，与 COCO/ultralytics 一致）
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+# 工作点：P/R、误检/漏检索引与混淆矩阵所用的置信度与 IoU
+DEFAULT_CONF = 0.25
+DEFAULT_MATCH_IOU = 0.5
+# 单批匹配的候选对上限（控制内存，超出时按图像分批）
+MAX_PAIRS_PER_BATCH = 2_000_000
+# 混淆矩阵中"背景"（漏检/误检）所在的类别编号
+BACKGROUND = -1
+BACKGROUND_NAME = '背景'
+
+
+def image_key(path: str) -> str:
+    """图像路径的规范化键（标注与预测按此对应）"""
+    return os.path.normcase(os.path.abspath(path))
+
+
+class GroundTruth:
+    """一张图像的标注框：boxes (N, 4) 像素坐标 xyxy，labels 类别名称"""
+
+    __slots__ = ('image_path', 'boxes', 'labels')
+
+    def __init__(self, image_path: str, boxes: np.ndarray, labels: Sequence[str]):
+        self.image_path = image_path
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.labels = tuple(labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+
+class LabelmeGroundTruth:
+    """labelme 标注目录（含子目录；矩形与多边形，多边形取外接矩形）
+
+    refresh() 只重新解析修改时间或大小变化的 JSON 文件，未变化的图像沿用同一 GroundTruth
+    对象，评估器据此跳过这些图像
+    """
+
+    def __init__(self, source_dir: str):
+        self.source_dir = source_dir
+        self.invalid_shapes = 0
+        self.unreadable_files: List[str] = []
+        # JSON 文件 -> ((修改时间, 大小), GroundTruth, 无效形状数)
+        self._files: Dict[str, Tuple[Tuple[int, int], Optional[GroundTruth], int]] = {}
+
+    def refresh(self) -> Dict[str, GroundTruth]:
+        """扫描目录（递归子目录），返回 图像键 -> GroundTruth"""
+        files = {}
+        self.unreadable_files = []
+        directories = [self.source_dir]
+        while directories:
+            with os.scandir(directories.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                        continue
+                    if not entry.name.lower().endswith('.json') or not entry.is_file():
+                        continue
+                    st = entry.stat()
+                    signature = (st.st_mtime_ns, st.st_size)
+                    cached = self._files.get(entry.path)
+                    # 解析失败的文件不缓存，每次重新读取并记入 unreadable_files
+                    if cached is not None and cached[0] == signature and cached[1] is not None:
+                        files[entry.path] = cached
+                    else:
+                        files[entry.path] = (signature, *self._parse(entry.path))
+        self._files = files
+        self.invalid_shapes = sum(invalid for _, _, invalid in files.values())
+        return {image_key(gt.image_path): gt for _, gt, _ in files.values() if gt is not None}
+
+    def _parse(self, json_file: str) -> Tuple[Optional[GroundTruth], int]:
+        """解析一个标注文件，返回 (GroundTruth, 无效形状数)"""
+        try:
+            with open(json_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception:
+            self.unreadable_files.append(os.path.relpath(json_file, self.source_dir))
+            return None, 0
+        if not isinstance(data, dict) or 'shapes' not in data:
+            return None, 0
+        image_name = data.get('imagePath') or os.path.splitext(os.path.basename(json_file))[0] + '.jpg'
+        # 图像与标注文件在同一目录（imagePath 中的相对目录忽略）
+        image_path = os.path.join(os.path.dirname(json_file), os.path.basename(image_name))
+        boxes = []
+        labels = []
+        invalid = 0
+        for shape in data.get('shapes', []):
+            points = shape.get('points') or []
+            # labelme 省略 shape_type 时为多边形
+            shape_type = shape.get('shape_type') or 'polygon'
+            if not ((shape_type == 'rectangle' and len(points) == 2)
+                    or (shape_type == 'polygon' and len(points) >= 3)):
+                invalid += 1
+                continue
+            pts = np.asarray(points, dtype=np.float32)
+            boxes.append((*pts.min(axis=0), *pts.max(axis=0)))
+            labels.append(shape.get('label', ''))
+        return GroundTruth(image_path, np.asarray(boxes, dtype=np.float32), labels), invalid
+
+
+def match_pairs(pred_image: np.ndarray, pred_boxes: np.ndarray, pred_cls: np.ndarray,
+                gt_image: np.ndarray, gt_boxes: np.ndarray, gt_cls: np.ndarray,
+                iou_thresholds: Sequence[float], class_aware: bool = True) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """在多张图像上一次完成预测与标注的一对一匹配
+
+    pred_image/gt_image 为所属图像编号，须按图像编号升序排列；
+    返回每个 IoU 阈值下匹配上的 (预测下标, 标注下标)
+    """
+    pred_idx, gt_idx = _candidate_pairs(pred_image, gt_image)
+    if class_aware and len(pred_idx):
+        same = pred_cls[pred_idx] == gt_cls[gt_idx]
+        pred_idx, gt_idx = pred_idx[same], gt_idx[same]
+    iou = _paired_iou(pred_boxes[pred_idx], gt_boxes[gt_idx])
+    positive = iou > 0
+    pred_idx, gt_idx, iou = pred_idx[positive], gt_idx[positive], iou[positive]
+    # 按 IoU 降序，每个预测、每个标注各取第一次出现（即 IoU 最大）的候选对
+    order = np.argsort(-iou, kind='stable')
+    pred_idx, gt_idx, iou = pred_idx[order], gt_idx[order], iou[order]
+    matches = []
+    for threshold in iou_thresholds:
+        selected = np.flatnonzero(iou >= threshold)
+        _, first = np.unique(pred_idx[selected], return_index=True)
+        selected = selected[np.sort(first)]
+        _, first = np.unique(gt_idx[selected], return_index=True)
+        selected = selected[first]
+        matches.append((pred_idx[selected], gt_idx[selected]))
+    return matches
+
+
+def _candidate_pairs(pred_image: np.ndarray, gt_image: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """同一图像内全部 (预测, 标注) 组合（不做 Python 循环）"""
+    if len(pred_image) == 0 or len(gt_image) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    num_images = int(max(pred_image.max(), gt_image.max())) + 1
+    gt_counts = np.bincount(gt_image, minlength=num_images)
+    gt_starts = np.concatenate(([0], np.cumsum(gt_counts)[:-1]))
+    per_pred = gt_counts[pred_image]
+    pred_idx = np.repeat(np.arange(len(pred_image)), per_pred)
+    block_starts = np.cumsum(per_pred) - per_pred
+    gt_idx = gt_starts[pred_image][pred_idx] + (np.arange(len(pred_idx)) - block_starts[pred_idx])
+    return pred_idx, gt_idx
+
+
+def _paired_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """逐对 IoU"""
+    inter_w = np.clip(np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-9)
+
+
+def average_precision(tp: np.ndarray, conf: np.ndarray, pred_cls: np.ndarray,
+                      gt_counts: np.ndarray) -> np.ndarray:
+    """各类别、各 IoU 阈值的 AP（COCO 101 点插值），返回 (类别数, 阈值数)"""
+    num_classes = len(gt_counts)
+    ap = np.zeros((num_classes, tp.shape[1]))
+    order = np.lexsort((-conf, pred_cls))
+    tp, pred_cls = tp[order], pred_cls[order]
+    bounds = np.searchsorted(pred_cls, np.arange(num_classes + 1))
+    recall_points = np.linspace(0, 1, 101)
+    for c in np.flatnonzero(gt_counts):
+        start, end = bounds[c], bounds[c + 1]
+        if start == end:
+            continue
+        tpc = np.cumsum(tp[start:end], axis=0)
+        recall = tpc / gt_counts[c]
+        precision = tpc / np.arange(1, end - start + 1)[:, None]
+        # 精度包络：每个召回率位置取其后的最大精度
+        envelope = np.maximum.accumulate(precision[::-1], axis=0)[::-1]
+        for t in range(tp.shape[1]):
+            idx = np.searchsorted(recall[:, t], recall_points, side='left')
+            inside = idx < end - start
+            values = np.zeros(len(recall_points))
+            values[inside] = envelope[idx[inside], t]
+            ap[c, t] = values.mean()
+    return ap
+
+
+class _ImageEval:
+    """单张图像的匹配结果（评估器内部缓存）"""
+
+    __slots__ = ('gt', 'detections', 'digest', 'conf', 'pred_cls', 'tp', 'gt_cls', 'fp_cls', 'fn_cls',
+                 'confusion')
+
+
+class Evaluator:
+    """增量评估器
+
+    evaluate() 比较每张图像的标注/预测与上次是否相同（同一对象或内容摘要一致），只重新匹配变化的图像，
+    再在全部图像的缓存结果上汇总指标
+    """
+
+    def __init__(self, iou_thresholds: Sequence[float] = IOU_THRESHOLDS, conf: float = DEFAULT_CONF,
+                 match_iou: float = DEFAULT_MATCH_IOU):
+        self.iou_thresholds = np.asarray(iou_thresholds, dtype=np.float64)
+        self.conf = conf
+        self.match_iou = match_iou
+        self.names: List[str] = []
+        self._class_ids: Dict[str, int] = {}
+        self._name_maps: Dict[tuple, np.ndarray] = {}
+        self._images: Dict[str, _ImageEval] = {}
+        self.last_matched = 0
+
+    def set_operating_point(self, conf: Optional[float] = None, match_iou: Optional[float] = None):
+        """修改工作点（影响全部图像的误检/漏检与混淆矩阵，下次评估全部重新匹配）"""
+        if conf is not None and conf != self.conf:
+            self.conf = conf
+            self._images.clear()
+        if match_iou is not None and match_iou != self.match_iou:
+            self.match_iou = match_iou
+            self._images.clear()
+
+    def reset(self):
+        self._images.clear()
+
+    # ---------- 类别 ----------
+    def _class_id(self, name: str) -> int:
+        class_id = self._class_ids.get(name)
+        if class_id is None:
+            class_id = self._class_ids[name] = len(self.names)
+            self.names.append(name)
+        return class_id
+
+    def _map_classes(self, detections: Detections) -> np.ndarray:
+        """模型类别编号 -> 评估器类别编号（按类别名称对应）"""
+        if len(detections) == 0:
+            return np.zeros(0, dtype=np.int32)
+        key = tuple(detections.names.items())
+        lookup = self._name_maps.get(key)
+        top = int(detections.classes.max())
+        if lookup is None or len(lookup) <= top:
+            size = max(top + 1, max(detections.names, default=-1) + 1)
+            lookup = np.array([self._class_id(detections.class_name(i)) for i in range(size)], dtype=np.int32)
+            self._name_maps[key] = lookup
+        return lookup[detections.classes]
+
+    # ---------- 评估 ----------
+    def evaluate(self, ground_truth: Dict[str, GroundTruth], predictions: Dict[str, Detections]) -> Dict:
+        """评估有标注的图像（没有预测的图像视为无检出；没有标注的预测不参与评估）
+
+        ground_truth 的键为 image_key()；predictions 的键为图像路径
+        """
+        start = time.perf_counter()
+        predictions = {image_key(path): det for path, det in predictions.items()}
+        empty = Detections.empty()
+        for key in [k for k in self._images if k not in ground_truth]:
+            del self._images[key]
+
+        dirty = []
+        for key, gt in ground_truth.items():
+            det = predictions.get(key, empty)
+            cached = self._images.get(key)
+            if cached is not None and cached.gt is gt and cached.detections is det:
+                continue
+            digest = _digest(gt, det)
+            if cached is not None and cached.digest == digest:
+                cached.gt, cached.detections = gt, det
+                continue
+            dirty.append((key, gt, det, digest))
+        self._match(dirty)
+        self.last_matched = len(dirty)
+
+        report = self._summarize()
+        report['matched_images'] = len(dirty)
+        report['unlabeled_predictions'] = sum(1 for key in predictions if key not in ground_truth)
+        report['elapsed'] = round(time.perf_counter() - start, 3)
+        return report
+
+    def _match(self, items: List[tuple]):
+        """分批匹配变化的图像并写入缓存"""
+        batch = []
+        pairs = 0
+        for item in items:
+            cost = len(item[1]) * len(item[2])
+            if batch and pairs + cost > MAX_PAIRS_PER_BATCH:
+                self._match_batch(batch)
+                batch, pairs = [], 0
+            batch.append(item)
+            pairs += cost
+        if batch:
+            self._match_batch(batch)
+
+    def _match_batch(self, items: List[tuple]):
+        gt_counts = np.array([len(gt) for _, gt, _, _ in items], dtype=np.int64)
+        pred_counts = np.array([len(det) for _, _, det, _ in items], dtype=np.int64)
+        image_ids = np.arange(len(items))
+        gt_image = np.repeat(image_ids, gt_counts)
+        pred_image = np.repeat(image_ids, pred_counts)
+        gt_boxes = _concat([gt.boxes for _, gt, _, _ in items], (0, 4), np.float32)
+        gt_cls = np.array([self._class_id(label) for _, gt, _, _ in items for label in gt.labels], dtype=np.int32)
+        pred_boxes = _concat([det.boxes for _, _, det, _ in items], (0, 4), np.float32)
+        pred_conf = _concat([det.scores for _, _, det, _ in items], (0,), np.float32)
+        pred_cls = _concat([self._map_classes(det) for _, _, det, _ in items], (0,), np.int32)
+
+        # AP：全部预测，多个 IoU 阈值，同类别匹配
+        tp = np.zeros((len(pred_conf), len(self.iou_thresholds)), dtype=bool)
+        for t, (p, _) in enumerate(match_pairs(pred_image, pred_boxes, pred_cls, gt_image, gt_boxes, gt_cls,
+                                               self.iou_thresholds)):
+            tp[p, t] = True
+
+        # 工作点：置信度 >= conf 的预测，同类别匹配 -> 误检/漏检；不分类别匹配 -> 混淆矩阵
+        kept = np.flatnonzero(pred_conf >= self.conf)
+        op_args = (pred_image[kept], pred_boxes[kept], pred_cls[kept], gt_image, gt_boxes, gt_cls, [self.match_iou])
+        (p_ok, g_ok), = match_pairs(*op_args)
+        fp = np.ones(len(kept), dtype=bool)
+        fp[p_ok] = False
+        fn = np.ones(len(gt_cls), dtype=bool)
+        fn[g_ok] = False
+        (p_any, g_any), = match_pairs(*op_args, class_aware=False)
+        unmatched_pred = np.ones(len(kept), dtype=bool)
+        unmatched_pred[p_any] = False
+        unmatched_gt = np.ones(len(gt_cls), dtype=bool)
+        unmatched_gt[g_any] = False
+        # 混淆矩阵条目 (预测类别, 真实类别, 所属图像)
+        confusion = np.concatenate([
+            np.stack([pred_cls[kept][p_any], gt_cls[g_any], gt_image[g_any]], axis=1),
+            np.stack([pred_cls[kept][unmatched_pred], np.full(unmatched_pred.sum(), BACKGROUND),
+                      pred_image[kept][unmatched_pred]], axis=1),
+            np.stack([np.full(unmatched_gt.sum(), BACKGROUND), gt_cls[unmatched_gt], gt_image[unmatched_gt]], axis=1),
+        ]).astype(np.int32)
+
+        pred_bounds = np.concatenate(([0], np.cumsum(pred_counts)))
+        gt_bounds = np.concatenate(([0], np.cumsum(gt_counts)))
+        kept_bounds = np.searchsorted(kept, pred_bounds)
+        confusion = confusion[np.argsort(confusion[:, 2], kind='stable')]
+        confusion_bounds = np.searchsorted(confusion[:, 2], np.arange(len(items) + 1))
+        fp_cls = pred_cls[kept]
+        for i, (key, gt, det, digest) in enumerate(items):
+            entry = _ImageEval()
+            entry.gt, entry.detections, entry.digest = gt, det, digest
+            ps, pe = pred_bounds[i], pred_bounds[i + 1]
+            gs, ge = gt_bounds[i], gt_bounds[i + 1]
+            ks, ke = kept_bounds[i], kept_bounds[i + 1]
+            entry.conf = pred_conf[ps:pe]
+            entry.pred_cls = pred_cls[ps:pe]
+            entry.tp = tp[ps:pe]
+            entry.gt_cls = gt_cls[gs:ge]
+            entry.fp_cls = fp_cls[ks:ke][fp[ks:ke]]
+            entry.fn_cls = gt_cls[gs:ge][fn[gs:ge]]
+            entry.confusion = confusion[confusion_bounds[i]:confusion_bounds[i + 1], :2]
+            self._images[key] = entry
+
+    def _summarize(self) -> Dict:
+        """在全部图像的缓存结果上汇总指标"""
+        entries = list(self._images.values())
+        num_classes = len(self.names)
+        num_t = len(self.iou_thresholds)
+        conf = _concat([e.conf for e in entries], (0,), np.float32)
+        pred_cls = _concat([e.pred_cls for e in entries], (0,), np.int32)
+        tp = _concat([e.tp for e in entries], (0, num_t), bool)
+        gt_cls = _concat([e.gt_cls for e in entries], (0,), np.int32)
+        fp_cls = _concat([e.fp_cls for e in entries], (0,), np.int32)
+        fn_cls = _concat([e.fn_cls for e in entries], (0,), np.int32)
+        confusion_pairs = _concat([e.confusion for e in entries], (0, 2), np.int32)
+
+        gt_counts = np.bincount(gt_cls, minlength=num_classes)
+        ap = average_precision(tp, conf, pred_cls, gt_counts)
+        kept = conf >= self.conf
+        pred_counts = np.bincount(pred_cls[kept], minlength=num_classes)
+        fp_counts = np.bincount(fp_cls, minlength=num_classes)
+        fn_counts = np.bincount(fn_cls, minlength=num_classes)
+        tp_counts = pred_counts - fp_counts
+
+        # 行 = 预测类别，列 = 真实类别，最后一行/列为背景
+        matrix = np.zeros((num_classes + 1, num_classes + 1), dtype=np.int64)
+        if len(confusion_pairs):
+            rows = np.where(confusion_pairs[:, 0] == BACKGROUND, num_classes, confusion_pairs[:, 0])
+            cols = np.where(confusion_pairs[:, 1] == BACKGROUND, num_classes, confusion_pairs[:, 1])
+            np.add.at(matrix, (rows, cols), 1)
+
+        classes = []
+        evaluated = gt_counts > 0
+        for c, name in enumerate(self.names):
+            if gt_counts[c] == 0 and pred_counts[c] == 0:
+                continue
+            classes.append({
+                'name': name,
+                'instances': int(gt_counts[c]),
+                'predictions': int(pred_counts[c]),
+                'tp': int(tp_counts[c]),
+                'fp': int(fp_counts[c]),
+                'fn': int(fn_counts[c]),
+                'precision': _ratio(tp_counts[c], pred_counts[c]),
+                'recall': _ratio(tp_counts[c], gt_counts[c]),
+                'ap50': float(ap[c, 0]),
+                'ap50_95': float(ap[c].mean()),
+            })
+        total_tp, total_pred, total_gt = tp_counts.sum(), pred_counts.sum(), gt_counts.sum()
+        return {
+            'num_images': len(entries),
+            'num_instances': int(total_gt),
+            'conf': self.conf,
+            'match_iou': self.match_iou,
+            'iou_thresholds': [round(float(t), 2) for t in self.iou_thresholds],
+            'precision': _ratio(total_tp, total_pred),
+            'recall': _ratio(total_tp, total_gt),
+            'map50': float(ap[evaluated, 0].mean()) if evaluated.any() else 0.0,
+            'map50_95': float(ap[evaluated].mean()) if evaluated.any() else 0.0,
+            'classes': classes,
+            'confusion_names': self.names + [BACKGROUND_NAME],
+            'confusion_matrix': matrix.tolist(),
+        }
+
+    # ---------- 误检/漏检索引 ----------
+    def review_index(self, class_name: Optional[str] = None, kind: str = 'all') -> List[Dict]:
+        """工作点下有误检/漏检的图像（按错误数降序），用于逐张复查
+
+        kind: 'fp' 只看误检，'fn' 只看漏检，'all' 两者（未选的一种计数为 0、类别列表为空）
+        """
+        class_id = self._class_ids.get(class_name) if class_name else None
+        if class_name and class_id is None:
+            return []
+        rows = []
+        for entry in self._images.values():
+            fp_cls, fn_cls = entry.fp_cls, entry.fn_cls
+            if class_id is not None:
+                fp_cls, fn_cls = fp_cls[fp_cls == class_id], fn_cls[fn_cls == class_id]
+            if kind == 'fp':
+                fn_cls = fn_cls[:0]
+            elif kind == 'fn':
+                fp_cls = fp_cls[:0]
+            fp, fn = len(fp_cls), len(fn_cls)
+            if fp or fn:
+                rows.append({'path': entry.gt.image_path, 'fp': fp, 'fn': fn,
+                             'fp_classes': [self.names[c] for c in fp_cls],
+                             'fn_classes': [self.names[c] for c in fn_cls]})
+        rows.sort(key=lambda row: (-(row['fp'] + row['fn']), row['path']))
+        return rows
+
+
+def _digest(gt: GroundTruth, detections: Detections) -> bytes:
+    """标注与预测内容的摘要"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(gt.boxes.tobytes())
+    h.update('\n'.join(gt.labels).encode('utf-8'))
+    for array in (detections.boxes, detections.scores, detections.classes):
+        h.update(array.tobytes())
+    h.update(repr(sorted(detections.names.items())).encode('utf-8'))
+    return h.digest()
+
+
+def _concat(arrays: Iterable[np.ndarray], empty_shape: Tuple[int, ...], dtype) -> np.ndarray:
+    arrays = list(arrays)
+    if not arrays:
+        return np.zeros(empty_shape, dtype=dtype)
+    return np.concatenate(arrays).astype(dtype, copy=False)
+
+
+def _ratio(numerator, denominator) -> float:
+    return float(numerator) / float(denominator) if denominator else 0.0
@@ -0,0 +1,71 @@
+"""
+跨进程文件锁 - 多个进程/工作站修改同一配置文件时串行化读-改-写
+"""
+import os
+import time
+
+
+class FileLock:
+    """基于锁文件的排他锁（Windows 使用 msvcrt，其余平台使用 fcntl），可重入"""
+
+    def __init__(self, lock_file: str, timeout: float = 10.0):
+        self.lock_file = lock_file
+        self.timeout = timeout
+        self._handle = None
+        self._depth = 0
+
+    def acquire(self):
+        if self._depth:
+            self._depth += 1
+            return
+        handle = open(self.lock_file, 'a+b')
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                _lock(handle)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    handle.close()
+                    raise TimeoutError(f"等待文件锁超时: {self.lock_file}")
+                time.sleep(0.05)
+        self._handle = handle
+        self._depth = 1
+
+    def release(self):
+        if not self._depth:
+            return
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                _unlock(self._handle)
+            finally:
+                self._handle.close()
+                self._handle = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+if os.name == 'nt':
+    import msvcrt
+
+    def _lock(handle):
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+
+    def _unlock(handle):
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock(handle):
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(handle):
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,321 @@
+"""
+图像缓存 - 两级缓存：内存中按字节预算淘汰的 LRU（解码后的缩小图像、标注工具的图像数据等），
+磁盘上的缩略图缓存（按 路径+修改时间+大小 作键），缩略图与预取在后台线程生成
+
+浏览标注/预测图像时来回翻页不再重复解码全分辨率原图
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+import numpy as np
+
+from .image_hash import read_image
+
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+DEFAULT_THUMBNAIL_DIR = os.path.join('cache', 'thumbnails')
+DEFAULT_THUMBNAIL_SIZE = 256
+DEFAULT_DISK_BUDGET = 1024 * 1024 * 1024
+# 缩略图每次提交到后台线程的张数（一块完成后再提交下一块）
+THUMBNAIL_CHUNK = 16
+
+FileKey = Tuple[str, int, int]
+
+
+def file_key(path: str) -> Optional[FileKey]:
+    """(规范化绝对路径, 修改时间 ns, 文件大小)；文件不存在时返回 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return os.path.normcase(os.path.abspath(path)), st.st_mtime_ns, st.st_size
+
+
+def _sizeof(value: Any) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    nbytes = getattr(value, 'nbytes', None)
+    return int(nbytes) if nbytes is not None else 1024
+
+
+class MemoryLRU:
+    """按字节预算淘汰最久未使用条目的线程安全 LRU"""
+
+    def __init__(self, budget_bytes: int = DEFAULT_MEMORY_BUDGET):
+        self.budget = budget_bytes
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self._items: 'OrderedDict[Hashable, Tuple[Any, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        size = _sizeof(value)
+        if size > self.budget:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.used -= old[1]
+            self._items[key] = (value, size)
+            self.used += size
+            while self.used > self.budget and self._items:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self.used -= evicted
+
+    def discard_path(self, normalized_path: str):
+        """删除某个文件的全部条目（键的第一项为 file_key）"""
+        with self._lock:
+            for key in [k for k in self._items if k[0][0] == normalized_path]:
+                self.used -= self._items.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.used = 0
+
+
+def decode_frame(path: str, max_side: Optional[int] = None) -> Optional[np.ndarray]:
+    """解码图像（BGR），指定 max_side 时缩小到最长边不超过该值
+
+    JPEG 等格式按缩小倍数直接降采样解码（IMREAD_REDUCED_*），比解码全图再缩放快得多
+    """
+    import cv2
+
+    flags = cv2.IMREAD_COLOR
+    if max_side:
+        size = _image_size(path)
+        if size is not None:
+            longest = max(size)
+            for factor, reduced in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                    (2, cv2.IMREAD_REDUCED_COLOR_2)):
+                if longest // factor >= max_side:
+                    flags = reduced
+                    break
+    img = read_image(path, flags)
+    if img is None or not max_side:
+        return img
+    h, w = img.shape[:2]
+    scale = max_side / max(h, w)
+    if scale < 1:
+        img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    return img
+
+
+def _image_size(path: str) -> Optional[Tuple[int, int]]:
+    """只读文件头获取 (宽, 高)，PIL 不可用或读取失败时返回 None"""
+    try:
+        from PIL import Image
+
+        with Image.open(path) as im:
+            return im.size
+    except Exception:
+        return None
+
+
+class ImageCache:
+    """两级图像缓存
+
+    cached(path, kind, loader) 以 (file_key, kind) 为键缓存任意加载结果，文件修改后自动失效；
+    同一条目正在后台预取时前台调用等待其结果，不重复解码
+    """
+
+    def __init__(self, memory_budget: int = DEFAULT_MEMORY_BUDGET, thumbnail_dir: Optional[str] = DEFAULT_THUMBNAIL_DIR,
+                 thumbnail_size: int = DEFAULT_THUMBNAIL_SIZE, disk_budget: int = DEFAULT_DISK_BUDGET, workers: int = 2):
+        self.memory = MemoryLRU(memory_budget)
+        self.thumbnail_dir = thumbnail_dir
+        self.thumbnail_size = thumbnail_size
+        self.disk_budget = disk_budget
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-cache')
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    # ---------- 内存缓存 ----------
+    def cached(self, path: str, kind: Hashable, loader: Callable[[str], Any]) -> Any:
+        """返回 loader(path) 的缓存结果（文件不存在时直接调用 loader）"""
+        fkey = file_key(path)
+        if fkey is None:
+            return loader(path)
+        key = (fkey, kind)
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            value = loader(path)
+            if value is not None:
+                self.memory.put(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def prefetch(self, paths: Iterable[str], kind: Hashable, loader: Callable[[str], Any]):
+        """后台预先加载（已缓存或正在加载的跳过）"""
+        for path in paths:
+            fkey = file_key(path)
+            if fkey is None:
+                continue
+            key = (fkey, kind)
+            with self._lock:
+                busy = key in self._inflight
+            if not busy and key not in self.memory:
+                self._executor.submit(self._quiet, self.cached, path, kind, loader)
+
+    def frame(self, path: str, max_side: Optional[int] = None) -> Optional[np.ndarray]:
+        """解码后的（缩小）图像，调用方不应修改返回的数组"""
+        return self.cached(path, ('frame', max_side), lambda p: decode_frame(p, max_side))
+
+    def prefetch_frames(self, paths: Iterable[str], max_side: Optional[int] = None):
+        self.prefetch(paths, ('frame', max_side), lambda p: decode_frame(p, max_side))
+
+    def invalidate(self, path: str):
+        """丢弃某个文件的内存缓存（磁盘缩略图按修改时间自动失效）"""
+        self.memory.discard_path(os.path.normcase(os.path.abspath(path)))
+
+    # ---------- 磁盘缩略图 ----------
+    def thumbnail_file(self, path: str) -> Optional[str]:
+        """缩略图缓存文件路径（不检查是否已生成）"""
+        fkey = file_key(path)
+        if fkey is None or not self.thumbnail_dir:
+            return None
+        digest = hashlib.sha1(f"{fkey[0]}|{fkey[1]}|{fkey[2]}|{self.thumbnail_size}".encode('utf-8')).hexdigest()
+        return os.path.join(self.thumbnail_dir, digest[:2], digest + '.jpg')
+
+    def thumbnail(self, path: str) -> Optional[np.ndarray]:
+        """缩略图：内存 -> 磁盘 -> 解码原图生成并写入磁盘"""
+        return self.cached(path, ('thumbnail', self.thumbnail_size), self._load_thumbnail)
+
+    def request_thumbnails(self, paths: Iterable[str], callback: Callable[[str, Optional[np.ndarray]], None],
+                           cancelled: Optional[Callable[[], bool]] = None, chunk: int = THUMBNAIL_CHUNK):
+        """后台依次生成缩略图，每张完成后在工作线程中调用 callback(path, 缩略图)
+
+        按 chunk 张分块，一块完成后才提交下一块，排在其后的预取任务不会被整个目录的缩略图阻塞；
+        cancelled() 为真时丢弃尚未生成的部分
+        """
+        paths = list(paths)
+
+        def run(start):
+            for path in paths[start:start + chunk]:
+                if cancelled is not None and cancelled():
+                    return
+                callback(path, self._quiet(self.thumbnail, path))
+            if start + chunk < len(paths):
+                submit(start + chunk)
+
+        def submit(start):
+            try:
+                self._executor.submit(run, start)
+            except RuntimeError:
+                # 线程池已关闭（程序退出中）
+                pass
+
+        if paths:
+            submit(0)
+
+    def _load_thumbnail(self, path: str) -> Optional[np.ndarray]:
+        import cv2
+
+        thumb_file = self.thumbnail_file(path)
+        if thumb_file and os.path.exists(thumb_file):
+            thumb = read_image(thumb_file)
+            if thumb is not None:
+                return thumb
+        thumb = decode_frame(path, self.thumbnail_size)
+        if thumb is None or not thumb_file:
+            return thumb
+        try:
+            os.makedirs(os.path.dirname(thumb_file), exist_ok=True)
+            ok, buffer = cv2.imencode('.jpg', thumb, [cv2.IMWRITE_JPEG_QUALITY, 85])
+            if ok:
+                tmp_file = f"{thumb_file}.{threading.get_ident()}.tmp"
+                buffer.tofile(tmp_file)
+                os.replace(tmp_file, thumb_file)
+        except OSError as e:
+            print(f"写入缩略图缓存失败 {thumb_file}: {e}")
+        return thumb
+
+    def prune_disk(self) -> int:
+        """磁盘缩略图超出预算时按最后访问/修改时间删除最旧的文件，返回删除数量"""
+        if not self.thumbnail_dir or not os.path.isdir(self.thumbnail_dir):
+            return 0
+        files = []
+        total = 0
+        for sub in os.scandir(self.thumbnail_dir):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                st = entry.stat()
+                files.append((max(st.st_atime, st.st_mtime), st.st_size, entry.path))
+                total += st.st_size
+        removed = 0
+        for _, size, file_path in sorted(files):
+            if total <= self.disk_budget:
+                break
+            try:
+                os.remove(file_path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    # ---------- 其他 ----------
+    @staticmethod
+    def _quiet(func, *args):
+        try:
+            return func(*args)
+        except Exception as e:
+            print(f"图像缓存后台任务失败: {e}")
+            return None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_cache: Optional[ImageCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_image_cache() -> ImageCache:
+    """进程内共享的图像缓存（首次使用时创建，并在后台清理超出预算的磁盘缩略图）"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ImageCache()
+            _cache._executor.submit(_cache._quiet, _cache.prune_disk)
+        return _cache
@@ -0,0 +1,67 @@
+"""
+图像感知哈希 - dHash（64 位差值哈希）及汉明距离计算
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# 单字节 popcount 查找表，用于不支持 np.bitwise_count 的旧版 NumPy
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def read_image(path: str, flags: Optional[int] = None):
+    """读取图像（兼容中文路径），失败返回 None"""
+    import cv2
+
+    if flags is None:
+        flags = cv2.IMREAD_COLOR
+    try:
+        buffer = np.fromfile(path, dtype=np.uint8)
+    except Exception:
+        return None
+    if buffer.size == 0:
+        return None
+    return cv2.imdecode(buffer, flags)
+
+
+def dhash(path: str) -> Optional[int]:
+    """计算单张图像的 64 位 dHash，读取失败返回 None"""
+    import cv2
+
+    # 降采样解码，JPEG 只需解码 1/4 分辨率
+    img = read_image(path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if img is None:
+        return None
+    small = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def compute_hashes(paths: List[str], workers: int = 8) -> Tuple[np.ndarray, np.ndarray]:
+    """并行计算一组图像的 dHash，返回 uint64 数组与有效掩码 (hashes, valid)"""
+    hashes = np.zeros(len(paths), dtype=np.uint64)
+    valid = np.zeros(len(paths), dtype=bool)
+    if not paths:
+        return hashes, valid
+    # OpenCV 解码释放 GIL，线程池即可并行
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for i, value in enumerate(pool.map(dhash, paths)):
+            if value is not None:
+                hashes[i] = value
+                valid[i] = True
+    return hashes, valid
+
+
+def popcount64(values: np.ndarray) -> np.ndarray:
+    """uint64 数组逐元素统计 1 的个数"""
+    values = np.asarray(values, dtype=np.uint64)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values).astype(np.int32)
+    as_bytes = values.reshape(-1, 1).view(np.uint8)
+    return _POPCOUNT_TABLE[as_bytes].sum(axis=1, dtype=np.int32).reshape(values.shape)
+
+
+def hamming_distance(a: int, b) -> np.ndarray:
+    """哈希 a 与哈希（数组）b 的汉明距离"""
+    return popcount64(np.bitwise_xor(np.uint64(a), np.asarray(b, dtype=np.uint64)))
@@ -0,0 +1,245 @@
+"""
+列式标注存储 - 将 YOLO 数据集的全部标注合并为一个 labels.npz
+各数组在文件内连续存放（不压缩），加载时可整体内存映射，避免逐个打开小 txt 文件
+"""
+import os
+import struct
+import zipfile
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .label_table import LabelTable, SPLIT_NAMES
+
+STORE_FILENAME = 'labels.npz'
+STORE_VERSION = 1
+
+# zip 本地文件头: 签名 ... 文件名长度(2) 扩展字段长度(2)，共 30 字节
+_ZIP_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+
+
+class LabelStore:
+    """合并标注存储
+
+    images   图像文件名（位于 images/<split>/ 下）
+    split    所属划分编号（见 label_table.SPLIT_NAMES）
+    shape    图像尺寸 (h, w)，未知为 0
+    offsets  第 i 张图像的标注为 cls/boxes[offsets[i]:offsets[i + 1]]
+    cls      类别编号 int16
+    boxes    归一化 xywh，float32
+    names    类别名称
+    """
+
+    def __init__(self, images: np.ndarray, split: np.ndarray, shape: np.ndarray,
+                 offsets: np.ndarray, cls: np.ndarray, boxes: np.ndarray, names: Sequence[str]):
+        self.images = images
+        self.split = split
+        self.shape = shape
+        self.offsets = offsets
+        self.cls = cls
+        self.boxes = boxes
+        self.names = list(names)
+
+    def __len__(self):
+        return len(self.images)
+
+    @property
+    def num_boxes(self) -> int:
+        return int(self.offsets[-1]) if len(self.offsets) else 0
+
+    def labels_for(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """第 index 张图像的 (类别, xywh 框)"""
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return self.cls[start:end], self.boxes[start:end]
+
+    # ------------------------------------------------------------------
+    # 构建与读写
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_records(cls, records: List[Tuple[str, int, int, int, List[Tuple[int, float, float, float, float]]]],
+                     names: Sequence[str]) -> 'LabelStore':
+        """由 (图像文件名, 划分, 高, 宽, [(类别, xc, yc, w, h), ...]) 记录构建"""
+        counts = [len(rows) for *_, rows in records]
+        flat = [row for *_, rows in records for row in rows]
+        table = np.asarray(flat, dtype=np.float64).reshape(-1, 5)
+        return cls(
+            images=np.asarray([r[0] for r in records], dtype=str),
+            split=np.asarray([r[1] for r in records], dtype=np.int8),
+            shape=np.asarray([(r[2], r[3]) for r in records], dtype=np.int32).reshape(-1, 2),
+            offsets=np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+            cls=table[:, 0].astype(np.int16),
+            boxes=table[:, 1:].astype(np.float32),
+            names=names,
+        )
+
+    def save(self, path: str):
+        """保存为不压缩的 npz（先写临时文件再替换，保证原子性）"""
+        path = str(path)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                version=np.array(STORE_VERSION),
+                images=self.images,
+                split=self.split,
+                shape=self.shape,
+                offsets=self.offsets,
+                cls=self.cls,
+                boxes=self.boxes,
+                names=np.asarray(self.names, dtype=str),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'LabelStore':
+        """加载存储；mmap=True 时各数组直接映射文件区域，不做整体读取"""
+        if mmap:
+            arrays = _mmap_npz(str(path))
+        else:
+            with np.load(str(path)) as data:
+                arrays = {key: data[key] for key in data.files}
+        version = int(arrays['version'])
+        if version != STORE_VERSION:
+            raise ValueError(f"不支持的标注存储版本: {version}")
+        return cls(
+            images=arrays['images'],
+            split=arrays['split'],
+            shape=arrays['shape'],
+            offsets=arrays['offsets'],
+            cls=arrays['cls'],
+            boxes=arrays['boxes'],
+            names=[str(n) for n in arrays['names']],
+        )
+
+    # ------------------------------------------------------------------
+    # 转换
+    # ------------------------------------------------------------------
+    def to_label_table(self, dataset_dir: str) -> LabelTable:
+        """转换为列式标注表（供统计分析使用）"""
+        root = Path(dataset_dir)
+        counts = np.diff(self.offsets)
+        xywh = self.boxes.astype(np.float32)
+        boxes = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1)
+        names = list(self.names)
+        max_id = int(self.cls.max()) if self.cls.size else -1
+        for extra in range(len(names), max_id + 1):
+            names.append(f'<{extra}>')
+        return LabelTable(
+            images=[str(root / 'images' / SPLIT_NAMES.get(int(s), '') / name)
+                    for name, s in zip(self.images.tolist(), self.split.tolist())],
+            image_w=np.asarray(self.shape[:, 1], dtype=np.int32),
+            image_h=np.asarray(self.shape[:, 0], dtype=np.int32),
+            split=np.asarray(self.split, dtype=np.int8),
+            image_idx=np.repeat(np.arange(len(self), dtype=np.int32), counts),
+            label_idx=np.asarray(self.cls, dtype=np.int32),
+            boxes=boxes,
+            label_names=names,
+        )
+
+    def materialize_txt(self, dataset_dir: str, only_missing: bool = True,
+                        indices: Optional[Sequence[int]] = None) -> int:
+        """按需生成逐图 txt 标注文件，返回写入的文件数"""
+        root = Path(dataset_dir)
+        written = 0
+        for i in (range(len(self)) if indices is None else indices):
+            split_name = SPLIT_NAMES.get(int(self.split[i]))
+            if split_name is None:
+                continue
+            label_file = root / 'labels' / split_name / (os.path.splitext(str(self.images[i]))[0] + '.txt')
+            if only_missing and label_file.exists():
+                continue
+            label_file.parent.mkdir(parents=True, exist_ok=True)
+            classes, boxes = self.labels_for(i)
+            with open(label_file, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(
+                    f"{int(c)} {b[0]:.6f} {b[1]:.6f} {b[2]:.6f} {b[3]:.6f}" for c, b in zip(classes, boxes)
+                ))
+            written += 1
+        return written
+
+    def to_ultralytics_labels(self, dataset_dir: str, split_name: str) -> List[Dict]:
+        """生成 ultralytics 数据集缓存中的逐图标注记录"""
+        root = Path(dataset_dir).absolute()
+        split_id = {v: k for k, v in SPLIT_NAMES.items()}[split_name]
+        labels = []
+        for i in np.flatnonzero(np.asarray(self.split) == split_id):
+            classes, boxes = self.labels_for(int(i))
+            labels.append({
+                'im_file': str(root / 'images' / split_name / str(self.images[i])),
+                'shape': (int(self.shape[i, 0]), int(self.shape[i, 1])),
+                'cls': np.asarray(classes, dtype=np.float32).reshape(-1, 1),
+                'bboxes': np.asarray(boxes, dtype=np.float32).reshape(-1, 4),
+                'segments': [],
+                'keypoints': None,
+                'normalized': True,
+                'bbox_format': 'xywh',
+            })
+        # ultralytics 按排序后的图像路径计算缓存哈希
+        labels.sort(key=lambda label: label['im_file'])
+        return labels
+
+    def write_ultralytics_cache(self, dataset_dir: str) -> List[str]:
+        """写出 labels/<split>.cache，使 ultralytics 直接读取标注而无需扫描 txt 文件
+
+        需要安装 ultralytics（用于计算其缓存校验哈希），未安装时返回空列表
+        """
+        try:
+            from ultralytics.data.utils import DATASET_CACHE_VERSION, get_hash
+        except Exception as e:
+            print(f"跳过 ultralytics 标注缓存: {e}")
+            return []
+
+        root = Path(dataset_dir)
+        written = []
+        for split_name in SPLIT_NAMES.values():
+            labels = self.to_ultralytics_labels(dataset_dir, split_name)
+            if not labels:
+                continue
+            im_files = [label['im_file'] for label in labels]
+            # 与 ultralytics img2label_paths 的映射保持一致
+            sa, sb = f'{os.sep}images{os.sep}', f'{os.sep}labels{os.sep}'
+            label_files = [sb.join(p.rsplit(sa, 1)).rsplit('.', 1)[0] + '.txt' for p in im_files]
+            num_found = sum(1 for label in labels if len(label['cls']))
+            cache = {
+                'labels': labels,
+                'hash': get_hash(label_files + im_files),
+                'results': (num_found, 0, len(labels) - num_found, 0, len(labels)),
+                'msgs': [],
+                'version': DATASET_CACHE_VERSION,
+            }
+            cache_path = root / 'labels' / f'{split_name}.cache'
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(cache_path, 'wb') as f:
+                np.save(f, cache, allow_pickle=True)
+            written.append(str(cache_path))
+        return written
+
+
+def _mmap_npz(path: str) -> Dict[str, np.ndarray]:
+    """内存映射不压缩 npz 中的各数组（压缩成员或对象数组退化为普通读取）"""
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            key = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[key] = np.lib.format.read_array(member)
+                continue
+            f.seek(info.header_offset)
+            header = _ZIP_LOCAL_HEADER.unpack(f.read(_ZIP_LOCAL_HEADER.size))
+            name_len, extra_len = header[-2], header[-1]
+            f.seek(info.header_offset + _ZIP_LOCAL_HEADER.size + name_len + extra_len)
+            major, _ = np.lib.format.read_magic(f)
+            if major == 1:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject:
+                raise ValueError(f"标注存储包含对象数组: {key}")
+            if int(np.prod(shape)) == 0:
+                arrays[key] = np.zeros(shape, dtype=dtype)
+                continue
+            arrays[key] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                    order='F' if fortran_order else 'C')
+    return arrays
@@ -0,0 +1,271 @@
+"""
+列式标注表 - 将 labelme 目录或 YOLO 数据集的标注汇总为连续的 NumPy 数组
+所有统计/分析都在这张表上向量化完成，避免逐文件的 Python 循环
+"""
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# 划分编号
+SPLIT_NONE = -1
+SPLIT_TRAIN = 0
+SPLIT_VAL = 1
+SPLIT_NAMES = {SPLIT_TRAIN: 'train', SPLIT_VAL: 'val'}
+
+
+class LabelTable:
+    """列式标注表
+
+    图像级列（长度 = 图像数）：
+        images      图像路径列表
+        image_w     图像宽度（未知为 0）
+        image_h     图像高度（未知为 0）
+        split       所属划分（SPLIT_TRAIN / SPLIT_VAL / SPLIT_NONE）
+    标注级列（长度 = 标注框数）：
+        image_idx   所属图像下标
+        label_idx   标签下标（对应 label_names）
+        boxes       归一化 xyxy 坐标，float32，形状 (n, 4)
+    """
+
+    def __init__(self, images: List[str], image_w: np.ndarray, image_h: np.ndarray,
+                 split: np.ndarray, image_idx: np.ndarray, label_idx: np.ndarray,
+                 boxes: np.ndarray, label_names: List[str], invalid_shapes: int = 0,
+                 unreadable_files: Optional[List[str]] = None):
+        self.images = images
+        self.image_w = image_w
+        self.image_h = image_h
+        self.split = split
+        self.image_idx = image_idx
+        self.label_idx = label_idx
+        self.boxes = boxes
+        self.label_names = label_names
+        self.invalid_shapes = invalid_shapes
+        self.unreadable_files = unreadable_files or []
+
+    @property
+    def num_images(self) -> int:
+        return len(self.images)
+
+    @property
+    def num_boxes(self) -> int:
+        return int(self.image_idx.shape[0])
+
+    def boxes_per_image(self) -> np.ndarray:
+        """每张图像的标注框数量"""
+        return np.bincount(self.image_idx, minlength=self.num_images)
+
+    # ------------------------------------------------------------------
+    # 构建
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_labelme_dir(cls, source_dir: str) -> 'LabelTable':
+        """从 labelme 标注目录构建（矩形与多边形，多边形取外接矩形）"""
+        source = Path(source_dir)
+        json_files = sorted(source.glob('*.json'))
+
+        images = []
+        widths = []
+        heights = []
+        label_names: List[str] = []
+        label_lookup: Dict[str, int] = {}
+        unreadable = []
+        invalid_shapes = 0
+
+        # 所有点展平到一个列表，配合 reduceat 一次性求外接矩形
+        points_flat = []
+        point_counts = []
+        shape_image = []
+        shape_label = []
+
+        for json_file in json_files:
+            try:
+                with open(json_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception:
+                unreadable.append(json_file.name)
+                continue
+            if not isinstance(data, dict) or 'shapes' not in data:
+                continue
+
+            image_name = data.get('imagePath') or json_file.with_suffix('.jpg').name
+            image_index = len(images)
+            images.append(str(source / os.path.basename(image_name)))
+            widths.append(int(data.get('imageWidth') or 0))
+            heights.append(int(data.get('imageHeight') or 0))
+
+            for shape in data.get('shapes', []):
+                points = shape.get('points') or []
+                shape_type = shape.get('shape_type', 'rectangle')
+                if not ((shape_type == 'rectangle' and len(points) == 2)
+                        or (shape_type == 'polygon' and len(points) >= 3)):
+                    invalid_shapes += 1
+                    continue
+                label = shape.get('label', '')
+                if label not in label_lookup:
+                    label_lookup[label] = len(label_names)
+                    label_names.append(label)
+                points_flat.extend(points)
+                point_counts.append(len(points))
+                shape_image.append(image_index)
+                shape_label.append(label_lookup[label])
+
+        image_w = np.asarray(widths, dtype=np.int32)
+        image_h = np.asarray(heights, dtype=np.int32)
+        image_idx = np.asarray(shape_image, dtype=np.int32)
+
+        if point_counts:
+            pts = np.asarray(points_flat, dtype=np.float64).reshape(-1, 2)
+            starts = np.concatenate(([0], np.cumsum(point_counts)[:-1]))
+            x_min = np.minimum.reduceat(pts[:, 0], starts)
+            y_min = np.minimum.reduceat(pts[:, 1], starts)
+            x_max = np.maximum.reduceat(pts[:, 0], starts)
+            y_max = np.maximum.reduceat(pts[:, 1], starts)
+
+            # 宽高未知时坐标记为 NaN，交由统计阶段识别
+            w = image_w[image_idx].astype(np.float64)
+            h = image_h[image_idx].astype(np.float64)
+            w[w <= 0] = np.nan
+            h[h <= 0] = np.nan
+            boxes = np.stack([x_min / w, y_min / h, x_max / w, y_max / h], axis=1).astype(np.float32)
+        else:
+            boxes = np.zeros((0, 4), dtype=np.float32)
+
+        return cls(
+            images=images,
+            image_w=image_w,
+            image_h=image_h,
+            split=np.full(len(images), SPLIT_NONE, dtype=np.int8),
+            image_idx=image_idx,
+            label_idx=np.asarray(shape_label, dtype=np.int32),
+            boxes=boxes,
+            label_names=label_names,
+            invalid_shapes=invalid_shapes,
+            unreadable_files=unreadable,
+        )
+
+    @classmethod
+    def from_yolo_dataset(cls, dataset_dir: str, names: Optional[List[str]] = None) -> 'LabelTable':
+        """从 YOLO 数据集目录（images/{train,val} + labels/{train,val}）构建
+
+        存在合并标注文件 labels.npz 时直接内存映射读取，不再逐个打开 txt
+        """
+        from .label_store import LabelStore, STORE_FILENAME
+
+        root = Path(dataset_dir)
+        if (root / STORE_FILENAME).exists():
+            table = LabelStore.load(str(root / STORE_FILENAME)).to_label_table(str(root))
+            if names is not None:
+                table.label_names = list(names) + table.label_names[len(names):]
+            return table
+        if names is None:
+            names = read_yolo_names(root / 'data.yaml')
+
+        images = []
+        splits = []
+        values = []
+        counts = []
+        unreadable = []
+        invalid_rows = 0
+
+        for split_id, split_name in SPLIT_NAMES.items():
+            image_dir = root / 'images' / split_name
+            label_dir = root / 'labels' / split_name
+            if not image_dir.is_dir():
+                continue
+            for entry in sorted(os.scandir(image_dir), key=lambda e: e.name):
+                if not entry.is_file() or not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                images.append(entry.path)
+                splits.append(split_id)
+                label_file = label_dir / (os.path.splitext(entry.name)[0] + '.txt')
+                try:
+                    with open(label_file, 'r', encoding='utf-8') as f:
+                        tokens = np.asarray(f.read().split(), dtype=np.float64)
+                except FileNotFoundError:
+                    tokens = np.zeros(0)
+                except Exception:
+                    # 无法读取或含非数字内容的标注文件整个跳过
+                    unreadable.append(label_file.name)
+                    tokens = np.zeros(0)
+                if len(tokens) % 5:
+                    invalid_rows += 1
+                    tokens = tokens[:len(tokens) - len(tokens) % 5]
+                values.append(tokens)
+                counts.append(len(tokens) // 5)
+
+        rows = (np.concatenate(values) if values else np.zeros(0)).reshape(-1, 5)
+        image_idx = np.repeat(np.arange(len(images), dtype=np.int32), counts)
+        valid = rows[:, 0] >= 0
+        invalid_rows += int((~valid).sum())
+        rows, image_idx = rows[valid], image_idx[valid]
+        class_ids = rows[:, 0].astype(np.int32)
+        xc, yc, bw, bh = rows[:, 1], rows[:, 2], rows[:, 3], rows[:, 4]
+        boxes = np.stack([xc - bw / 2, yc - bh / 2, xc + bw / 2, yc + bh / 2], axis=1).astype(np.float32)
+
+        # 类别编号转换为名称下标，越界编号记为 "<id>"
+        label_names = list(names or [])
+        max_id = int(class_ids.max()) if class_ids.size else -1
+        for extra in range(len(label_names), max_id + 1):
+            label_names.append(f'<{extra}>')
+
+        return cls(
+            images=images,
+            image_w=np.zeros(len(images), dtype=np.int32),
+            image_h=np.zeros(len(images), dtype=np.int32),
+            split=np.asarray(splits, dtype=np.int8),
+            image_idx=image_idx,
+            label_idx=class_ids,
+            boxes=boxes,
+            label_names=label_names,
+            invalid_shapes=invalid_rows,
+            unreadable_files=unreadable,
+        )
+
+    @classmethod
+    def from_path(cls, path: str) -> 'LabelTable':
+        """自动识别目录类型：含 labels/ 或 data.yaml 视为 YOLO 数据集，否则视为 labelme 目录"""
+        root = Path(path)
+        if (root / 'labels').is_dir() or (root / 'data.yaml').exists():
+            return cls.from_yolo_dataset(path)
+        return cls.from_labelme_dir(path)
+
+
+def read_yolo_names(yaml_file: Path) -> List[str]:
+    """读取 data.yaml 中的类别名称，未安装 PyYAML 时退化为按行解析"""
+    if not Path(yaml_file).exists():
+        return []
+    try:
+        import yaml
+        with open(yaml_file, 'r', encoding='utf-8') as f:
+            names = (yaml.safe_load(f) or {}).get('names', [])
+    except ImportError:
+        names = _read_yolo_names_fallback(yaml_file)
+    except Exception as e:
+        print(f"读取类别名称失败: {e}")
+        return []
+    if isinstance(names, dict):
+        return [str(names[k]) for k in sorted(names)]
+    if not isinstance(names, (list, tuple)):
+        print(f"读取类别名称失败: {yaml_file} 中的 names 不是列表或字典")
+        return []
+    return [str(n) for n in names]
+
+
+def _read_yolo_names_fallback(yaml_file: Path):
+    """不依赖 PyYAML 解析单行的 names: [...] / {...}，无法解析时返回空列表"""
+    import ast
+
+    try:
+        with open(yaml_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('names:'):
+                    value = line.split(':', 1)[1].split('#', 1)[0].strip()
+                    return ast.literal_eval(value)
+    except (OSError, ValueError, SyntaxError) as e:
+        print(f"读取类别名称失败: {yaml_file}: {e}")
+    return []
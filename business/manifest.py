@@ -0,0 +1,303 @@
+"""
+预测清单 - 统一清单格式（docs/plans/2026-03-03-anomalib-plugin-design.md 5.4）的追加写入与索引读取
+
+一次预测任务的输出目录中：
+    manifest.jsonl  每张图像一行 JSON（只追加）
+    manifest.idx    定长二进制偏移索引（行偏移、行长度、OK/NG、分数），与清单同步追加
+    batch.json      批次信息（model_info、data_info、time_cost、errors）与结束状态
+写入按批次落盘，任务结束（含失败/停止）时一定写出结束状态；
+进程被强制结束时 batch.json 保持 running，读取端只索引完整的行；
+索引缺失、落后（包括落后后又续写留下的空隙）时从清单补建
+"""
+import json
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from .model_backends.base import (BackendError, MANIFEST_BROKEN, STATUS_FAILED, STATUS_STOPPED, STATUS_SUCCESS,
+                                  StopRequested)
+
+MANIFEST_FILE = 'manifest.jsonl'
+INDEX_FILE = 'manifest.idx'
+BATCH_FILE = 'batch.json'
+
+STATUS_RUNNING = 'running'
+
+# 每张图像必填字段
+ENTRY_FIELDS = ('image_path', 'backend', 'label', 'score', 'threshold_mode', 'threshold_value',
+                'heatmap_path', 'overlay_path', 'raw_meta')
+
+# 索引中的判定结果编码
+LABEL_CODES = {'OK': 0, 'NG': 1}
+LABEL_UNKNOWN = 2
+
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('length', '<u4'), ('label', 'u1'), ('score', '<f4')])
+
+# 写入缓冲：达到张数或间隔秒数即落盘
+FLUSH_ENTRIES = 256
+FLUSH_SECONDS = 1.0
+# 补建索引时每次读取的字节数
+SCAN_CHUNK = 1 << 22
+
+
+def _write_json(path: str, data: Dict):
+    tmp_file = path + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, path)
+
+
+def _index_record(offset: int, length: int, entry: Dict) -> tuple:
+    score = entry.get('score')
+    return (offset, length, LABEL_CODES.get(entry.get('label'), LABEL_UNKNOWN),
+            np.nan if score is None else float(score))
+
+
+class ManifestWriter:
+    """清单追加写入器（用作上下文管理器时，异常退出也会写出 failed/stopped 状态）"""
+
+    def __init__(self, run_dir: str, backend: str, model_info: Optional[Dict] = None,
+                 data_info: Optional[Dict] = None, flush_entries: int = FLUSH_ENTRIES,
+                 flush_seconds: float = FLUSH_SECONDS):
+        os.makedirs(run_dir, exist_ok=True)
+        self.run_dir = run_dir
+        self.backend = backend
+        self.flush_entries = flush_entries
+        self.flush_seconds = flush_seconds
+        self.batch = {
+            'backend': backend,
+            'status': STATUS_RUNNING,
+            'message': '',
+            'started': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'model_info': model_info or {},
+            'data_info': dict(data_info or {}),
+            'counts': {'total': 0, 'OK': 0, 'NG': 0},
+            'time_cost': None,
+            'errors': [],
+        }
+        self._start = time.perf_counter()
+        self._manifest = open(os.path.join(run_dir, MANIFEST_FILE), 'ab')
+        self._index = open(os.path.join(run_dir, INDEX_FILE), 'ab')
+        self._offset = self._manifest.tell()
+        if self._offset:
+            # 续写上次中断的清单：补齐被截断的最后一行，避免与新行连在一起
+            with open(self.manifest_path, 'rb') as f:
+                f.seek(self._offset - 1)
+                if f.read(1) != b'\n':
+                    self._manifest.write(b'\n')
+                    self._offset += 1
+        self._lines: List[bytes] = []
+        self._records: List[tuple] = []
+        self._last_flush = time.monotonic()
+        self.closed = False
+        _write_json(os.path.join(run_dir, BATCH_FILE), self.batch)
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.run_dir, MANIFEST_FILE)
+
+    def add(self, entry: Dict):
+        """追加一张图像的清单条目（缺少的必填字段补为 None）"""
+        for field in ENTRY_FIELDS:
+            entry.setdefault(field, None)
+        line = (json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        self._records.append(_index_record(self._offset, len(line), entry))
+        self._lines.append(line)
+        self._offset += len(line)
+        counts = self.batch['counts']
+        counts['total'] += 1
+        if entry['label'] in counts:
+            counts[entry['label']] += 1
+        if len(self._lines) >= self.flush_entries or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def error(self, image_path: Optional[str], message: str):
+        self.batch['errors'].append({'image_path': image_path, 'message': message})
+
+    def flush(self):
+        """写出缓冲（先清单后索引，索引永远不会指向未写出的行）"""
+        if self._lines:
+            self._manifest.write(b''.join(self._lines))
+            self._manifest.flush()
+            np.array(self._records, dtype=INDEX_DTYPE).tofile(self._index)
+            self._index.flush()
+            self._lines.clear()
+            self._records.clear()
+        self._last_flush = time.monotonic()
+
+    def close(self, status: str = STATUS_SUCCESS, message: str = ''):
+        """落盘并写出结束状态（重复调用无效）"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.flush()
+            for f in (self._manifest, self._index):
+                os.fsync(f.fileno())
+        finally:
+            self._manifest.close()
+            self._index.close()
+            self.batch.update(status=status, message=message, finished=time.strftime('%Y-%m-%d %H:%M:%S'),
+                              time_cost=round(time.perf_counter() - self._start, 3))
+            _write_json(os.path.join(self.run_dir, BATCH_FILE), self.batch)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close(STATUS_SUCCESS)
+        elif issubclass(exc_type, StopRequested):
+            self.close(STATUS_STOPPED, '已停止')
+        else:
+            self.close(STATUS_FAILED, str(exc))
+        return False
+
+
+class ManifestReader:
+    """清单读取：按偏移索引分页、筛选，只读取需要显示的行"""
+
+    def __init__(self, run_dir: str):
+        self.run_dir = run_dir
+        self.manifest_path = os.path.join(run_dir, MANIFEST_FILE)
+        if not os.path.exists(self.manifest_path):
+            raise BackendError(MANIFEST_BROKEN, "预测清单不存在", self.manifest_path)
+        self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        # 无法解析的行数（补建索引时跳过）
+        self.broken_lines = 0
+        self.refresh()
+
+    # ---------- 批次信息 ----------
+    def batch(self) -> Dict:
+        """batch.json；缺失或损坏时抛出 MANIFEST_BROKEN"""
+        batch_file = os.path.join(self.run_dir, BATCH_FILE)
+        try:
+            with open(batch_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            raise BackendError(MANIFEST_BROKEN, "批次信息无法读取", f"{batch_file}: {e}")
+
+    # ---------- 索引 ----------
+    def refresh(self) -> int:
+        """同步索引到清单的最新完整行（任务仍在写入时可反复调用），返回条目数"""
+        size = os.path.getsize(self.manifest_path)
+        if not len(self.index):
+            self.index = self._fill_gaps(self._load_sidecar(size))
+        covered = int(self.index['offset'][-1]) + int(self.index['length'][-1]) if len(self.index) else 0
+        if covered < size:
+            tail = self._scan(covered, size)
+            if len(tail):
+                self.index = np.concatenate([self.index, tail])
+        return len(self.index)
+
+    def _load_sidecar(self, size: int) -> np.ndarray:
+        """读取索引文件，丢弃超出清单长度或偏移不递增的记录（之后的行从清单补建）"""
+        index_path = os.path.join(self.run_dir, INDEX_FILE)
+        if not os.path.exists(index_path):
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        count = os.path.getsize(index_path) // INDEX_DTYPE.itemsize
+        index = np.fromfile(index_path, dtype=INDEX_DTYPE, count=count)
+        if not len(index):
+            return index
+        ends = index['offset'].astype(np.int64) + index['length']
+        # 相邻记录之间允许有空隙（由 _fill_gaps 从清单补建）
+        ordered = np.r_[True, index['offset'][1:] >= ends[:-1]]
+        valid = np.logical_and.accumulate(ordered & (ends <= size))
+        return index[:int(valid.sum())]
+
+    def _fill_gaps(self, index: np.ndarray) -> np.ndarray:
+        """从清单补建索引中的空隙：开头缺失的行、索引落后后又续写时漏掉的行、中断续写时被截断的行"""
+        if not len(index):
+            return index
+        starts = index['offset'].astype(np.int64)
+        ends = starts + index['length']
+        gaps = np.flatnonzero(starts[1:] > ends[:-1])
+        if not len(gaps) and starts[0] == 0:
+            return index
+        parts = [self._scan(0, int(starts[0]))] if starts[0] > 0 else []
+        previous = 0
+        for k in gaps:
+            parts.append(index[previous:k + 1])
+            parts.append(self._scan(int(ends[k]), int(starts[k + 1])))
+            previous = k + 1
+        parts.append(index[previous:])
+        return np.concatenate(parts)
+
+    def _scan(self, start: int, end: int) -> np.ndarray:
+        """从清单 [start, end) 补建索引（只索引以换行结尾且能解析的行）"""
+        records = []
+        with open(self.manifest_path, 'rb') as f:
+            f.seek(start)
+            position = start
+            pending = b''
+            while position < end:
+                chunk = f.read(min(SCAN_CHUNK, end - position))
+                if not chunk:
+                    break
+                position += len(chunk)
+                data = pending + chunk
+                line_start = 0
+                base = position - len(data)
+                while True:
+                    newline = data.find(b'\n', line_start)
+                    if newline < 0:
+                        break
+                    line = data[line_start:newline + 1]
+                    try:
+                        records.append(_index_record(base + line_start, len(line), json.loads(line)))
+                    except (ValueError, AttributeError):
+                        self.broken_lines += 1
+                    line_start = newline + 1
+                pending = data[line_start:]
+        return np.array(records, dtype=INDEX_DTYPE)
+
+    # ---------- 读取 ----------
+    def __len__(self):
+        return len(self.index)
+
+    def read(self, rows: Sequence[int]) -> List[Dict]:
+        """按行号读取条目（按偏移排序后顺序读取）"""
+        rows = np.asarray(rows, dtype=np.int64)
+        entries: List[Optional[Dict]] = [None] * len(rows)
+        with open(self.manifest_path, 'rb') as f:
+            for i in np.argsort(rows, kind='stable'):
+                record = self.index[rows[i]]
+                f.seek(int(record['offset']))
+                entries[i] = json.loads(f.read(int(record['length'])))
+        return entries
+
+    def select(self, label: Optional[str] = None, min_score: Optional[float] = None,
+               max_score: Optional[float] = None, sort_by_score: bool = False) -> np.ndarray:
+        """筛选行号（只用索引，不读清单）；sort_by_score 时按分数从高到低"""
+        mask = np.ones(len(self.index), dtype=bool)
+        if label is not None:
+            mask &= self.index['label'] == LABEL_CODES.get(label, LABEL_UNKNOWN)
+        scores = self.index['score']
+        if min_score is not None:
+            mask &= scores >= min_score
+        if max_score is not None:
+            mask &= scores <= max_score
+        rows = np.flatnonzero(mask)
+        if sort_by_score:
+            rows = rows[np.argsort(-np.nan_to_num(scores[rows], nan=-np.inf), kind='stable')]
+        return rows
+
+    def page(self, offset: int = 0, limit: int = 100, **filters) -> List[Dict]:
+        """筛选后的一页条目（filters 同 select）"""
+        rows = self.select(**filters)
+        return self.read(rows[offset:offset + limit])
+
+    def counts(self) -> Dict[str, int]:
+        labels = np.bincount(self.index['label'], minlength=LABEL_UNKNOWN + 1)
+        return {'total': len(self.index), 'OK': int(labels[0]), 'NG': int(labels[1])}
+
+    def __iter__(self) -> Iterator[Dict]:
+        """顺序读取全部已索引的条目"""
+        with open(self.manifest_path, 'rb') as f:
+            for record in self.index:
+                offset = int(record['offset'])
+                if f.tell() != offset:
+                    f.seek(offset)
+                yield json.loads(f.read(int(record['length'])))
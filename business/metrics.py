@@ -0,0 +1,339 @@
+"""
+运行指标 - 计数器、仪表、直方图（含计时器），供界面监控面板与 Prometheus 文本格式导出
+
+指标在模块级定义一次，热路径上直接调用 inc/observe；关闭采集（环境变量 SLDMV_METRICS=0
+或 set_enabled(False)）后每次调用只做一次标志判断。
+"""
+import bisect
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+METRICS_ENV = 'SLDMV_METRICS'
+METRICS_PORT_ENV = 'SLDMV_METRICS_PORT'
+DEFAULT_PORT = 9464
+# 延迟直方图默认分桶（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 直方图保留最近的观测值用于面板显示分位数
+RECENT_SAMPLES = 512
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+
+class _Metric:
+    """指标基类；enabled 为全局采集开关"""
+
+    enabled = os.environ.get(METRICS_ENV, '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+    def __init__(self, name: str, labels: Tuple[Tuple[str, str], ...]):
+        self.name = name
+        self.labels = labels
+        self._lock = threading.Lock()
+
+
+class Counter(_Metric):
+    """只增计数器"""
+
+    def __init__(self, name, labels):
+        super().__init__(name, labels)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        if not _Metric.enabled:
+            return
+        with self._lock:
+            self.value += amount
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值（队列深度、运行中的任务数等）"""
+
+    def __init__(self, name, labels):
+        super().__init__(name, labels)
+        self.value = 0.0
+
+    def set(self, value: float):
+        if not _Metric.enabled:
+            return
+        self.value = float(value)
+
+    def inc(self, amount: float = 1.0):
+        if not _Metric.enabled:
+            return
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+
+class _Timer:
+    """直方图计时上下文（秒）"""
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: 'Histogram'):
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    """采集关闭时的空计时上下文"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return None
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Histogram(_Metric):
+    """分桶直方图，另保留最近 RECENT_SAMPLES 个观测值计算分位数"""
+
+    def __init__(self, name, labels, buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value: float):
+        if not _Metric.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.bucket_counts[index] += 1
+            self.count += 1
+            self.sum += value
+            self.recent.append(value)
+
+    def time(self):
+        """计时上下文：with histogram.time(): ..."""
+        return _Timer(self) if _Metric.enabled else _NULL_TIMER
+
+    def quantile(self, q: float) -> Optional[float]:
+        """最近观测值的分位数，无数据时返回 None"""
+        with self._lock:
+            samples = sorted(self.recent)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+_TYPES = {COUNTER: Counter, GAUGE: Gauge, HISTOGRAM: Histogram}
+
+
+class MetricsRegistry:
+    """指标注册表：同名指标按标签区分，导出时归为一族"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # name -> (type, help, {labels: metric})
+        self._families: Dict[str, Tuple[str, str, Dict[tuple, _Metric]]] = {}
+
+    def _get(self, kind: str, name: str, help_text: str, labels: Optional[Dict[str, str]], **kwargs):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = (kind, help_text, {})
+            elif family[0] != kind:
+                raise ValueError(f"指标 {name} 已注册为 {family[0]}")
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = _TYPES[kind](name, key, **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str = '', labels: Optional[Dict[str, str]] = None) -> Counter:
+        return self._get(COUNTER, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str = '', labels: Optional[Dict[str, str]] = None) -> Gauge:
+        return self._get(GAUGE, name, help_text, labels)
+
+    def histogram(self, name: str, help_text: str = '', labels: Optional[Dict[str, str]] = None,
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get(HISTOGRAM, name, help_text, labels, buckets=buckets)
+
+    def families(self) -> List[Tuple[str, str, str, List[_Metric]]]:
+        """(名称, 类型, 说明, 指标列表)，按名称排序"""
+        with self._lock:
+            return [(name, kind, help_text, list(metrics.values()))
+                    for name, (kind, help_text, metrics) in sorted(self._families.items())]
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式（0.0.4）"""
+        lines = []
+        for name, kind, help_text, metrics in self.families():
+            if help_text:
+                lines.append(f"# HELP {name} {_escape_help(help_text)}")
+            lines.append(f"# TYPE {name} {kind}")
+            for metric in metrics:
+                if kind == HISTOGRAM:
+                    with metric._lock:
+                        counts = list(metric.bucket_counts)
+                        total, count = metric.sum, metric.count
+                    cumulative = 0
+                    for bound, n in zip(list(metric.buckets) + [float('inf')], counts):
+                        cumulative += n
+                        le = '+Inf' if bound == float('inf') else repr(float(bound))
+                        lines.append(f"{name}_bucket{_format_labels(metric.labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(metric.labels)} {total!r}")
+                    lines.append(f"{name}_count{_format_labels(metric.labels)} {count}")
+                else:
+                    lines.append(f"{name}{_format_labels(metric.labels)} {float(metric.value)!r}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_help(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+class MetricsServer:
+    """在本机端口以 Prometheus 文本格式提供 /metrics"""
+
+    def __init__(self, registry: 'MetricsRegistry', port: int = DEFAULT_PORT, host: str = '127.0.0.1'):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._server is not None
+
+    def start(self):
+        """启动导出服务（端口被占用时抛出 OSError）"""
+        if self._server is not None:
+            return
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='MetricsServer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        self._thread = None
+
+
+_registry = MetricsRegistry()
+_server: Optional[MetricsServer] = None
+
+
+def get_registry() -> MetricsRegistry:
+    """进程级共享的指标注册表"""
+    return _registry
+
+
+def counter(name: str, help_text: str = '', labels: Optional[Dict[str, str]] = None) -> Counter:
+    return _registry.counter(name, help_text, labels)
+
+
+def gauge(name: str, help_text: str = '', labels: Optional[Dict[str, str]] = None) -> Gauge:
+    return _registry.gauge(name, help_text, labels)
+
+
+def histogram(name: str, help_text: str = '', labels: Optional[Dict[str, str]] = None,
+              buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return _registry.histogram(name, help_text, labels, buckets)
+
+
+# stage_timer 的前缀 -> 指标说明中的环节名
+STAGE_TITLES = {'train': '训练', 'predict': '预测', 'autolabel': '自动标注'}
+
+
+def stage_timer(prefix: str, stage: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    """某环节各阶段耗时直方图 sldmv_<prefix>_stage_seconds{stage=...}"""
+    return histogram(f'sldmv_{prefix}_stage_seconds', f"{STAGE_TITLES.get(prefix, prefix)}各阶段耗时（秒）",
+                     {'stage': stage}, buckets)
+
+
+def is_enabled() -> bool:
+    return _Metric.enabled
+
+
+def set_enabled(enabled: bool):
+    """开启/关闭采集（关闭后已有数值保留，不再变化）"""
+    _Metric.enabled = bool(enabled)
+
+
+def start_server(port: int = DEFAULT_PORT, host: str = '127.0.0.1') -> MetricsServer:
+    """启动（或返回已启动的）进程级 Prometheus 导出服务"""
+    global _server
+    if _server is None or not _server.running:
+        _server = MetricsServer(_registry, port, host)
+        _server.start()
+    return _server
+
+
+def stop_server():
+    global _server
+    if _server is not None:
+        _server.stop()
+        _server = None
+
+
+def running_server() -> Optional[MetricsServer]:
+    return _server if _server is not None and _server.running else None
+
+
+def start_server_from_env() -> Optional[MetricsServer]:
+    """设置了 SLDMV_METRICS_PORT 时启动导出服务"""
+    value = os.environ.get(METRICS_PORT_ENV, '').strip()
+    if not value:
+        return None
+    try:
+        return start_server(int(value))
+    except (ValueError, OSError) as e:
+        print(f"启动指标导出服务失败（{METRICS_PORT_ENV}={value}）: {e}")
+        return None
@@ -0,0 +1,27 @@
+"""
+模型后端 - 可插拔的训练/预测后端（YOLO 及其 ONNX/OpenVINO 导出模型、Anomalib PatchCore）
+
+后端的选择与分发见 business/backend_router.py
+
+各后端按需导入，torch 等重依赖只在实际使用某个后端时加载
+"""
+import importlib
+
+_EXPORTS = {
+    'BackendError': '.base',
+    'ModelBackend': '.base',
+    'YoloBackend': '.yolo_backend',
+    'OnnxBackend': '.yolo_backend',
+    'OpenVinoBackend': '.yolo_backend',
+    'AnomalibBackend': '.anomalib_backend',
+}
+
+__all__ = ['BackendError', 'ModelBackend', 'YoloBackend', 'OnnxBackend', 'OpenVinoBackend', 'AnomalibBackend']
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,482 @@
+"""
+Anomalib PatchCore 后端 - 只用良品图像训练的异常检测，面向只有 CPU 的工位
+
+与 anomalib 的 PatchCore 相同：预训练 CNN 的 layer2/layer3 特征经 3×3 邻域平均后拼接为局部块特征，
+贪心核心集采样后作为记忆库，测试块特征到记忆库的最近距离即异常分数。
+为控制内存与单张耗时：
+    核心集：先按 max_patches 随机抽样，再按 coreset_ratio / max_bank_size 贪心采样（投影到 projection_dim 维选点）
+    记忆库：float16 内存映射文件（memory_bank.py），preload 可选常驻内存
+    搜索  ：分块矩阵乘积精确搜索，或 IVF 近似搜索（ivf_lists > 0 时建立，nprobe 控制精度/速度）
+
+训练输出 runs/anomalib/train/<时间戳>/，预测输出 runs/anomalib/predict/<时间戳>/
+（heatmaps/、overlays/ 与 manifest.py 写出的清单）
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..decision import DecisionEngine, DecisionRules, MODE_SCORE
+from ..image_hash import read_image
+from ..label_table import IMAGE_EXTENSIONS
+from ..manifest import ManifestWriter
+from ..profiler import span
+from .base import (BackendError, Emit, ModelBackend, DATA_INVALID, ENV_MISSING, TRAIN_FAILED, PREDICT_FAILED)
+from .memory_bank import MemoryBank, greedy_coreset
+
+RUNS_DIR = os.path.join('runs', 'anomalib')
+MODEL_META_FILE = 'model.json'
+
+DATA_STANDARD = 'standard'
+DATA_ADAPTER = 'adapter'
+
+# ImageNet 归一化参数（RGB）
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# 热力图高斯平滑的 sigma（输入分辨率下的像素，与 anomalib 一致）
+BLUR_SIGMA = 4
+
+DEFAULT_TRAIN_CONFIG = {
+    'data_mode': DATA_STANDARD,
+    'backbone': 'wide_resnet50_2',   # 节拍紧张时可用 resnet18
+    'weights_path': None,            # 离线工位：本地 state_dict 文件
+    'image_size': 256,
+    'feature_dim': 384,              # 块特征降维后的维度（0 表示不降维）
+    'coreset_ratio': 0.1,
+    'max_bank_size': 16384,
+    'max_patches': 200000,           # 核心集采样前最多保留的块特征数
+    'projection_dim': 128,
+    'ivf_lists': 0,                  # 0 表示只用精确搜索
+    'val_ratio': 0.1,
+    'batch_size': 8,
+    'threads': 0,
+    'seed': 0,
+}
+
+DEFAULT_PREDICT_CONFIG = {
+    'threshold_mode': MODE_SCORE,
+    'score_threshold': 0.5,          # 归一化分数，训练阈值对应 0.5
+    'pixel_threshold': 0.5,
+    'area_threshold': 0.001,
+    'nprobe': 8,
+    'preload': True,
+    'save_heatmaps': True,
+    'batch_size': 8,
+    'threads': 0,
+}
+
+
+def list_images(directory: str) -> List[str]:
+    """目录下的图像文件（不递归，按文件名排序）"""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def _has_shapes(image_path: str) -> bool:
+    """同名 labelme JSON 中是否有标注形状（有标注视为不良品）"""
+    json_file = os.path.splitext(image_path)[0] + '.json'
+    if not os.path.exists(json_file):
+        return False
+    try:
+        with open(json_file, 'r', encoding='utf-8') as f:
+            return bool(json.load(f).get('shapes'))
+    except Exception:
+        return False
+
+
+def collect_data(data_dir: str, mode: str) -> Dict:
+    """整理训练数据，返回 {'good': [...], 'test_good': [...], 'test_defect': {类别: [...]}}
+
+    standard：data_dir/train/good、data_dir/test/good、data_dir/test/<缺陷类别>（ground_truth 目前不使用）
+    adapter ：现有的图像目录，没有 labelme 标注形状的图像作为良品，有标注的作为不良品测试集
+    """
+    if not data_dir or not os.path.isdir(data_dir):
+        raise BackendError(DATA_INVALID, f"数据目录不存在: {data_dir}")
+    data = {'good': [], 'test_good': [], 'test_defect': {}}
+    if mode == DATA_STANDARD:
+        train_dir = os.path.join(data_dir, 'train', 'good')
+        data['good'] = list_images(train_dir)
+        if not data['good']:
+            raise BackendError(DATA_INVALID, "标准模式需要 train/good 目录且其中有良品图像",
+                               f"未找到图像: {train_dir}")
+        test_dir = os.path.join(data_dir, 'test')
+        if os.path.isdir(test_dir):
+            for name in sorted(os.listdir(test_dir)):
+                images = list_images(os.path.join(test_dir, name))
+                if not images:
+                    continue
+                if name == 'good':
+                    data['test_good'] = images
+                else:
+                    data['test_defect'][name] = images
+    elif mode == DATA_ADAPTER:
+        images = list_images(data_dir)
+        if not images:
+            raise BackendError(DATA_INVALID, "数据目录中没有图像", data_dir)
+        defects = []
+        for path in images:
+            (defects if _has_shapes(path) else data['good']).append(path)
+        if defects:
+            data['test_defect']['defect'] = defects
+        if not data['good']:
+            raise BackendError(DATA_INVALID, "适配模式需要没有标注形状的良品图像",
+                               f"{len(images)} 张图像都带有 labelme 标注")
+    else:
+        raise BackendError(DATA_INVALID, f"未知的数据模式: {mode}")
+    return data
+
+
+def best_f1_threshold(good_scores: np.ndarray, defect_scores: np.ndarray) -> float:
+    """使图像级 F1 最大的分数阈值（需要良品与不良品分数）"""
+    scores = np.concatenate([good_scores, defect_scores])
+    labels = np.concatenate([np.zeros(len(good_scores)), np.ones(len(defect_scores))])
+    order = np.argsort(-scores, kind='stable')
+    scores, labels = scores[order], labels[order]
+    tp = np.cumsum(labels)
+    fp = np.cumsum(1 - labels)
+    f1 = 2 * tp / (tp + fp + len(defect_scores))
+    # 相同分数只在最后一个位置可作为阈值
+    valid = np.r_[scores[1:] != scores[:-1], True]
+    best = np.flatnonzero(valid)[np.argmax(f1[valid])]
+    return float(scores[best])
+
+
+class PatchFeatureExtractor:
+    """torchvision 预训练骨干网络的局部块特征"""
+
+    def __init__(self, backbone: str, image_size: int, feature_dim: int = 0, weights_path: Optional[str] = None):
+        import torch
+        import torchvision
+
+        constructor = getattr(torchvision.models, backbone, None)
+        if constructor is None:
+            raise BackendError(ENV_MISSING, f"torchvision 不支持骨干网络: {backbone}")
+        try:
+            if weights_path:
+                model = constructor(weights=None)
+                model.load_state_dict(torch.load(weights_path, map_location='cpu'))
+            else:
+                model = constructor(weights='DEFAULT')
+        except Exception as e:
+            raise BackendError(ENV_MISSING, "无法加载骨干网络的预训练权重（离线工位请设置 weights_path）", str(e))
+        self.model = model.eval()
+        self.image_size = image_size
+        self.feature_dim = feature_dim
+        self._torch = torch
+        self._pool = torch.nn.AvgPool2d(3, 1, 1)
+
+    def preprocess(self, image: np.ndarray) -> np.ndarray:
+        """BGR 图像 -> 归一化的 CHW float32"""
+        import cv2
+
+        resized = cv2.resize(image, (self.image_size, self.image_size), interpolation=cv2.INTER_AREA)
+        rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.0
+        return ((rgb - IMAGENET_MEAN) / IMAGENET_STD).transpose(2, 0, 1)
+
+    def __call__(self, batch: np.ndarray) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """(B, 3, H, W) -> 块特征 (B, h*w, d) 与特征图尺寸 (h, w)"""
+        torch = self._torch
+        functional = torch.nn.functional
+        m = self.model
+        with torch.inference_mode():
+            x = torch.from_numpy(batch)
+            x = m.maxpool(m.relu(m.bn1(m.conv1(x))))
+            f2 = m.layer2(m.layer1(x))
+            f3 = m.layer3(f2)
+            f2 = self._pool(f2)
+            f3 = functional.interpolate(self._pool(f3), size=f2.shape[-2:], mode='bilinear', align_corners=False)
+            features = torch.cat([f2, f3], dim=1)
+            b, c, h, w = features.shape
+            features = features.permute(0, 2, 3, 1).reshape(-1, c)
+            if self.feature_dim and c > self.feature_dim:
+                features = functional.adaptive_avg_pool1d(features.unsqueeze(1), self.feature_dim).squeeze(1)
+            return features.reshape(b, h * w, -1).numpy(), (h, w)
+
+
+class AnomalibBackend(ModelBackend):
+    """PatchCore 异常检测后端"""
+
+    name = 'anomalib'
+    requires = ('torch', 'torchvision', 'cv2')
+
+    @staticmethod
+    def _set_threads(threads: int):
+        if threads:
+            import torch
+
+            torch.set_num_threads(threads)
+
+    @staticmethod
+    def _output_dir(config: Dict, task: str) -> str:
+        output_dir = config.get('output_dir') or os.path.join(RUNS_DIR, task, time.strftime('%Y%m%d_%H%M%S'))
+        os.makedirs(output_dir, exist_ok=True)
+        return output_dir
+
+    # ---------- 特征提取 ----------
+    def _iter_features(self, extractor: PatchFeatureExtractor, paths: List[str], batch_size: int, emit: Emit,
+                       stage: str, keep_images: bool = False):
+        """逐批产出 (路径列表, 原图列表, 块特征, 特征图尺寸)；读取失败的图像记入 self._load_errors
+
+        keep_images=False 时原图列表为原图尺寸 (h, w)；
+        下一批图像在线程池中解码（OpenCV 释放 GIL），与当前批的前向计算重叠
+        """
+        self._load_errors = errors = []
+
+        def load(path):
+            image = read_image(path)
+            if image is None:
+                return path, None, None
+            return path, image if keep_images else image.shape[:2], extractor.preprocess(image)
+
+        batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+        done = 0
+        with ThreadPoolExecutor(max_workers=max(2, batch_size)) as pool:
+            pending = [pool.submit(load, p) for p in batches[0]] if batches else []
+            for index in range(len(batches)):
+                self.check_stop()
+                loaded = [future.result() for future in pending]
+                if index + 1 < len(batches):
+                    pending = [pool.submit(load, p) for p in batches[index + 1]]
+                valid = [item for item in loaded if item[2] is not None]
+                errors.extend({'image_path': path, 'message': '无法读取图像'} for path, _, tensor in loaded
+                              if tensor is None)
+                done += len(loaded)
+                if valid:
+                    with span("提取特征", "anomalib", images=len(valid)):
+                        features, grid = extractor(np.stack([item[2] for item in valid]))
+                    yield [item[0] for item in valid], [item[1] for item in valid], features, grid
+                emit({'type': 'progress', 'stage': stage, 'current': done, 'total': len(paths)})
+
+    @staticmethod
+    def _anomaly_maps(distances: np.ndarray, grid: Tuple[int, int], image_size: int) -> np.ndarray:
+        """块距离 (B, h*w) -> 输入分辨率下平滑后的异常图 (B, S, S)"""
+        import cv2
+
+        maps = np.empty((len(distances), image_size, image_size), dtype=np.float32)
+        for i, patch in enumerate(distances):
+            resized = cv2.resize(patch.reshape(grid).astype(np.float32), (image_size, image_size),
+                                 interpolation=cv2.INTER_LINEAR)
+            maps[i] = cv2.GaussianBlur(resized, (0, 0), BLUR_SIGMA)
+        return maps
+
+    def _score_images(self, extractor, bank: MemoryBank, paths: List[str], batch_size: int, nprobe: Optional[int],
+                      emit: Emit, stage: str) -> np.ndarray:
+        """图像异常分数（原始距离）"""
+        scores = []
+        for _, _, features, grid in self._iter_features(extractor, paths, batch_size, emit, stage):
+            distances = bank.search(features.reshape(-1, features.shape[-1]), nprobe).reshape(len(features), -1)
+            maps = self._anomaly_maps(distances, grid, extractor.image_size)
+            scores.extend(maps.reshape(len(maps), -1).max(axis=1).tolist())
+        return np.asarray(scores, dtype=np.float32)
+
+    # ---------- 训练 ----------
+    def train(self, config: Dict, emit: Emit) -> Dict:
+        self.require_env()
+        config = {**DEFAULT_TRAIN_CONFIG, **config}
+        data = collect_data(config.get('data_dir'), config['data_mode'])
+        self._set_threads(config['threads'])
+        rng = np.random.default_rng(config['seed'])
+
+        good = list(data['good'])
+        rng.shuffle(good)
+        num_val = int(round(len(good) * config['val_ratio'])) if len(good) > 1 else 0
+        val_images, train_images = good[:num_val], good[num_val:]
+        emit({'type': 'log', 'message': f"良品训练 {len(train_images)} 张，验证 {len(val_images)} 张，"
+                                        f"不良品测试 {sum(len(v) for v in data['test_defect'].values())} 张"})
+
+        extractor = PatchFeatureExtractor(config['backbone'], config['image_size'], config['feature_dim'],
+                                          config['weights_path'])
+        # 每张图像保留的块数上限，使抽样后总数不超过 max_patches（训练期内存上限）
+        patches, grid = [], None
+        per_image = None
+        for _, _, features, grid in self._iter_features(extractor, train_images, config['batch_size'], emit,
+                                                        '提取训练特征'):
+            if per_image is None:
+                per_image = max(1, min(features.shape[1], config['max_patches'] // max(1, len(train_images))))
+            for image_features in features:
+                if per_image < len(image_features):
+                    image_features = image_features[rng.choice(len(image_features), per_image, replace=False)]
+                patches.append(image_features.astype(np.float16))
+        if not patches:
+            raise BackendError(DATA_INVALID, "没有可读取的良品训练图像", json.dumps(self._load_errors, ensure_ascii=False))
+        train_errors = list(self._load_errors)
+        features = np.concatenate(patches)
+        del patches
+
+        bank_size = max(1, min(int(len(features) * config['coreset_ratio']), config['max_bank_size']))
+        emit({'type': 'log', 'message': f"块特征 {len(features)} 个 × {features.shape[1]} 维，核心集 {bank_size} 个"})
+        with span("核心集采样", "anomalib", patches=len(features), size=bank_size):
+            selected = greedy_coreset(
+                features, bank_size, config['projection_dim'], config['seed'],
+                progress=lambda current, total: (self.check_stop(), emit(
+                    {'type': 'progress', 'stage': '核心集采样', 'current': current, 'total': total})))
+        output_dir = self._output_dir(config, 'train')
+        with span("写出记忆库", "anomalib", size=bank_size):
+            bank = MemoryBank.build(features[np.sort(selected)], output_dir, config['ivf_lists'], config['seed'])
+        del features
+        bank.preload()
+
+        # 阈值：有不良品时取 F1 最优，否则取验证良品（没有验证集时为训练良品）的最高分
+        nprobe = config.get('nprobe')
+        threshold_images = val_images or train_images[:max(1, config['batch_size'])]
+        good_scores = self._score_images(extractor, bank, threshold_images + data['test_good'], config['batch_size'],
+                                         nprobe, emit, '计算阈值')
+        defect_paths = [path for paths in data['test_defect'].values() for path in paths]
+        if defect_paths:
+            defect_scores = self._score_images(extractor, bank, defect_paths, config['batch_size'], nprobe, emit,
+                                               '计算阈值')
+            threshold = best_f1_threshold(good_scores, defect_scores)
+            threshold_source = 'f1'
+        else:
+            defect_scores = np.zeros(0, dtype=np.float32)
+            threshold = float(good_scores.max()) if len(good_scores) else 0.0
+            threshold_source = 'val_good_max' if val_images else 'train_good_max'
+        if threshold <= 0:
+            raise BackendError(TRAIN_FAILED, "无法确定异常阈值（良品分数为 0）")
+
+        meta = {
+            'backend': self.name,
+            'algorithm': 'patchcore',
+            'backbone': config['backbone'],
+            'weights_path': config['weights_path'],
+            'image_size': config['image_size'],
+            'feature_dim': config['feature_dim'],
+            'grid': list(grid),
+            'threshold': threshold,
+            'threshold_source': threshold_source,
+            'bank': bank.info(),
+            'data_dir': config.get('data_dir'),
+            'data_mode': config['data_mode'],
+            'train_images': len(train_images),
+            'val_images': len(val_images),
+            'good_score_max': float(good_scores.max()) if len(good_scores) else None,
+            'defect_score_min': float(defect_scores.min()) if len(defect_scores) else None,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'errors': train_errors + list(self._load_errors),
+        }
+        tmp_file = os.path.join(output_dir, MODEL_META_FILE + '.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, os.path.join(output_dir, MODEL_META_FILE))
+        return {'message': f"训练完成，记忆库 {len(bank)} 个特征，阈值 {threshold:.4f}",
+                'model_dir': output_dir, 'threshold': threshold, 'errors': meta['errors']}
+
+    # ---------- 预测 ----------
+    @staticmethod
+    def load_model(model_dir: str, preload: bool = True) -> Tuple[Dict, MemoryBank]:
+        meta_file = os.path.join(model_dir or '', MODEL_META_FILE)
+        if not os.path.exists(meta_file):
+            raise BackendError(DATA_INVALID, "模型目录中没有 model.json", model_dir)
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        try:
+            bank = MemoryBank.load(model_dir, preload)
+        except Exception as e:
+            raise BackendError(PREDICT_FAILED, "无法加载记忆库", str(e))
+        return meta, bank
+
+    @staticmethod
+    def normalize(values: np.ndarray, threshold: float) -> np.ndarray:
+        """原始距离 -> 0~1 分数，训练阈值对应 0.5"""
+        return np.clip(values * (0.5 / threshold), 0.0, 1.0)
+
+    def predict(self, config: Dict, emit: Emit) -> Dict:
+        self.require_env()
+        config = {**DEFAULT_PREDICT_CONFIG, **config}
+        paths = list(config.get('images') or list_images(config.get('image_dir') or ''))
+        if not paths:
+            raise BackendError(DATA_INVALID, "没有待预测的图像")
+        meta, bank = self.load_model(config.get('model_dir'), config['preload'])
+        self._set_threads(config['threads'])
+        extractor = PatchFeatureExtractor(meta['backbone'], meta['image_size'], meta['feature_dim'],
+                                          meta.get('weights_path'))
+        rules = DecisionRules(mode=config['threshold_mode'], score_threshold=config['score_threshold'],
+                              pixel_threshold=config['pixel_threshold'], area_threshold=config['area_threshold'])
+        engine = DecisionEngine(rules)
+        threshold_value = rules.score_threshold if rules.mode == MODE_SCORE else rules.area_threshold
+
+        output_dir = self._output_dir(config, 'predict')
+        heatmap_dir = os.path.join(output_dir, 'heatmaps')
+        overlay_dir = os.path.join(output_dir, 'overlays')
+        if config['save_heatmaps']:
+            os.makedirs(heatmap_dir, exist_ok=True)
+            os.makedirs(overlay_dir, exist_ok=True)
+
+        model_info = {'backend': self.name, 'model_dir': config.get('model_dir'), 'backbone': meta['backbone'],
+                      'threshold': meta['threshold'], 'bank': bank.info(),
+                      'nprobe': config['nprobe'] if bank.has_ivf else None}
+        index = 0
+        with ManifestWriter(output_dir, self.name, model_info, {'images': len(paths)}) as writer:
+            for batch_paths, images, features, grid in self._iter_features(
+                    extractor, paths, config['batch_size'], emit, '预测', keep_images=config['save_heatmaps']):
+                start = time.perf_counter()
+                with span("记忆库搜索", "anomalib", patches=features.shape[0] * features.shape[1]):
+                    distances = bank.search(features.reshape(-1, features.shape[-1]), config['nprobe'])
+                raw_maps = self._anomaly_maps(distances.reshape(len(features), -1), grid, extractor.image_size)
+                raw_scores = raw_maps.reshape(len(raw_maps), -1).max(axis=1)
+                maps = self.normalize(raw_maps, meta['threshold'])
+                elapsed_ms = (time.perf_counter() - start) * 1000 / len(features)
+                for path, image, anomaly_map, raw_score in zip(batch_paths, images, maps, raw_scores):
+                    score = float(anomaly_map.max())
+                    decision = engine.decide(anomaly_score=score, anomaly_map=anomaly_map)
+                    heatmap_path = overlay_path = None
+                    if config['save_heatmaps']:
+                        try:
+                            heatmap_path, overlay_path = self._save_visuals(
+                                path, image, anomaly_map, index, heatmap_dir, overlay_dir)
+                        except Exception as e:
+                            writer.error(path, f"保存热力图失败: {e}")
+                    entry = {
+                        'image_path': path,
+                        'backend': self.name,
+                        'label': decision.label,
+                        'score': round(score, 6),
+                        'threshold_mode': rules.mode,
+                        'threshold_value': threshold_value,
+                        'heatmap_path': heatmap_path,
+                        'overlay_path': overlay_path,
+                        'raw_meta': {
+                            'raw_score': round(float(raw_score), 6),
+                            'area_ratio': decision.area_ratio,
+                            'pixel_threshold': rules.pixel_threshold,
+                            'model_threshold': meta['threshold'],
+                            'inference_ms': round(elapsed_ms, 2),
+                            'reasons': decision.reasons,
+                        },
+                    }
+                    writer.add(entry)
+                    index += 1
+                    emit({'type': 'result', 'entry': entry})
+            for error in self._load_errors:
+                writer.error(error['image_path'], error['message'])
+        counts = writer.batch['counts']
+        return {'message': f"预测完成：OK {counts['OK']} 张，NG {counts['NG']} 张",
+                'output_dir': output_dir, 'manifest': writer.manifest_path,
+                'ok': counts['OK'], 'ng': counts['NG'], 'errors': writer.batch['errors']}
+
+    @staticmethod
+    def _save_visuals(image_path: str, image: np.ndarray, anomaly_map: np.ndarray, index: int,
+                      heatmap_dir: str, overlay_dir: str) -> Tuple[str, str]:
+        """保存伪彩色热力图（PNG）与叠加图（JPG），尺寸与原图一致"""
+        import cv2
+
+        height, width = image.shape[:2]
+        colored = cv2.applyColorMap(
+            cv2.resize((anomaly_map * 255).astype(np.uint8), (width, height), interpolation=cv2.INTER_LINEAR),
+            cv2.COLORMAP_JET)
+        stem = f"{index:06d}_{os.path.splitext(os.path.basename(image_path))[0]}"
+        heatmap_path = os.path.join(heatmap_dir, stem + '.png')
+        overlay_path = os.path.join(overlay_dir, stem + '.jpg')
+        ok, buffer = cv2.imencode('.png', colored)
+        if ok:
+            buffer.tofile(heatmap_path)
+        ok, buffer = cv2.imencode('.jpg', cv2.addWeighted(image, 0.6, colored, 0.4, 0))
+        if ok:
+            buffer.tofile(overlay_path)
+        return heatmap_path, overlay_path
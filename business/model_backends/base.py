@@ -0,0 +1,131 @@
+"""
+模型后端接口 - 训练/预测/导出的统一入口与错误模型（见 docs/plans/2026-03-03-anomalib-plugin-design.md）
+
+后端通过 emit(event) 回调报告进度，事件为可直接 JSON 序列化的字典：
+    {'type': 'log', 'message': str}
+    {'type': 'progress', 'stage': str, 'current': int, 'total': int}   # 可附带 'seconds'（阶段耗时）、'loss'
+    {'type': 'result', 'entry': dict}                  # 每张图像的清单条目（进程内调用时可附带 'detections'）
+    {'type': 'status', 'status': 'success' | 'failed' | 'stopped', 'message': str, ...}
+每次 train/predict 都以且仅以一个 status 事件结束
+"""
+import importlib.util
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 错误代码
+DATA_INVALID = 'DATA_INVALID'
+ENV_MISSING = 'ENV_MISSING'
+TRAIN_FAILED = 'TRAIN_FAILED'
+PREDICT_FAILED = 'PREDICT_FAILED'
+MANIFEST_BROKEN = 'MANIFEST_BROKEN'
+
+# 批次结束状态
+STATUS_SUCCESS = 'success'
+STATUS_FAILED = 'failed'
+STATUS_STOPPED = 'stopped'
+
+Emit = Callable[[Dict], None]
+
+
+# 依赖探测缓存：模块名 -> 是否可导入
+_PROBES: Dict[str, bool] = {}
+
+
+def probe_modules(modules: Sequence[str], refresh: bool = False) -> List[str]:
+    """返回缺失的模块（只查找模块位置不实际导入，结果缓存）"""
+    missing = []
+    for module in modules:
+        if refresh or module not in _PROBES:
+            try:
+                _PROBES[module] = importlib.util.find_spec(module) is not None
+            except (ImportError, ValueError):
+                _PROBES[module] = False
+        if not _PROBES[module]:
+            missing.append(module)
+    return missing
+
+
+class BackendError(Exception):
+    """后端统一异常：界面显示 message，日志记录 detail"""
+
+    def __init__(self, code: str, message: str, detail: Optional[str] = None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.detail = detail
+
+    def to_dict(self) -> Dict:
+        return {'code': self.code, 'message': self.message, 'detail': self.detail}
+
+
+class StopRequested(Exception):
+    """调用方请求停止（由 check_stop 抛出，run_task 转换为 stopped 状态）"""
+
+
+class ModelBackend:
+    """模型后端基类"""
+
+    name = ''
+    # healthcheck 需要的第三方模块
+    requires: Tuple[str, ...] = ()
+
+    def __init__(self):
+        self._stop_event = threading.Event()
+
+    # ---------- 接口 ----------
+    def healthcheck(self) -> Tuple[bool, str]:
+        """检查运行环境，返回 (是否可用, 说明)；默认只探测 requires 中的模块是否安装"""
+        missing = probe_modules(self.requires)
+        if missing:
+            return False, f"缺少依赖: {', '.join(missing)}"
+        return True, "可用"
+
+    def require_env(self):
+        """环境不可用时抛出 ENV_MISSING"""
+        ok, message = self.healthcheck()
+        if not ok:
+            raise BackendError(ENV_MISSING, message)
+
+    def train(self, config: Dict, emit: Emit) -> Dict:
+        raise NotImplementedError
+
+    def predict(self, config: Dict, emit: Emit) -> Dict:
+        raise NotImplementedError
+
+    def export(self, config: Dict, emit: Emit) -> Dict:
+        raise BackendError(ENV_MISSING, f"{self.name} 后端不支持导出")
+
+    # ---------- 停止 ----------
+    def request_stop(self):
+        self._stop_event.set()
+
+    def check_stop(self):
+        """在循环中调用，已请求停止时抛出 StopRequested"""
+        if self._stop_event.is_set():
+            raise StopRequested()
+
+    # ---------- 执行 ----------
+    def run_task(self, task: str, config: Dict, emit: Emit) -> Dict:
+        """执行 train/predict/export，保证以一个 status 事件结束；返回该事件"""
+        self._stop_event.clear()
+        start = time.perf_counter()
+        try:
+            summary = getattr(self, task)(config, emit) or {}
+            event = {'type': 'status', 'status': STATUS_SUCCESS, 'message': summary.pop('message', '完成')}
+            event.update(summary)
+        except StopRequested:
+            event = {'type': 'status', 'status': STATUS_STOPPED, 'message': '已停止'}
+        except BackendError as e:
+            event = {'type': 'status', 'status': STATUS_FAILED, 'message': e.message, 'error': e.to_dict()}
+        except Exception as e:
+            import traceback
+
+            code = TRAIN_FAILED if task == 'train' else PREDICT_FAILED
+            error = BackendError(code, f"{task} 出错: {e}", traceback.format_exc())
+            event = {'type': 'status', 'status': STATUS_FAILED, 'message': error.message, 'error': error.to_dict()}
+        event['backend'] = self.name
+        event['task'] = task
+        event['time_cost'] = round(time.perf_counter() - start, 3)
+        emit(event)
+        return event
@@ -0,0 +1,236 @@
+"""
+PatchCore 记忆库 - 贪心核心集采样、内存映射的 float16 特征库与最近邻搜索（纯 NumPy，适合只有 CPU 的工位）
+
+最近邻搜索两种方式：
+    精确：按块读取特征库，|q|² - 2q·b + |b|² 的矩阵乘积求最小距离
+    IVF ：k-means 将特征库分为若干簇并按簇重新排列（每簇在文件中连续），查询只搜索最近的 nprobe 个簇
+"""
+import json
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+BANK_FILE = 'memory_bank.npy'
+NORMS_FILE = 'bank_norms.npy'
+IVF_FILE = 'ivf.npz'
+BANK_META_FILE = 'bank.json'
+
+# 精确搜索时每次参与矩阵乘积的特征库行数（控制临时内存：行数 × 查询数 × 4 字节）
+SEARCH_BLOCK_ROWS = 8192
+# 核心集采样时投影降维后的维度（只用于选点，距离排序在随机投影下近似保持）
+DEFAULT_PROJECTION_DIM = 128
+# IVF 训练的 k-means 迭代次数与采样上限
+KMEANS_ITERATIONS = 10
+KMEANS_MAX_SAMPLES = 65536
+
+
+def random_projection(dim_in: int, dim_out: int, seed: int = 0) -> np.ndarray:
+    """高斯随机投影矩阵 (dim_in, dim_out)"""
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal((dim_in, dim_out)) / np.sqrt(dim_out)).astype(np.float32)
+
+
+def greedy_coreset(features: np.ndarray, size: int, projection_dim: int = DEFAULT_PROJECTION_DIM,
+                   seed: int = 0, progress=None) -> np.ndarray:
+    """k-center 贪心核心集：每次选取离已选点集最远的特征，返回所选下标
+
+    先随机投影降维，每轮只需一次 (N, p) 的距离更新；耗时约与 N × size × p 成正比
+    """
+    n = len(features)
+    if size >= n:
+        return np.arange(n)
+    if projection_dim and features.shape[1] > projection_dim:
+        projected = np.empty((n, projection_dim), dtype=np.float32)
+        matrix = random_projection(features.shape[1], projection_dim, seed)
+        for start in range(0, n, SEARCH_BLOCK_ROWS):
+            projected[start:start + SEARCH_BLOCK_ROWS] = features[start:start + SEARCH_BLOCK_ROWS].astype(np.float32) @ matrix
+    else:
+        projected = np.ascontiguousarray(features, dtype=np.float32)
+    norms = np.einsum('ij,ij->i', projected, projected)
+    selected = np.empty(size, dtype=np.int64)
+    selected[0] = np.random.default_rng(seed).integers(n)
+    min_dist = np.full(n, np.inf, dtype=np.float32)
+    for i in range(1, size + 1):
+        center = projected[selected[i - 1]]
+        dist = norms - 2 * (projected @ center) + norms[selected[i - 1]]
+        np.minimum(min_dist, dist, out=min_dist)
+        if i == size:
+            break
+        selected[i] = int(np.argmax(min_dist))
+        if progress is not None and i % 256 == 0:
+            progress(i, size)
+    return selected
+
+
+def kmeans(features: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """k-means 聚类中心 (k, d)（样本过多时随机采样训练）"""
+    rng = np.random.default_rng(seed)
+    sample = features
+    if len(features) > KMEANS_MAX_SAMPLES:
+        sample = features[np.sort(rng.choice(len(features), KMEANS_MAX_SAMPLES, replace=False))]
+    sample = np.asarray(sample, dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = nearest_centroid(sample, centroids)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # 空簇重新放到离所属中心最远的样本上
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            dist = np.einsum('ij,ij->i', sample - centroids[assign], sample - centroids[assign])
+            centroids[empty] = sample[np.argsort(-dist)[:len(empty)]]
+    return centroids
+
+
+def nearest_centroid(features: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """每个特征最近的聚类中心编号（分块计算）"""
+    c_norms = np.einsum('ij,ij->i', centroids, centroids)
+    assign = np.empty(len(features), dtype=np.int64)
+    for start in range(0, len(features), SEARCH_BLOCK_ROWS):
+        block = np.asarray(features[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+        assign[start:start + len(block)] = np.argmin(c_norms[None, :] - 2 * block @ centroids.T, axis=1)
+    return assign
+
+
+class MemoryBank:
+    """PatchCore 特征库
+
+    特征以 float16 保存为 .npy，加载时内存映射（不占进程内存，由系统页缓存按需换入）；
+    preload=True 时一次转换为 float32 常驻内存，搜索更快
+    """
+
+    def __init__(self, bank: np.ndarray, norms: np.ndarray, centroids: Optional[np.ndarray] = None,
+                 offsets: Optional[np.ndarray] = None):
+        self.bank = bank
+        self.norms = norms
+        self.centroids = centroids
+        self.offsets = offsets
+        self._dense: Optional[np.ndarray] = None
+
+    def __len__(self):
+        return len(self.bank)
+
+    @property
+    def dim(self) -> int:
+        return self.bank.shape[1]
+
+    @property
+    def has_ivf(self) -> bool:
+        return self.centroids is not None
+
+    # ---------- 保存/加载 ----------
+    @classmethod
+    def build(cls, features: np.ndarray, directory: str, ivf_lists: int = 0, seed: int = 0) -> 'MemoryBank':
+        """写出特征库（ivf_lists > 0 时同时建立 IVF 索引，特征按簇重新排列）"""
+        os.makedirs(directory, exist_ok=True)
+        features = np.asarray(features, dtype=np.float32)
+        order = np.arange(len(features))
+        centroids = offsets = None
+        ivf_file = os.path.join(directory, IVF_FILE)
+        if ivf_lists and len(features) > ivf_lists:
+            centroids = kmeans(features, ivf_lists, seed=seed)
+            assign = nearest_centroid(features, centroids)
+            order = np.argsort(assign, kind='stable')
+            offsets = np.searchsorted(assign[order], np.arange(ivf_lists + 1)).astype(np.int64)
+            np.savez(ivf_file, centroids=centroids, offsets=offsets)
+        elif os.path.exists(ivf_file):
+            # 同一目录重建为精确搜索时，旧的 IVF 索引与新的特征排列不再对应
+            os.remove(ivf_file)
+        bank = np.lib.format.open_memmap(os.path.join(directory, BANK_FILE), mode='w+', dtype=np.float16,
+                                         shape=features.shape)
+        norms = np.empty(len(features), dtype=np.float32)
+        for start in range(0, len(features), SEARCH_BLOCK_ROWS):
+            block = features[order[start:start + SEARCH_BLOCK_ROWS]].astype(np.float16)
+            bank[start:start + len(block)] = block
+            # 范数按 float16 存储后的值计算，与搜索时使用的特征一致
+            block32 = block.astype(np.float32)
+            norms[start:start + len(block)] = np.einsum('ij,ij->i', block32, block32)
+        bank.flush()
+        del bank
+        np.save(os.path.join(directory, NORMS_FILE), norms)
+        with open(os.path.join(directory, BANK_META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'size': int(len(features)), 'dim': int(features.shape[1]),
+                       'ivf_lists': int(len(centroids)) if centroids is not None else 0}, f, indent=2)
+        return cls.load(directory)
+
+    @classmethod
+    def load(cls, directory: str, preload: bool = False) -> 'MemoryBank':
+        bank = np.load(os.path.join(directory, BANK_FILE), mmap_mode='r')
+        norms = np.load(os.path.join(directory, NORMS_FILE))
+        centroids = offsets = None
+        ivf_file = os.path.join(directory, IVF_FILE)
+        if os.path.exists(ivf_file):
+            with np.load(ivf_file) as data:
+                centroids, offsets = data['centroids'], data['offsets']
+        memory_bank = cls(bank, norms, centroids, offsets)
+        if preload:
+            memory_bank.preload()
+        return memory_bank
+
+    def preload(self):
+        """转换为 float32 常驻内存"""
+        if self._dense is None:
+            self._dense = np.asarray(self.bank, dtype=np.float32)
+
+    def _rows(self, start: int, end: int) -> np.ndarray:
+        if self._dense is not None:
+            return self._dense[start:end]
+        return np.asarray(self.bank[start:end], dtype=np.float32)
+
+    # ---------- 搜索 ----------
+    def search(self, queries: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """每个查询特征到特征库的最近欧氏距离
+
+        有 IVF 索引且 nprobe 小于簇数时近似搜索，否则精确搜索
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        q_norms = np.einsum('ij,ij->i', queries, queries)
+        if self.has_ivf and nprobe and nprobe < len(self.centroids):
+            best = self._search_ivf(queries, q_norms, nprobe)
+        else:
+            best = np.full(len(queries), np.inf, dtype=np.float32)
+            for start in range(0, len(self.bank), SEARCH_BLOCK_ROWS):
+                end = min(start + SEARCH_BLOCK_ROWS, len(self.bank))
+                self._update(best, queries, q_norms, start, end)
+        return np.sqrt(np.maximum(best, 0))
+
+    def _update(self, best: np.ndarray, queries: np.ndarray, q_norms: np.ndarray, start: int, end: int,
+                index: Optional[np.ndarray] = None):
+        """用特征库 [start, end) 行更新 best（平方距离）；index 为参与的查询下标"""
+        rows = self._rows(start, end)
+        q = queries if index is None else queries[index]
+        # |q|² 对同一查询是常数，先求 |b|² - 2q·b 的最小值再加回
+        partial = (self.norms[start:end][None, :] - 2 * (q @ rows.T)).min(axis=1)
+        if index is None:
+            np.minimum(best, partial + q_norms, out=best)
+        else:
+            best[index] = np.minimum(best[index], partial + q_norms[index])
+
+    def _search_ivf(self, queries: np.ndarray, q_norms: np.ndarray, nprobe: int) -> np.ndarray:
+        c_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        scores = c_norms[None, :] - 2 * queries @ self.centroids.T
+        probes = np.argpartition(scores, nprobe - 1, axis=1)[:, :nprobe]
+        # 按簇分组：每个簇一次矩阵乘积处理全部探测它的查询
+        query_ids = np.repeat(np.arange(len(queries)), nprobe)
+        lists = probes.reshape(-1)
+        order = np.argsort(lists, kind='stable')
+        lists, query_ids = lists[order], query_ids[order]
+        bounds = np.searchsorted(lists, np.arange(len(self.centroids) + 1))
+        best = np.full(len(queries), np.inf, dtype=np.float32)
+        for l in np.flatnonzero(np.diff(bounds)):
+            start, end = self.offsets[l], self.offsets[l + 1]
+            if start < end:
+                self._update(best, queries, q_norms, start, end, query_ids[bounds[l]:bounds[l + 1]])
+        return best
+
+    def info(self) -> Dict:
+        return {
+            'size': len(self),
+            'dim': self.dim,
+            'ivf_lists': len(self.centroids) if self.has_ivf else 0,
+            'bytes': int(self.bank.size * self.bank.itemsize),
+        }
@@ -0,0 +1,499 @@
+"""
+YOLO 后端 - 将 ultralytics 的训练/预测/导出包装为统一后端接口
+
+ONNX / OpenVINO 导出模型同样由 ultralytics 加载推理，只是依赖的运行时不同
+预测输出 runs/predict/<时间戳>/（manifest.py 写出的清单，每张图像的判定与最高置信度）
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from ..profiler import span
+from .base import BackendError, Emit, ModelBackend, DATA_INVALID
+
+# 训练时接受的 ultralytics 参数（其余键不传给 model.train）
+TRAIN_ARGS = ('data', 'epochs', 'imgsz', 'batch', 'device', 'workers', 'project', 'name')
+# 预测时至少缓存的模型数（一次任务用到更多模型时，如级联 + 多模型集成，缓存随之放大）
+MAX_CACHED_MODELS = 4
+RUNS_DIR = os.path.join('runs', 'predict')
+
+
+def _model_key(model_path: str) -> tuple:
+    """模型缓存键：路径及文件的修改时间、大小（重新训练/导出覆盖同名文件后会重新加载）"""
+    try:
+        if os.path.isdir(model_path):
+            files = [os.path.join(model_path, name) for name in sorted(os.listdir(model_path))]
+        else:
+            files = [model_path]
+        return (model_path,) + tuple((stat.st_mtime_ns, stat.st_size) for stat in map(os.stat, files))
+    except OSError:
+        return (model_path,)
+
+
+class YoloBackend(ModelBackend):
+    """ultralytics YOLO 检测后端"""
+
+    name = 'yolo'
+    requires = ('ultralytics',)
+
+    def __init__(self):
+        super().__init__()
+        # 最近加载的模型（_model_key -> 模型），连续预测同一组模型时复用
+        self._models: OrderedDict = OrderedDict()
+        self._cache_size = MAX_CACHED_MODELS
+
+    def _load(self, model_path: str, emit: Emit):
+        """加载模型并报告加载耗时"""
+        self.require_env()
+        with span("导入 ultralytics", self.name):
+            from ultralytics import YOLO
+
+        start = time.perf_counter()
+        with span("加载模型", self.name, model=model_path):
+            model = YOLO(model_path)
+        emit({'type': 'progress', 'stage': 'load_model', 'current': 1, 'total': 1,
+              'seconds': time.perf_counter() - start})
+        return model
+
+    def load_model(self, model_path: str, emit: Emit):
+        """加载模型（最近用过且文件未变化的直接复用）"""
+        key = _model_key(model_path)
+        model = self._models.pop(key, None)
+        if model is None:
+            # 同一路径的旧版本不再使用
+            for stale in [k for k in self._models if k[0] == model_path]:
+                del self._models[stale]
+            model = self._load(model_path, emit)
+        self._models[key] = model
+        while len(self._models) > self._cache_size:
+            self._models.popitem(last=False)
+        return model
+
+    # ---------- 训练 ----------
+    def train(self, config: Dict, emit: Emit) -> Dict:
+        from ..shard_dataset import SHARD_INDEX_FILENAME
+
+        config = dict(config)
+        # 分片数据集先顺序解包到本地
+        if config['data'].endswith(SHARD_INDEX_FILENAME):
+            config['data'] = self._timed_stage('stage_shards', "解包分片数据集", emit, self._stage_shards, config)
+        # 预缩放图像缓存
+        if config.get('resize_cache'):
+            config['data'] = self._timed_stage('resize_cache', "准备预缩放缓存", emit, self._prepare_resized_cache,
+                                               config)
+        self.check_stop()
+
+        emit({'type': 'log', 'message': f"正在加载模型: {config['model']}..."})
+        # 训练会修改模型对象，不使用预测缓存
+        model = self._load(config['model'], emit)
+        self._add_epoch_callbacks(model, emit)
+
+        emit({'type': 'log', 'message': "开始训练..."})
+        emit({'type': 'log', 'message': f"数据: {config['data']}"})
+        emit({'type': 'log', 'message': f"训练轮数: {config['epochs']}"})
+        emit({'type': 'log', 'message': f"批次大小: {config['batch']}"})
+        emit({'type': 'log', 'message': f"图像尺寸: {config['imgsz']}"})
+        emit({'type': 'log', 'message': "-" * 50})
+
+        model.train(
+            **{key: config[key] for key in TRAIN_ARGS},
+            exist_ok=True,
+            patience=config.get('patience', 50),
+            save=True,
+            plots=True,
+            verbose=True,
+        )
+        # 请求停止时训练在当前轮结束后退出，已保存的权重保留
+        self.check_stop()
+        save_dir = os.path.join(config['project'], config['name'])
+        return {'message': f"训练完成！模型已保存到: {save_dir}", 'save_dir': save_dir}
+
+    def _timed_stage(self, stage: str, title: str, emit: Emit, func, config: Dict) -> str:
+        """执行数据准备阶段并报告耗时"""
+        start = time.perf_counter()
+        with span(title, self.name):
+            result = func(config, emit)
+        emit({'type': 'progress', 'stage': stage, 'current': 1, 'total': 1, 'seconds': time.perf_counter() - start})
+        return result
+
+    @staticmethod
+    def _stage_shards(config: Dict, emit: Emit) -> str:
+        """将分片数据集解包到训练保存目录下，返回解包后的 data.yaml"""
+        from ..shard_dataset import stage_shards
+
+        shard_dir = os.path.dirname(os.path.abspath(config['data']))
+        target_dir = os.path.join(config['project'], 'staged_data', os.path.basename(shard_dir))
+        emit({'type': 'log', 'message': f"正在解包分片数据集到: {target_dir}"})
+
+        def on_progress(done, total):
+            if done == total or done % 1000 == 0:
+                emit({'type': 'log', 'message': f"  解包进度: {done}/{total}"})
+
+        yaml_path = stage_shards(shard_dir, target_dir, progress=on_progress)
+        emit({'type': 'log', 'message': f"分片数据集就绪: {yaml_path}"})
+        return yaml_path
+
+    @staticmethod
+    def _prepare_resized_cache(config: Dict, emit: Emit) -> str:
+        """生成/复用与训练尺寸匹配的预缩放缓存，返回缓存的 data.yaml"""
+        from ..resize_cache import ResizedDatasetCache
+
+        cache = ResizedDatasetCache.from_yaml(config['data'], image_format=config.get('resize_format', 'jpg'))
+        emit({'type': 'log', 'message': f"正在准备预缩放图像缓存（最长边 {config['imgsz']}）..."})
+        last_reported = [0]
+
+        def on_progress(done, total):
+            percent = int(done * 100 / max(total, 1))
+            if percent >= last_reported[0] + 10 or done == total:
+                last_reported[0] = percent
+                emit({'type': 'log', 'message': f"  缓存进度: {done}/{total}"})
+
+        yaml_path, stats = cache.ensure(config['imgsz'], progress=on_progress)
+        emit({'type': 'log', 'message': f"预缩放缓存就绪: 共 {stats['total']} 张，更新 {stats['updated']} 张，"
+                                        f"复用 {stats['reused']} 张，失败 {stats['failed']} 张"})
+        emit({'type': 'log', 'message': f"缓存数据集: {yaml_path}"})
+        return yaml_path
+
+    def _add_epoch_callbacks(self, model, emit: Emit):
+        """每轮结束时报告耗时与损失；请求停止时让训练器在本轮结束后退出"""
+        epoch_start = [time.perf_counter()]
+
+        def on_epoch_start(trainer):
+            epoch_start[0] = time.perf_counter()
+
+        def on_epoch_end(trainer):
+            try:
+                loss = float(trainer.tloss.sum()) if getattr(trainer, 'tloss', None) is not None else 0.0
+            except (TypeError, ValueError, AttributeError):
+                loss = 0.0
+            emit({'type': 'progress', 'stage': 'epoch', 'current': trainer.epoch + 1, 'total': trainer.epochs,
+                  'loss': loss, 'seconds': time.perf_counter() - epoch_start[0]})
+            if self._stop_event.is_set():
+                trainer.stop = True
+
+        model.add_callback("on_train_epoch_start", on_epoch_start)
+        model.add_callback("on_train_epoch_end", on_epoch_end)
+
+    # ---------- 预测 ----------
+    def predict(self, config: Dict, emit: Emit) -> Dict:
+        """逐张预测；result 事件附带原始检测框 'detections'（Detections）供界面按阈值重新过滤
+
+        config['ensemble']（EnsembleConfig.to_dict()）为 TTA / 多模型集成时改为分批融合推理；
+        config['cascade']（CascadeConfig.to_dict()）启用时先由门控模型筛查，只有可疑图像才用上述方式推理；
+        config['decision']（conf / iou / max_det / rules）为写入清单的判定参数，缺省时按推理参数、有检出即 NG
+        """
+        from ..decision import MODE_SCORE, DecisionEngine, DecisionRules
+        from ..manifest import ManifestWriter
+
+        image_paths = config.get('images') or []
+        if not image_paths:
+            raise BackendError(DATA_INVALID, "没有待预测的图像")
+        decision = config.get('decision') or {}
+        conf = decision.get('conf', config['conf'])
+        iou = decision.get('iou', config['iou'])
+        max_det = decision.get('max_det', config['max_det'])
+        engine = DecisionEngine(DecisionRules.from_dict(decision['rules']) if decision.get('rules') else None)
+        floor = engine.rules.min_conf(conf)
+        threshold_value = conf if engine.rules.mode == MODE_SCORE else engine.rules.area_threshold
+
+        output_dir = config.get('output_dir') or os.path.join(RUNS_DIR, time.strftime('%Y%m%d_%H%M%S'))
+        model_info = {'backend': self.name, 'model': config['model'], 'imgsz': config['imgsz'],
+                      'ensemble': config.get('ensemble'), 'cascade': config.get('cascade'),
+                      'decision': {'conf': conf, 'iou': iou, 'max_det': max_det, 'rules': engine.rules.to_dict()}}
+        with ManifestWriter(output_dir, self.name, model_info, {'images': len(image_paths)}) as writer:
+            def on_event(event):
+                """逐张判定并写入清单（检测框按判定参数过滤后判定，分数为原始检测框的最高置信度）"""
+                if event['type'] == 'result' and 'error' in event:
+                    writer.error(event['entry']['image_path'], event['error'])
+                elif event['type'] == 'result':
+                    detections = event['detections']
+                    result = engine.decide(detections.filter(floor, iou, max_det), conf)
+                    entry = event['entry']
+                    entry.update(label=result.label,
+                                 score=round(float(detections.scores.max()), 6) if len(detections) else 0.0,
+                                 threshold_mode=engine.rules.mode, threshold_value=threshold_value)
+                    entry['raw_meta'].update(reasons=result.reasons, defect_classes=result.defect_classes,
+                                             area_ratio=result.area_ratio)
+                    writer.add(entry)
+                emit(event)
+
+            summary = self._predict(config, on_event)
+        counts = writer.batch['counts']
+        summary.update(output_dir=output_dir, manifest=writer.manifest_path, ok=counts['OK'], ng=counts['NG'])
+        return summary
+
+    def _predict(self, config: Dict, emit: Emit) -> Dict:
+        """按推理模式分发（级联 / TTA、多模型集成 / 单模型）"""
+        from ..cascade import CascadeConfig
+        from ..ensemble import EnsembleConfig
+
+        ensemble = EnsembleConfig.from_dict(config['ensemble']) if config.get('ensemble') else None
+        if ensemble is not None and ensemble.is_single:
+            ensemble = None
+        if ensemble is not None:
+            emit({'type': 'log', 'message': f"推理模式: {ensemble.describe(config['model'], config['imgsz'])}"})
+        cascade = CascadeConfig.from_dict(config['cascade']) if config.get('cascade') else None
+        # 本次任务用到的模型全部留在缓存中，逐批推理时不会互相挤出
+        used = {config['model']}
+        if ensemble is not None and ensemble.use_ensemble:
+            used.update(item['path'] for item in ensemble.models)
+        if cascade is not None and cascade.active:
+            used.add(cascade.gate_model)
+        self._cache_size = max(MAX_CACHED_MODELS, len(used))
+        if cascade is not None and cascade.active:
+            return self._predict_cascade(config, cascade, ensemble, emit)
+        return self._predict_images(config, ensemble, emit)
+
+    def _error_result(self, img_path: str, message: str) -> Dict:
+        """单张图像预测失败的 result 事件（没有检测框，'error' 为原因），其余图像照常预测"""
+        return {'type': 'result', 'error': message,
+                'entry': {'image_path': img_path, 'backend': self.name, 'raw_meta': {'inference_ms': 0.0}}}
+
+    def _predict_images(self, config: Dict, ensemble, emit: Emit) -> Dict:
+        if ensemble is not None:
+            return self._predict_ensemble(config, ensemble, emit)
+        return self._predict_single(config, emit)
+
+    def _predict_single(self, config: Dict, emit: Emit) -> Dict:
+        """逐张推理；无法读取的图像发出失败结果后继续，其余异常仍终止任务"""
+        from ..detections import Detections
+        from ..image_hash import read_image
+
+        image_paths = config['images']
+        model = self.load_model(config['model'], emit)
+        for i, img_path in enumerate(image_paths):
+            self.check_stop()
+            start = time.perf_counter()
+            try:
+                with span("首张预测" if i == 0 else "预测", self.name, image=img_path):
+                    results = model.predict(
+                        img_path,
+                        conf=config['conf'],
+                        iou=config['iou'],
+                        device=config.get('device', ''),
+                        imgsz=config['imgsz'],
+                        max_det=config['max_det'],
+                        verbose=False
+                    )
+                    detections = Detections.from_ultralytics(results[0])
+            except Exception:
+                if read_image(img_path) is not None:
+                    raise
+                emit(self._error_result(img_path, "无法读取图像"))
+                continue
+            emit({
+                'type': 'result',
+                'entry': {'image_path': img_path, 'backend': self.name,
+                          'raw_meta': {'inference_ms': round((time.perf_counter() - start) * 1000, 2),
+                                       'detections': len(detections)}},
+                'detections': detections,
+            })
+        return {'message': f"成功预测 {len(image_paths)} 张图像", 'images': len(image_paths)}
+
+    def _predict_ensemble(self, config: Dict, ensemble, emit: Emit) -> Dict:
+        """TTA / 多模型集成：每批图像的全部翻转视图一次送入模型，每个 (模型, 尺度) 一次批量前向，结果做 WBF
+
+        result 事件的 inference_ms 为整批耗时按张均摊，raw_meta 记录推理模式与每张图像的推理次数；
+        无法读取的图像发出失败结果（按输入顺序），同批其余图像照常推理
+        """
+        from ..detections import Detections
+        from ..ensemble import flip_image, unflip_boxes, weighted_boxes_fusion
+        from ..image_hash import read_image
+
+        image_paths = config['images']
+        flips = ensemble.view_flips()
+        passes = ensemble.passes(config['model'], config['imgsz'])
+        total_weight = sum(weight for _, weight, _ in passes) * len(flips)
+        description = ensemble.describe(config['model'], config['imgsz'])
+        models = {path: self.load_model(path, emit) for path, _, _ in passes}
+        for start in range(0, len(image_paths), ensemble.batch):
+            self.check_stop()
+            batch_paths = image_paths[start:start + ensemble.batch]
+            done = start + len(batch_paths)
+            batch_start = time.perf_counter()
+            chunk, images = [], []
+            for img_path in batch_paths:
+                image = read_image(img_path)
+                if image is not None:
+                    chunk.append(img_path)
+                    images.append(image)
+            if not chunk:
+                for img_path in batch_paths:
+                    emit(self._error_result(img_path, "无法读取图像"))
+                continue
+            views = [flip_image(image, flip) for image in images for flip in flips]
+            outputs: List[List[Detections]] = [[] for _ in chunk]
+            weights: List[List[float]] = [[] for _ in chunk]
+            with span("集成推理", self.name, images=len(chunk), views=len(views) * len(passes)):
+                for model_path, weight, imgsz in passes:
+                    results = models[model_path].predict(
+                        views,
+                        conf=max(config['conf'], ensemble.skip_conf),
+                        iou=min(config['iou'], ensemble.fusion_iou),
+                        device=config.get('device', ''),
+                        imgsz=imgsz,
+                        max_det=config['max_det'],
+                        verbose=False
+                    )
+                    for k, result in enumerate(results):
+                        i, flip = divmod(k, len(flips))
+                        detections = Detections.from_ultralytics(result)
+                        detections.boxes = unflip_boxes(detections.boxes, flips[flip], images[i].shape)
+                        outputs[i].append(detections)
+                        weights[i].append(weight)
+            inference_seconds = time.perf_counter() - batch_start
+            fusion_start = time.perf_counter()
+            with span("加权框融合", self.name, images=len(chunk)):
+                fused = [weighted_boxes_fusion(outputs[i], weights[i], ensemble.fusion_iou, ensemble.skip_conf,
+                                               total_weight) for i in range(len(chunk))]
+            fusion_seconds = time.perf_counter() - fusion_start
+            emit({'type': 'progress', 'stage': 'ensemble_batch', 'current': done,
+                  'total': len(image_paths), 'seconds': inference_seconds})
+            emit({'type': 'progress', 'stage': 'fusion', 'current': done,
+                  'total': len(image_paths), 'seconds': fusion_seconds})
+            per_image_ms = round((inference_seconds + fusion_seconds) * 1000 / len(chunk), 2)
+            results = dict(zip(chunk, fused))
+            for img_path in batch_paths:
+                detections = results.get(img_path)
+                if detections is None:
+                    emit(self._error_result(img_path, "无法读取图像"))
+                    continue
+                emit({
+                    'type': 'result',
+                    'entry': {'image_path': img_path, 'backend': self.name,
+                              'raw_meta': {'inference_ms': per_image_ms, 'detections': len(detections),
+                                           'mode': ensemble.mode, 'passes': len(flips) * len(passes)}},
+                    'detections': detections,
+                })
+        return {'message': f"成功预测 {len(image_paths)} 张图像（{description}）", 'images': len(image_paths)}
+
+    def _predict_cascade(self, config: Dict, cascade, ensemble, emit: Emit) -> Dict:
+        """级联：门控模型分批筛查全部图像，分数不低于升级阈值的图像再用重模型（单模型或 TTA/集成）推理
+
+        未升级的图像直接判为无检出（result 的检测框为空）；升级图像的 inference_ms 含均摊的门控耗时。
+        result 事件按输入顺序发出（未升级图像排在前面的升级图像出结果后才发出）；
+        重模型没有给出结果的升级图像（重模型推理出错或停止）发出失败的 result 事件，每张输入图像都有一个结果。
+        返回值的 'cascade' 为升级数量与每张耗时分布
+        """
+        from ..cascade import CascadeStats, gate_score
+        from ..detections import Detections
+
+        image_paths = config['images']
+        gate = self.load_model(cascade.gate_model, emit)
+        # 未升级图像的空结果使用重模型的类别表
+        names = dict(getattr(self.load_model(config['model'], emit), 'names', None) or {})
+        heavy_config = dict(config, imgsz=cascade.heavy_imgsz or config['imgsz'])
+        emit({'type': 'log', 'message': f"级联推理: 门控 {os.path.basename(cascade.gate_model)}（{cascade.gate_imgsz}），"
+                                        f"分数 ≥ {cascade.escalate_threshold:g} 时升级到 "
+                                        f"{os.path.basename(config['model'])}（{heavy_config['imgsz']}）"})
+        stats = CascadeStats()
+        for start in range(0, len(image_paths), cascade.batch):
+            self.check_stop()
+            chunk = image_paths[start:start + cascade.batch]
+            gate_start = time.perf_counter()
+            with span("门控推理", self.name, images=len(chunk)):
+                results = gate.predict(
+                    chunk,
+                    conf=cascade.gate_conf,
+                    device=config.get('device', ''),
+                    imgsz=cascade.gate_imgsz,
+                    batch=len(chunk),
+                    verbose=False
+                )
+                scores = [gate_score(result, cascade.gate_classes) for result in results]
+            gate_seconds = time.perf_counter() - gate_start
+            emit({'type': 'progress', 'stage': 'gate', 'current': start + len(chunk), 'total': len(image_paths),
+                  'seconds': gate_seconds})
+            gate_ms = round(gate_seconds * 1000 / len(chunk), 2)
+            # 按输入顺序排队的 result 事件（升级图像的位置在重模型出结果前为 None）
+            slots: List[Optional[Dict]] = []
+            escalated: Dict[str, List[int]] = {}
+            for img_path, score, result in zip(chunk, scores, results):
+                if score >= cascade.escalate_threshold:
+                    escalated.setdefault(img_path, []).append(len(slots))
+                    slots.append(None)
+                    continue
+                stats.add(gate_ms, False)
+                shape = tuple(result.orig_shape[:2]) if getattr(result, 'orig_shape', None) is not None else None
+                slots.append({
+                    'type': 'result',
+                    'entry': {'image_path': img_path, 'backend': self.name,
+                              'raw_meta': {'inference_ms': gate_ms, 'detections': 0, 'mode': 'cascade',
+                                           'escalated': False, 'gate_score': round(score, 4)}},
+                    'detections': Detections.empty(names, shape),
+                })
+            gate_scores = dict(zip(chunk, scores))
+            emitted = 0
+
+            def flush(drain=False):
+                """发出队首已就绪的事件（drain 时重模型没有给出结果的图像发出失败结果）"""
+                nonlocal emitted
+                while emitted < len(slots) and (slots[emitted] is not None or drain):
+                    event = slots[emitted]
+                    if event is None:
+                        event = self._error_result(chunk[emitted], "重模型没有给出结果")
+                        event['entry']['raw_meta'].update(inference_ms=gate_ms, mode='cascade', escalated=True,
+                                                          gate_score=round(gate_scores[chunk[emitted]], 4))
+                    emit(event)
+                    emitted += 1
+
+            def on_heavy_event(event):
+                if event['type'] != 'result':
+                    emit(event)
+                    return
+                img_path = event['entry']['image_path']
+                meta = event['entry']['raw_meta']
+                meta['inference_ms'] = round(meta['inference_ms'] + gate_ms, 2)
+                meta.update(heavy_mode=meta.get('mode', 'single'), mode='cascade', escalated=True,
+                            gate_score=round(gate_scores[img_path], 4))
+                stats.add(meta['inference_ms'], True)
+                indices = escalated.get(img_path)
+                if indices:
+                    slots[indices.pop(0)] = event
+                    flush()
+                else:
+                    emit(event)
+
+            flush()
+            if escalated:
+                try:
+                    self._predict_images(dict(heavy_config, images=[path for path in chunk if path in escalated]),
+                                         ensemble, on_heavy_event)
+                finally:
+                    flush(drain=True)
+        report = stats.describe()
+        emit({'type': 'log', 'message': report})
+        return {'message': f"成功预测 {len(image_paths)} 张图像（{report}）", 'images': len(image_paths),
+                'cascade': stats.summary()}
+
+    # ---------- 导出 ----------
+    def export(self, config: Dict, emit: Emit) -> Dict:
+        """导出为 ONNX / OpenVINO 等格式（format 取 ultralytics 的导出格式名）"""
+        model = self.load_model(config['model'], emit)
+        export_format = config.get('format', 'onnx')
+        emit({'type': 'log', 'message': f"正在导出 {export_format} 模型..."})
+        with span("导出模型", self.name, format=export_format):
+            path = model.export(format=export_format, imgsz=config.get('imgsz', 640),
+                                half=config.get('half', False), device=config.get('device') or None)
+        return {'message': f"导出完成: {path}", 'export_path': str(path)}
+
+
+class OnnxBackend(YoloBackend):
+    """ultralytics 导出的 ONNX 模型（onnxruntime 推理）"""
+
+    name = 'onnx'
+    requires = ('ultralytics', 'onnxruntime')
+
+    def train(self, config: Dict, emit: Emit) -> Dict:
+        raise BackendError(DATA_INVALID, "ONNX 模型不能用于训练，请选择 .pt 模型")
+
+    def export(self, config: Dict, emit: Emit) -> Dict:
+        raise BackendError(DATA_INVALID, "请从 .pt 模型导出")
+
+
+class OpenVinoBackend(OnnxBackend):
+    """ultralytics 导出的 OpenVINO 模型（目录 *_openvino_model）"""
+
+    name = 'openvino'
+    requires = ('ultralytics', 'openvino')
@@ -0,0 +1,40 @@
+"""
+预测管理 - 通过后端路由执行预测/导出任务，后端按模型文件类型自动选择
+"""
+from typing import Dict, Optional
+
+from .backend_router import BackendRouter, backend_for_model, get_router
+from .model_backends.base import Emit
+
+
+class PredictManager:
+    """预测任务管理（后端实例由路由缓存，连续预测同一模型时不重复加载）"""
+
+    def __init__(self, router: Optional[BackendRouter] = None):
+        self.router = router or get_router()
+        self.backend_name: Optional[str] = None
+
+    @staticmethod
+    def backend_for(model_path: str) -> str:
+        return backend_for_model(model_path)
+
+    def predict(self, config: Dict, emit: Emit) -> Dict:
+        """执行预测（阻塞），返回结束状态事件"""
+        return self._run('predict', config, emit)
+
+    def export(self, config: Dict, emit: Emit) -> Dict:
+        """导出模型（ONNX / OpenVINO 等），返回结束状态事件"""
+        return self._run('export', config, emit)
+
+    def _run(self, task: str, config: Dict, emit: Emit) -> Dict:
+        config = dict(config)
+        config.setdefault('backend', self.backend_for(config.get('model') or config.get('model_dir') or ''))
+        self.backend_name = config['backend']
+        return self.router.run(task, config, emit)
+
+    def healthcheck(self, model_path: str, refresh: bool = False):
+        return self.router.healthcheck(self.backend_for(model_path), refresh)
+
+    def stop(self):
+        if self.backend_name is not None:
+            self.router.stop(self.backend_name)
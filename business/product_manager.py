@@ -2,21 +2,49 @@
 产品管理器 - 业务逻辑层
 管理产品和缺陷类别，支持两层结构
 """
-import json
 import os
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+
+from .product_store import ProductStore, VersionConflictError, export_json, read_catalog, write_catalog
+
+
+def class_names_from_map(label_map: Dict[str, int]) -> List[str]:
+    """由 {类别名: 类别编号} 生成按编号排列的名称列表，空缺编号以 "_unused_<编号>" 占位"""
+    names = [f'_unused_{i}' for i in range(max(label_map.values(), default=-1) + 1)]
+    for name, index in label_map.items():
+        names[index] = name
+    return names
 
 
 class ProductManager:
-    """产品管理器 - 管理产品和缺陷类别"""
+    """产品管理器 - 管理产品和缺陷类别
+
+    数据持久化在 SQLite（config/products.db，WAL 模式），每次修改单独提交；
+    内存中维护 id/名称索引，查询不再线性扫描。首次运行时自动从旧版 products.json 迁移。
+    多个进程共享同一数据库时，poll()/refresh() 按变更日志增量同步，subscribe() 注册变更通知
+    """
 
-    def __init__(self, config_file='config/products.json'):
+    def __init__(self, config_file='config/products.json', db_file: Optional[str] = None):
         self.config_file = config_file
+        self.db_file = db_file or os.path.splitext(config_file)[0] + '.db'
         self.products = []  # 产品列表
         self.defect_categories = {}  # 缺陷类别字典 {product_id: [categories]}
+        self._product_index = {}  # {product_id: product}
+        self._product_names = {}  # {name: product_id}
+        self._category_index = {}  # {product_id: {category_id: category}}
+        self._category_names = {}  # {product_id: {name: category_id}}
+        self._label_maps = {}  # {product_id: (version, {name: class_index})}
+        self._last_seq = 0  # 已同步到的变更日志序号
+        self._data_version = None
+        self._pending_changes = []
+        self._listeners = []
         self._ensure_config_dir()
+        self.store = ProductStore(self.db_file)
+        self._migrate_json()
         self.load_data()
+        self._pending_changes.clear()
+        self._data_version = self.store.data_version()
 
     def _ensure_config_dir(self):
         """确保配置目录存在"""
@@ -24,74 +52,200 @@ class ProductManager:
         if config_dir and not os.path.exists(config_dir):
             os.makedirs(config_dir)
 
+    def _migrate_json(self):
+        """数据库为空且存在旧版 JSON 时导入（旧文件保留不动）"""
+        if not self.store.is_empty() or not os.path.exists(self.config_file):
+            return
+        try:
+            num_products, num_categories = self.store.import_json(self.config_file)
+            print(f"已从 {self.config_file} 迁移 {num_products} 个产品、{num_categories} 个缺陷类别")
+        except Exception as e:
+            print(f"迁移旧版数据失败: {e}")
+
     def load_data(self):
-        """加载数据"""
-        if os.path.exists(self.config_file):
-            try:
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.products = data.get('products', [])
-                    self.defect_categories = data.get('defect_categories', {})
-            except Exception as e:
-                print(f"加载数据失败: {e}")
-                self.products = []
-                self.defect_categories = {}
-        else:
-            self.products = []
-            self.defect_categories = {}
+        """加载数据并重建索引"""
+        try:
+            self._last_seq = self.store.last_change_seq()
+            self.products, self.defect_categories = self.store.load_all()
+            self._label_maps = self.store.load_label_maps()
+        except Exception as e:
+            print(f"加载数据失败: {e}")
+            self.products, self.defect_categories, self._label_maps = [], {}, {}
+        self._rebuild_index()
+        self._pending_changes.append({'entity': 'all', 'op': 'reload', 'product_id': None, 'local': True})
+
+    def _rebuild_index(self):
+        self._product_index = {p['id']: p for p in self.products}
+        self._product_names = {p['name']: p['id'] for p in self.products}
+        self._category_index = {}
+        self._category_names = {}
+        for product_id, categories in self.defect_categories.items():
+            self._category_index[product_id] = {c['id']: c for c in categories}
+            self._category_names[product_id] = {c['name']: c['id'] for c in categories}
+
+    def save_data(self, json_file: Optional[str] = None) -> bool:
+        """导出 JSON 快照（原子写入，默认写到 config_file）；修改操作已实时写入数据库，无需调用"""
+        return export_json(json_file or self.config_file, self.products, self.defect_categories,
+                           datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
 
-    def save_data(self):
-        """保存数据"""
+    def _run(self, write, default=False):
+        """在一个数据库事务内执行修改（可包含多步），失败时回滚并从数据库重新加载内存数据"""
         try:
-            data = {
-                'products': self.products,
-                'defect_categories': self.defect_categories,
-                'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            return True
+            with self.store.transaction():
+                # 持有写锁后先同步其他进程的修改，保证名称查重等检查基于最新数据
+                self._pull_changes()
+                result = write()
+        except VersionConflictError as e:
+            print(f"数据已被其他程序修改: {e}")
+            self.load_data()
+            result = default
         except Exception as e:
             print(f"保存数据失败: {e}")
-            return False
+            self.load_data()
+            result = default
+        self.refresh()
+        return result
+
+    # 多进程同步与变更通知
+    def subscribe(self, callback):
+        """注册变更回调 callback(changes)，changes 为变更记录列表（entity 为 'all' 表示整体重新加载）"""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def poll(self) -> List[Dict]:
+        """低成本检查其他进程是否提交过修改，有则增量同步；适合由定时器周期调用"""
+        data_version = self.store.data_version()
+        if data_version == self._data_version:
+            return []
+        self._data_version = data_version
+        return self.refresh()
+
+    def refresh(self) -> List[Dict]:
+        """增量同步上次同步以来的全部修改（本进程及其他进程），通知订阅者并返回变更记录"""
+        try:
+            self._pull_changes()
+        except Exception as e:
+            print(f"同步数据失败: {e}")
+        changes, self._pending_changes = self._pending_changes, []
+        if changes:
+            for callback in list(self._listeners):
+                try:
+                    callback(changes)
+                except Exception as e:
+                    print(f"变更通知处理失败: {e}")
+        return changes
+
+    def _pull_changes(self):
+        changes = self.store.changes_since(self._last_seq)
+        if changes is None:
+            # 落后太多，变更日志已被清理
+            self.load_data()
+            return
+        if not changes:
+            return
+        self._last_seq = changes[-1]['seq']
+        for product_id in dict.fromkeys(c['product_id'] for c in changes):
+            self._reload_product(product_id)
+        self._pending_changes.extend(changes)
+
+    def _reload_product(self, product_id: int):
+        """从数据库重新读取单个产品及其类别、类别映射，只更新受影响的索引"""
+        product, categories = self.store.load_product(product_id)
+        old = self._product_index.pop(product_id, None)
+        if old is not None:
+            self._product_names.pop(old['name'], None)
+        if product is None:
+            if old is not None:
+                self.products.remove(old)
+        elif old is not None:
+            old.clear()
+            old.update(product)
+            product = old
+        elif not self.products or self.products[-1]['id'] < product_id:
+            self.products.append(product)
+        else:
+            position = next(i for i, p in enumerate(self.products) if p['id'] > product_id)
+            self.products.insert(position, product)
+        if product is not None:
+            self._product_index[product_id] = product
+            self._product_names[product['name']] = product_id
+
+        if product is None and not categories:
+            self.defect_categories.pop(product_id, None)
+            self._category_index.pop(product_id, None)
+            self._category_names.pop(product_id, None)
+            self._label_maps.pop(product_id, None)
+            return
+        self.defect_categories[product_id] = categories
+        self._category_index[product_id] = {c['id']: c for c in categories}
+        self._category_names[product_id] = {c['name']: c['id'] for c in categories}
+        self._label_maps[product_id] = self.store.load_label_map(product_id)
 
     # 产品管理方法
     def add_product(self, name: str, description: str = '', path: str = '') -> bool:
         """添加产品"""
-        if self.product_exists(name):
-            return False
+        return self._run(lambda: self._add_product(name, description, path) is not None)
 
+    def update_product(self, product_id: int, name: str, description: str = '', path: str = None,
+                       expected_version: Optional[int] = None) -> bool:
+        """更新产品；传入 expected_version（取自 get_product_by_id 的 'version'）时，若期间已被其他工作站修改则失败"""
+        return self._run(lambda: self._update_product(product_id, name, description, path, expected_version))
+
+    def delete_product(self, product_id: int) -> bool:
+        """删除产品"""
+        return self._run(lambda: self._delete_product(product_id) or True)
+
+    def _add_product(self, name: str, description: str, path: str) -> Optional[Dict]:
+        if not name or self.product_exists(name):
+            return None
         product = {
-            'id': len(self.products),
+            'id': self.store.next_id('product', max(self._product_index, default=-1) + 1),
             'name': name,
             'description': description,
             'path': path,
             'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
+        self.store.insert_product(product)
         self.products.append(product)
         self.defect_categories[product['id']] = []
-        return self.save_data()
+        self._product_index[product['id']] = product
+        self._product_names[name] = product['id']
+        self._category_index[product['id']] = {}
+        self._category_names[product['id']] = {}
+        return product
 
-    def update_product(self, product_id: int, name: str, description: str = '', path: str = None) -> bool:
-        """更新产品"""
-        for product in self.products:
-            if product['id'] == product_id:
-                if name != product['name'] and self.product_exists(name):
-                    return False
-                product['name'] = name
-                product['description'] = description
-                if path is not None:
-                    product['path'] = path
-                product['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                return self.save_data()
-        return False
+    def _update_product(self, product_id: int, name: str, description: str, path: Optional[str],
+                        expected_version: Optional[int] = None) -> bool:
+        product = self._product_index.get(product_id)
+        if product is None or not name:
+            return False
+        if name != product['name'] and self.product_exists(name):
+            return False
+        updated = dict(product, name=name, description=description,
+                       updated_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        if path is not None:
+            updated['path'] = path
+        updated['version'] = self.store.update_product(updated, expected_version)
+        del self._product_names[product['name']]
+        product.update(updated)
+        self._product_names[name] = product_id
+        return True
 
-    def delete_product(self, product_id: int) -> bool:
-        """删除产品"""
-        self.products = [p for p in self.products if p['id'] != product_id]
-        if product_id in self.defect_categories:
-            del self.defect_categories[product_id]
-        return self.save_data()
+    def _delete_product(self, product_id: int) -> bool:
+        self.store.delete_product(product_id)
+        product = self._product_index.pop(product_id, None)
+        if product is not None:
+            self.products.remove(product)
+            self._product_names.pop(product['name'], None)
+        self.defect_categories.pop(product_id, None)
+        self._category_index.pop(product_id, None)
+        self._category_names.pop(product_id, None)
+        self._label_maps.pop(product_id, None)
+        return product is not None
 
     def get_products(self) -> List[Dict]:
         """获取所有产品"""
@@ -99,14 +253,12 @@ class ProductManager:
 
     def get_product_by_id(self, product_id: int) -> Optional[Dict]:
         """根据ID获取产品"""
-        for product in self.products:
-            if product['id'] == product_id:
-                return product.copy()
-        return None
+        product = self._product_index.get(product_id)
+        return product.copy() if product is not None else None
 
     def product_exists(self, name: str) -> bool:
         """检查产品是否存在"""
-        return any(p['name'] == name for p in self.products)
+        return name in self._product_names
 
     def get_product_count(self) -> int:
         """获取产品数量"""
@@ -115,45 +267,62 @@ class ProductManager:
     # 缺陷类别管理方法
     def add_defect_category(self, product_id: int, name: str, description: str = '') -> bool:
         """添加缺陷类别"""
-        if product_id not in self.defect_categories:
-            self.defect_categories[product_id] = []
+        return self._run(lambda: self._add_defect_category(product_id, name, description) is not None)
 
-        if self.defect_category_exists(product_id, name):
-            return False
+    def update_defect_category(self, product_id: int, category_id: int, name: str, description: str = '',
+                               expected_version: Optional[int] = None) -> bool:
+        """更新缺陷类别；expected_version 的含义同 update_product"""
+        return self._run(lambda: self._update_defect_category(product_id, category_id, name, description,
+                                                              expected_version))
 
+    def delete_defect_category(self, product_id: int, category_id: int) -> bool:
+        """删除缺陷类别"""
+        return self._run(lambda: self._delete_defect_category(product_id, category_id))
+
+    def _add_defect_category(self, product_id: int, name: str, description: str) -> Optional[Dict]:
+        if not name or self.defect_category_exists(product_id, name):
+            return None
+        index = self._category_index.setdefault(product_id, {})
         category = {
-            'id': len(self.defect_categories[product_id]),
+            'id': self.store.next_id(f'category:{product_id}', max(index, default=-1) + 1),
             'name': name,
             'description': description,
             'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
-        self.defect_categories[product_id].append(category)
-        return self.save_data()
+        self.store.insert_category(product_id, category)
+        self._label_maps[product_id] = self.store.load_label_map(product_id)
+        self.defect_categories.setdefault(product_id, []).append(category)
+        index[category['id']] = category
+        self._category_names.setdefault(product_id, {})[name] = category['id']
+        return category
 
-    def update_defect_category(self, product_id: int, category_id: int, name: str, description: str = '') -> bool:
-        """更新缺陷类别"""
-        if product_id not in self.defect_categories:
+    def _update_defect_category(self, product_id: int, category_id: int, name: str, description: str,
+                                expected_version: Optional[int] = None) -> bool:
+        category = self._category_index.get(product_id, {}).get(category_id)
+        if category is None or not name:
             return False
-
-        for cat in self.defect_categories[product_id]:
-            if cat['id'] == category_id:
-                if name != cat['name'] and self.defect_category_exists(product_id, name):
-                    return False
-                cat['name'] = name
-                cat['description'] = description
-                cat['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                return self.save_data()
-        return False
-
-    def delete_defect_category(self, product_id: int, category_id: int) -> bool:
-        """删除缺陷类别"""
-        if product_id not in self.defect_categories:
+        if name != category['name'] and self.defect_category_exists(product_id, name):
             return False
+        updated = dict(category, name=name, description=description,
+                       updated_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        updated['version'] = self.store.update_category(product_id, updated, old_name=category['name'],
+                                                        expected_version=expected_version)
+        self._label_maps[product_id] = self.store.load_label_map(product_id)
+        names = self._category_names[product_id]
+        del names[category['name']]
+        category.update(updated)
+        names[name] = category_id
+        return True
 
-        self.defect_categories[product_id] = [
-            cat for cat in self.defect_categories[product_id] if cat['id'] != category_id
-        ]
-        return self.save_data()
+    def _delete_defect_category(self, product_id: int, category_id: int) -> bool:
+        category = self._category_index.get(product_id, {}).get(category_id)
+        if category is None:
+            return False
+        self.store.delete_category(product_id, category_id)
+        self.defect_categories[product_id].remove(category)
+        del self._category_index[product_id][category_id]
+        self._category_names[product_id].pop(category['name'], None)
+        return True
 
     def get_defect_categories(self, product_id: int) -> List[Dict]:
         """获取产品的缺陷类别"""
@@ -165,9 +334,7 @@ class ProductManager:
 
     def defect_category_exists(self, product_id: int, name: str) -> bool:
         """检查缺陷类别是否存在"""
-        if product_id not in self.defect_categories:
-            return False
-        return any(cat['name'] == name for cat in self.defect_categories[product_id])
+        return name in self._category_names.get(product_id, {})
 
     def get_defect_category_count(self, product_id: int) -> int:
         """获取产品的缺陷类别数量"""
@@ -175,11 +342,11 @@ class ProductManager:
 
     # 兼容性方法 - 用于标注工具
     def get_category_names(self) -> List[str]:
-        """获取所有缺陷类别名称（用于标注工具）"""
-        all_categories = []
+        """获取所有缺陷类别名称（用于标注工具，跨产品同名类别只保留一个）"""
+        all_categories = {}
         for product_id in self.defect_categories:
-            all_categories.extend(self.get_defect_category_names(product_id))
-        return all_categories
+            all_categories.update(dict.fromkeys(self.get_defect_category_names(product_id)))
+        return list(all_categories)
 
     def get_category_count(self) -> int:
         """获取所有缺陷类别数量（用于标注工具）"""
@@ -188,6 +355,24 @@ class ProductManager:
             total += len(self.defect_categories[product_id])
         return total
 
+    # 类别映射 - 每个产品独立的 类别名 -> 类别编号，编号单调分配且不回收，供制作数据集/训练使用
+    def get_label_map(self, product_id: int, include_retired: bool = False) -> Dict[str, int]:
+        """获取产品的类别映射 {类别名: 类别编号}；默认只含现有类别，include_retired 时包含已删除类别保留的编号"""
+        mapping = self._label_maps.get(product_id, (0, {}))[1]
+        if include_retired:
+            return dict(mapping)
+        active = self._category_names.get(product_id, {})
+        return {name: index for name, index in mapping.items() if name in active}
+
+    def get_label_map_version(self, product_id: int) -> int:
+        """类别映射版本号，编号分配或类别改名时递增"""
+        return self._label_maps.get(product_id, (0, {}))[0]
+
+    def get_class_names(self, product_id: int) -> List[str]:
+        """按类别编号排列的类别名称列表（含已删除类别的保留位，保证编号与下标一致）"""
+        mapping = self._label_maps.get(product_id, (0, {}))[1]
+        return class_names_from_map(mapping)
+
     # 获取产品-缺陷类别映射
     def get_product_defect_mapping(self) -> Dict[str, List[str]]:
         """获取产品-缺陷类别映射"""
@@ -198,3 +383,81 @@ class ProductManager:
             mapping[product_name] = defect_names
         return mapping
 
+    # 批量操作 - 每次调用只产生一个事务
+    def add_products(self, products: List[Dict]) -> int:
+        """批量添加产品 [{'name', 'description', 'path'}]，名称已存在的跳过，返回新增数量"""
+        return self._run(lambda: sum(
+            self._add_product(p.get('name', ''), p.get('description', ''), p.get('path', '')) is not None
+            for p in products
+        ), 0)
+
+    def update_products(self, products: List[Dict]) -> int:
+        """批量更新产品 [{'id', 'name', 'description', 'path'}]，返回成功数量"""
+        return self._run(lambda: sum(
+            self._update_product(p['id'], p.get('name', ''), p.get('description', ''), p.get('path'))
+            for p in products
+        ), 0)
+
+    def delete_products(self, product_ids: List[int]) -> int:
+        """批量删除产品（连同其缺陷类别），返回删除数量"""
+        return self._run(lambda: sum(self._delete_product(pid) for pid in product_ids), 0)
+
+    def add_defect_categories(self, product_id: int, categories: List) -> int:
+        """批量添加缺陷类别，元素为名称或 {'name', 'description'}，已存在的跳过，返回新增数量"""
+        items = [{'name': c} if isinstance(c, str) else c for c in categories]
+        return self._run(lambda: sum(
+            self._add_defect_category(product_id, c.get('name', ''), c.get('description', '')) is not None
+            for c in items
+        ), 0)
+
+    def update_defect_categories(self, product_id: int, categories: List[Dict]) -> int:
+        """批量更新缺陷类别 [{'id', 'name', 'description'}]，返回成功数量"""
+        return self._run(lambda: sum(
+            self._update_defect_category(product_id, c['id'], c.get('name', ''), c.get('description', ''))
+            for c in categories
+        ), 0)
+
+    def delete_defect_categories(self, product_id: int, category_ids: List[int]) -> int:
+        """批量删除缺陷类别，返回删除数量"""
+        return self._run(lambda: sum(self._delete_defect_category(product_id, cid) for cid in category_ids), 0)
+
+    # 导入导出
+    def import_catalog(self, file_path: str) -> Tuple[bool, str]:
+        """从 CSV/JSON 导入产品目录（单个事务）；已存在的产品只补充缺失的缺陷类别"""
+        try:
+            catalog = read_catalog(file_path)
+        except Exception as e:
+            return False, f"读取文件失败: {str(e)}"
+
+        def write():
+            added_products = 0
+            added_categories = 0
+            for item in catalog:
+                name = item['name']
+                if not self.product_exists(name):
+                    if self._add_product(name, item.get('description', ''), item.get('path', '')) is None:
+                        continue
+                    added_products += 1
+                product_id = self._product_names[name]
+                for category in item.get('defect_categories', []):
+                    if self._add_defect_category(product_id, category['name'],
+                                                 category.get('description', '')) is not None:
+                        added_categories += 1
+            return added_products, added_categories
+
+        result = self._run(write, None)
+        if result is None:
+            return False, "导入失败，数据未做任何修改"
+        return True, f"共读取 {len(catalog)} 个产品，新增 {result[0]} 个产品、{result[1]} 个缺陷类别"
+
+    def export_catalog(self, file_path: str) -> Tuple[bool, str]:
+        """导出产品目录为 CSV/JSON（按扩展名判断）"""
+        catalog = [
+            dict(product, defect_categories=self.defect_categories.get(product['id'], []))
+            for product in self.products
+        ]
+        try:
+            write_catalog(file_path, catalog)
+        except Exception as e:
+            return False, f"导出失败: {str(e)}"
+        return True, f"已导出 {len(catalog)} 个产品到: {file_path}"
@@ -0,0 +1,29 @@
+"""
+按产品保存的设置文件 - {'products': {产品: 设置}, 'updated_at': ...}
+
+推理模式（config/inference_modes.json）、级联（config/cascade.json）等按产品区分的设置共用
+"""
+import json
+import os
+from datetime import datetime
+from typing import Dict
+
+
+def read_product_settings(path: str) -> Dict[str, Dict]:
+    """读取全部产品的设置（文件不存在时为空）"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('products', {})
+
+
+def save_product_settings(path: str, product_id, settings: Dict):
+    """写入一个产品的设置（保留其他产品的设置，先写临时文件再替换）"""
+    products = read_product_settings(path)
+    products[str(product_id)] = settings
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    data = {'products': products, 'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+    tmp_file = path + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, path)
@@ -0,0 +1,484 @@
+"""
+产品数据存储 - SQLite（WAL 模式）持久化产品与缺陷类别
+每次修改在一个事务内提交，崩溃时不会留下写了一半的数据
+"""
+import csv
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+SCHEMA_VERSION = 3
+# 变更日志保留条数，落后更多的读取方整体重新加载
+CHANGE_LOG_KEEP = 10000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    description TEXT NOT NULL DEFAULT '',
+    path TEXT NOT NULL DEFAULT '',
+    created_at TEXT,
+    updated_at TEXT,
+    version INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS defect_categories (
+    product_id INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    created_at TEXT,
+    updated_at TEXT,
+    version INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (product_id, id),
+    UNIQUE (product_id, name)
+);
+CREATE TABLE IF NOT EXISTS sequences (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS label_maps (
+    product_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    class_index INTEGER NOT NULL,
+    PRIMARY KEY (product_id, name),
+    UNIQUE (product_id, class_index)
+);
+CREATE TABLE IF NOT EXISTS label_map_versions (
+    product_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    entity TEXT NOT NULL,
+    product_id INTEGER NOT NULL,
+    item_id INTEGER,
+    op TEXT NOT NULL,
+    origin TEXT,
+    changed_at TEXT
+);
+"""
+
+_PRODUCT_COLUMNS = ('id', 'name', 'description', 'path', 'created_at', 'updated_at')
+_CATEGORY_COLUMNS = ('id', 'name', 'description', 'created_at', 'updated_at')
+
+
+class VersionConflictError(Exception):
+    """乐观并发冲突：记录已被其他进程修改或删除"""
+
+
+class ProductStore:
+    """产品/缺陷类别的 SQLite 存储
+
+    只负责持久化，内存索引由 ProductManager 维护；
+    transaction() 可嵌套，最外层退出时统一提交，批量操作只产生一次磁盘同步。
+    多个进程（多台工作站共享配置目录、labelme、后台任务）可同时打开同一数据库：
+    写入通过 SQLite 事务串行化，每次修改记入 change_log，供其他进程增量同步
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.origin = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._lock = threading.RLock()
+        self._depth = 0
+        self.conn = sqlite3.connect(db_file, isolation_level=None, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_SCHEMA)
+        self._upgrade()
+
+    def _upgrade(self):
+        """升级旧版数据库结构"""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        version = int(row[0]) if row else SCHEMA_VERSION
+        with self.transaction() as conn:
+            if version < 2:
+                # 按现有类别编号顺序建立类别映射
+                for product_id, name in conn.execute(
+                    'SELECT product_id, name FROM defect_categories ORDER BY product_id, id'
+                ).fetchall():
+                    self._assign_class(product_id, name)
+            if version < 3:
+                for table in ('products', 'defect_categories'):
+                    columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+                    if 'version' not in columns:
+                        conn.execute(f'ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+            conn.execute('DELETE FROM change_log WHERE seq <= (SELECT MAX(seq) FROM change_log) - ?',
+                         (CHANGE_LOG_KEEP,))
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)",
+                         (str(SCHEMA_VERSION),))
+
+    def close(self):
+        self.conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """事务上下文，异常时整体回滚"""
+        with self._lock:
+            if self._depth == 0:
+                self.conn.execute('BEGIN IMMEDIATE')
+            self._depth += 1
+            try:
+                yield self.conn
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.conn.execute('ROLLBACK')
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self.conn.execute('COMMIT')
+
+    def data_version(self) -> int:
+        """其他连接提交修改后该值会变化，可用于低成本轮询"""
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def last_change_seq(self) -> int:
+        return self.conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+
+    def changes_since(self, seq: int) -> Optional[List[Dict]]:
+        """seq 之后的变更记录；日志已被清理到 seq 之后时返回 None（需整体重新加载）"""
+        oldest = self.conn.execute('SELECT MIN(seq) FROM change_log').fetchone()[0]
+        if oldest is not None and oldest > seq + 1 and seq < self.last_change_seq():
+            return None
+        return [
+            {'seq': row[0], 'entity': row[1], 'product_id': row[2], 'item_id': row[3], 'op': row[4],
+             'origin': row[5], 'local': row[5] == self.origin}
+            for row in self.conn.execute(
+                'SELECT seq, entity, product_id, item_id, op, origin FROM change_log WHERE seq > ? ORDER BY seq',
+                (seq,),
+            )
+        ]
+
+    def _log(self, entity: str, product_id: int, item_id: Optional[int], op: str):
+        self.conn.execute(
+            'INSERT INTO change_log (entity, product_id, item_id, op, origin, changed_at) '
+            "VALUES (?, ?, ?, ?, ?, datetime('now', 'localtime'))",
+            (entity, product_id, item_id, op, self.origin),
+        )
+
+    def is_empty(self) -> bool:
+        row = self.conn.execute(
+            'SELECT (SELECT COUNT(*) FROM products) + (SELECT COUNT(*) FROM defect_categories)'
+        ).fetchone()
+        return row[0] == 0
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+    def load_all(self) -> Tuple[List[Dict], Dict[int, List[Dict]]]:
+        """读取全部产品与缺陷类别"""
+        columns = _PRODUCT_COLUMNS + ('version',)
+        products = [_row_to_dict(columns, row) for row in self.conn.execute(
+            f"SELECT {', '.join(columns)} FROM products ORDER BY id"
+        )]
+        categories: Dict[int, List[Dict]] = {p['id']: [] for p in products}
+        columns = _CATEGORY_COLUMNS + ('version',)
+        for row in self.conn.execute(
+            f"SELECT product_id, {', '.join(columns)} FROM defect_categories ORDER BY product_id, id"
+        ):
+            categories.setdefault(row[0], []).append(_row_to_dict(columns, row[1:]))
+        return products, categories
+
+    def load_product(self, product_id: int) -> Tuple[Optional[Dict], List[Dict]]:
+        """读取单个产品及其缺陷类别，产品不存在时为 (None, 类别)"""
+        columns = _PRODUCT_COLUMNS + ('version',)
+        row = self.conn.execute(f"SELECT {', '.join(columns)} FROM products WHERE id = ?",
+                                (product_id,)).fetchone()
+        columns = _CATEGORY_COLUMNS + ('version',)
+        categories = [_row_to_dict(columns, r) for r in self.conn.execute(
+            f"SELECT {', '.join(columns)} FROM defect_categories WHERE product_id = ? ORDER BY id", (product_id,)
+        )]
+        return (_row_to_dict(_PRODUCT_COLUMNS + ('version',), row) if row else None), categories
+
+    def load_label_maps(self) -> Dict[int, Tuple[int, Dict[str, int]]]:
+        """读取全部产品的类别映射 {product_id: (版本, {类别名: 类别编号})}"""
+        maps: Dict[int, Tuple[int, Dict[str, int]]] = {}
+        versions = dict(self.conn.execute('SELECT product_id, version FROM label_map_versions'))
+        for product_id, name, class_index in self.conn.execute(
+            'SELECT product_id, name, class_index FROM label_maps ORDER BY product_id, class_index'
+        ):
+            maps.setdefault(product_id, (versions.get(product_id, 0), {}))[1][name] = class_index
+        return maps
+
+    def load_label_map(self, product_id: int) -> Tuple[int, Dict[str, int]]:
+        """读取单个产品的类别映射 (版本, {类别名: 类别编号})"""
+        row = self.conn.execute('SELECT version FROM label_map_versions WHERE product_id = ?',
+                                (product_id,)).fetchone()
+        mapping = dict(self.conn.execute(
+            'SELECT name, class_index FROM label_maps WHERE product_id = ? ORDER BY class_index', (product_id,)
+        ))
+        return (row[0] if row else 0), mapping
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def next_id(self, sequence: str, floor: int = 0) -> int:
+        """从单调递增序列取下一个编号（删除后不复用），floor 为调用方已知的最小可用编号"""
+        with self.transaction() as conn:
+            row = conn.execute('SELECT value FROM sequences WHERE name = ?', (sequence,)).fetchone()
+            value = max(row[0] if row else 0, floor)
+            conn.execute('INSERT OR REPLACE INTO sequences (name, value) VALUES (?, ?)', (sequence, value + 1))
+            return value
+
+    def _assign_class(self, product_id: int, name: str) -> bool:
+        """类别名首次出现时分配下一个类别编号（编号不回收），返回是否新分配"""
+        conn = self.conn
+        if conn.execute('SELECT 1 FROM label_maps WHERE product_id = ? AND name = ?',
+                        (product_id, name)).fetchone():
+            return False
+        next_index = conn.execute('SELECT COALESCE(MAX(class_index) + 1, 0) FROM label_maps WHERE product_id = ?',
+                                  (product_id,)).fetchone()[0]
+        conn.execute('INSERT INTO label_maps (product_id, name, class_index) VALUES (?, ?, ?)',
+                     (product_id, name, next_index))
+        self._bump_label_version(product_id)
+        return True
+
+    def _bump_label_version(self, product_id: int):
+        self.conn.execute(
+            'INSERT INTO label_map_versions (product_id, version) VALUES (?, 1) '
+            'ON CONFLICT(product_id) DO UPDATE SET version = version + 1',
+            (product_id,),
+        )
+        self._log('label_map', product_id, None, 'update')
+
+    def insert_product(self, product: Dict):
+        with self.transaction() as conn:
+            conn.execute(
+                'INSERT INTO products (id, name, description, path, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                tuple(product.get(c, '' if c in ('description', 'path') else None) for c in _PRODUCT_COLUMNS),
+            )
+            self._log('product', product['id'], None, 'insert')
+
+    def update_product(self, product: Dict, expected_version: Optional[int] = None) -> int:
+        """更新产品并返回新版本号；expected_version 与库中版本不一致时抛出 VersionConflictError"""
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE products SET name = ?, description = ?, path = ?, updated_at = ?, version = version + 1 '
+                'WHERE id = ? AND (? IS NULL OR version = ?)',
+                (product['name'], product.get('description', ''), product.get('path', ''),
+                 product.get('updated_at'), product['id'], expected_version, expected_version),
+            )
+            if cursor.rowcount == 0:
+                raise VersionConflictError(f"产品 {product['id']} 已被修改或删除")
+            self._log('product', product['id'], None, 'update')
+            return conn.execute('SELECT version FROM products WHERE id = ?', (product['id'],)).fetchone()[0]
+
+    def delete_product(self, product_id: int):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM products WHERE id = ?', (product_id,))
+            conn.execute('DELETE FROM defect_categories WHERE product_id = ?', (product_id,))
+            conn.execute('DELETE FROM label_maps WHERE product_id = ?', (product_id,))
+            conn.execute('DELETE FROM label_map_versions WHERE product_id = ?', (product_id,))
+            self._log('product', product_id, None, 'delete')
+
+    def insert_category(self, product_id: int, category: Dict):
+        """插入缺陷类别，类别名首次出现时同时分配类别编号"""
+        with self.transaction() as conn:
+            conn.execute(
+                'INSERT INTO defect_categories (product_id, id, name, description, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (product_id,) + tuple(category.get(c, '' if c == 'description' else None)
+                                      for c in _CATEGORY_COLUMNS),
+            )
+            self._assign_class(product_id, category['name'])
+            self._log('category', product_id, category['id'], 'insert')
+
+    def update_category(self, product_id: int, category: Dict, old_name: Optional[str] = None,
+                        expected_version: Optional[int] = None) -> int:
+        """更新缺陷类别并返回新版本号；改名时类别编号随之转移（新名称已有编号时沿用新名称的编号）"""
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE defect_categories SET name = ?, description = ?, updated_at = ?, version = version + 1 '
+                'WHERE product_id = ? AND id = ? AND (? IS NULL OR version = ?)',
+                (category['name'], category.get('description', ''), category.get('updated_at'),
+                 product_id, category['id'], expected_version, expected_version),
+            )
+            if cursor.rowcount == 0:
+                raise VersionConflictError(f"缺陷类别 {category['id']} 已被修改或删除")
+            if old_name is not None and old_name != category['name']:
+                taken = conn.execute('SELECT 1 FROM label_maps WHERE product_id = ? AND name = ?',
+                                     (product_id, category['name'])).fetchone()
+                if taken:
+                    self._bump_label_version(product_id)
+                else:
+                    conn.execute('UPDATE label_maps SET name = ? WHERE product_id = ? AND name = ?',
+                                 (category['name'], product_id, old_name))
+                    if not self._assign_class(product_id, category['name']):
+                        self._bump_label_version(product_id)
+            self._log('category', product_id, category['id'], 'update')
+            return conn.execute('SELECT version FROM defect_categories WHERE product_id = ? AND id = ?',
+                                (product_id, category['id'])).fetchone()[0]
+
+    def delete_category(self, product_id: int, category_id: int):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM defect_categories WHERE product_id = ? AND id = ?',
+                         (product_id, category_id))
+            self._log('category', product_id, category_id, 'delete')
+
+    # ------------------------------------------------------------------
+    # 迁移与导出
+    # ------------------------------------------------------------------
+    def import_json(self, json_file: str) -> Tuple[int, int]:
+        """从旧版 products.json 迁移，返回 (产品数, 缺陷类别数)
+
+        旧文件中 defect_categories 的键为字符串，且可能出现重复键；
+        重复键下的类别会合并，编号冲突时顺延，同名类别只保留一个
+        """
+        with open(json_file, 'r', encoding='utf-8') as f:
+            data = json.load(f, object_pairs_hook=_merge_duplicate_keys)
+
+        products = data.get('products', [])
+        categories = data.get('defect_categories', {})
+        num_categories = 0
+        with self.transaction():
+            for product in products:
+                product = dict(product, id=int(product['id']))
+                self.insert_product(product)
+            for key, items in categories.items():
+                product_id = int(key)
+                used_ids = set()
+                used_names = set()
+                for category in items:
+                    if category.get('name') in used_names:
+                        continue
+                    category = dict(category)
+                    category_id = int(category.get('id', 0))
+                    while category_id in used_ids:
+                        category_id += 1
+                    category['id'] = category_id
+                    used_ids.add(category_id)
+                    used_names.add(category['name'])
+                    self.insert_category(product_id, category)
+                    num_categories += 1
+        return len(products), num_categories
+
+
+def export_json(json_file: str, products: List[Dict], categories: Dict[int, List[Dict]],
+                updated_at: Optional[str] = None) -> bool:
+    """原子写出 JSON 快照（先写临时文件再替换）"""
+    try:
+        data = {
+            'products': products,
+            'defect_categories': {str(k): v for k, v in categories.items()},
+        }
+        if updated_at:
+            data['updated_at'] = updated_at
+        tmp_file = json_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, json_file)
+        return True
+    except Exception as e:
+        print(f"导出数据失败: {e}")
+        return False
+
+
+CATALOG_CSV_COLUMNS = ('product', 'product_description', 'product_path', 'category', 'category_description')
+
+
+def read_catalog(file_path: str) -> List[Dict]:
+    """读取产品目录 [{'name', 'description', 'path', 'defect_categories': [{'name', 'description'}]}]
+
+    JSON: {"products": [...]}（与 write_catalog 输出一致）或 products.json 旧格式；
+    CSV: 每行一个缺陷类别（category 为空表示只有产品），列见 CATALOG_CSV_COLUMNS
+    """
+    catalog: Dict[str, Dict] = {}
+
+    def entry(name: str, description: str = '', path: str = '') -> Dict:
+        if name not in catalog:
+            catalog[name] = {'name': name, 'description': description, 'path': path, 'defect_categories': []}
+        return catalog[name]
+
+    if file_path.lower().endswith('.csv'):
+        with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+            for row in csv.DictReader(f):
+                name = (row.get('product') or '').strip()
+                if not name:
+                    continue
+                item = entry(name, row.get('product_description') or '', row.get('product_path') or '')
+                category = (row.get('category') or '').strip()
+                if category:
+                    item['defect_categories'].append(
+                        {'name': category, 'description': row.get('category_description') or ''}
+                    )
+        return list(catalog.values())
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f, object_pairs_hook=_merge_duplicate_keys)
+    legacy = data.get('defect_categories', {}) if isinstance(data, dict) else {}
+    for product in data.get('products', []) if isinstance(data, dict) else data:
+        name = str(product.get('name', '')).strip()
+        if not name:
+            continue
+        item = entry(name, product.get('description', ''), product.get('path', ''))
+        categories = product.get('defect_categories')
+        if categories is None:
+            categories = legacy.get(str(product.get('id')), [])
+        for category in categories:
+            category = {'name': category} if isinstance(category, str) else category
+            if category.get('name'):
+                item['defect_categories'].append(
+                    {'name': category['name'], 'description': category.get('description', '')}
+                )
+    return list(catalog.values())
+
+
+def write_catalog(file_path: str, catalog: List[Dict]):
+    """写出产品目录（格式按扩展名），先写临时文件再替换"""
+    tmp_file = file_path + '.tmp'
+    if file_path.lower().endswith('.csv'):
+        with open(tmp_file, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(CATALOG_CSV_COLUMNS)
+            for product in catalog:
+                base = [product['name'], product.get('description', ''), product.get('path', '')]
+                categories = product.get('defect_categories', [])
+                if not categories:
+                    writer.writerow(base + ['', ''])
+                for category in categories:
+                    writer.writerow(base + [category['name'], category.get('description', '')])
+    else:
+        data = {'products': [
+            {
+                'name': product['name'],
+                'description': product.get('description', ''),
+                'path': product.get('path', ''),
+                'defect_categories': [
+                    {'name': c['name'], 'description': c.get('description', '')}
+                    for c in product.get('defect_categories', [])
+                ],
+            }
+            for product in catalog
+        ]}
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, file_path)
+
+
+def _row_to_dict(columns, row) -> Dict:
+    """行转字典，updated_at 为空时省略（与旧版 JSON 结构一致）"""
+    item = dict(zip(columns, row))
+    if item.get('updated_at') is None:
+        item.pop('updated_at', None)
+    return item
+
+
+def _merge_duplicate_keys(pairs) -> Dict:
+    """json 解析钩子：重复键的列表值合并而不是后者覆盖前者"""
+    result = {}
+    for key, value in pairs:
+        if key in result and isinstance(result[key], list) and isinstance(value, list):
+            result[key] = result[key] + value
+        else:
+            result[key] = value
+    return result
@@ -0,0 +1,244 @@
+"""
+启动/运行耗时统计 - 记录各阶段耗时与首次导入的模块耗时，生成文本报告便于发现启动变慢
+
+只在设置环境变量 SLDMV_PROFILE（或启动参数 --profile）时记录：打印启动耗时报告，记录全部嵌套导入，
+并导出 Chrome trace-event JSON，可在 chrome://tracing 或 https://ui.perfetto.dev 中查看；
+未开启时 span/record 不做任何记录
+"""
+import builtins
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional, Sequence
+
+PROFILE_ENV = 'SLDMV_PROFILE'
+PROFILE_ARG = '--profile'
+DEFAULT_TRACE_DIR = 'profiles'
+# 单次运行最多保留的事件数，超出后丢弃（避免长时间运行时无限增长）
+MAX_EVENTS = 200000
+
+
+class Profiler:
+    """耗时记录器
+
+    span(name) 记录一个阶段（可嵌套）；ImportTimer 记录首次导入的顶层模块耗时（含其依赖）；
+    enabled 为 False 时 span 返回空上下文，record/mark 直接返回
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.origin = time.perf_counter()
+        self.spans: List[Dict] = []
+        self.imports: List[Dict] = []
+        self.thread_names: Dict[int, str] = {threading.get_ident(): 'MainThread'}
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def now_ms(self) -> float:
+        """自创建以来经过的毫秒数"""
+        return (time.perf_counter() - self.origin) * 1000
+
+    def span(self, name: str, category: str = 'app', **args):
+        if not self.enabled:
+            return nullcontext()
+        return self._span(name, category, args)
+
+    @contextmanager
+    def _span(self, name: str, category: str, args: Dict):
+        start = self.now_ms()
+        stack = self._stack()
+        stack.append(name)
+        try:
+            yield
+        finally:
+            stack.pop()
+            self.record(name, start, self.now_ms() - start, category, depth=len(stack), **args)
+
+    def record(self, name: str, start_ms: float, duration_ms: float, category: str = 'app',
+               depth: int = 0, **args):
+        if not self.enabled:
+            return
+        item = {'name': name, 'cat': category, 'start': start_ms, 'dur': duration_ms,
+                'tid': threading.get_ident(), 'depth': depth, 'args': args}
+        with self._lock:
+            if len(self.spans) < MAX_EVENTS:
+                self.spans.append(item)
+            else:
+                self.dropped += 1
+
+    def mark(self, name: str, category: str = 'app'):
+        """记录一个时间点（耗时为 0 的阶段）"""
+        self.record(name, self.now_ms(), 0.0, category)
+
+    def name_thread(self, name: str):
+        """为当前线程命名（QThread 在 Python 侧没有可读的线程名，trace 中按此名称分行显示）"""
+        with self._lock:
+            self.thread_names[threading.get_ident()] = name
+
+    def _stack(self) -> List[str]:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def report(self, title: str = '启动耗时报告', top_imports: int = 15) -> str:
+        """文本报告：按时间顺序列出阶段耗时，按耗时列出最慢的首次导入"""
+        lines = [f"==== {title}（总计 {self.now_ms():.0f} ms）===="]
+        for item in sorted(self.spans, key=lambda s: s['start']):
+            if item['cat'] == 'import':
+                continue
+            lines.append(f"{'  ' * item['depth']}{item['name']:<36} {item['dur']:>8.1f} ms  @ {item['start']:.0f} ms")
+        if self.imports:
+            lines.append(f"-- 最慢的首次导入（前 {top_imports} 项，含依赖）--")
+            for item in sorted(self.imports, key=lambda s: -s['dur'])[:top_imports]:
+                lines.append(f"  {item['name']:<34} {item['dur']:>8.1f} ms")
+        return '\n'.join(lines)
+
+    def trace_events(self) -> List[Dict]:
+        """转换为 Chrome trace-event 格式（时间单位微秒）"""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+            thread_names = dict(self.thread_names)
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                   'args': {'name': 'SLDMVDeepLearningPlatForm'}}]
+        for tid, name in thread_names.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}})
+        for item in spans:
+            event = {'name': item['name'], 'cat': item['cat'], 'pid': pid, 'tid': item['tid'],
+                     'ts': round(item['start'] * 1000, 1),
+                     'args': {k: str(v) for k, v in item['args'].items()}}
+            if item['dur'] > 0:
+                event.update(ph='X', dur=round(item['dur'] * 1000, 1))
+            else:
+                event.update(ph='i', s='t')
+            events.append(event)
+        return events
+
+    def save_trace(self, path: str) -> str:
+        """写出 Chrome trace JSON（原子替换），返回文件路径"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        data = {'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms',
+                'otherData': {'dropped_events': self.dropped}}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return path
+
+
+class ImportTimer:
+    """统计期间首次导入的模块耗时
+
+    默认只记录最外层导入（嵌套导入计入其调用方）；nested=True 时记录每个首次导入的模块，
+    在 trace 中呈现为嵌套的调用层级
+    """
+
+    def __init__(self, profiler: Profiler, nested: bool = False):
+        self.profiler = profiler
+        self.nested = nested
+        self._original = None
+        self._local = threading.local()
+
+    def start(self):
+        if self._original is None:
+            self._original = builtins.__import__
+            builtins.__import__ = self._import
+
+    def stop(self):
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        depth = getattr(self._local, 'depth', 0)
+        if self.nested:
+            return self._import_nested(name, globals, locals, fromlist, level, depth)
+        if depth or level or name in sys.modules:
+            self._local.depth = depth + 1
+            try:
+                return self._original(name, globals, locals, fromlist, level)
+            finally:
+                self._local.depth = depth
+        start = self.profiler.now_ms()
+        self._local.depth = 1
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            self._local.depth = 0
+            duration = self.profiler.now_ms() - start
+            self.profiler.imports.append({'name': name, 'start': start, 'dur': duration})
+            self.profiler.record(f'import {name}', start, duration, 'import')
+
+    def _import_nested(self, name, globals, locals, fromlist, level, depth):
+        if level and globals:
+            package = globals.get('__package__') or ''
+            parts = package.rsplit('.', level - 1) if level > 1 else [package]
+            module_name = f"{parts[0]}.{name}" if name else parts[0]
+        else:
+            module_name = name
+        if module_name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+        start = self.profiler.now_ms()
+        self._local.depth = depth + 1
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            self._local.depth = depth
+            duration = self.profiler.now_ms() - start
+            if depth == 0:
+                self.profiler.imports.append({'name': module_name, 'start': start, 'dur': duration})
+            self.profiler.record(f'import {module_name}', start, duration, 'import', depth=depth)
+
+
+_profiler: Optional[Profiler] = None
+
+
+def get_profiler() -> Profiler:
+    """进程级共享的耗时记录器（首次调用时创建，计时起点为创建时刻；按启动参数/环境变量决定是否记录）"""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(enabled=trace_output_path(sys.argv) is not None)
+    return _profiler
+
+
+def span(name: str, category: str = 'app', **args):
+    """get_profiler().span 的简写"""
+    return get_profiler().span(name, category, **args)
+
+
+def name_thread(name: str):
+    """get_profiler().name_thread 的简写"""
+    get_profiler().name_thread(name)
+
+
+def trace_output_path(argv: Sequence[str]) -> Optional[str]:
+    """根据启动参数/环境变量确定 trace 输出路径，未开启性能分析时返回 None
+
+    --profile 或 SLDMV_PROFILE=1 输出到 profiles/trace_<时间>.json；
+    --profile=<路径> 或 SLDMV_PROFILE=<路径> 输出到指定文件
+    """
+    value = None
+    for arg in argv[1:]:
+        if arg == PROFILE_ARG:
+            value = '1'
+        elif arg.startswith(PROFILE_ARG + '='):
+            value = arg.split('=', 1)[1] or '1'
+    if value is None:
+        value = os.environ.get(PROFILE_ENV, '').strip()
+    if not value or value.lower() in ('0', 'false', 'no', 'off'):
+        return None
+    if value.lower() in ('1', 'true', 'yes', 'on'):
+        return os.path.join(DEFAULT_TRACE_DIR, time.strftime('trace_%Y%m%d_%H%M%S.json'))
+    return value
@@ -0,0 +1,336 @@
+"""
+复标队列 - 把预测结果中的 NG、置信度临界、评估误检/漏检图像送回标注
+
+队列保存在 SQLite（WAL 模式）中，按优先级分批物化为工作目录：
+    relabel/batch_0001/00001__xxx.jpg   指向原图的硬链接（跨盘时为符号链接，都不可用时才复制）
+    relabel/batch_0001/00001__xxx.json  预填的 labelme 标注（原图已有标注时沿用，否则取预测框）
+文件名带批内序号，labelme 按文件名排序即为队列顺序。标注员保存后，sync() 只检查未清理批次中的条目，
+把修改过的 JSON 写回原图所在目录（原图同名 .json，imagePath 改回原图文件名）
+"""
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .detections import Detections
+
+DEFAULT_WORK_DIR = 'relabel'
+QUEUE_DB_FILE = 'queue.db'
+# 每批物化的图像数（labelme 打开目录时逐个检查 JSON，批次过大会明显变慢）
+DEFAULT_BATCH_SIZE = 500
+
+# 送标原因
+REASON_NG = 'ng'
+REASON_UNCERTAIN = 'uncertain'
+REASON_FP = 'fp'
+REASON_FN = 'fn'
+REASON_NAMES = {REASON_NG: 'NG', REASON_UNCERTAIN: '置信度临界', REASON_FP: '误检', REASON_FN: '漏检'}
+
+# 条目状态
+STATUS_PENDING = 'pending'      # 未物化
+STATUS_OPEN = 'open'            # 已物化，等待标注
+STATUS_DONE = 'done'            # 已写回原目录
+STATUS_SKIPPED = 'skipped'
+STATUS_CONFLICT = 'conflict'    # 送标后原标注被其他人修改，未覆盖
+
+# 置信度临界带：最高置信度在 [conf - band, conf + band) 内视为不确定
+UNCERTAIN_BAND = 0.15
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    image_path TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    priority REAL NOT NULL DEFAULT 0,
+    prefill TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    batch INTEGER,
+    work_name TEXT,
+    prefill_mtime REAL,
+    source_mtime REAL,
+    archived INTEGER NOT NULL DEFAULT 0,
+    added_at TEXT,
+    synced_at TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_items_active_path ON items (image_path) WHERE status IN ('pending', 'open');
+CREATE INDEX IF NOT EXISTS idx_items_status_priority ON items (status, priority DESC, id);
+CREATE INDEX IF NOT EXISTS idx_items_batch ON items (batch, status);
+"""
+
+
+# ---------- 由预测结果生成条目 ----------
+def shapes_from_detections(detections: Detections) -> List[Dict]:
+    """检测框 -> labelme 矩形形状（description 记录预测置信度）"""
+    shapes = []
+    for box, score, class_id in zip(detections.boxes.tolist(), detections.scores.tolist(),
+                                    detections.classes.tolist()):
+        shapes.append({
+            'label': detections.class_name(int(class_id)),
+            'points': [[box[0], box[1]], [box[2], box[3]]],
+            'group_id': None,
+            'description': f"pred {score:.2f}",
+            'shape_type': 'rectangle',
+            'flags': {},
+        })
+    return shapes
+
+
+def items_from_detections(predictions: Dict[str, Detections], conf: float, decisions: Optional[Dict] = None,
+                          band: float = UNCERTAIN_BAND) -> List[Tuple[str, str, float, Optional[List[Dict]]]]:
+    """检测结果 -> (图像路径, 原因, 优先级, 预填形状)
+
+    predictions 为 NMS 后至少保留到 conf - band 的检测框，decisions 为 OK/NG 判定；
+    NG 优先（优先级 1 + 分数），其次最高置信度越接近阈值越靠前；预填形状只含不低于 conf 的框
+    """
+    items = []
+    for path, detections in predictions.items():
+        decision = (decisions or {}).get(path)
+        scores = detections.scores
+        top = float(scores.max()) if len(scores) else 0.0
+        kept = detections.subset(np.flatnonzero(scores >= conf))
+        if decision is not None and decision.is_ng:
+            items.append((path, REASON_NG, 1.0 + (decision.score or 0.0), shapes_from_detections(kept)))
+        elif len(scores) and abs(top - conf) < band:
+            items.append((path, REASON_UNCERTAIN, 1.0 - abs(top - conf) / band, shapes_from_detections(kept)))
+    return items
+
+
+def items_from_manifest(entries: Iterable[Dict], margin: float = UNCERTAIN_BAND) -> List[Tuple[str, str, float, None]]:
+    """统一清单条目 -> 条目（NG，以及分数在判定阈值 ± margin 内的 OK）"""
+    items = []
+    for entry in entries:
+        score = entry.get('score')
+        threshold = entry.get('threshold_value')
+        if entry.get('label') == 'NG':
+            items.append((entry['image_path'], REASON_NG, 1.0 + (score or 0.0), None))
+        elif score is not None and entry.get('threshold_mode') == 'score' and threshold is not None \
+                and abs(score - threshold) < margin:
+            items.append((entry['image_path'], REASON_UNCERTAIN, 1.0 - abs(score - threshold) / margin, None))
+    return items
+
+
+def items_from_review(rows: Sequence[Dict]) -> List[Tuple[str, str, float, None]]:
+    """评估的误检/漏检图像（Evaluator.review_index）-> 条目，错误数越多越靠前"""
+    items = []
+    for row in rows:
+        reason = REASON_FN if row['fn'] >= row['fp'] else REASON_FP
+        items.append((row['path'], reason, float(row['fp'] + row['fn']), None))
+    return items
+
+
+def _link(src: str, dst: str) -> str:
+    """硬链接 -> 符号链接 -> 复制，返回实际方式"""
+    try:
+        os.link(src, dst)
+        return 'hardlink'
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.abspath(src), dst)
+        return 'symlink'
+    except OSError:
+        shutil.copy2(src, dst)
+        return 'copy'
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _write_json(path: str, data: Dict):
+    tmp_file = path + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, path)
+
+
+class RelabelQueue:
+    """复标队列"""
+
+    def __init__(self, work_dir: str = DEFAULT_WORK_DIR):
+        self.work_dir = work_dir
+        os.makedirs(work_dir, exist_ok=True)
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(os.path.join(work_dir, QUEUE_DB_FILE), isolation_level=None,
+                                    check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_SCHEMA)
+        # 复制方式统计（提示用户工作目录与数据不在同一磁盘）
+        self.link_modes: Dict[str, int] = {}
+
+    def close(self):
+        self.conn.close()
+
+    def _execute_many(self, sql: str, rows: List[tuple]):
+        with self._lock:
+            self.conn.execute('BEGIN')
+            try:
+                self.conn.executemany(sql, rows)
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    # ---------- 入队 ----------
+    def add(self, items: Iterable[Tuple[str, str, float, Optional[List[Dict]]]]) -> int:
+        """加入条目（图像已在队列中且未完成时忽略），返回新增数"""
+        now = time.strftime('%Y-%m-%d %H:%M:%S')
+        rows = [(os.path.abspath(path), reason, priority, None if shapes is None else json.dumps(shapes), now)
+                for path, reason, priority, shapes in items]
+        with self._lock:
+            before = self.conn.total_changes
+            self._execute_many('INSERT OR IGNORE INTO items (image_path, reason, priority, prefill, added_at) '
+                               'VALUES (?, ?, ?, ?, ?)', rows)
+            return self.conn.total_changes - before
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self.conn.execute('SELECT status, COUNT(*) FROM items GROUP BY status').fetchall()
+        counts = {status: 0 for status in (STATUS_PENDING, STATUS_OPEN, STATUS_DONE, STATUS_SKIPPED, STATUS_CONFLICT)}
+        counts.update(dict(rows))
+        return counts
+
+    def reason_counts(self, status: str = STATUS_PENDING) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.conn.execute('SELECT reason, COUNT(*) FROM items WHERE status = ? GROUP BY reason',
+                                          (status,)).fetchall())
+
+    # ---------- 物化 ----------
+    def batch_dir(self, batch: int) -> str:
+        return os.path.join(self.work_dir, f"batch_{batch:04d}")
+
+    def open_batches(self) -> List[int]:
+        with self._lock:
+            rows = self.conn.execute('SELECT DISTINCT batch FROM items WHERE status = ? ORDER BY batch',
+                                     (STATUS_OPEN,)).fetchall()
+        return [row[0] for row in rows]
+
+    def next_batch(self, size: int = DEFAULT_BATCH_SIZE) -> Optional[str]:
+        """有未完成的批次时返回最早的一批，否则按优先级物化下一批；队列为空返回 None"""
+        open_batches = self.open_batches()
+        if open_batches:
+            return self.batch_dir(open_batches[0])
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT id, image_path, prefill FROM items WHERE status = ? ORDER BY priority DESC, id LIMIT ?',
+                (STATUS_PENDING, size)).fetchall()
+            if not rows:
+                return None
+            batch = (self.conn.execute('SELECT MAX(batch) FROM items').fetchone()[0] or 0) + 1
+        directory = self.batch_dir(batch)
+        os.makedirs(directory, exist_ok=True)
+        updates = []
+        missing = []
+        for seq, (item_id, image_path, prefill) in enumerate(rows, 1):
+            if not os.path.exists(image_path):
+                missing.append((STATUS_SKIPPED, item_id))
+                continue
+            work_name = f"{seq:05d}__{os.path.basename(image_path)}"
+            mode = _link(image_path, os.path.join(directory, work_name))
+            self.link_modes[mode] = self.link_modes.get(mode, 0) + 1
+            json_file = os.path.join(directory, os.path.splitext(work_name)[0] + '.json')
+            source_json = os.path.splitext(image_path)[0] + '.json'
+            _write_json(json_file, self._prefill(image_path, work_name, source_json, prefill))
+            updates.append((STATUS_OPEN, batch, work_name, _mtime(json_file), _mtime(source_json), item_id))
+        with self._lock:
+            self._execute_many('UPDATE items SET status = ?, batch = ?, work_name = ?, prefill_mtime = ?, '
+                               'source_mtime = ? WHERE id = ?', updates)
+            self._execute_many('UPDATE items SET status = ? WHERE id = ?', missing)
+        if missing and not updates:
+            return self.next_batch(size)
+        return directory
+
+    @staticmethod
+    def _prefill(image_path: str, work_name: str, source_json: str, prefill: Optional[str]) -> Dict:
+        """预填标注：原图已有 labelme 标注时沿用（由标注员修正），否则使用预测框"""
+        data = None
+        if os.path.exists(source_json):
+            try:
+                with open(source_json, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"读取原标注失败 {source_json}: {e}")
+        if data is None:
+            data = {'version': '5.0.1', 'flags': {}, 'shapes': json.loads(prefill) if prefill else [],
+                    'imageHeight': None, 'imageWidth': None}
+        data['imagePath'] = work_name
+        data['imageData'] = None
+        return data
+
+    # ---------- 回写 ----------
+    def sync(self) -> Dict[str, int]:
+        """把已保存（JSON 修改时间变化）的条目写回原图目录，返回 {'done': n, 'conflict': n}
+
+        只检查未清理批次中的条目；已写回的条目再次保存时同样会重新写回
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT id, image_path, batch, work_name, prefill_mtime, source_mtime FROM items '
+                'WHERE status IN (?, ?) AND archived = 0', (STATUS_OPEN, STATUS_DONE)).fetchall()
+        now = time.strftime('%Y-%m-%d %H:%M:%S')
+        updates = []
+        conflicts = []
+        result = {STATUS_DONE: 0, STATUS_CONFLICT: 0}
+        for item_id, image_path, batch, work_name, prefill_mtime, source_mtime in rows:
+            json_file = os.path.join(self.batch_dir(batch), os.path.splitext(work_name)[0] + '.json')
+            mtime = _mtime(json_file)
+            if mtime is None or mtime == prefill_mtime:
+                continue
+            source_json = os.path.splitext(image_path)[0] + '.json'
+            if _mtime(source_json) != source_mtime:
+                conflicts.append((STATUS_CONFLICT, now, item_id))
+                result[STATUS_CONFLICT] += 1
+                continue
+            try:
+                with open(json_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                # 可能正在保存，下次再同步
+                print(f"读取标注失败 {json_file}: {e}")
+                continue
+            data['imagePath'] = os.path.basename(image_path)
+            data['imageData'] = None
+            _write_json(source_json, data)
+            # 记录本次看到的修改时间，之后只有再次保存才会重新写回
+            updates.append((STATUS_DONE, now, mtime, _mtime(source_json), item_id))
+            result[STATUS_DONE] += 1
+        if conflicts:
+            self._execute_many('UPDATE items SET status = ?, synced_at = ? WHERE id = ?', conflicts)
+        if updates:
+            self._execute_many('UPDATE items SET status = ?, synced_at = ?, prefill_mtime = ?, source_mtime = ? '
+                               'WHERE id = ?', updates)
+        return result
+
+    def skip_batch(self, batch: int) -> int:
+        """跳过某批中尚未保存的条目（先同步已保存的），返回跳过数"""
+        self.sync()
+        with self._lock:
+            cursor = self.conn.execute('UPDATE items SET status = ? WHERE batch = ? AND status = ?',
+                                       (STATUS_SKIPPED, batch, STATUS_OPEN))
+            return cursor.rowcount
+
+    def cleanup(self) -> int:
+        """删除已全部处理完的批次目录（先同步），返回删除数"""
+        self.sync()
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT batch FROM items WHERE batch IS NOT NULL AND archived = 0 GROUP BY batch '
+                'HAVING SUM(status = ?) = 0', (STATUS_OPEN,)).fetchall()
+        removed = 0
+        for (batch,) in rows:
+            directory = self.batch_dir(batch)
+            if os.path.isdir(directory):
+                shutil.rmtree(directory, ignore_errors=True)
+                removed += 1
+        if rows:
+            self._execute_many('UPDATE items SET archived = 1 WHERE batch = ?', rows)
+        return removed
@@ -0,0 +1,232 @@
+"""
+预缩放图像缓存 - 按训练尺寸预先缩放数据集图像，训练时无需每个 epoch 解码全分辨率原图
+标注为归一化坐标，缩放后保持不变
+"""
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from .image_hash import read_image
+from .label_store import LabelStore, STORE_FILENAME
+from .label_table import IMAGE_EXTENSIONS, SPLIT_NAMES, read_yolo_names
+
+MANIFEST_FILENAME = 'cache_manifest.json'
+SUPPORTED_FORMATS = ('jpg', 'bmp')
+
+
+class ResizedDatasetCache:
+    """数据集预缩放缓存
+
+    缓存位于 <数据集>/resized_<边长>_<格式>/，目录结构与原数据集一致并带独立 data.yaml；
+    各尺寸缓存互不覆盖，切换回已有尺寸时只重新生成源文件有变化的图像
+    """
+
+    def __init__(self, dataset_dir: str, image_format: str = 'jpg', quality: int = 95, workers: int = 8):
+        if image_format not in SUPPORTED_FORMATS:
+            raise ValueError(f"不支持的缓存格式: {image_format}")
+        self.dataset_dir = Path(dataset_dir)
+        self.image_format = image_format
+        self.quality = quality
+        self.workers = workers
+
+    @classmethod
+    def from_yaml(cls, yaml_file: str, **kwargs) -> 'ResizedDatasetCache':
+        """根据 data.yaml 定位数据集根目录"""
+        return cls(str(dataset_root_from_yaml(yaml_file)), **kwargs)
+
+    def cache_dir(self, target: int) -> Path:
+        return self.dataset_dir / f'resized_{target}_{self.image_format}'
+
+    def ensure(self, imgsz: int, scale: int = 1,
+               progress: Optional[Callable[[int, int], None]] = None) -> Tuple[str, Dict[str, int]]:
+        """确保 imgsz * scale 尺寸的缓存为最新，返回 (缓存 data.yaml 路径, 统计)"""
+        target = int(imgsz) * max(1, int(scale))
+        out_dir = self.cache_dir(target)
+        manifest_file = out_dir / MANIFEST_FILENAME
+        manifest = self._load_manifest(manifest_file, target)
+        shapes = self._known_shapes()
+
+        # 收集需要（重新）生成的图像
+        tasks = []
+        alive = set()
+        for split_name in SPLIT_NAMES.values():
+            src_dir = self.dataset_dir / 'images' / split_name
+            if not src_dir.is_dir():
+                continue
+            (out_dir / 'images' / split_name).mkdir(parents=True, exist_ok=True)
+            for entry in os.scandir(src_dir):
+                if not entry.is_file() or not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                key = f'{split_name}/{entry.name}'
+                alive.add(key)
+                stat = entry.stat()
+                signature = [stat.st_size, stat.st_mtime_ns]
+                dst = out_dir / 'images' / split_name / self._output_name(entry.name)
+                if manifest['entries'].get(key) != signature or not dst.exists():
+                    tasks.append((key, entry.path, str(dst), signature, shapes.get(entry.name)))
+
+        # 清理源文件已删除的缓存图像
+        for key in set(manifest['entries']) - alive:
+            split_name, name = key.split('/', 1)
+            stale = out_dir / 'images' / split_name / self._output_name(name)
+            if stale.exists():
+                stale.unlink()
+            del manifest['entries'][key]
+
+        done = 0
+        failed = 0
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            for key, signature, ok in pool.map(lambda t: self._resize_one(t, target), tasks):
+                done += 1
+                if ok:
+                    manifest['entries'][key] = signature
+                else:
+                    failed += 1
+                if progress is not None:
+                    progress(done, len(tasks))
+
+        self._sync_labels(out_dir, target)
+        yaml_path = self._write_yaml(out_dir)
+        self._save_manifest(manifest_file, manifest)
+        stats = {'target': target, 'total': len(alive), 'updated': len(tasks) - failed,
+                 'reused': len(alive) - len(tasks), 'failed': failed}
+        return yaml_path, stats
+
+    # ------------------------------------------------------------------
+    # 内部实现
+    # ------------------------------------------------------------------
+    def _output_name(self, name: str) -> str:
+        return os.path.splitext(name)[0] + '.' + self.image_format
+
+    def _resize_one(self, task, target: int):
+        import cv2
+
+        key, src, dst, signature, shape = task
+        # 已知原图尺寸时使用降采样解码，JPEG 可直接按 1/2、1/4、1/8 解码
+        flags = cv2.IMREAD_COLOR
+        if shape is not None and max(shape) > 0:
+            ratio = max(shape) / target
+            if ratio >= 8:
+                flags = cv2.IMREAD_REDUCED_COLOR_8
+            elif ratio >= 4:
+                flags = cv2.IMREAD_REDUCED_COLOR_4
+            elif ratio >= 2:
+                flags = cv2.IMREAD_REDUCED_COLOR_2
+        img = read_image(src, flags)
+        if img is None:
+            return key, signature, False
+
+        h, w = img.shape[:2]
+        factor = target / max(h, w)
+        if factor < 1:
+            img = cv2.resize(img, (max(1, round(w * factor)), max(1, round(h * factor))),
+                             interpolation=cv2.INTER_AREA)
+
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.quality] if self.image_format == 'jpg' else []
+        ok, buffer = cv2.imencode('.' + self.image_format, img, params)
+        if not ok:
+            return key, signature, False
+        buffer.tofile(dst)
+        return key, signature, True
+
+    def _known_shapes(self) -> Dict[str, Tuple[int, int]]:
+        """从合并标注文件读取原图尺寸"""
+        store_file = self.dataset_dir / STORE_FILENAME
+        if not store_file.exists():
+            return {}
+        try:
+            store = LabelStore.load(str(store_file))
+            return {name: (int(h), int(w)) for name, (h, w) in zip(store.images.tolist(), store.shape.tolist())}
+        except Exception as e:
+            print(f"读取合并标注文件失败: {e}")
+            return {}
+
+    def _sync_labels(self, out_dir: Path, target: int):
+        """同步标注：硬链接原 txt（不支持时复制），并为缓存目录生成合并标注与 ultralytics 标注缓存"""
+        store_file = self.dataset_dir / STORE_FILENAME
+        store = LabelStore.load(str(store_file), mmap=False) if store_file.exists() else None
+
+        for split_name in SPLIT_NAMES.values():
+            src_dir = self.dataset_dir / 'labels' / split_name
+            dst_dir = out_dir / 'labels' / split_name
+            dst_dir.mkdir(parents=True, exist_ok=True)
+            if not src_dir.is_dir():
+                continue
+            for entry in os.scandir(src_dir):
+                if not entry.name.endswith('.txt'):
+                    continue
+                dst = dst_dir / entry.name
+                if dst.exists() and dst.stat().st_mtime_ns >= entry.stat().st_mtime_ns:
+                    continue
+                if dst.exists():
+                    dst.unlink()
+                try:
+                    os.link(entry.path, dst)
+                except OSError:
+                    shutil.copy2(entry.path, dst)
+
+        if store is not None:
+            # 图像扩展名可能改变，重命名后写入缓存目录自己的合并标注与 ultralytics 缓存
+            store.images = np.asarray([self._output_name(n) for n in store.images.tolist()], dtype=str)
+            factor = np.minimum(1.0, target / np.maximum(store.shape.max(axis=1, keepdims=True), 1))
+            store.shape = np.round(store.shape * factor).astype(np.int32)
+            store.save(str(out_dir / STORE_FILENAME))
+            store.write_ultralytics_cache(str(out_dir))
+
+    def _write_yaml(self, out_dir: Path) -> str:
+        names = read_yolo_names(self.dataset_dir / 'data.yaml')
+        yaml_content = f"""# YOLO数据集配置文件（预缩放缓存，源数据集: {self.dataset_dir.absolute()}）
+path: {out_dir.absolute()}  # 数据集根目录
+train: images/train  # 训练集图像目录（相对于path）
+val: images/val  # 验证集图像目录（相对于path）
+
+# 类别
+nc: {len(names)}  # 类别数量
+names: {names}  # 类别名称列表
+"""
+        yaml_file = out_dir / 'data.yaml'
+        with open(yaml_file, 'w', encoding='utf-8') as f:
+            f.write(yaml_content)
+        return str(yaml_file)
+
+    def _load_manifest(self, manifest_file: Path, target: int) -> Dict:
+        if manifest_file.exists():
+            try:
+                with open(manifest_file, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                if manifest.get('target') == target and manifest.get('format') == self.image_format \
+                        and manifest.get('quality') == self.quality:
+                    return manifest
+            except Exception as e:
+                print(f"读取缓存清单失败，将重新生成: {e}")
+        return {'target': target, 'format': self.image_format, 'quality': self.quality, 'entries': {}}
+
+    @staticmethod
+    def _save_manifest(manifest_file: Path, manifest: Dict):
+        tmp_file = manifest_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_file, manifest_file)
+
+
+def dataset_root_from_yaml(yaml_file: str) -> Path:
+    """读取 data.yaml 中的 path 字段，缺省为 yaml 所在目录"""
+    yaml_path = Path(yaml_file)
+    root = None
+    try:
+        with open(yaml_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('path:'):
+                    root = line.split(':', 1)[1].split('#', 1)[0].strip()
+                    break
+    except Exception as e:
+        print(f"读取数据集配置失败: {e}")
+    if root:
+        root_path = Path(root)
+        return root_path if root_path.is_absolute() else (yaml_path.parent / root_path)
+    return yaml_path.parent
@@ -0,0 +1,329 @@
+"""
+预测结果库 - SQLite（WAL 模式）持久化每次预测任务的图像与检测框，支持按任务/类别/置信度/路径快速筛选
+
+images 表冗余记录每张图像的检测数与最高置信度，"无检出"类查询不必扫描检测表；
+检测表按 (任务, 类别, 置信度) 建索引，百万级检测框的筛选在亚秒级完成
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .detections import Detections
+
+DEFAULT_DB_FILE = os.path.join('results', 'predictions.db')
+# 批量写入：累计图像数或距上次提交的时间超过阈值时提交一次
+BATCH_IMAGES = 64
+BATCH_SECONDS = 1.0
+# 入库的最低置信度（低于任务阈值的检测框也保留，之后可按更低的阈值查询）
+STORE_MIN_CONF = 0.05
+
+RUN_RUNNING = 'running'
+RUN_FINISHED = 'finished'
+RUN_FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    model_path TEXT NOT NULL,
+    model_hash TEXT NOT NULL,
+    params TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL,
+    image_count INTEGER NOT NULL DEFAULT 0,
+    detection_count INTEGER NOT NULL DEFAULT 0,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS run_classes (
+    run_id INTEGER NOT NULL,
+    class_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (run_id, class_id)
+);
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    inference_ms REAL,
+    detection_count INTEGER NOT NULL,
+    max_conf REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_images_run_conf ON images (run_id, max_conf);
+CREATE INDEX IF NOT EXISTS idx_images_path ON images (path);
+CREATE TABLE IF NOT EXISTS detections (
+    image_id INTEGER NOT NULL,
+    run_id INTEGER NOT NULL,
+    class_id INTEGER NOT NULL,
+    conf REAL NOT NULL,
+    x1 REAL NOT NULL,
+    y1 REAL NOT NULL,
+    x2 REAL NOT NULL,
+    y2 REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_detections_run_class_conf ON detections (run_id, class_id, conf);
+CREATE INDEX IF NOT EXISTS idx_detections_image ON detections (image_id);
+"""
+
+
+def file_sha1(path: str, chunk_size: int = 1 << 20) -> str:
+    """文件内容的 SHA-1（模型哈希，用于区分同名但内容不同的模型）"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultsStore:
+    """预测结果库
+
+    写入通过 RunWriter 批量提交；查询方法可在界面线程调用（WAL 下读写互不阻塞）
+    """
+
+    def __init__(self, db_file: str = DEFAULT_DB_FILE):
+        self.db_file = db_file
+        db_dir = os.path.dirname(db_file)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_file, isolation_level=None, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_SCHEMA)
+        # 查询使用独立连接：推理线程提交批次时界面线程的查询不必等待
+        self._reader = sqlite3.connect(db_file, check_same_thread=False, timeout=30)
+        self._reader_lock = threading.Lock()
+
+    def close(self):
+        self._reader.close()
+        self.conn.close()
+
+    def _query(self, sql: str, args: Sequence = ()) -> List[tuple]:
+        with self._reader_lock:
+            return self._reader.execute(sql, args).fetchall()
+
+    def _query_dicts(self, sql: str, args: Sequence = ()) -> List[Dict]:
+        with self._reader_lock:
+            cursor = self._reader.execute(sql, args)
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    @contextmanager
+    def transaction(self):
+        """事务上下文，异常时整体回滚"""
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+
+    # ---------- 写入 ----------
+    def start_run(self, name: str, model_path: str, params: Optional[Dict] = None,
+                  model_hash: Optional[str] = None) -> int:
+        """登记一次预测任务，返回任务编号"""
+        if model_hash is None:
+            model_hash = file_sha1(model_path) if os.path.isfile(model_path) else ''
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (name, model_path, model_hash, params, status, started_at) "
+                "VALUES (?, ?, ?, ?, ?, datetime('now', 'localtime'))",
+                (name, model_path, model_hash, json.dumps(params or {}, ensure_ascii=False), RUN_RUNNING),
+            )
+            return cursor.lastrowid
+
+    def writer(self, run_id: int, min_conf: float = STORE_MIN_CONF) -> 'RunWriter':
+        return RunWriter(self, run_id, min_conf)
+
+    def finish_run(self, run_id: int, status: str = RUN_FINISHED):
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE runs SET status = ?, finished_at = datetime('now', 'localtime'), "
+                "image_count = (SELECT COUNT(*) FROM images WHERE run_id = ?), "
+                "detection_count = (SELECT COUNT(*) FROM detections WHERE run_id = ?) WHERE id = ?",
+                (status, run_id, run_id, run_id),
+            )
+
+    def delete_run(self, run_id: int):
+        with self.transaction() as conn:
+            for table, column in (('detections', 'run_id'), ('images', 'run_id'),
+                                  ('run_classes', 'run_id'), ('runs', 'id')):
+                conn.execute(f'DELETE FROM {table} WHERE {column} = ?', (run_id,))
+
+    # ---------- 查询 ----------
+    def list_runs(self) -> List[Dict]:
+        """全部任务（新的在前）"""
+        runs = self._query_dicts(
+            'SELECT id, name, model_path, model_hash, params, status, image_count, detection_count, '
+            'started_at, finished_at FROM runs ORDER BY id DESC'
+        )
+        for run in runs:
+            run['params'] = json.loads(run['params'] or '{}')
+        return runs
+
+    def class_names(self, run_id: Optional[int] = None) -> List[str]:
+        """任务（或全部任务）中出现的类别名称"""
+        if run_id is None:
+            rows = self._query('SELECT DISTINCT name FROM run_classes ORDER BY name')
+        else:
+            rows = self._query('SELECT name FROM run_classes WHERE run_id = ? ORDER BY class_id', (run_id,))
+        return [row[0] for row in rows]
+
+    def query_images(self, run_id: Optional[int] = None, class_names: Optional[Sequence[str]] = None,
+                     min_conf: Optional[float] = None, no_detections: bool = False,
+                     path_contains: Optional[str] = None, limit: int = 1000, offset: int = 0) -> List[Dict]:
+        """筛选图像
+
+        class_names/min_conf：存在指定类别（未指定则任意类别）且置信度 >= min_conf 的检测框；
+        no_detections=True：没有置信度 >= min_conf（未指定则入库下限）的检测框
+        """
+        where = []
+        args: List = []
+        if run_id is not None:
+            where.append('i.run_id = ?')
+            args.append(run_id)
+        if path_contains:
+            where.append("i.path LIKE ? ESCAPE '\\'")
+            args.append('%' + path_contains.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if no_detections:
+            # 没有入库检测框的图像 max_conf 记为 0，两种情况都走 (run_id, max_conf) 索引
+            if min_conf is None:
+                where.append('i.max_conf <= 0')
+            else:
+                where.append('i.max_conf < ?')
+                args.append(min_conf)
+        elif class_names:
+            class_ids = self._class_ids(run_id, class_names)
+            if not class_ids:
+                return []
+            # 逐个 (任务, 类别) 走 (run_id, class_id, conf) 索引的范围扫描
+            pairs = ' OR '.join('(run_id = ? AND class_id = ? AND conf >= ?)' for _ in class_ids)
+            subquery = f'SELECT image_id FROM detections WHERE {pairs}'
+            for pair_run, class_id in class_ids:
+                args.extend((pair_run, class_id, min_conf or 0.0))
+            where.append(f'i.id IN ({subquery})')
+        elif min_conf is not None:
+            where.append('i.max_conf >= ?')
+            args.append(min_conf)
+
+        sql = ('SELECT i.id, i.run_id, i.path, i.width, i.height, i.inference_ms, i.detection_count, i.max_conf '
+               'FROM images i')
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY i.id LIMIT ? OFFSET ?'
+        args.extend([limit, offset])
+        return self._query_dicts(sql, args)
+
+    def run_predictions(self, run_id: int) -> Dict[str, Detections]:
+        """一次读出某个任务全部图像的检测框（图像路径 -> Detections，供评估等批量使用）"""
+        names = dict(self._query('SELECT class_id, name FROM run_classes WHERE run_id = ?', (run_id,)))
+        images = self._query('SELECT id, path, width, height FROM images WHERE run_id = ? ORDER BY id', (run_id,))
+        rows = self._query(
+            'SELECT image_id, x1, y1, x2, y2, conf, class_id FROM detections WHERE run_id = ? ORDER BY image_id',
+            (run_id,),
+        )
+        table = np.asarray(rows, dtype=np.float64).reshape(-1, 7)
+        image_ids = table[:, 0].astype(np.int64)
+        bounds = np.searchsorted(image_ids, [image_id for image_id, _, _, _ in images] + [np.iinfo(np.int64).max])
+        predictions = {}
+        for i, (_, path, width, height) in enumerate(images):
+            block = table[bounds[i]:bounds[i + 1]]
+            shape = (height, width) if width and height else None
+            predictions[path] = Detections(block[:, 1:5], block[:, 5], block[:, 6], names, shape)
+        return predictions
+
+    def _class_ids(self, run_id: Optional[int], class_names: Sequence[str]) -> List[tuple]:
+        """类别名称对应的 (任务编号, 类别编号)"""
+        placeholders = ','.join('?' * len(class_names))
+        sql = f'SELECT run_id, class_id FROM run_classes WHERE name IN ({placeholders})'
+        args = list(class_names)
+        if run_id is not None:
+            sql += ' AND run_id = ?'
+            args.append(run_id)
+        return self._query(sql, args)
+
+    def image_detections(self, image_id: int) -> Detections:
+        """某张图像入库的检测框"""
+        found = self._query('SELECT run_id, width, height FROM images WHERE id = ?', (image_id,))
+        if not found:
+            return Detections.empty()
+        run_id, width, height = found[0]
+        names = dict(self._query('SELECT class_id, name FROM run_classes WHERE run_id = ?', (run_id,)))
+        rows = self._query(
+            'SELECT x1, y1, x2, y2, conf, class_id FROM detections WHERE image_id = ? ORDER BY conf DESC',
+            (image_id,),
+        )
+        shape = (height, width) if width and height else None
+        if not rows:
+            return Detections.empty(names, shape)
+        return Detections([r[:4] for r in rows], [r[4] for r in rows], [r[5] for r in rows], names, shape)
+
+
+class RunWriter:
+    """单个任务的批量写入器（在推理线程中使用，每 BATCH_IMAGES 张或 BATCH_SECONDS 秒提交一次）"""
+
+    def __init__(self, store: ResultsStore, run_id: int, min_conf: float = STORE_MIN_CONF):
+        self.store = store
+        self.run_id = run_id
+        self.min_conf = min_conf
+        self._images: List[tuple] = []
+        self._detections: List[List[tuple]] = []
+        self._classes: Dict[int, str] = {}
+        self._known_classes = set()
+        self._last_flush = time.monotonic()
+
+    def add(self, image_path: str, detections: Detections, inference_ms: Optional[float] = None):
+        keep = detections.scores >= self.min_conf
+        scores = detections.scores[keep]
+        height, width = detections.image_shape or (None, None)
+        self._images.append((self.run_id, image_path, width, height, inference_ms, len(scores),
+                             float(scores.max()) if len(scores) else 0.0))
+        self._detections.append([
+            (self.run_id, c, s, *box)
+            for box, s, c in zip(detections.boxes[keep].tolist(), scores.tolist(), detections.classes[keep].tolist())
+        ])
+        for class_id, name in detections.names.items():
+            if class_id not in self._known_classes:
+                self._classes[class_id] = str(name)
+        if len(self._images) >= BATCH_IMAGES or time.monotonic() - self._last_flush >= BATCH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        if not self._images and not self._classes:
+            return
+        with self.store.transaction() as conn:
+            if self._classes:
+                conn.executemany('INSERT OR REPLACE INTO run_classes (run_id, class_id, name) VALUES (?, ?, ?)',
+                                 [(self.run_id, k, v) for k, v in self._classes.items()])
+            rows = []
+            for image, detections in zip(self._images, self._detections):
+                image_id = conn.execute(
+                    'INSERT INTO images (run_id, path, width, height, inference_ms, detection_count, max_conf) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', image,
+                ).lastrowid
+                rows.extend((image_id,) + d for d in detections)
+            conn.executemany(
+                'INSERT INTO detections (image_id, run_id, class_id, conf, x1, y1, x2, y2) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows,
+            )
+        self._known_classes.update(self._classes)
+        self._classes.clear()
+        self._images.clear()
+        self._detections.clear()
+        self._last_flush = time.monotonic()
+
+    def close(self, status: str = RUN_FINISHED):
+        """提交剩余结果并结束任务"""
+        self.flush()
+        self.store.finish_run(self.run_id, status)
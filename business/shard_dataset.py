@@ -0,0 +1,219 @@
+"""
+分片数据集 - 将图像与标注打包为少量大文件顺序存放，减少 NAS 上海量小文件的随机读取
+
+目录结构：
+    shard_00000.bin ...   图像原始字节依次拼接
+    shard_index.npz       每张图像所在分片、偏移、长度
+    labels.npz            合并标注（与 shard_index 同序，见 label_store.LabelStore）
+训练时 stage_shards 先把分片顺序读出、解包到本地目录（ultralytics 训练器按目录结构读取数据集）
+"""
+import os
+import random
+import shutil
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .label_store import LabelStore, STORE_FILENAME
+from .label_table import SPLIT_NAMES
+
+SHARD_INDEX_FILENAME = 'shard_index.npz'
+SHARD_PATTERN = 'shard_{:05d}.bin'
+DEFAULT_SHARD_SIZE = 1 << 30
+
+
+class ShardWriter:
+    """分片写入器：按写入顺序拼接图像字节，单个分片超过 shard_size 后切换到下一个"""
+
+    def __init__(self, out_dir: str, shard_size: int = DEFAULT_SHARD_SIZE):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.shard_size = shard_size
+        self.shard_files: List[str] = []
+        self.shard_ids: List[int] = []
+        self.offsets: List[int] = []
+        self.lengths: List[int] = []
+        self._file = None
+        self._position = 0
+
+    def add(self, data: bytes) -> int:
+        """写入一张图像的编码字节，返回其记录序号"""
+        if self._file is None or self._position >= self.shard_size:
+            self._open_next()
+        self.shard_ids.append(len(self.shard_files) - 1)
+        self.offsets.append(self._position)
+        self.lengths.append(len(data))
+        self._file.write(data)
+        self._position += len(data)
+        return len(self.offsets) - 1
+
+    def close(self):
+        """关闭当前分片并写出偏移表"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        tmp_path = self.out_dir / (SHARD_INDEX_FILENAME + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                shard=np.asarray(self.shard_ids, dtype=np.int32),
+                offset=np.asarray(self.offsets, dtype=np.int64),
+                length=np.asarray(self.lengths, dtype=np.int64),
+                files=np.asarray(self.shard_files, dtype=str),
+            )
+        os.replace(tmp_path, self.out_dir / SHARD_INDEX_FILENAME)
+
+    def _open_next(self):
+        if self._file is not None:
+            self._file.close()
+        name = SHARD_PATTERN.format(len(self.shard_files))
+        self.shard_files.append(name)
+        self._file = open(self.out_dir / name, 'wb')
+        self._position = 0
+
+
+class ShardReader:
+    """分片读取器：各分片整体内存映射，按偏移表切片取出图像字节"""
+
+    def __init__(self, shard_dir: str):
+        self.shard_dir = Path(shard_dir)
+        with np.load(str(self.shard_dir / SHARD_INDEX_FILENAME)) as index:
+            self.shard = index['shard']
+            self.offset = index['offset']
+            self.length = index['length']
+            self.files = [str(name) for name in index['files']]
+        self.store = LabelStore.load(str(self.shard_dir / STORE_FILENAME))
+        if len(self.store) != len(self.offset):
+            raise ValueError("分片偏移表与合并标注数量不一致")
+        self._maps: Dict[int, np.memmap] = {}
+
+    def __len__(self):
+        return len(self.offset)
+
+    @property
+    def names(self) -> List[str]:
+        return self.store.names
+
+    def shard_map(self, shard_id: int) -> np.memmap:
+        if shard_id not in self._maps:
+            self._maps[shard_id] = np.memmap(self.shard_dir / self.files[shard_id], dtype=np.uint8, mode='r')
+        return self._maps[shard_id]
+
+    def read_bytes(self, index: int) -> memoryview:
+        start = int(self.offset[index])
+        return memoryview(self.shard_map(int(self.shard[index]))[start:start + int(self.length[index])])
+
+    def decode(self, index: int, flags: Optional[int] = None) -> Optional[np.ndarray]:
+        import cv2
+
+        buffer = np.frombuffer(self.read_bytes(index), dtype=np.uint8)
+        return cv2.imdecode(buffer, cv2.IMREAD_COLOR if flags is None else flags)
+
+    def records_by_shard(self, split_id: Optional[int] = None) -> Dict[int, np.ndarray]:
+        """按分片分组的记录序号（组内按偏移升序，保证顺序读取）"""
+        selected = np.arange(len(self)) if split_id is None else np.flatnonzero(self.store.split == split_id)
+        order = np.lexsort((self.offset[selected], self.shard[selected]))
+        selected = selected[order]
+        shard_ids, starts = np.unique(self.shard[selected], return_index=True)
+        return {int(s): group for s, group in zip(shard_ids, np.split(selected, starts[1:]))}
+
+    def extract(self, target_dir: str, progress: Optional[Callable[[int, int], None]] = None) -> int:
+        """按分片顺序解包为 images/<split> 目录结构（附带合并标注与 txt），返回写出的图像数"""
+        root = Path(target_dir)
+        for split_name in SPLIT_NAMES.values():
+            (root / 'images' / split_name).mkdir(parents=True, exist_ok=True)
+        total = len(self)
+        done = 0
+        for records in self.records_by_shard().values():
+            for i in records:
+                split_name = SPLIT_NAMES.get(int(self.store.split[i]))
+                if split_name is not None:
+                    with open(root / 'images' / split_name / str(self.store.images[i]), 'wb') as f:
+                        f.write(self.read_bytes(int(i)))
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+        self.store.save(str(root / STORE_FILENAME))
+        self.store.materialize_txt(str(root), only_missing=False)
+        self.store.write_ultralytics_cache(str(root))
+        return done
+
+
+def export_shards(dataset_dir: str, out_dir: str, shard_size: int = DEFAULT_SHARD_SIZE,
+                  seed: int = 0, progress: Optional[Callable[[int, int], None]] = None) -> Tuple[int, int]:
+    """将 YOLO 数据集（需含 labels.npz）打包为分片，返回 (图像数, 分片数)
+
+    写入前打乱图像顺序，使每个分片包含随机样本，训练时分片级打乱即可近似全局打乱
+    """
+    root = Path(dataset_dir)
+    store = LabelStore.load(str(root / STORE_FILENAME), mmap=False)
+    order = list(range(len(store)))
+    random.Random(seed).shuffle(order)
+
+    writer = ShardWriter(out_dir, shard_size)
+    kept = []
+    for done, i in enumerate(order, 1):
+        split_name = SPLIT_NAMES.get(int(store.split[i]))
+        image_path = root / 'images' / (split_name or '') / str(store.images[i])
+        try:
+            with open(image_path, 'rb') as f:
+                writer.add(f.read())
+            kept.append(i)
+        except OSError as e:
+            print(f"跳过无法读取的图像 {image_path}: {e}")
+        if progress is not None:
+            progress(done, len(order))
+    writer.close()
+
+    # 合并标注按分片写入顺序重排
+    counts = np.diff(store.offsets)
+    rows = np.concatenate([np.arange(store.offsets[i], store.offsets[i + 1]) for i in kept] or
+                          [np.zeros(0, dtype=np.int64)])
+    shard_store = LabelStore(
+        images=store.images[kept],
+        split=store.split[kept],
+        shape=store.shape[kept],
+        offsets=np.concatenate(([0], np.cumsum(counts[kept]))).astype(np.int64),
+        cls=store.cls[rows],
+        boxes=store.boxes[rows],
+        names=store.names,
+    )
+    shard_store.save(str(Path(out_dir) / STORE_FILENAME))
+    return len(kept), len(writer.shard_files)
+
+
+def stage_shards(shard_dir: str, target_dir: str,
+                 progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """将分片顺序解包到本地目录并生成 data.yaml，返回 yaml 路径
+
+    ultralytics 训练流程只接受目录结构，分片在 NAS 上顺序读取一次后落到本地盘；
+    分片偏移表未变化时直接复用上次解包结果
+    """
+    source = Path(shard_dir)
+    target = Path(target_dir)
+    index_file = source / SHARD_INDEX_FILENAME
+    stamp = f"{index_file.stat().st_size}:{index_file.stat().st_mtime_ns}"
+    stamp_file = target / '.staged_from'
+    yaml_file = target / 'data.yaml'
+    if yaml_file.exists() and stamp_file.exists() and stamp_file.read_text(encoding='utf-8') == stamp:
+        return str(yaml_file)
+
+    for sub in ('images', 'labels'):
+        if (target / sub).is_dir():
+            shutil.rmtree(target / sub)
+    reader = ShardReader(str(source))
+    reader.extract(str(target), progress)
+    yaml_content = f"""# YOLO数据集配置文件（由分片解包，来源: {source.absolute()}）
+path: {target.absolute()}  # 数据集根目录
+train: images/train  # 训练集图像目录（相对于path）
+val: images/val  # 验证集图像目录（相对于path）
+
+# 类别
+nc: {len(reader.names)}  # 类别数量
+names: {reader.names}  # 类别名称列表
+"""
+    with open(yaml_file, 'w', encoding='utf-8') as f:
+        f.write(yaml_content)
+    stamp_file.write_text(stamp, encoding='utf-8')
+    return str(yaml_file)
@@ -0,0 +1,31 @@
+"""
+训练管理 - 通过后端路由执行训练任务（界面线程只负责把事件转换为信号）
+"""
+from typing import Dict, Optional
+
+from .backend_router import BackendRouter, get_router
+from .model_backends.base import BackendError, Emit
+
+
+class TrainManager:
+    """训练任务管理"""
+
+    def __init__(self, router: Optional[BackendRouter] = None):
+        self.router = router or get_router()
+        self.backend_name: Optional[str] = None
+
+    def train(self, config: Dict, emit: Emit) -> Dict:
+        """执行训练（阻塞），返回结束状态事件"""
+        try:
+            self.backend_name = self.router.resolve(config)
+        except BackendError:
+            self.backend_name = None
+        return self.router.run('train', config, emit)
+
+    def healthcheck(self, backend: str, refresh: bool = False):
+        return self.router.healthcheck(backend, refresh)
+
+    def stop(self):
+        """请求停止当前训练（YOLO 在当前轮结束后停止）"""
+        if self.backend_name is not None:
+            self.router.stop(self.backend_name)
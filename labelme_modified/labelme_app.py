@@ -2,13 +2,18 @@
 SLDMV wrapper for labelme MainWindow with:
 - 完整中文映射（tr 覆盖常见菜单/动作/提示，未覆盖项回退）
 - 可选 YOLO (.pt) 自动标注：1) 当前图片 2) 整个目录
+- 大目录文件列表分批加载（首批加入后立即可标注，其余在空闲时补充）
+- 图像数据经共享内存缓存读取，并在后台预取相邻图像，来回翻页（A/D）无需重复读取解码
 - 保持 UTF-8 干净，避免乱码
 """
 import os
-from typing import Optional, List
+import re
+from typing import Optional, List, Set, Tuple
 
 from PyQt5.QtCore import QTimer, Qt
+from PyQt5.QtGui import QImageReader
 from PyQt5.QtWidgets import (
+    QListWidgetItem,
     QMessageBox,
     QProgressDialog,
     QApplication,
@@ -27,6 +32,22 @@ from PyQt5.QtWidgets import (
     QSizePolicy,
 )
 
+from business import metrics
+from business.image_cache import get_image_cache
+
+AUTOLABEL_IMAGES = metrics.counter("sldmv_autolabel_images_total", "自动标注已处理的图像数")
+AUTOLABEL_ERRORS = metrics.counter("sldmv_autolabel_errors_total", "自动标注失败的图像数")
+AUTOLABEL_PENDING = metrics.gauge("sldmv_autolabel_pending_images", "目录自动标注待处理的图像数")
+AUTOLABEL_LOAD_SECONDS = metrics.stage_timer("autolabel", "load_model")
+AUTOLABEL_INFERENCE_SECONDS = metrics.stage_timer("autolabel", "inference")
+AUTOLABEL_WRITE_SECONDS = metrics.stage_timer("autolabel", "write")
+
+# 文件列表每批加入的条目数
+FILE_LIST_CHUNK = 2000
+# 打开一张图像后预取的后续/前序图像数
+PREFETCH_NEXT = 2
+PREFETCH_PREV = 1
+
 try:
     from labelme.app import MainWindow as LabelmeMainWindowBase  # type: ignore
     LABELME_AVAILABLE = True
@@ -35,6 +56,24 @@ except Exception as e:  # pragma: no cover
     LABELME_AVAILABLE = False
     LabelmeMainWindowBase = object  # fallback 防止类型检查报错
 
+_original_load_image_file = None
+
+
+def _install_image_cache() -> None:
+    """让 labelme 读取图像数据（读取、EXIF 旋转、重新编码）经过共享缓存"""
+    global _original_load_image_file
+    if _original_load_image_file is not None:
+        return
+    from labelme.label_file import LabelFile  # type: ignore
+
+    _original_load_image_file = LabelFile.load_image_file
+    cache = get_image_cache()
+
+    def load_image_file(image_path):
+        return cache.cached(image_path, "labelme", _original_load_image_file)
+
+    LabelFile.load_image_file = staticmethod(load_image_file)
+
 
 class LabelmeMainWindow(LabelmeMainWindowBase):
     def __init__(
@@ -47,6 +86,7 @@ class LabelmeMainWindow(LabelmeMainWindowBase):
     ):
         if not LABELME_AVAILABLE:
             raise ImportError("labelme 模块不可用")
+        _install_image_cache()
 
         if output_dir:
             output_dir = os.path.abspath(output_dir)
@@ -452,6 +492,124 @@ class LabelmeMainWindow(LabelmeMainWindowBase):
         except Exception:
             return None
 
+    # -------------------- 大目录文件列表 --------------------
+    @property
+    def imageList(self) -> List[str]:  # type: ignore[override]
+        """文件列表（分批加载期间缓存已加入的条目，避免每次翻页遍历整个列表控件）"""
+        cached = getattr(self, "_image_list", None)
+        if cached is not None and len(cached) == self.fileListWidget.count():
+            return cached
+        return [self.fileListWidget.item(i).text() for i in range(self.fileListWidget.count())]
+
+    def scanAllImages(self, folderPath: str) -> List[str]:  # type: ignore[override]
+        return self._scan_directory(folderPath)[0]
+
+    def _scan_directory(self, folder_path: str) -> Tuple[List[str], Set[str]]:
+        """一次遍历得到 (排序后的图像路径, 已有标注 JSON 路径集合)，不再逐张检查标注文件是否存在"""
+        extensions = tuple(
+            "." + fmt.data().decode().lower() for fmt in QImageReader.supportedImageFormats()
+        )
+        images: List[str] = []
+        label_files: Set[str] = set()
+        pending = [folder_path]
+        while pending:
+            try:
+                entries = list(os.scandir(pending.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                    continue
+                name = entry.name.lower()
+                if name.endswith(".json"):
+                    label_files.add(os.path.normcase(os.path.normpath(entry.path)))
+                elif name.endswith(extensions):
+                    images.append(os.path.normpath(entry.path))
+        if self.output_dir and os.path.isdir(self.output_dir):
+            for entry in os.scandir(self.output_dir):
+                if entry.name.lower().endswith(".json"):
+                    label_files.add(os.path.normcase(os.path.normpath(entry.path)))
+        try:
+            import natsort
+            images = natsort.os_sorted(images)
+        except ImportError:
+            images.sort()
+        return images, label_files
+
+    def _label_file_for(self, filename: str) -> str:
+        label_file = os.path.splitext(filename)[0] + ".json"
+        if self.output_dir:
+            label_file = os.path.join(self.output_dir, os.path.basename(label_file))
+        return os.path.normcase(os.path.normpath(label_file))
+
+    def importDirImages(self, dirpath, pattern=None, load=True):  # type: ignore[override]
+        """打开目录：首批条目加入后立即打开第一张图像，其余条目在事件循环空闲时分批补充"""
+        self.actions.openNextImg.setEnabled(True)
+        self.actions.openPrevImg.setEnabled(True)
+
+        if not self.mayContinue() or not dirpath:
+            return
+
+        self.lastOpenDir = dirpath
+        self.filename = None
+        self._file_list_token = getattr(self, "_file_list_token", 0) + 1
+        self.fileListWidget.clear()
+        self._image_list = []
+
+        filenames, label_files = self._scan_directory(dirpath)
+        if pattern:
+            try:
+                filenames = [f for f in filenames if re.search(pattern, f)]
+            except re.error:
+                pass
+        self._append_file_items(filenames[:FILE_LIST_CHUNK], label_files)
+        self.openNextImg(load=load)
+        if len(filenames) > FILE_LIST_CHUNK:
+            self._schedule_file_items(self._file_list_token, filenames, FILE_LIST_CHUNK, label_files)
+
+    def _schedule_file_items(self, token: int, filenames: List[str], start: int, label_files: Set[str]):
+        def append_next():
+            # 期间又打开了其他目录则放弃本次加载
+            if token != self._file_list_token:
+                return
+            end = start + FILE_LIST_CHUNK
+            self._append_file_items(filenames[start:end], label_files)
+            if end < len(filenames):
+                self._schedule_file_items(token, filenames, end, label_files)
+
+        QTimer.singleShot(0, append_next)
+
+    def _append_file_items(self, filenames: List[str], label_files: Set[str]):
+        self.fileListWidget.setUpdatesEnabled(False)
+        try:
+            for filename in filenames:
+                item = QListWidgetItem(filename)
+                item.setFlags(Qt.ItemIsEnabled | Qt.ItemIsSelectable)
+                item.setCheckState(
+                    Qt.Checked if self._label_file_for(filename) in label_files else Qt.Unchecked
+                )
+                self.fileListWidget.addItem(item)
+            self._image_list.extend(filenames)
+        finally:
+            self.fileListWidget.setUpdatesEnabled(True)
+
+    def loadFile(self, filename=None):  # type: ignore[override]
+        loaded = super().loadFile(filename)
+        if loaded:
+            self._prefetch_neighbours()
+        return loaded
+
+    def _prefetch_neighbours(self) -> None:
+        """后台预取当前图像前后的图像数据"""
+        row = self.fileListWidget.currentRow()
+        image_list = self.imageList
+        if row < 0 or not image_list:
+            return
+        rows = list(range(row + 1, row + 1 + PREFETCH_NEXT)) + list(range(row - PREFETCH_PREV, row))
+        paths = [image_list[i] for i in rows if 0 <= i < len(image_list)]
+        get_image_cache().prefetch(paths, "labelme", _original_load_image_file)
+
     # -------------------- 工具函数 --------------------
     def _get_current_image_path(self) -> Optional[str]:
         # 常见属性尝试
@@ -494,7 +652,8 @@ class LabelmeMainWindow(LabelmeMainWindowBase):
             from ultralytics import YOLO  # type: ignore
         except Exception as e:
             raise RuntimeError(f"未安装 ultralytics 库: {e}")
-        self._ai_model = YOLO(self._ai_model_path)
+        with AUTOLABEL_LOAD_SECONDS.time():
+            self._ai_model = YOLO(self._ai_model_path)
 
     def _predict_to_shapes(self, result) -> List[dict]:
         shapes: List[dict] = []
@@ -523,10 +682,12 @@ class LabelmeMainWindow(LabelmeMainWindowBase):
             raise RuntimeError("未找到当前图片，请先打开图片或目录")
 
         self._ensure_ai_loaded()
-        results = self._ai_model.predict(
-            img_path, conf=float(getattr(self, "_ai_conf", 0.25)), verbose=False
-        )
+        with AUTOLABEL_INFERENCE_SECONDS.time():
+            results = self._ai_model.predict(
+                img_path, conf=float(getattr(self, "_ai_conf", 0.25)), verbose=False
+            )
         if not results:
+            AUTOLABEL_ERRORS.inc()
             raise RuntimeError("模型无返回结果")
         shapes = self._predict_to_shapes(results[0])
 
@@ -545,8 +706,9 @@ class LabelmeMainWindow(LabelmeMainWindowBase):
         }
         json_path = os.path.splitext(img_path)[0] + ".json"
         import json
-        with open(json_path, "w", encoding="utf-8") as f:
+        with AUTOLABEL_WRITE_SECONDS.time(), open(json_path, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+        AUTOLABEL_IMAGES.inc()
 
         try:
             if hasattr(self, "loadFile") and callable(getattr(self, "loadFile")):
@@ -600,6 +762,7 @@ class LabelmeMainWindow(LabelmeMainWindowBase):
         import json
         from PIL import Image
 
+        AUTOLABEL_PENDING.set(len(images))
         for i, img_path in enumerate(images, start=1):
             if progress.wasCanceled():
                 break
@@ -607,10 +770,12 @@ class LabelmeMainWindow(LabelmeMainWindowBase):
             progress.setLabelText(f"处理 {os.path.basename(img_path)} ({i}/{len(images)})")
             QApplication.processEvents()
             try:
-                results = self._ai_model.predict(
-                    img_path, conf=float(getattr(self, "_ai_conf", 0.25)), verbose=False
-                )
+                with AUTOLABEL_INFERENCE_SECONDS.time():
+                    results = self._ai_model.predict(
+                        img_path, conf=float(getattr(self, "_ai_conf", 0.25)), verbose=False
+                    )
                 if not results:
+                    AUTOLABEL_ERRORS.inc()
                     continue
                 shapes = self._predict_to_shapes(results[0])
                 with Image.open(img_path) as im:
@@ -625,11 +790,18 @@ class LabelmeMainWindow(LabelmeMainWindowBase):
                     "imageWidth": int(width),
                 }
                 json_path = os.path.splitext(img_path)[0] + ".json"
-                with open(json_path, "w", encoding="utf-8") as f:
+                with AUTOLABEL_WRITE_SECONDS.time(), open(json_path, "w", encoding="utf-8") as f:
                     json.dump(data, f, ensure_ascii=False, indent=2)
-            except Exception:
+                AUTOLABEL_IMAGES.inc()
+            except Exception as e:
+                print(f"自动标注 {img_path} 失败: {e}")
+                AUTOLABEL_ERRORS.inc()
                 continue
+            finally:
+                # 处理完（含失败）才从待处理数中扣除
+                AUTOLABEL_PENDING.dec()
 
+        AUTOLABEL_PENDING.set(0)
         progress.setValue(len(images))
         cur = self._get_current_image_path()
         if cur:
@@ -1,14 +1,44 @@
 import os
 import sys
 
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QFont, QIcon
-from PyQt5.QtWidgets import QApplication
-
 # 添加当前目录到系统路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from ui.main_window import MainWindow
+from business.profiler import PROFILE_ARG, ImportTimer, get_profiler, trace_output_path
+
+# 开启性能分析（--profile 或 SLDMV_PROFILE）时记录各阶段与全部导入的耗时，
+# 窗口显示后打印启动耗时报告，并在显示后与退出时写出 trace；未开启时不记录也不打印
+profiler = get_profiler()
+trace_path = trace_output_path(sys.argv)
+import_timer = ImportTimer(profiler, nested=True)
+if profiler.enabled:
+    import_timer.start()
+
+with profiler.span("导入界面模块", "startup"):
+    from PyQt5.QtCore import Qt, QTimer
+    from PyQt5.QtGui import QFont, QIcon
+    from PyQt5.QtWidgets import QApplication
+
+    from business.metrics import start_server_from_env
+    from ui.main_window import MainWindow
+
+
+def report_startup(window):
+    """窗口显示后（事件循环首次空闲，首帧已绘制）输出启动耗时报告（仅开启性能分析时）"""
+    if profiler.enabled:
+        profiler.mark("首次绘制完成", "startup")
+        print(profiler.report())
+        save_trace()
+    window.statusBar().showMessage(f"就绪（启动用时 {profiler.now_ms() / 1000:.1f} 秒）")
+
+
+def save_trace():
+    """写出 Chrome trace 文件"""
+    try:
+        path = profiler.save_trace(trace_path)
+        print(f"性能跟踪已写入: {os.path.abspath(path)}（可在 chrome://tracing 或 ui.perfetto.dev 打开）")
+    except OSError as e:
+        print(f"写入性能跟踪失败: {e}")
 
 
 def main():
@@ -16,7 +46,8 @@ def main():
     QApplication.setAttribute(Qt.AA_EnableHighDpiScaling, True)
     QApplication.setAttribute(Qt.AA_UseHighDpiPixmaps, True)
     icon_path=os.path.join("icon","SLD-Logo-256.ico")
-    app = QApplication(sys.argv)
+    with profiler.span("创建 QApplication", "startup"):
+        app = QApplication([arg for arg in sys.argv if not arg.startswith(PROFILE_ARG)])
     app.setApplicationName("YOLO训练平台")
     app.setOrganizationName("YOLOPlatform")
     app.setWindowIcon(QIcon(icon_path))
@@ -49,9 +80,17 @@ def main():
         }
     """)
 
+    # 设置了 SLDMV_METRICS_PORT 时启动 Prometheus 指标导出
+    start_server_from_env()
+
     # 创建主窗口
-    window = MainWindow()
-    window.show()
+    with profiler.span("创建主窗口", "startup"):
+        window = MainWindow()
+    with profiler.span("显示主窗口", "startup"):
+        window.show()
+    QTimer.singleShot(0, lambda: report_startup(window))
+    if trace_path is not None:
+        app.aboutToQuit.connect(save_trace)
 
     sys.exit(app.exec_())
 
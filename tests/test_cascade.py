@@ -0,0 +1,77 @@
+"""级联推理：结果按输入顺序、每张输入图像恰好一个结果"""
+import pytest
+
+import business.cascade
+from business.detections import Detections
+from business.model_backends.base import STATUS_FAILED
+from business.model_backends.yolo_backend import YoloBackend
+
+
+class FakeResult:
+    def __init__(self, path, score):
+        self.path = path
+        self.score = score
+        self.orig_shape = (100, 100)
+
+
+class FakeGate:
+    """门控模型：文件名以 ng 开头的图像给出高分"""
+
+    def predict(self, chunk, **kwargs):
+        return [FakeResult(path, 0.9 if path.startswith('ng') else 0.0) for path in chunk]
+
+
+class FakeHeavy:
+    names = {0: 'defect'}
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(business.cascade, 'gate_score', lambda result, classes=(): result.score)
+    backend = YoloBackend()
+    monkeypatch.setattr(backend, 'load_model',
+                        lambda path, emit: FakeGate() if path == 'gate.pt' else FakeHeavy())
+    return backend
+
+
+def _config(images, tmp_path):
+    return {'model': 'heavy.pt', 'images': images, 'conf': 0.25, 'iou': 0.45, 'imgsz': 640, 'max_det': 100,
+            'output_dir': str(tmp_path),
+            'cascade': {'enabled': True, 'gate_model': 'gate.pt', 'escalate_threshold': 0.5, 'batch': 8}}
+
+
+def _heavy_result(backend, path):
+    return {'type': 'result', 'detections': Detections.empty({0: 'defect'}, (100, 100)),
+            'entry': {'image_path': path, 'backend': backend.name, 'raw_meta': {'inference_ms': 1.0}}}
+
+
+def test_results_in_input_order(backend, monkeypatch, tmp_path):
+    def heavy(config, ensemble, emit):
+        # 重模型倒序给出结果
+        for path in reversed(config['images']):
+            emit(_heavy_result(backend, path))
+        return {}
+
+    monkeypatch.setattr(backend, '_predict_images', heavy)
+    images = ['ok1.jpg', 'ng1.jpg', 'ok2.jpg', 'ng2.jpg', 'ok3.jpg']
+    events = []
+    status = backend.run_task('predict', _config(images, tmp_path), events.append)
+    results = [event for event in events if event['type'] == 'result']
+    assert [event['entry']['image_path'] for event in results] == images
+    assert [event['entry']['raw_meta']['escalated'] for event in results] == [False, True, False, True, False]
+    assert status['ok'] + status['ng'] == len(images)
+
+
+def test_drained_images_get_error_results(backend, monkeypatch, tmp_path):
+    def heavy(config, ensemble, emit):
+        emit(_heavy_result(backend, config['images'][0]))
+        raise RuntimeError("重模型出错")
+
+    monkeypatch.setattr(backend, '_predict_images', heavy)
+    images = ['ng1.jpg', 'ok1.jpg', 'ng2.jpg', 'ok2.jpg']
+    events = []
+    status = backend.run_task('predict', _config(images, tmp_path), events.append)
+    assert status['status'] == STATUS_FAILED
+    results = [event for event in events if event['type'] == 'result']
+    assert [event['entry']['image_path'] for event in results] == images
+    assert ['error' in event for event in results] == [False, False, True, False]
@@ -0,0 +1,120 @@
+"""NMS、加权框融合与集成推理的逐张容错"""
+import numpy as np
+import pytest
+
+import business.detections
+import business.image_hash
+from business.detections import Detections, nms
+from business.ensemble import FLIP_H, FLIP_NONE, greedy_clusters, weighted_boxes_fusion
+from business.manifest import ManifestReader
+from business.model_backends.yolo_backend import YoloBackend
+
+
+def _detections(boxes, scores, classes, names=None):
+    return Detections(np.array(boxes, dtype=np.float32), np.array(scores), np.array(classes),
+                      names or {0: 'scratch', 1: 'dent'}, (100, 100))
+
+
+def _brute_force_nms(boxes, scores, iou_threshold):
+    order = list(np.argsort(-scores, kind='stable'))
+    keep = []
+    while order:
+        i = order.pop(0)
+        keep.append(i)
+        order = [j for j in order if business.detections.box_iou(boxes[i], boxes[j:j + 1])[0] <= iou_threshold]
+    return np.array(keep)
+
+
+def test_nms_suppresses_overlaps_per_class():
+    boxes = np.array([[0, 0, 10, 10], [1, 0, 11, 10], [50, 50, 60, 60], [0, 0, 10, 10]], dtype=np.float32)
+    scores = np.array([0.9, 0.8, 0.7, 0.6], dtype=np.float32)
+    classes = np.array([0, 0, 0, 1])
+    assert nms(boxes, scores, 0.5).tolist() == [0, 2]
+    # 不同类别的重叠框互不抑制
+    assert nms(boxes, scores, 0.5, classes).tolist() == [0, 2, 3]
+    assert nms(boxes[:0], scores[:0], 0.5).tolist() == []
+
+
+def test_nms_row_path_matches_matrix_path(monkeypatch):
+    rng = np.random.default_rng(0)
+    xy = rng.uniform(0, 200, (300, 2)).astype(np.float32)
+    boxes = np.concatenate([xy, xy + rng.uniform(5, 40, (300, 2)).astype(np.float32)], axis=1)
+    scores = rng.uniform(0, 1, 300).astype(np.float32)
+    expected = _brute_force_nms(boxes, scores, 0.45)
+    assert nms(boxes, scores, 0.45).tolist() == expected.tolist()
+    monkeypatch.setattr(business.detections, 'NMS_MATRIX_LIMIT', 0)
+    assert nms(boxes, scores, 0.45).tolist() == expected.tolist()
+    # 簇首与 NMS 保留的框相同
+    leaders, cluster = greedy_clusters(boxes, scores, 0.45)
+    assert leaders.tolist() == expected.tolist()
+    assert (cluster[leaders] == np.arange(len(leaders))).all()
+
+
+def test_filter_applies_conf_and_max_det():
+    detections = _detections([[0, 0, 10, 10], [20, 20, 30, 30], [40, 40, 50, 50]], [0.9, 0.3, 0.1], [0, 1, 0])
+    assert detections.filter(0.25, 0.5, 100).scores.tolist() == pytest.approx([0.9, 0.3])
+    assert len(detections.filter(0.0, 0.5, 1)) == 1
+
+
+def test_wbf_known_values():
+    first = _detections([[0, 0, 10, 10]], [0.8], [0])
+    second = _detections([[2, 0, 12, 10]], [0.6], [0])
+    fused = weighted_boxes_fusion([first, second], [1.0, 1.0], iou_threshold=0.55, skip_conf=0.05)
+    assert len(fused) == 1
+    # 融合框按 置信度×权重 加权平均，置信度为加权和 / 总权重
+    np.testing.assert_allclose(fused.boxes[0], [1.2 / 1.4, 0, 15.2 / 1.4, 10], rtol=1e-5)
+    assert fused.scores[0] == pytest.approx(0.7)
+
+
+def test_wbf_lowers_boxes_missing_from_some_passes():
+    first = _detections([[0, 0, 10, 10], [50, 50, 60, 60]], [0.8, 0.5], [0, 0])
+    second = _detections([[0, 0, 10, 10]], [0.8], [0])
+    fused = weighted_boxes_fusion([first, second], [2.0, 1.0], iou_threshold=0.55, skip_conf=0.05)
+    assert fused.scores.tolist() == pytest.approx([0.8, 0.5 * 2.0 / 3.0])
+    # skip_conf 以下的框不参与融合
+    assert len(weighted_boxes_fusion([first, second], [2.0, 1.0], skip_conf=0.6)) == 1
+
+
+def test_wbf_aligns_classes_by_name():
+    first = _detections([[0, 0, 10, 10]], [0.8], [0], {0: 'scratch', 1: 'dent'})
+    second = _detections([[0, 0, 10, 10]], [0.8], [0], {0: 'dent', 1: 'scratch'})
+    fused = weighted_boxes_fusion([first, second], [1.0, 1.0])
+    # 名称不同的类别不归为一簇，类别编号以第一个结果为准
+    assert sorted(fused.class_name(c) for c in fused.classes) == ['dent', 'scratch']
+    assert fused.scores.tolist() == pytest.approx([0.4, 0.4])
+
+
+class FakeModel:
+    names = {0: 'scratch'}
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, views, **kwargs):
+        self.calls.append(len(views))
+        return [None] * len(views)
+
+
+def test_ensemble_skips_unreadable_images(monkeypatch, tmp_path):
+    model = FakeModel()
+    backend = YoloBackend()
+    monkeypatch.setattr(backend, 'load_model', lambda path, emit: model)
+    monkeypatch.setattr(business.image_hash, 'read_image',
+                        lambda path: None if 'broken' in path else np.zeros((100, 100, 3), dtype=np.uint8))
+    monkeypatch.setattr(Detections, 'from_ultralytics',
+                        classmethod(lambda cls, result: cls.empty({0: 'scratch'}, (100, 100))))
+    images = ['a.jpg', 'broken.jpg', 'b.jpg', 'broken2.jpg', 'broken3.jpg']
+    config = {'model': 'm.pt', 'images': images, 'conf': 0.25, 'iou': 0.45, 'imgsz': 640, 'max_det': 100,
+              'output_dir': str(tmp_path),
+              'ensemble': {'mode': 'tta', 'flips': [FLIP_NONE, FLIP_H], 'batch': 3}}
+    events = []
+    status = backend.run_task('predict', config, events.append)
+    assert status['status'] == 'success'
+    results = [event for event in events if event['type'] == 'result']
+    assert [event['entry']['image_path'] for event in results] == images
+    assert ['error' in event for event in results] == [False, True, False, True, True]
+    # 只有可读取的图像送入模型（每张 2 个翻转视图），全部无法读取的批次不推理
+    assert model.calls == [4]
+    assert status['ok'] == 2
+    batch = ManifestReader(str(tmp_path)).batch()
+    assert [error['image_path'] for error in batch['errors']] == ['broken.jpg', 'broken2.jpg', 'broken3.jpg']
@@ -0,0 +1,107 @@
+"""评估器：已知数值的 P/R/AP、混淆矩阵、误检/漏检索引与增量匹配"""
+import json
+
+import numpy as np
+import pytest
+
+from business.detections import Detections
+from business.evaluator import Evaluator, GroundTruth, LabelmeGroundTruth, image_key
+
+NAMES = {0: 'scratch', 1: 'dent'}
+
+
+def _gt(path, boxes, labels):
+    return {image_key(path): GroundTruth(path, np.array(boxes, dtype=np.float32), labels)}
+
+
+def _det(boxes, scores, classes):
+    return Detections(np.array(boxes, dtype=np.float32), np.array(scores), np.array(classes), NAMES, (100, 100))
+
+
+def test_precision_recall_ap_and_confusion():
+    # 两个标注：一个被精确命中，一个漏检；另有一个高置信度误检
+    gt = _gt('a.jpg', [[0, 0, 10, 10], [50, 50, 60, 60]], ['scratch', 'scratch'])
+    pred = {'a.jpg': _det([[0, 0, 10, 10], [80, 80, 90, 90]], [0.9, 0.8], [0, 0])}
+    report = Evaluator().evaluate(gt, pred)
+
+    assert report['precision'] == pytest.approx(0.5)
+    assert report['recall'] == pytest.approx(0.5)
+    # 召回率只到 0.5：101 个插值点中 0~0.5 的 51 个精度为 1，其余为 0
+    assert report['map50'] == pytest.approx(51 / 101)
+    assert report['map50_95'] == pytest.approx(51 / 101)
+    cls, = report['classes']
+    assert (cls['tp'], cls['fp'], cls['fn']) == (1, 1, 1)
+    # 行 = 预测，列 = 真实，最后一行/列为背景；模型的全部类别都进入矩阵
+    assert report['confusion_names'] == ['scratch', 'dent', '背景']
+    assert report['confusion_matrix'] == [[1, 0, 1], [0, 0, 0], [1, 0, 0]]
+
+
+def test_partial_overlap_counts_only_lower_iou_thresholds():
+    # IoU = 0.72：在 0.5~0.7 的 5 个阈值下命中，0.75~0.95 下未命中
+    gt = _gt('a.jpg', [[0, 0, 10, 10]], ['scratch'])
+    pred = {'a.jpg': _det([[0, 0, 10, 7.2]], [0.9], [0])}
+    report = Evaluator().evaluate(gt, pred)
+    assert report['map50'] == pytest.approx(1.0)
+    assert report['map50_95'] == pytest.approx(0.5)
+
+
+def test_wrong_class_goes_to_confusion_matrix_and_review_index():
+    gt = _gt('a.jpg', [[0, 0, 10, 10]], ['scratch'])
+    pred = {'a.jpg': _det([[0, 0, 10, 10], [40, 40, 50, 50]], [0.9, 0.1], [1, 0])}
+    evaluator = Evaluator()
+    report = evaluator.evaluate(gt, pred)
+
+    # 低于工作点置信度的预测只参与 AP
+    assert report['precision'] == 0.0 and report['recall'] == 0.0
+    names = report['confusion_names']
+    matrix = report['confusion_matrix']
+    assert matrix[names.index('dent')][names.index('scratch')] == 1
+    assert sum(map(sum, matrix)) == 1
+
+    row, = evaluator.review_index()
+    assert (row['fp'], row['fn'], row['fp_classes'], row['fn_classes']) == (1, 1, ['dent'], ['scratch'])
+    row, = evaluator.review_index(kind='fn')
+    assert (row['fp'], row['fn']) == (0, 1)
+    assert evaluator.review_index('scratch', kind='fp') == []
+    assert evaluator.review_index('unknown') == []
+
+
+def test_only_changed_images_are_rematched():
+    gt = {}
+    gt.update(_gt('a.jpg', [[0, 0, 10, 10]], ['scratch']))
+    gt.update(_gt('b.jpg', [[0, 0, 10, 10]], ['dent']))
+    pred = {'a.jpg': _det([[0, 0, 10, 10]], [0.9], [0]), 'b.jpg': _det([[0, 0, 10, 10]], [0.9], [1])}
+    evaluator = Evaluator()
+    assert evaluator.evaluate(gt, pred)['matched_images'] == 2
+    assert evaluator.evaluate(gt, pred)['matched_images'] == 0
+    # 内容相同的新对象不重新匹配
+    pred['a.jpg'] = _det([[0, 0, 10, 10]], [0.9], [0])
+    assert evaluator.evaluate(gt, pred)['matched_images'] == 0
+
+    pred['b.jpg'] = Detections.empty(NAMES)
+    report = evaluator.evaluate(gt, pred)
+    assert report['matched_images'] == 1
+    assert report['recall'] == pytest.approx(0.5)
+    assert report['precision'] == pytest.approx(1.0)
+
+
+def test_labelme_ground_truth_reads_nested_dirs_and_polygons(tmp_path):
+    nested = tmp_path / 'line1'
+    nested.mkdir()
+    shapes = [
+        {'label': 'scratch', 'shape_type': 'rectangle', 'points': [[10, 20], [30, 40]]},
+        {'label': 'dent', 'points': [[0, 0], [8, 2], [4, 6]]},
+        {'label': 'dent', 'shape_type': 'polygon', 'points': [[0, 0], [1, 1]]},
+    ]
+    (nested / 'a.json').write_text(json.dumps({'imagePath': '../x/a.png', 'shapes': shapes}), encoding='utf-8')
+    (tmp_path / 'bad.json').write_text('{', encoding='utf-8')
+
+    source = LabelmeGroundTruth(str(tmp_path))
+    ground_truth = source.refresh()
+    gt = ground_truth[image_key(str(nested / 'a.png'))]
+    assert gt.labels == ('scratch', 'dent')
+    assert gt.boxes.tolist() == [[10, 20, 30, 40], [0, 0, 8, 6]]
+    assert source.invalid_shapes == 1
+    assert source.unreadable_files == ['bad.json']
+    # 未修改的文件沿用同一 GroundTruth 对象
+    assert source.refresh()[image_key(str(nested / 'a.png'))] is gt
@@ -0,0 +1,137 @@
+"""预测清单：写入/筛选、被截断的最后一行、索引缺失与落后后续写的空隙补建"""
+import json
+import os
+
+import numpy as np
+import pytest
+
+from business.manifest import BATCH_FILE, INDEX_DTYPE, INDEX_FILE, MANIFEST_FILE, ManifestReader, ManifestWriter
+from business.model_backends.base import BackendError, MANIFEST_BROKEN, StopRequested
+
+
+def _entry(i, label=None, score=None):
+    return {'image_path': f'img_{i:03d}.jpg', 'backend': 'yolo',
+            'label': label or ('NG' if i % 3 == 0 else 'OK'), 'score': i / 10 if score is None else score}
+
+
+def _write(run_dir, start, stop, **kwargs):
+    with ManifestWriter(str(run_dir), 'yolo', **kwargs) as writer:
+        for i in range(start, stop):
+            writer.add(_entry(i))
+
+
+def _paths(reader):
+    return [entry['image_path'] for entry in reader]
+
+
+def _truncate_index(run_dir, records):
+    index_path = os.path.join(run_dir, INDEX_FILE)
+    with open(index_path, 'r+b') as f:
+        f.truncate(records * INDEX_DTYPE.itemsize)
+
+
+def test_write_select_and_page(tmp_path):
+    with ManifestWriter(str(tmp_path), 'yolo', flush_entries=4) as writer:
+        for i in range(10):
+            writer.add(_entry(i))
+        writer.add({'image_path': 'unknown.jpg', 'backend': 'yolo'})
+        writer.error('bad.jpg', '图像无法读取')
+    batch = ManifestReader(str(tmp_path)).batch()
+    assert batch['status'] == 'success'
+    assert batch['counts'] == {'total': 11, 'OK': 6, 'NG': 4}
+    assert batch['errors'] == [{'image_path': 'bad.jpg', 'message': '图像无法读取'}]
+
+    reader = ManifestReader(str(tmp_path))
+    assert len(reader) == 11
+    assert reader.counts() == {'total': 11, 'OK': 6, 'NG': 4}
+    # 缺少的必填字段补为 None
+    assert reader.read([10])[0]['heatmap_path'] is None
+    assert reader.select(label='NG').tolist() == [0, 3, 6, 9]
+    assert reader.select(min_score=0.25, max_score=0.55).tolist() == [3, 4, 5]
+    # 没有分数的条目排在最后
+    assert reader.select(sort_by_score=True).tolist()[:3] == [9, 8, 7]
+    assert reader.select(sort_by_score=True).tolist()[-1] == 10
+    assert [e['image_path'] for e in reader.page(1, 2, label='NG')] == ['img_003.jpg', 'img_006.jpg']
+    assert [e['image_path'] for e in reader.read([5, 1])] == ['img_005.jpg', 'img_001.jpg']
+
+
+def test_failed_and_stopped_runs_record_status(tmp_path):
+    with pytest.raises(RuntimeError):
+        with ManifestWriter(str(tmp_path / 'failed'), 'yolo') as writer:
+            writer.add(_entry(1))
+            raise RuntimeError('显存不足')
+    with pytest.raises(StopRequested):
+        with ManifestWriter(str(tmp_path / 'stopped'), 'yolo'):
+            raise StopRequested()
+    failed = ManifestReader(str(tmp_path / 'failed'))
+    assert (failed.batch()['status'], failed.batch()['message']) == ('failed', '显存不足')
+    assert len(failed) == 1
+    assert ManifestReader(str(tmp_path / 'stopped')).batch()['status'] == 'stopped'
+
+
+def test_missing_manifest_or_batch_is_reported(tmp_path):
+    with pytest.raises(BackendError) as info:
+        ManifestReader(str(tmp_path))
+    assert info.value.code == MANIFEST_BROKEN
+    _write(tmp_path, 0, 2)
+    os.remove(tmp_path / BATCH_FILE)
+    with pytest.raises(BackendError):
+        ManifestReader(str(tmp_path)).batch()
+
+
+def test_truncated_tail_is_skipped_until_complete(tmp_path):
+    _write(tmp_path, 0, 5)
+    line = json.dumps(_entry(5)).encode('utf-8') + b'\n'
+    # 进程在写最后一行时被强制结束：半行不索引
+    with open(tmp_path / MANIFEST_FILE, 'ab') as f:
+        f.write(line[:10])
+    reader = ManifestReader(str(tmp_path))
+    assert len(reader) == 5
+    # 仍在写入的任务补全该行后，refresh 增量索引
+    with open(tmp_path / MANIFEST_FILE, 'ab') as f:
+        f.write(line[10:])
+    assert reader.refresh() == 6
+    assert _paths(reader)[-1] == 'img_005.jpg'
+
+
+def test_resume_after_truncated_tail(tmp_path):
+    _write(tmp_path, 0, 3)
+    with open(tmp_path / MANIFEST_FILE, 'ab') as f:
+        f.write(b'{"image_path": "img_half')
+    # 续写时补齐换行，半行作为无法解析的行跳过
+    _write(tmp_path, 3, 6)
+    reader = ManifestReader(str(tmp_path))
+    assert _paths(reader) == [f'img_{i:03d}.jpg' for i in range(6)]
+    assert reader.broken_lines == 1
+
+
+def test_missing_index_is_rebuilt(tmp_path):
+    _write(tmp_path, 0, 7)
+    os.remove(tmp_path / INDEX_FILE)
+    reader = ManifestReader(str(tmp_path))
+    assert _paths(reader) == [f'img_{i:03d}.jpg' for i in range(7)]
+    assert reader.select(label='NG').tolist() == [0, 3, 6]
+
+
+def test_lagging_index_is_extended_from_manifest(tmp_path):
+    _write(tmp_path, 0, 8)
+    _truncate_index(tmp_path, 3)
+    reader = ManifestReader(str(tmp_path))
+    assert _paths(reader) == [f'img_{i:03d}.jpg' for i in range(8)]
+    # 索引中无效的尾部（偏移超出清单）同样丢弃后补建
+    with open(tmp_path / INDEX_FILE, 'ab') as f:
+        np.array([(10 ** 9, 10, 0, 0.5)], dtype=INDEX_DTYPE).tofile(f)
+    assert len(ManifestReader(str(tmp_path))) == 8
+
+
+def test_gap_left_by_lagging_index_and_resume_is_filled(tmp_path):
+    _write(tmp_path, 0, 6)
+    _truncate_index(tmp_path, 2)
+    # 索引落后后又续写：索引中 2~5 行缺失，之后的记录正常
+    _write(tmp_path, 6, 9)
+    index = np.fromfile(tmp_path / INDEX_FILE, dtype=INDEX_DTYPE)
+    assert len(index) == 5
+    reader = ManifestReader(str(tmp_path))
+    assert _paths(reader) == [f'img_{i:03d}.jpg' for i in range(9)]
+    assert reader.broken_lines == 0
+    assert reader.select(label='NG').tolist() == [0, 3, 6]
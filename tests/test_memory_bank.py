@@ -0,0 +1,72 @@
+"""PatchCore 记忆库：精确/IVF 搜索与暴力最近邻对比、重建时的索引文件、核心集采样"""
+import os
+
+import numpy as np
+import pytest
+
+from business.model_backends import memory_bank
+from business.model_backends.memory_bank import IVF_FILE, MemoryBank, greedy_coreset
+
+
+def _features(n=600, dim=24, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 4, (8, dim))
+    return (centers[rng.integers(len(centers), size=n)] + rng.normal(0, 0.5, (n, dim))).astype(np.float32)
+
+
+def _brute_force(bank, queries):
+    # 特征库以 float16 保存，暴力搜索也在同样取整后的特征上进行
+    bank = bank.astype(np.float16).astype(np.float64)
+    diff = queries.astype(np.float64)[:, None, :] - bank[None, :, :]
+    return np.sqrt((diff ** 2).sum(axis=2).min(axis=1))
+
+
+@pytest.mark.parametrize('preload', [False, True])
+def test_exact_search_matches_brute_force(tmp_path, monkeypatch, preload):
+    # 小块大小使搜索跨越多个块
+    monkeypatch.setattr(memory_bank, 'SEARCH_BLOCK_ROWS', 64)
+    features = _features()
+    queries = _features(50, seed=1)
+    MemoryBank.build(features, str(tmp_path))
+    bank = MemoryBank.load(str(tmp_path), preload=preload)
+    assert len(bank) == len(features) and bank.dim == features.shape[1]
+    assert not bank.has_ivf
+    np.testing.assert_allclose(bank.search(queries), _brute_force(features, queries), rtol=1e-4, atol=1e-3)
+
+
+def test_ivf_search(tmp_path):
+    features = _features()
+    queries = _features(50, seed=1)
+    bank = MemoryBank.build(features, str(tmp_path), ivf_lists=8)
+    assert bank.has_ivf and bank.info()['ivf_lists'] == 8
+    assert bank.offsets[0] == 0 and bank.offsets[-1] == len(features)
+    expected = _brute_force(features, queries)
+    # 探测全部簇即精确搜索
+    np.testing.assert_allclose(bank.search(queries, nprobe=8), expected, rtol=1e-4, atol=1e-3)
+    np.testing.assert_allclose(bank.search(queries), expected, rtol=1e-4, atol=1e-3)
+    # 近似搜索只会漏掉更近的点，距离不小于精确值；数据成簇时绝大多数查询结果一致
+    approx = bank.search(queries, nprobe=2)
+    assert (approx >= expected - 1e-3).all()
+    assert np.isclose(approx, expected, rtol=1e-4, atol=1e-3).mean() >= 0.9
+
+
+def test_rebuild_without_ivf_removes_stale_index(tmp_path):
+    features = _features()
+    MemoryBank.build(features, str(tmp_path), ivf_lists=8)
+    assert os.path.exists(tmp_path / IVF_FILE)
+    bank = MemoryBank.build(features[::-1], str(tmp_path))
+    assert not os.path.exists(tmp_path / IVF_FILE)
+    assert not MemoryBank.load(str(tmp_path)).has_ivf
+    queries = _features(20, seed=2)
+    np.testing.assert_allclose(bank.search(queries, nprobe=1), _brute_force(features, queries),
+                               rtol=1e-4, atol=1e-3)
+
+
+def test_greedy_coreset_covers_outliers():
+    features = _features(300)
+    assert greedy_coreset(features, 400).tolist() == list(range(300))
+    outlier = np.full((1, features.shape[1]), 100, dtype=np.float32)
+    features = np.concatenate([features, outlier])
+    selected = greedy_coreset(features, 16, projection_dim=8)
+    assert len(set(selected.tolist())) == 16
+    assert len(features) - 1 in selected
@@ -0,0 +1,157 @@
+"""复标队列：入队去重、按优先级领取批次、写回/冲突、跳过与清理后释放"""
+import json
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from business.detections import Detections
+from business.relabel_queue import (REASON_FN, REASON_FP, REASON_NG, REASON_UNCERTAIN, RelabelQueue,
+                                    items_from_detections, items_from_manifest, items_from_review)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = RelabelQueue(str(tmp_path / 'relabel'))
+    yield q
+    q.close()
+
+
+def _images(directory, count):
+    directory.mkdir(exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = directory / f'img_{i}.jpg'
+        path.write_bytes(b'jpg')
+        paths.append(str(path))
+    return paths
+
+
+def _save(json_file, data, mtime):
+    """模拟标注员保存（显式修改时间，避免文件系统时间精度影响判断）"""
+    with open(json_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.utime(json_file, (mtime, mtime))
+
+
+def _load(json_file):
+    with open(json_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_add_ignores_images_already_queued(queue, tmp_path):
+    paths = _images(tmp_path / 'data', 2)
+    assert queue.add([(paths[0], REASON_NG, 1.5, None), (paths[1], REASON_UNCERTAIN, 0.5, None)]) == 2
+    assert queue.add([(paths[0], REASON_FP, 3.0, None)]) == 0
+    # 已领取（物化）但未完成的图像同样不重复入队
+    queue.next_batch()
+    assert queue.add([(paths[1], REASON_FP, 3.0, None)]) == 0
+    assert queue.counts()['open'] == 2
+
+
+def test_next_batch_claims_by_priority_and_returns_open_batch_until_released(queue, tmp_path):
+    paths = _images(tmp_path / 'data', 5)
+    queue.add([(path, REASON_UNCERTAIN, float(i), None) for i, path in enumerate(paths)])
+    first = queue.next_batch(size=2)
+    assert sorted(os.listdir(first)) == ['00001__img_4.jpg', '00001__img_4.json',
+                                         '00002__img_3.jpg', '00002__img_3.json']
+    assert _load(os.path.join(first, '00001__img_4.json'))['imagePath'] == '00001__img_4.jpg'
+    assert queue.counts()['pending'] == 3 and queue.counts()['open'] == 2
+    # 未处理完的批次再次领取时原样返回，不物化新批次
+    assert queue.next_batch(size=2) == first
+    assert queue.open_batches() == [1]
+
+    # 跳过释放该批，下一批按优先级继续
+    assert queue.skip_batch(1) == 2
+    second = queue.next_batch(size=2)
+    assert second != first
+    assert sorted(name for name in os.listdir(second) if name.endswith('.jpg')) == ['00001__img_2.jpg',
+                                                                                   '00002__img_1.jpg']
+    assert queue.counts()['skipped'] == 2
+
+
+def test_missing_images_are_skipped_when_claimed(queue, tmp_path):
+    paths = _images(tmp_path / 'data', 2)
+    queue.add([(paths[0], REASON_NG, 2.0, None), (paths[1], REASON_NG, 1.0, None)])
+    os.remove(paths[0])
+    os.remove(paths[1])
+    assert queue.next_batch(size=1) is None
+    assert queue.counts()['skipped'] == 2
+    assert queue.next_batch() is None
+
+
+def test_prefill_prefers_existing_annotation(queue, tmp_path):
+    paths = _images(tmp_path / 'data', 2)
+    existing = {'shapes': [{'label': 'dent', 'points': [[1, 1], [2, 2]], 'shape_type': 'rectangle'}],
+                'imagePath': 'img_0.jpg', 'imageData': 'abc'}
+    _save(os.path.splitext(paths[0])[0] + '.json', existing, 1_000_000)
+    predicted = [{'label': 'scratch', 'points': [[0, 0], [5, 5]], 'shape_type': 'rectangle'}]
+    queue.add([(paths[0], REASON_NG, 2.0, predicted), (paths[1], REASON_NG, 1.0, predicted)])
+    directory = queue.next_batch()
+    first = _load(os.path.join(directory, '00001__img_0.json'))
+    assert [s['label'] for s in first['shapes']] == ['dent'] and first['imageData'] is None
+    assert [s['label'] for s in _load(os.path.join(directory, '00002__img_1.json'))['shapes']] == ['scratch']
+
+
+def test_sync_writes_back_saved_items_and_detects_conflicts(queue, tmp_path):
+    paths = _images(tmp_path / 'data', 3)
+    queue.add([(path, REASON_NG, 3.0 - i, None) for i, path in enumerate(paths)])
+    directory = queue.next_batch()
+    # 未保存的条目不写回
+    assert queue.sync() == {'done': 0, 'conflict': 0}
+
+    saved = {'shapes': [{'label': 'scratch', 'points': [[0, 0], [3, 3]], 'shape_type': 'rectangle'}],
+             'imagePath': '00001__img_0.jpg'}
+    _save(os.path.join(directory, '00001__img_0.json'), saved, 2_000_000)
+    _save(os.path.join(directory, '00002__img_1.json'), saved, 2_000_000)
+    # 送标后原标注被其他人修改：不覆盖
+    _save(os.path.splitext(paths[1])[0] + '.json', {'shapes': []}, 1_500_000)
+    assert queue.sync() == {'done': 1, 'conflict': 1}
+    written = _load(os.path.splitext(paths[0])[0] + '.json')
+    assert written['imagePath'] == 'img_0.jpg' and written['shapes'][0]['label'] == 'scratch'
+    assert _load(os.path.splitext(paths[1])[0] + '.json') == {'shapes': []}
+    # 再次同步不重复写回；再次保存时重新写回
+    assert queue.sync() == {'done': 0, 'conflict': 0}
+    _save(os.path.join(directory, '00001__img_0.json'), saved, 3_000_000)
+    assert queue.sync() == {'done': 1, 'conflict': 0}
+    counts = queue.counts()
+    assert (counts['done'], counts['conflict'], counts['open']) == (1, 1, 1)
+
+    # 还有未保存的条目时批次保留；跳过后清理删除目录并释放图像可重新入队
+    assert queue.cleanup() == 0
+    assert queue.skip_batch(1) == 1
+    assert queue.cleanup() == 1
+    assert not os.path.exists(directory)
+    assert queue.add([(paths[0], REASON_FN, 1.0, None)]) == 1
+    # 已清理批次中的条目不再同步
+    assert queue.sync() == {'done': 0, 'conflict': 0}
+
+
+def test_items_from_results():
+    names = {0: 'scratch'}
+    detections = {
+        'ng.jpg': Detections(np.array([[0, 0, 5, 5], [1, 1, 2, 2]]), np.array([0.9, 0.2]), np.array([0, 0]), names),
+        'edge.jpg': Detections(np.array([[0, 0, 5, 5]]), np.array([0.2]), np.array([0]), names),
+        'clear.jpg': Detections(np.array([[0, 0, 5, 5]]), np.array([0.05]), np.array([0]), names),
+    }
+    decisions = {'ng.jpg': SimpleNamespace(is_ng=True, score=0.9)}
+    items = {path: tuple(item) for path, *item in items_from_detections(detections, 0.25, decisions)}
+    assert set(items) == {'ng.jpg', 'edge.jpg'}
+    reason, priority, shapes = items['ng.jpg']
+    assert (reason, priority) == (REASON_NG, pytest.approx(1.9))
+    # 预填形状只含不低于阈值的框
+    assert len(shapes) == 1 and shapes[0]['description'] == 'pred 0.90'
+    assert items['edge.jpg'][:2] == (REASON_UNCERTAIN, pytest.approx(1 - 0.05 / 0.15))
+    # 低于阈值的临界图像不预填
+    assert items['edge.jpg'][2] == []
+
+    entries = [
+        {'image_path': 'a.jpg', 'label': 'NG', 'score': 0.8},
+        {'image_path': 'b.jpg', 'label': 'OK', 'score': 0.45, 'threshold_mode': 'score', 'threshold_value': 0.5},
+        {'image_path': 'c.jpg', 'label': 'OK', 'score': 0.1, 'threshold_mode': 'score', 'threshold_value': 0.5},
+    ]
+    assert [item[:2] for item in items_from_manifest(entries)] == [('a.jpg', REASON_NG), ('b.jpg', REASON_UNCERTAIN)]
+
+    rows = [{'path': 'x.jpg', 'fp': 2, 'fn': 1}, {'path': 'y.jpg', 'fp': 0, 'fn': 1}]
+    assert items_from_review(rows) == [('x.jpg', REASON_FP, 3.0, None), ('y.jpg', REASON_FN, 1.0, None)]
@@ -1,16 +1,32 @@
 """
 界面层
+
+各界面模块按需导入，避免导入 ui 包时加载全部界面及其依赖
 """
-from .category_widget import CategoryWidget
-from .label_widget import LabelWidget
-from .main_window import MainWindow
-from .predict_widget import PredictWidget
-from .train_widget import TrainWidget
+import importlib
+
+_EXPORTS = {
+    'MainWindow': '.main_window',
+    'CategoryWidget': '.category_widget',
+    'LabelWidget': '.label_widget',
+    'TrainWidget': '.train_widget',
+    'PredictWidget': '.predict_widget',
+    'MetricsWidget': '.metrics_widget',
+}
 
 __all__ = [
     'MainWindow',
     'CategoryWidget',
     'LabelWidget',
     'TrainWidget',
-    'PredictWidget'
-]
\ No newline at end of file
+    'PredictWidget',
+    'MetricsWidget',
+]
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
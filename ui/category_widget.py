@@ -211,6 +211,10 @@ class CategoryWidget(QWidget):
         self.stats_label.setStyleSheet("color: #7f8c8d; font-size: 12px; padding: 5px;")
         layout.addWidget(self.stats_label)
 
+    def on_categories_changed(self):
+        """类别文件被其他进程修改（ConfigWatcher 已重新加载）后刷新列表"""
+        self.load_categories()
+
     def load_categories(self):
         """加载类别列表"""
         self.table.setRowCount(0)
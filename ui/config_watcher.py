@@ -0,0 +1,42 @@
+"""
+配置变更监听 - 定时检查共享配置（其他工作站、labelme 进程、后台任务的修改），以信号通知各界面增量刷新
+"""
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+
+class ConfigWatcher(QObject):
+    """配置变更监听器
+
+    products_changed(list): ProductManager 的变更记录（本进程与其他进程的修改都会通知）
+    categories_changed(): CategoryManager 对应的 JSON 文件被其他进程修改并已重新加载
+    """
+
+    products_changed = pyqtSignal(list)
+    categories_changed = pyqtSignal()
+
+    def __init__(self, product_manager=None, category_manager=None, interval_ms: int = 1000, parent=None):
+        super().__init__(parent)
+        self.product_manager = product_manager
+        self.category_manager = category_manager
+        if product_manager is not None:
+            product_manager.subscribe(self._on_product_changes)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.poll)
+        self.timer.start()
+
+    def poll(self):
+        """检查一次变更（PRAGMA data_version / 文件签名，无修改时开销很小）"""
+        if self.product_manager is not None:
+            self.product_manager.poll()
+        if self.category_manager is not None and self.category_manager.reload_if_changed():
+            self.categories_changed.emit()
+
+    def stop(self):
+        self.timer.stop()
+        if self.product_manager is not None:
+            self.product_manager.unsubscribe(self._on_product_changes)
+
+    def _on_product_changes(self, changes):
+        self.products_changed.emit(changes)
@@ -0,0 +1,283 @@
+"""
+模型评估对话框 - 将当前预测结果或结果库中的任务与 labelme 标注对比，
+显示各类别 P/R/AP、混淆矩阵，并列出有误检/漏检的图像供复查
+"""
+import os
+
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QDoubleSpinBox, QLineEdit,
+                             QPushButton, QTableWidget, QTableWidgetItem, QHeaderView, QMessageBox, QFileDialog,
+                             QTabWidget, QWidget)
+
+from business.detections import RAW_CONF
+from business.evaluator import Evaluator, LabelmeGroundTruth
+from business.profiler import name_thread, span
+
+# 预测来源：当前预测界面中的结果
+SOURCE_CURRENT = 'current'
+
+
+class EvaluateThread(QThread):
+    """评估线程（读取标注、载入结果库任务与匹配都在后台完成）"""
+
+    finished_signal = pyqtSignal(bool, object)  # 是否成功, 报告字典或错误信息
+
+    def __init__(self, evaluator, ground_truth, predictions=None, nms_params=None, results_store=None, run_id=None):
+        super().__init__()
+        self.evaluator = evaluator
+        self.ground_truth = ground_truth
+        self.predictions = predictions
+        # 当前预测结果为原始检测框，评估前按 (iou, max_det) 做 NMS
+        self.nms_params = nms_params
+        self.results_store = results_store
+        self.run_id = run_id
+
+    def run(self):
+        name_thread("EvaluateThread")
+        try:
+            with span("读取标注", "evaluate"):
+                ground_truth = self.ground_truth.refresh()
+            if self.predictions is None:
+                with span("载入结果库任务", "evaluate", run_id=self.run_id):
+                    predictions = self.results_store.run_predictions(self.run_id)
+            else:
+                iou, max_det = self.nms_params
+                with span("NMS", "evaluate", images=len(self.predictions)):
+                    predictions = {path: det.filter(RAW_CONF, iou, max_det)
+                                   for path, det in self.predictions.items()}
+            with span("匹配与汇总", "evaluate", images=len(ground_truth)):
+                report = self.evaluator.evaluate(ground_truth, predictions)
+            report['invalid_shapes'] = self.ground_truth.invalid_shapes
+            report['unreadable_files'] = list(self.ground_truth.unreadable_files)
+            self.finished_signal.emit(True, report)
+        except Exception as e:
+            self.finished_signal.emit(False, f"评估出错: {str(e)}")
+
+
+class EvaluationDialog(QDialog):
+    """模型评估对话框"""
+
+    # 将待复查的图像路径显示到预测界面的图像列表
+    show_images = pyqtSignal(list)
+    # 将误检/漏检图像（review_index 的行）送入复标队列
+    relabel_images = pyqtSignal(list)
+
+    def __init__(self, predictions_provider, results_store=None, parent=None):
+        """predictions_provider() 返回 (当前原始检测框 {图像路径: Detections}, NMS IoU, 最大检测数)"""
+        super().__init__(parent)
+        self.predictions_provider = predictions_provider
+        self.results_store = results_store
+        self.evaluator = Evaluator()
+        self.ground_truth = None
+        self.eval_thread = None
+        self.init_ui()
+
+    def init_ui(self):
+        """初始化UI"""
+        self.setWindowTitle("模型评估")
+        self.resize(1000, 680)
+
+        layout = QVBoxLayout(self)
+
+        # 标注目录与预测来源
+        source_layout = QHBoxLayout()
+        source_layout.addWidget(QLabel("标注目录："))
+        self.gt_edit = QLineEdit()
+        self.gt_edit.setPlaceholderText("labelme 标注目录（图像与 JSON 同目录）")
+        source_layout.addWidget(self.gt_edit)
+        gt_btn = QPushButton("📁")
+        gt_btn.setMaximumWidth(40)
+        gt_btn.clicked.connect(self.select_gt_dir)
+        source_layout.addWidget(gt_btn)
+        source_layout.addWidget(QLabel("预测来源："))
+        self.source_combo = QComboBox()
+        self.source_combo.setMinimumWidth(240)
+        self.source_combo.addItem("当前预测结果", SOURCE_CURRENT)
+        if self.results_store is not None:
+            for run in self.results_store.list_runs():
+                self.source_combo.addItem(
+                    f"#{run['id']} {run['name']} | {os.path.basename(run['model_path'])}", run['id'])
+        self.source_combo.currentIndexChanged.connect(lambda _: self.evaluator.reset())
+        source_layout.addWidget(self.source_combo)
+        layout.addLayout(source_layout)
+
+        option_layout = QHBoxLayout()
+        option_layout.addWidget(QLabel("置信度阈值："))
+        self.conf_spin = QDoubleSpinBox()
+        self.conf_spin.setRange(0.0, 1.0)
+        self.conf_spin.setSingleStep(0.05)
+        self.conf_spin.setValue(self.evaluator.conf)
+        option_layout.addWidget(self.conf_spin)
+        option_layout.addWidget(QLabel("匹配 IoU："))
+        self.iou_spin = QDoubleSpinBox()
+        self.iou_spin.setRange(0.05, 0.95)
+        self.iou_spin.setSingleStep(0.05)
+        self.iou_spin.setValue(self.evaluator.match_iou)
+        option_layout.addWidget(self.iou_spin)
+        self.eval_btn = QPushButton("📊 开始评估")
+        self.eval_btn.clicked.connect(self.start_evaluate)
+        option_layout.addWidget(self.eval_btn)
+        option_layout.addStretch()
+        layout.addLayout(option_layout)
+
+        self.summary_label = QLabel("")
+        self.summary_label.setWordWrap(True)
+        layout.addWidget(self.summary_label)
+
+        tabs = QTabWidget()
+        self.class_table = QTableWidget(0, 10)
+        self.class_table.setHorizontalHeaderLabels(
+            ["类别", "标注数", "预测数", "TP", "FP", "FN", "精确率", "召回率", "AP50", "AP50-95"])
+        self._setup_table(self.class_table)
+        tabs.addTab(self.class_table, "各类别指标")
+
+        self.confusion_table = QTableWidget(0, 0)
+        self.confusion_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        tabs.addTab(self.confusion_table, "混淆矩阵（行=预测，列=真实）")
+
+        review_widget = QWidget()
+        review_layout = QVBoxLayout(review_widget)
+        review_filter = QHBoxLayout()
+        self.review_kind = QComboBox()
+        self.review_kind.addItem("误检+漏检", 'all')
+        self.review_kind.addItem("只看误检", 'fp')
+        self.review_kind.addItem("只看漏检", 'fn')
+        self.review_kind.currentIndexChanged.connect(self.refresh_review)
+        review_filter.addWidget(self.review_kind)
+        self.review_class = QComboBox()
+        self.review_class.currentIndexChanged.connect(self.refresh_review)
+        review_filter.addWidget(self.review_class)
+        review_filter.addStretch()
+        show_btn = QPushButton("📋 显示到图像列表")
+        show_btn.clicked.connect(self.on_show_images)
+        review_filter.addWidget(show_btn)
+        relabel_btn = QPushButton("📝 送标注")
+        relabel_btn.clicked.connect(self.on_relabel_images)
+        review_filter.addWidget(relabel_btn)
+        review_layout.addLayout(review_filter)
+        self.review_table = QTableWidget(0, 5)
+        self.review_table.setHorizontalHeaderLabels(["图像", "误检", "漏检", "误检类别", "漏检类别"])
+        self._setup_table(self.review_table)
+        review_layout.addWidget(self.review_table)
+        tabs.addTab(review_widget, "误检/漏检图像")
+        layout.addWidget(tabs)
+
+    @staticmethod
+    def _setup_table(table):
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        table.horizontalHeader().setStretchLastSection(True)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        table.setSelectionBehavior(QTableWidget.SelectRows)
+
+    def select_gt_dir(self):
+        directory = QFileDialog.getExistingDirectory(self, "选择 labelme 标注目录")
+        if directory:
+            self.gt_edit.setText(directory)
+
+    def start_evaluate(self):
+        """开始评估（再次评估时只重新匹配标注或预测有变化的图像）"""
+        gt_dir = self.gt_edit.text().strip()
+        if not gt_dir or not os.path.isdir(gt_dir):
+            QMessageBox.warning(self, "警告", "请选择 labelme 标注目录！")
+            return
+        if self.ground_truth is None or self.ground_truth.source_dir != gt_dir:
+            self.ground_truth = LabelmeGroundTruth(gt_dir)
+            self.evaluator.reset()
+
+        source = self.source_combo.currentData()
+        predictions = nms_params = None
+        if source == SOURCE_CURRENT:
+            predictions, iou, max_det = self.predictions_provider()
+            nms_params = (iou, max_det)
+            if not predictions:
+                QMessageBox.warning(self, "警告", "当前没有预测结果，请先预测或选择结果库中的任务！")
+                return
+
+        self.evaluator.set_operating_point(self.conf_spin.value(), self.iou_spin.value())
+        self.eval_btn.setEnabled(False)
+        self.summary_label.setText("正在评估...")
+        self.eval_thread = EvaluateThread(
+            self.evaluator,
+            self.ground_truth,
+            predictions,
+            nms_params,
+            self.results_store,
+            None if source == SOURCE_CURRENT else source,
+        )
+        self.eval_thread.finished_signal.connect(self.on_evaluate_finished)
+        self.eval_thread.start()
+
+    def on_evaluate_finished(self, success, report):
+        self.eval_btn.setEnabled(True)
+        if not success:
+            self.summary_label.setText("评估失败")
+            QMessageBox.warning(self, "评估失败", report)
+            return
+
+        summary = (f"图像 {report['num_images']} 张，标注 {report['num_instances']} 个 | "
+                   f"P {report['precision']:.3f}  R {report['recall']:.3f}  "
+                   f"mAP50 {report['map50']:.3f}  mAP50-95 {report['map50_95']:.3f} | "
+                   f"本次匹配 {report['matched_images']} 张，用时 {report['elapsed']} 秒")
+        if report['unlabeled_predictions']:
+            summary += f"\n{report['unlabeled_predictions']} 张预测图像没有标注，未参与评估"
+        if report['invalid_shapes'] or report['unreadable_files']:
+            summary += f"\n忽略无效形状 {report['invalid_shapes']} 个，无法读取的标注文件 {len(report['unreadable_files'])} 个"
+        self.summary_label.setText(summary)
+
+        self.class_table.setRowCount(len(report['classes']))
+        for row, item in enumerate(report['classes']):
+            values = [item['name'], item['instances'], item['predictions'], item['tp'], item['fp'], item['fn'],
+                      f"{item['precision']:.3f}", f"{item['recall']:.3f}", f"{item['ap50']:.3f}",
+                      f"{item['ap50_95']:.3f}"]
+            for column, value in enumerate(values):
+                cell = QTableWidgetItem(str(value))
+                if column > 0:
+                    cell.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.class_table.setItem(row, column, cell)
+
+        names = report['confusion_names']
+        matrix = report['confusion_matrix']
+        self.confusion_table.setRowCount(len(names))
+        self.confusion_table.setColumnCount(len(names))
+        self.confusion_table.setHorizontalHeaderLabels(names)
+        self.confusion_table.setVerticalHeaderLabels(names)
+        for i, row in enumerate(matrix):
+            for j, value in enumerate(row):
+                cell = QTableWidgetItem(str(value))
+                cell.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.confusion_table.setItem(i, j, cell)
+
+        self.review_class.blockSignals(True)
+        self.review_class.clear()
+        self.review_class.addItem("全部类别", None)
+        for item in report['classes']:
+            self.review_class.addItem(item['name'], item['name'])
+        self.review_class.blockSignals(False)
+        self.refresh_review()
+
+    def refresh_review(self, *args):
+        """按类别与类型刷新误检/漏检图像列表"""
+        if self.eval_thread is not None and self.eval_thread.isRunning():
+            return
+        rows = self.evaluator.review_index(self.review_class.currentData(), self.review_kind.currentData())
+        self.review_table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            values = [row['path'], row['fp'], row['fn'], ', '.join(row['fp_classes']), ', '.join(row['fn_classes'])]
+            for column, value in enumerate(values):
+                self.review_table.setItem(i, column, QTableWidgetItem(str(value)))
+
+    def on_show_images(self):
+        paths = [self.review_table.item(i, 0).text() for i in range(self.review_table.rowCount())]
+        if not paths:
+            QMessageBox.information(self, "提示", "没有需要复查的图像")
+            return
+        self.show_images.emit(paths)
+
+    def on_relabel_images(self):
+        if self.eval_thread is not None and self.eval_thread.isRunning():
+            return
+        rows = self.evaluator.review_index(self.review_class.currentData(), self.review_kind.currentData())
+        if not rows:
+            QMessageBox.information(self, "提示", "没有需要复查的图像")
+            return
+        self.relabel_images.emit(rows)
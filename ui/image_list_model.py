@@ -0,0 +1,240 @@
+"""
+图像列表模型 - 基于 model/view 的大规模图像列表（数十万条目）：
+路径字典去重、后台递归扫描分批加入、过滤与排序、可见条目按需加载缩略图
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QIcon, QImage, QPixmap
+
+from ui.thumbnail_loader import ThumbnailLoader
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+# 排序方式
+SORT_NONE = 'none'
+SORT_NAME = 'name'
+SORT_PATH = 'path'
+SORT_MTIME = 'mtime'
+# 内存中保留的缩略图图标数（超出后淘汰最久未显示的，需要时从磁盘缓存重新读取）
+MAX_ICONS = 5000
+
+
+class FolderScanThread(QThread):
+    """后台递归扫描文件夹，分批发出找到的图像路径及其修改时间（按修改时间排序时不必在界面线程读取）"""
+
+    batch_found = pyqtSignal(list, list)  # 路径, st_mtime
+    scan_finished = pyqtSignal(int)
+
+    def __init__(self, folder: str, extensions=IMAGE_EXTENSIONS, batch_size: int = 2000,
+                 batch_interval: float = 0.2, parent=None):
+        super().__init__(parent)
+        self.folder = folder
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        total = 0
+        batch: List[str] = []
+        mtimes: List[float] = []
+        last_emit = time.monotonic()
+        pending = [self.folder]
+        while pending and not self._cancelled:
+            try:
+                entries = sorted(os.scandir(pending.pop()), key=lambda e: e.name)
+            except OSError as e:
+                print(f"扫描文件夹失败: {e}")
+                continue
+            subdirs = []
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.lower().endswith(self.extensions):
+                        mtimes.append(entry.stat().st_mtime)
+                        batch.append(entry.path)
+                except OSError:
+                    continue
+            # 逆序压栈，保持子目录按名称顺序遍历
+            pending.extend(reversed(subdirs))
+            now = time.monotonic()
+            if len(batch) >= self.batch_size or (batch and now - last_emit >= self.batch_interval):
+                total += len(batch)
+                self.batch_found.emit(batch, mtimes)
+                batch, mtimes = [], []
+                last_emit = now
+        if batch and not self._cancelled:
+            total += len(batch)
+            self.batch_found.emit(batch, mtimes)
+        self.scan_finished.emit(total)
+
+
+class ImageListModel(QAbstractListModel):
+    """图像路径列表模型
+
+    全部路径按加入顺序保存，视图行为过滤、排序后的下标；新加入的条目追加在末尾，
+    排序在 apply_view()（修改过滤/排序或扫描结束时）统一进行
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._paths: List[str] = []
+        # 与 _paths 同序的修改时间（扫描时取得；未知为 None，按修改时间排序时才读取并缓存）
+        self._mtimes: List[Optional[float]] = []
+        self._index: Dict[str, int] = {}
+        self._view: List[int] = []
+        self._view_row: Dict[int, int] = {}
+        self._filter = ''
+        self._sort = SORT_NONE
+        self._descending = False
+        self._icons: 'OrderedDict[str, QIcon]' = OrderedDict()
+        self._requested = set()
+        self._to_request: List[str] = []
+        self.thumbnail_loader = ThumbnailLoader(self)
+        self.thumbnail_loader.thumbnail_ready.connect(self._on_thumbnail)
+
+    # ---------- Qt 模型接口 ----------
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._view)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._view):
+            return None
+        path = self._paths[self._view[index.row()]]
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return path
+        if role == Qt.DecorationRole:
+            return self._icon(path)
+        return None
+
+    # ---------- 数据 ----------
+    def total_count(self) -> int:
+        return len(self._paths)
+
+    def path_at(self, row: int) -> Optional[str]:
+        if 0 <= row < len(self._view):
+            return self._paths[self._view[row]]
+        return None
+
+    def visible_paths(self) -> List[str]:
+        """过滤、排序后的全部路径"""
+        return [self._paths[i] for i in self._view]
+
+    def add_paths(self, paths: Iterable[str], mtimes: Optional[Sequence[float]] = None) -> int:
+        """加入路径（已存在的跳过），返回新增数量；mtimes 为与 paths 同序的修改时间"""
+        start = len(self._paths)
+        if mtimes is None:
+            paths = ((path, None) for path in paths)
+        else:
+            paths = zip(paths, mtimes)
+        for path, mtime in paths:
+            if path not in self._index:
+                self._index[path] = len(self._paths)
+                self._paths.append(path)
+                self._mtimes.append(mtime)
+        added = range(start, len(self._paths))
+        if not added:
+            return 0
+        visible = [i for i in added if self._matches(self._paths[i])]
+        if visible:
+            first = len(self._view)
+            self.beginInsertRows(QModelIndex(), first, first + len(visible) - 1)
+            for offset, i in enumerate(visible):
+                self._view_row[i] = first + offset
+            self._view.extend(visible)
+            self.endInsertRows()
+        return len(added)
+
+    def clear(self):
+        self.thumbnail_loader.cancel()
+        self.beginResetModel()
+        self._paths.clear()
+        self._mtimes.clear()
+        self._index.clear()
+        self._view.clear()
+        self._view_row.clear()
+        self._icons.clear()
+        self._requested.clear()
+        self._to_request.clear()
+        self.endResetModel()
+
+    # ---------- 过滤与排序 ----------
+    def set_filter(self, text: str):
+        """按路径子串过滤（不区分大小写，空格分隔的多个关键字须全部匹配）"""
+        self._filter = text.strip().lower()
+        self.apply_view()
+
+    def set_sort(self, key: str, descending: bool = False):
+        self._sort = key
+        self._descending = descending
+        self.apply_view()
+
+    def _matches(self, path: str) -> bool:
+        if not self._filter:
+            return True
+        lowered = path.lower()
+        return all(word in lowered for word in self._filter.split())
+
+    def apply_view(self):
+        """重新计算过滤、排序后的视图行"""
+        self.beginResetModel()
+        view = [i for i, path in enumerate(self._paths) if self._matches(path)]
+        if self._sort == SORT_NAME:
+            view.sort(key=lambda i: os.path.basename(self._paths[i]).lower(), reverse=self._descending)
+        elif self._sort == SORT_PATH:
+            view.sort(key=lambda i: self._paths[i].lower(), reverse=self._descending)
+        elif self._sort == SORT_MTIME:
+            mtimes = self._mtimes
+            for i in view:
+                if mtimes[i] is None:
+                    mtimes[i] = _mtime(self._paths[i])
+            view.sort(key=mtimes.__getitem__, reverse=self._descending)
+        elif self._descending:
+            view.reverse()
+        self._view = view
+        self._view_row = {i: row for row, i in enumerate(view)}
+        self.endResetModel()
+
+    # ---------- 缩略图（只为实际显示的条目加载） ----------
+    def _icon(self, path: str) -> Optional[QIcon]:
+        icon = self._icons.get(path)
+        if icon is not None:
+            self._icons.move_to_end(path)
+            return icon
+        if path not in self._requested:
+            self._requested.add(path)
+            if not self._to_request:
+                QTimer.singleShot(0, self._flush_requests)
+            self._to_request.append(path)
+        return None
+
+    def _flush_requests(self):
+        paths, self._to_request = self._to_request, []
+        self.thumbnail_loader.request(paths)
+
+    def _on_thumbnail(self, path: str, image: QImage):
+        i = self._index.get(path)
+        if i is None:
+            return
+        self._icons[path] = QIcon(QPixmap.fromImage(image))
+        while len(self._icons) > MAX_ICONS:
+            evicted, _ = self._icons.popitem(last=False)
+            self._requested.discard(evicted)
+        row = self._view_row.get(i)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0.0
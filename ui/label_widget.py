@@ -22,8 +22,15 @@ from PyQt5.QtWidgets import (
     QDialog,
     QTabWidget,
     QScrollArea,
+    QTextBrowser,
+    QCheckBox,
+    QSpinBox,
+    QComboBox,
 )
 
+from business.profiler import span
+from ui.labelme_launcher import shared_launcher
+
 
 class DatasetMakerThread(QThread):
     """数据集制作线程"""
@@ -31,21 +38,31 @@ class DatasetMakerThread(QThread):
     progress = pyqtSignal(int, str)
     finished = pyqtSignal(bool, str)
 
-    def __init__(self, source_dir, output_dir, categories, train_ratio=0.8):
+    def __init__(self, source_dir, output_dir, categories, train_ratio=0.8,
+                 dedup_threshold=None, dedup_policy="representative", export_shards=False,
+                 label_map_version=None):
         super().__init__()
         self.source_dir = source_dir
         self.output_dir = output_dir
         self.categories = categories
         self.train_ratio = train_ratio
+        self.dedup_threshold = dedup_threshold
+        self.dedup_policy = dedup_policy
+        self.export_shards = export_shards
+        self.label_map_version = label_map_version
 
     def run(self):
         try:
             from business.dataset_maker import DatasetMaker
 
-            maker = DatasetMaker(self.source_dir, self.output_dir, self.categories)
+            maker = DatasetMaker(self.source_dir, self.output_dir, self.categories,
+                                 label_map_version=self.label_map_version)
 
-            self.progress.emit(10, "正在分析标注文件……")
-            success, message = maker.prepare_dataset(self.train_ratio)
+            self.progress.emit(10, "正在分析标注文件……" if self.dedup_threshold is None
+                               else "正在检测近重复图像……")
+            success, message = maker.prepare_dataset(
+                self.train_ratio, dedup_threshold=self.dedup_threshold, dedup_policy=self.dedup_policy
+            )
 
             if success:
                 self.progress.emit(50, "正在生成 YOLO 格式标注……")
@@ -54,8 +71,17 @@ class DatasetMakerThread(QThread):
                 self.progress.emit(80, "正在生成配置文件……")
                 maker.create_yaml_config()
 
+                result = f"数据集已保存到：{self.output_dir}"
+                if self.export_shards:
+                    self.progress.emit(90, "正在打包分片……")
+                    shard_ok, shard_message = maker.export_shards()
+                    result += f"\n{shard_message}"
+                    if not shard_ok:
+                        self.finished.emit(False, result)
+                        return
+
                 self.progress.emit(100, "数据集制作完成！")
-                self.finished.emit(True, f"数据集已保存到：{self.output_dir}")
+                self.finished.emit(True, result)
             else:
                 self.finished.emit(False, message)
 
@@ -63,6 +89,30 @@ class DatasetMakerThread(QThread):
             self.finished.emit(False, f"制作数据集时出错：{str(e)}")
 
 
+class DatasetReportThread(QThread):
+    """数据集质量分析线程"""
+
+    finished = pyqtSignal(bool, object)  # success, report 或错误信息
+
+    def __init__(self, source_dir, categories, output_prefix):
+        super().__init__()
+        self.source_dir = source_dir
+        self.categories = categories
+        self.output_prefix = output_prefix
+
+    def run(self):
+        try:
+            from business.dataset_stats import DatasetAnalyzer, save_json_report, save_html_report
+
+            analyzer = DatasetAnalyzer(self.source_dir, known_categories=self.categories)
+            report = analyzer.analyze()
+            save_json_report(report, self.output_prefix + ".json")
+            save_html_report(report, self.output_prefix + ".html")
+            self.finished.emit(True, report)
+        except Exception as e:
+            self.finished.emit(False, f"分析数据集时出错：{str(e)}")
+
+
 class LabelWidget(QWidget):
     """标注界面 - 集成 labelme"""
 
@@ -264,6 +314,32 @@ class LabelWidget(QWidget):
         ratio_layout.addWidget(self.ratio_label)
         dataset_layout.addLayout(ratio_layout)
 
+        # 近重复去重
+        dedup_layout = QHBoxLayout()
+        self.dedup_check = QCheckBox("近重复去重")
+        self.dedup_check.setToolTip("按感知哈希检测近重复图像，避免训练集膨胀及近重复图像跨训练/验证集泄漏")
+        dedup_layout.addWidget(self.dedup_check)
+        dedup_layout.addWidget(QLabel("汉明距离阈值:"))
+        self.dedup_threshold_spin = QSpinBox()
+        self.dedup_threshold_spin.setRange(0, 12)
+        self.dedup_threshold_spin.setValue(4)
+        self.dedup_threshold_spin.setEnabled(False)
+        dedup_layout.addWidget(self.dedup_threshold_spin)
+        self.dedup_policy_combo = QComboBox()
+        self.dedup_policy_combo.addItem("每簇保留一张", "representative")
+        self.dedup_policy_combo.addItem("保留全部，同簇同划分", "group")
+        self.dedup_policy_combo.setEnabled(False)
+        dedup_layout.addWidget(self.dedup_policy_combo)
+        dedup_layout.addStretch()
+        self.dedup_check.toggled.connect(self.dedup_threshold_spin.setEnabled)
+        self.dedup_check.toggled.connect(self.dedup_policy_combo.setEnabled)
+        dataset_layout.addLayout(dedup_layout)
+
+        # 分片导出
+        self.shard_check = QCheckBox("同时打包为分片（适合放在 NAS 上的大数据集）")
+        self.shard_check.setToolTip("将图像与标注打包为少量大文件，训练时顺序读取，避免大量小文件随机读取")
+        dataset_layout.addWidget(self.shard_check)
+
         # 数据集信息
         self.dataset_info_label = QLabel("请先选择包含标注文件的目录")
         self.dataset_info_label.setStyleSheet(
@@ -293,6 +369,27 @@ class LabelWidget(QWidget):
         self.make_dataset_btn.setEnabled(False)
         dataset_layout.addWidget(self.make_dataset_btn)
 
+        # 数据质量报告按钮
+        self.report_btn = QPushButton("数据质量报告")
+        self.report_btn.setToolTip("统计类别分布、框尺寸、越界/退化框、重复图像与未登记类别")
+        self.report_btn.setStyleSheet(
+            """
+            QPushButton {
+                background: #34495e;
+                color: #ffffff;
+                border: none;
+                padding: 8px 16px;
+                border-radius: 6px;
+                font-size: 13px;
+            }
+            QPushButton:hover { background: #2c3e50; }
+            QPushButton:disabled { background: #bdc3c7; }
+            """
+        )
+        self.report_btn.clicked.connect(self.show_dataset_report)
+        self.report_btn.setEnabled(False)
+        dataset_layout.addWidget(self.report_btn)
+
         dataset_group.setLayout(dataset_layout)
         layout.addWidget(dataset_group)
         # 让数据集区域获得更多空间
@@ -401,127 +498,29 @@ class LabelWidget(QWidget):
         dlg.exec_()
 
     def open_labelme(self):
-        """打开 labelme 标注工具"""
+        """打开 labelme 标注工具（复用预先创建的窗口，已选择标注目录时直接打开该目录）"""
+        launcher = shared_launcher()
+        progress = None
         try:
-            # 进度提示
-            progress = QProgressDialog("正在启动标注工具……", "取消", 0, 0, self)
-            progress.setWindowTitle("启动标注工具")
-            progress.setWindowModality(Qt.WindowModal)
-            progress.setMinimumDuration(0)
-            progress.setValue(0)
-            progress.show()
-            QApplication.processEvents()
-
-            # 导入修改后的 labelme 窗口
-            from labelme_modified.labelme_app import LabelmeMainWindow
+            if not launcher.ready:
+                # 预创建尚未完成时才需要等待
+                progress = QProgressDialog("正在启动标注工具……", "取消", 0, 0, self)
+                progress.setWindowTitle("启动标注工具")
+                progress.setWindowModality(Qt.WindowModal)
+                progress.setMinimumDuration(0)
+                progress.setValue(0)
+                progress.show()
+                QApplication.processEvents()
 
             # 获取缺陷类别列表（允许为空）
             labels = self.product_manager.get_category_names()
-
-            # 创建配置（包含 labelme 需要的必需字段，如 shape）
-            config = {
-                "labels": labels,
-                "sort_labels": True,
-                "show_label_text_field": True,
-                "label_completion": "startswith",
-                "fit_to_content": {"column": True, "row": False},
-                # 关闭自动保存，在切换图片时弹出“是否保存”的提醒
-                "auto_save": False,
-                "store_data": False,
-                "validate_label": None,
-                "label_flags": {},
-                "flags": {},
-                "shape_color": "auto",
-                "shift_auto_shape_color": 0,
-                "label_colors": {},
-                "default_shape_color": None,
-                "display_label_popup": True,
-                "file_search": None,
-                "keep_prev": False,
-                "keep_prev_scale": False,
-                "keep_prev_brightness_contrast": False,
-                "epsilon": 10.0,
-                "canvas": {
-                    "double_click": "close",
-                    "num_backups": 10,
-                    "crosshair": {
-                        "polygon": True,
-                        "rectangle": True,
-                        "circle": True,
-                        "line": True,
-                        "point": True,
-                        "linestrip": True,
-                        "ai_polygon": True,
-                        "ai_mask": True,
-                    },
-                    "fill_drawing": False,
-                },
-                "flag_dock": {"show": False, "closable": True, "floatable": True, "movable": True},
-                "label_dock": {"show": True, "closable": True, "floatable": True, "movable": True},
-                "shape_dock": {"show": True, "closable": True, "floatable": True, "movable": True},
-                "file_dock": {"show": True, "closable": True, "floatable": True, "movable": True},
-                "ai": {"default": "Sam2 (balanced)"},
-                "shape": {
-                    "line_color": [0, 255, 0, 128],
-                    "fill_color": [0, 255, 0, 100],
-                    "select_line_color": [255, 255, 255, 255],
-                    "select_fill_color": [0, 255, 0, 155],
-                    "vertex_fill_color": [0, 255, 0, 255],
-                    "hvertex_fill_color": [255, 255, 255, 255],
-                    "point_size": 8,
-                },
-                "shortcuts": {
-                    "quit": "Ctrl+Q",
-                    "open": "Ctrl+O",
-                    "open_dir": "Ctrl+D",
-                    "open_next": "D",
-                    "open_prev": "A",
-                    "save": "Ctrl+S",
-                    "save_as": "Ctrl+Shift+S",
-                    "close": "Ctrl+W",
-                    "delete_file": "Ctrl+Delete",
-                    "save_to": "",
-                    "toggle_keep_prev_mode": "",
-                    "create_polygon": "P",
-                    "create_rectangle": "R",
-                    "create_circle": "",
-                    "create_line": "",
-                    "create_point": "",
-                    "create_linestrip": "",
-                    "edit_polygon": "E",
-                    "delete_polygon": "Delete",
-                    "duplicate_polygon": "Ctrl+D",
-                    "copy_polygon": "Ctrl+C",
-                    "paste_polygon": "Ctrl+V",
-                    "undo_last_point": "Ctrl+Z",
-                    "undo": "Ctrl+Z",
-                    "remove_selected_point": "Backspace",
-                    "hide_all_polygons": "",
-                    "show_all_polygons": "",
-                    "toggle_all_polygons": "",
-                    "zoom_in": "Ctrl++",
-                    "zoom_out": "Ctrl+-",
-                    "zoom_to_original": "Ctrl+0",
-                    "fit_window": "Ctrl+F",
-                    "fit_width": "Ctrl+Shift+F",
-                    "edit_label": "Ctrl+E",
-                },
-            }
-
-            progress.setLabelText("正在初始化标注工具……")
-            QApplication.processEvents()
-
-            # 使用 labelme 默认保存策略（JSON 与图像同目录）
-            self.labelme_window = LabelmeMainWindow(config=config)
-
-            progress.setLabelText("正在显示标注工具……")
-            QApplication.processEvents()
-
-            self.labelme_window.show()
-            progress.close()
+            self.labelme_window = launcher.show(labels, self.current_dir)
+            if progress is not None:
+                progress.close()
 
         except ImportError as e:
-            progress.close()
+            if progress is not None:
+                progress.close()
             reply = QMessageBox.question(
                 self,
                 "labelme 未安装",
@@ -532,12 +531,22 @@ class LabelWidget(QWidget):
             if reply == QMessageBox.Yes:
                 self._install_labelme()
         except Exception as e:
-            try:
+            if progress is not None:
                 progress.close()
-            except Exception:
-                pass
             QMessageBox.critical(self, "错误", f"打开标注工具时出错：\n{str(e)}\n\n请检查 labelme 是否正确安装。")
 
+    def on_config_changed(self, changes):
+        """缺陷类别变更后，同步到（预先创建或已打开的）标注工具的标签列表"""
+        if not any(c['entity'] in ('all', 'category', 'label_map') for c in changes):
+            return
+        launcher = shared_launcher()
+        if not launcher.ready:
+            return
+        try:
+            launcher.sync_labels(self.product_manager.get_category_names())
+        except Exception as e:
+            print(f"同步标注工具标签失败: {e}")
+
     def _install_labelme(self):
         """安装 labelme"""
         try:
@@ -610,10 +619,11 @@ class LabelWidget(QWidget):
             self.output_dir_edit.setText(default_output)
 
             # 统计标注与图片文件
-            json_files = list(Path(directory).glob("*.json"))
-            image_files = []
-            for ext in [".jpg", ".jpeg", ".png", ".bmp"]:
-                image_files.extend(list(Path(directory).glob(f"*{ext}")))
+            with span("扫描标注目录", "scan", directory=directory):
+                json_files = list(Path(directory).glob("*.json"))
+                image_files = []
+                for ext in [".jpg", ".jpeg", ".png", ".bmp"]:
+                    image_files.extend(list(Path(directory).glob(f"*{ext}")))
 
             self.dataset_info_label.setText(
                 f"找到 {len(image_files)} 张图像，{len(json_files)} 个标注文件"
@@ -621,9 +631,25 @@ class LabelWidget(QWidget):
 
             # 启用制作数据集按钮
             self.make_dataset_btn.setEnabled(len(json_files) > 0)
+            self.report_btn.setEnabled(True)
             if len(json_files) == 0:
                 QMessageBox.warning(self, "提示", "该目录下没有找到标注文件（.json）。")
 
+    def choose_product(self, prompt):
+        """选择有缺陷类别的产品，返回 (是否确认, 产品 ID)；选择全部产品时产品 ID 为 None"""
+        from PyQt5.QtWidgets import QInputDialog
+
+        products = [p for p in self.product_manager.get_products()
+                    if self.product_manager.get_defect_category_count(p["id"]) > 0]
+        all_products_option = "全部产品（合并类别，按顺序编号）"
+        choices = [p["name"] for p in products] + [all_products_option]
+        choice, ok = QInputDialog.getItem(self, "选择产品", prompt, choices, 0, False)
+        if not ok:
+            return False, None
+        if choice == all_products_option:
+            return True, None
+        return True, products[choices.index(choice)]["id"]
+
     def make_dataset(self):
         """制作 YOLO 数据集"""
         if not self.current_dir:
@@ -635,6 +661,17 @@ class LabelWidget(QWidget):
             QMessageBox.warning(self, "提示", "请先在产品管理页面添加缺陷类别！")
             return
 
+        # 选择产品：使用该产品的类别映射，类别编号在多次制作间保持稳定
+        ok, product_id = self.choose_product("按哪个产品的缺陷类别制作数据集：")
+        if not ok:
+            return
+        if product_id is None:
+            categories = self.product_manager.get_category_names()
+            label_map_version = None
+        else:
+            categories = self.product_manager.get_label_map(product_id)
+            label_map_version = self.product_manager.get_label_map_version(product_id)
+
         # 获取输出目录
         output_dir = self.output_dir_edit.text().strip()
         if not output_dir:
@@ -664,9 +701,11 @@ class LabelWidget(QWidget):
         progress.setValue(0)
 
         # 创建线程
-        categories = self.product_manager.get_category_names()
+        dedup_threshold = self.dedup_threshold_spin.value() if self.dedup_check.isChecked() else None
         self.maker_thread = DatasetMakerThread(
-            self.current_dir, output_dir, categories, train_ratio=train_ratio
+            self.current_dir, output_dir, categories, train_ratio=train_ratio,
+            dedup_threshold=dedup_threshold, dedup_policy=self.dedup_policy_combo.currentData(),
+            export_shards=self.shard_check.isChecked(), label_map_version=label_map_version,
         )
 
         # 连接信号
@@ -688,6 +727,67 @@ class LabelWidget(QWidget):
         else:
             QMessageBox.warning(self, "失败", message)
 
+    def show_dataset_report(self):
+        """分析当前目录（labelme 标注目录或 YOLO 数据集）并显示质量报告"""
+        if not self.current_dir:
+            QMessageBox.warning(self, "提示", "请先选择标注目录。")
+            return
+
+        # 按所选产品的缺陷类别判断未登记/缺失类别
+        ok, product_id = self.choose_product("按哪个产品的缺陷类别分析数据集：")
+        if not ok:
+            return
+        if product_id is None:
+            categories = self.product_manager.get_category_names()
+        else:
+            categories = self.product_manager.get_defect_category_names(product_id)
+
+        # 报告与数据集输出目录同级保存，避免混入标注 JSON
+        parent_dir = os.path.dirname(self.current_dir)
+        output_prefix = os.path.join(parent_dir, os.path.basename(self.current_dir) + "_quality_report")
+
+        progress = QProgressDialog("正在分析数据集……", None, 0, 0, self)
+        progress.setWindowTitle("数据质量报告")
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(0)
+        progress.show()
+
+        self.report_thread = DatasetReportThread(self.current_dir, categories, output_prefix)
+        self.report_thread.finished.connect(
+            lambda success, result: self.on_report_finished(success, result, output_prefix, progress)
+        )
+        self.report_thread.start()
+
+    def on_report_finished(self, success, result, output_prefix, progress):
+        """质量分析完成"""
+        progress.close()
+        if not success:
+            QMessageBox.warning(self, "失败", result)
+            return
+
+        from business.dataset_stats import render_html_report
+
+        dlg = QDialog(self)
+        dlg.setWindowTitle("数据质量报告")
+        dlg.resize(760, 640)
+        vbox = QVBoxLayout(dlg)
+        browser = QTextBrowser(dlg)
+        browser.setHtml(render_html_report(result))
+        vbox.addWidget(browser)
+
+        path_label = QLabel(f"报告已保存：{output_prefix}.html / .json")
+        path_label.setStyleSheet("color: #7f8c8d;")
+        path_label.setWordWrap(True)
+        vbox.addWidget(path_label)
+
+        btn_row = QHBoxLayout()
+        btn_row.addStretch()
+        btn_close = QPushButton("关闭", dlg)
+        btn_close.clicked.connect(dlg.accept)
+        btn_row.addWidget(btn_close)
+        vbox.addLayout(btn_row)
+        dlg.exec_()
+
     def sync_labels_to_product(self):
         """从标注目录扫描类别并同步到产品管理"""
         try:
@@ -734,12 +834,8 @@ class LabelWidget(QWidget):
                 QMessageBox.information(self, "提示", "未在标注文件中发现新的类别。")
                 return
 
-            # 写入到产品的缺陷类别（去重）
-            added = 0
-            for name in sorted(labels_found):
-                if not self.product_manager.defect_category_exists(product_id, name):
-                    if self.product_manager.add_defect_category(product_id, name, ""):
-                        added += 1
+            # 写入到产品的缺陷类别（去重，单个事务批量写入）
+            added = self.product_manager.add_defect_categories(product_id, sorted(labels_found))
 
             QMessageBox.information(self, "同步完成", f"同步完成，共新增 {added} 个缺陷类别。")
         except Exception as e:
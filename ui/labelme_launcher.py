@@ -0,0 +1,176 @@
+"""
+标注工具宿主 - 共享的 labelme 窗口：启动后空闲时预先创建，之后每次打开都复用同一窗口
+"""
+import os
+from typing import List, Optional
+
+from business.profiler import span
+
+
+def build_labelme_config(labels: List[str]) -> dict:
+    """labelme 配置（包含 labelme 需要的必需字段，如 shape）"""
+    return {
+        "labels": labels,
+        "sort_labels": True,
+        "show_label_text_field": True,
+        "label_completion": "startswith",
+        "fit_to_content": {"column": True, "row": False},
+        # 关闭自动保存，在切换图片时弹出“是否保存”的提醒
+        "auto_save": False,
+        "store_data": False,
+        "validate_label": None,
+        "label_flags": {},
+        "flags": {},
+        "shape_color": "auto",
+        "shift_auto_shape_color": 0,
+        "label_colors": {},
+        "default_shape_color": None,
+        "display_label_popup": True,
+        "file_search": None,
+        "keep_prev": False,
+        "keep_prev_scale": False,
+        "keep_prev_brightness_contrast": False,
+        "epsilon": 10.0,
+        "canvas": {
+            "double_click": "close",
+            "num_backups": 10,
+            "crosshair": {
+                "polygon": True,
+                "rectangle": True,
+                "circle": True,
+                "line": True,
+                "point": True,
+                "linestrip": True,
+                "ai_polygon": True,
+                "ai_mask": True,
+            },
+            "fill_drawing": False,
+        },
+        "flag_dock": {"show": False, "closable": True, "floatable": True, "movable": True},
+        "label_dock": {"show": True, "closable": True, "floatable": True, "movable": True},
+        "shape_dock": {"show": True, "closable": True, "floatable": True, "movable": True},
+        "file_dock": {"show": True, "closable": True, "floatable": True, "movable": True},
+        "ai": {"default": "Sam2 (balanced)"},
+        "shape": {
+            "line_color": [0, 255, 0, 128],
+            "fill_color": [0, 255, 0, 100],
+            "select_line_color": [255, 255, 255, 255],
+            "select_fill_color": [0, 255, 0, 155],
+            "vertex_fill_color": [0, 255, 0, 255],
+            "hvertex_fill_color": [255, 255, 255, 255],
+            "point_size": 8,
+        },
+        "shortcuts": {
+            "quit": "Ctrl+Q",
+            "open": "Ctrl+O",
+            "open_dir": "Ctrl+D",
+            "open_next": "D",
+            "open_prev": "A",
+            "save": "Ctrl+S",
+            "save_as": "Ctrl+Shift+S",
+            "close": "Ctrl+W",
+            "delete_file": "Ctrl+Delete",
+            "save_to": "",
+            "toggle_keep_prev_mode": "",
+            "create_polygon": "P",
+            "create_rectangle": "R",
+            "create_circle": "",
+            "create_line": "",
+            "create_point": "",
+            "create_linestrip": "",
+            "edit_polygon": "E",
+            "delete_polygon": "Delete",
+            "duplicate_polygon": "Ctrl+D",
+            "copy_polygon": "Ctrl+C",
+            "paste_polygon": "Ctrl+V",
+            "undo_last_point": "Ctrl+Z",
+            "undo": "Ctrl+Z",
+            "remove_selected_point": "Backspace",
+            "hide_all_polygons": "",
+            "show_all_polygons": "",
+            "toggle_all_polygons": "",
+            "zoom_in": "Ctrl++",
+            "zoom_out": "Ctrl+-",
+            "zoom_to_original": "Ctrl+0",
+            "fit_window": "Ctrl+F",
+            "fit_width": "Ctrl+Shift+F",
+            "edit_label": "Ctrl+E",
+        },
+    }
+
+
+class LabelmeLauncher:
+    """标注工具窗口宿主
+
+    labelme 的导入与窗口创建耗时较长：prepare() 在主界面空闲时预先创建（隐藏）窗口，
+    show() 复用该窗口并通过其 importDirImages 切换目录；关闭窗口只是隐藏，下次打开无需重建
+    """
+
+    def __init__(self):
+        self.window = None
+
+    @property
+    def ready(self) -> bool:
+        return self.window is not None
+
+    def prepare(self, labels: List[str]):
+        """创建窗口（已创建时直接返回）；labelme 不可用时抛出 ImportError"""
+        if self.window is not None:
+            return self.window
+        with span("导入 labelme", "labelme"):
+            from labelme_modified.labelme_app import LabelmeMainWindow
+        # 使用 labelme 默认保存策略（JSON 与图像同目录）
+        with span("创建标注窗口", "labelme", labels=len(labels)):
+            self.window = LabelmeMainWindow(config=build_labelme_config(labels))
+        return self.window
+
+    def prepare_quietly(self, labels: List[str]) -> bool:
+        """空闲时预创建，失败只记录日志（真正打开时再提示用户）"""
+        try:
+            self.prepare(labels)
+            return True
+        except Exception as e:
+            print(f"预创建标注工具失败: {e}")
+            return False
+
+    def sync_labels(self, labels: List[str]):
+        """把新增的缺陷类别加入标注工具的标签候选"""
+        label_dialog = getattr(self.window, "labelDialog", None)
+        if label_dialog is None:
+            return
+        for name in labels:
+            label_dialog.addLabelHistory(name)
+
+    def show(self, labels: List[str], directory: Optional[str] = None):
+        """显示（必要时先创建）标注窗口；指定目录且与当前目录不同时切换过去"""
+        window = self.prepare(labels)
+        self.sync_labels(labels)
+        with span("显示标注窗口", "labelme"):
+            if window.isMinimized():
+                window.showNormal()
+            else:
+                window.show()
+            window.raise_()
+            window.activateWindow()
+        if directory and os.path.isdir(directory):
+            current = getattr(window, "lastOpenDir", None)
+            if not current or os.path.normcase(os.path.abspath(current)) != os.path.normcase(os.path.abspath(directory)):
+                with span("打开标注目录", "labelme", directory=directory):
+                    window.importDirImages(directory)
+        return window
+
+    def close(self):
+        """主程序退出时关闭标注窗口"""
+        if self.window is not None:
+            self.window.close()
+
+
+_launcher: Optional[LabelmeLauncher] = None
+
+
+def shared_launcher() -> LabelmeLauncher:
+    """进程内共享的标注工具宿主"""
+    global _launcher
+    if _launcher is None:
+        _launcher = LabelmeLauncher()
+    return _launcher
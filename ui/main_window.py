@@ -1,7 +1,9 @@
 """
 Main window for SLDMVDeepLearningPlatForm (clean UTF-8, ASCII-only labels).
 """
-from PyQt5.QtCore import Qt
+import importlib
+
+from PyQt5.QtCore import Qt, QThread, QTimer
 from PyQt5.QtWidgets import (
     QMainWindow,
     QWidget,
@@ -13,11 +15,41 @@ from PyQt5.QtWidgets import (
     QSizePolicy,
 )
 
+from business.category_manager import CategoryManager
 from business.product_manager import ProductManager
-from ui.product_widget import ProductWidget
-from ui.label_widget import LabelWidget
-from ui.predict_widget import PredictWidget
-from ui.train_widget import TrainWidget
+from business.profiler import name_thread, span
+from ui.config_watcher import ConfigWatcher
+from ui.labelme_launcher import shared_launcher
+
+# Tabs: (title, attribute, module, class). Widgets are imported and built on first activation.
+TAB_SPECS = [
+    ("产品管理", "product_widget", "ui.product_widget", "ProductWidget"),
+    ("数据标注", "label_widget", "ui.label_widget", "LabelWidget"),
+    ("模型训练", "train_widget", "ui.train_widget", "TrainWidget"),
+    ("图像预测", "predict_widget", "ui.predict_widget", "PredictWidget"),
+    ("运行监控", "metrics_widget", "ui.metrics_widget", "MetricsWidget"),
+]
+
+# Heavy non-GUI modules imported in the background after the window is shown.
+# labelme_app is a Qt GUI module, so it is imported on the main thread by prepare_labelme().
+PREWARM_MODULES = ["numpy", "cv2", "ultralytics"]
+
+
+class PrewarmThread(QThread):
+    """Import heavy dependencies in the background so the first train/predict run starts faster."""
+
+    def __init__(self, modules, parent=None):
+        super().__init__(parent)
+        self.modules = modules
+
+    def run(self):
+        name_thread("PrewarmThread")
+        for name in self.modules:
+            try:
+                with span(f"预热 {name}", "prewarm"):
+                    importlib.import_module(name)
+            except Exception as e:
+                print(f"预热模块 {name} 失败: {e}")
 
 
 class MainWindow(QMainWindow):
@@ -25,8 +57,18 @@ class MainWindow(QMainWindow):
 
     def __init__(self):
         super().__init__()
-        self.product_manager = ProductManager()
-        self.init_ui()
+        with span("加载产品数据", "startup"):
+            self.product_manager = ProductManager()
+        with span("加载类别数据", "startup"):
+            self.category_manager = CategoryManager()
+        self.product_widget = None
+        self.label_widget = None
+        self.train_widget = None
+        self.predict_widget = None
+        self.metrics_widget = None
+        self._prewarm_thread = None
+        with span("创建主窗口界面", "startup"):
+            self.init_ui()
 
     def init_ui(self):
         """Initialize UI layout and widgets."""
@@ -99,17 +141,19 @@ class MainWindow(QMainWindow):
         )
         self.tab_widget.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
 
-        # Feature tabs
-        self.product_widget = ProductWidget(self.product_manager)
-        self.label_widget = LabelWidget(self.product_manager)
-        self.train_widget = TrainWidget(self.product_manager)
-        self.predict_widget = PredictWidget(self.product_manager)
+        # 共享配置变更监听：其他工作站/进程修改产品、类别数据后增量刷新界面
+        self.config_watcher = ConfigWatcher(self.product_manager, self.category_manager, parent=self)
 
-        # ASCII-only tab titles to avoid font/encoding issues
-        self.tab_widget.addTab(self.product_widget, "产品管理")
-        self.tab_widget.addTab(self.label_widget, "数据标注")
-        self.tab_widget.addTab(self.train_widget, "模型训练")
-        self.tab_widget.addTab(self.predict_widget, "图像预测")
+        # Feature tabs: empty containers now, real widgets on first activation
+        self._tab_containers = []
+        for title, _, _, _ in TAB_SPECS:
+            container = QWidget()
+            container_layout = QVBoxLayout(container)
+            container_layout.setContentsMargins(0, 0, 0, 0)
+            self._tab_containers.append(container)
+            self.tab_widget.addTab(container, title)
+        self.tab_widget.currentChanged.connect(self.ensure_tab)
+        self.ensure_tab(self.tab_widget.currentIndex())
 
         main_layout.addWidget(self.tab_widget, 1)
 
@@ -126,6 +170,40 @@ class MainWindow(QMainWindow):
             """
         )
 
+    def ensure_tab(self, index: int):
+        """Build the widget of tab `index` if it has not been built yet, and return it."""
+        if index < 0 or index >= len(TAB_SPECS):
+            return None
+        _, attr, module_name, class_name = TAB_SPECS[index]
+        widget = getattr(self, attr)
+        if widget is not None:
+            return widget
+
+        with span(f"创建页签 {class_name}", "ui"):
+            with span(f"导入 {module_name}", "import"):
+                module = importlib.import_module(module_name)
+            widget = getattr(module, class_name)(self.product_manager)
+        self._tab_containers[index].layout().addWidget(widget)
+        setattr(self, attr, widget)
+        if hasattr(widget, "on_config_changed"):
+            self.config_watcher.products_changed.connect(widget.on_config_changed)
+        if hasattr(widget, "on_categories_changed"):
+            self.config_watcher.categories_changed.connect(widget.on_categories_changed)
+        return widget
+
+    def showEvent(self, event):
+        """Start background pre-warming once the window is on screen."""
+        super().showEvent(event)
+        if self._prewarm_thread is None:
+            self._prewarm_thread = PrewarmThread(PREWARM_MODULES, self)
+            self._prewarm_thread.finished.connect(self.prepare_labelme)
+            QTimer.singleShot(500, self._prewarm_thread.start)
+
+    def prepare_labelme(self):
+        """Import labelme and build the shared (hidden) labelme window on the main thread once the
+        background imports are done, so opening it is instant."""
+        shared_launcher().prepare_quietly(self.product_manager.get_category_names())
+
     def center_on_screen(self):
         """Center the window on the primary screen."""
         screen = QDesktopWidget().screenGeometry()
@@ -148,6 +226,9 @@ class MainWindow(QMainWindow):
             QMessageBox.No,
         )
         if reply == QMessageBox.Yes:
+            if self.predict_widget is not None:
+                self.predict_widget.flush_settings()
+            shared_launcher().close()
             event.accept()
         else:
             event.ignore()
@@ -0,0 +1,199 @@
+"""
+预测清单浏览对话框 - 按判定结果、分数范围筛选统一清单（manifest.jsonl），只读取当前页的行
+"""
+import os
+
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QDoubleSpinBox, QCheckBox,
+                             QPushButton, QTableWidget, QTableWidgetItem, QHeaderView, QMessageBox, QFileDialog)
+
+from business.manifest import ManifestReader
+from business.model_backends.base import BackendError
+from business.relabel_queue import items_from_manifest
+
+# 每页读取的条目数（"加载更多"按页追加）
+PAGE_SIZE = 1000
+
+
+class ManifestDialog(QDialog):
+    """预测清单浏览对话框"""
+
+    # 将筛选出的图像路径显示到预测界面的图像列表
+    show_images = pyqtSignal(list)
+    # 筛选出的 NG 与临界图像送标注（复标队列条目）
+    relabel_items = pyqtSignal(list)
+
+    def __init__(self, start_dir: str = '', parent=None):
+        super().__init__(parent)
+        self.start_dir = start_dir
+        # 当前打开的预测目录
+        self.run_dir = None
+        self.reader = None
+        self._rows = []
+        self._offset = 0
+        self.init_ui()
+
+    def init_ui(self):
+        """初始化UI"""
+        self.setWindowTitle("预测清单")
+        self.resize(900, 600)
+
+        layout = QVBoxLayout(self)
+
+        dir_layout = QHBoxLayout()
+        open_btn = QPushButton("📂 打开预测目录")
+        open_btn.clicked.connect(self.open_run)
+        dir_layout.addWidget(open_btn)
+        refresh_btn = QPushButton("⟳ 刷新")
+        refresh_btn.setToolTip("任务仍在写入时读取新增的条目")
+        refresh_btn.clicked.connect(self.refresh)
+        dir_layout.addWidget(refresh_btn)
+        self.batch_label = QLabel("")
+        self.batch_label.setWordWrap(True)
+        dir_layout.addWidget(self.batch_label, 1)
+        layout.addLayout(dir_layout)
+
+        # 筛选条件
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("判定："))
+        self.label_combo = QComboBox()
+        self.label_combo.addItem("全部", None)
+        self.label_combo.addItem("NG", 'NG')
+        self.label_combo.addItem("OK", 'OK')
+        filter_layout.addWidget(self.label_combo)
+
+        filter_layout.addWidget(QLabel("分数："))
+        self.min_spin = QDoubleSpinBox()
+        self.max_spin = QDoubleSpinBox()
+        for spin, value in ((self.min_spin, 0.0), (self.max_spin, 1.0)):
+            spin.setRange(0.0, 1e6)
+            spin.setDecimals(3)
+            spin.setSingleStep(0.05)
+            spin.setValue(value)
+            filter_layout.addWidget(spin)
+        self.max_check = QCheckBox("限制上限")
+        self.max_check.toggled.connect(self.max_spin.setEnabled)
+        self.max_spin.setEnabled(False)
+        filter_layout.addWidget(self.max_check)
+
+        self.sort_check = QCheckBox("按分数从高到低")
+        self.sort_check.setChecked(True)
+        filter_layout.addWidget(self.sort_check)
+        search_btn = QPushButton("🔍 查询")
+        search_btn.clicked.connect(self.search)
+        filter_layout.addWidget(search_btn)
+        layout.addLayout(filter_layout)
+
+        # 结果表格
+        self.table = QTableWidget(0, 4)
+        self.table.setHorizontalHeaderLabels(["图像", "判定", "分数", "完整路径"])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        layout.addWidget(self.table)
+
+        bottom_layout = QHBoxLayout()
+        self.count_label = QLabel("")
+        bottom_layout.addWidget(self.count_label)
+        bottom_layout.addStretch()
+        self.more_btn = QPushButton("加载更多")
+        self.more_btn.clicked.connect(self.load_more)
+        self.more_btn.setEnabled(False)
+        bottom_layout.addWidget(self.more_btn)
+        show_btn = QPushButton("📋 显示到图像列表")
+        show_btn.clicked.connect(self.on_show_images)
+        bottom_layout.addWidget(show_btn)
+        relabel_btn = QPushButton("📝 送标注")
+        relabel_btn.setToolTip("筛选结果中的 NG 与分数接近判定阈值的图像加入复标队列")
+        relabel_btn.clicked.connect(self.on_relabel)
+        bottom_layout.addWidget(relabel_btn)
+        layout.addLayout(bottom_layout)
+
+    def open_run(self):
+        """选择预测任务的输出目录"""
+        directory = QFileDialog.getExistingDirectory(self, "选择预测目录", self.start_dir)
+        if directory:
+            self.open_dir(directory)
+
+    def open_dir(self, directory):
+        """打开预测目录的清单并按当前条件查询"""
+        try:
+            self.reader = ManifestReader(directory)
+        except BackendError as e:
+            QMessageBox.warning(self, "错误", f"{e.message}\n{e.detail or ''}")
+            return
+        self.run_dir = directory
+        self.start_dir = os.path.dirname(directory)
+        self.update_batch_label()
+        self.search()
+
+    def refresh(self):
+        """同步清单新增的行并重新查询"""
+        if self.reader is None:
+            return
+        self.reader.refresh()
+        self.update_batch_label()
+        self.search()
+
+    def update_batch_label(self):
+        counts = self.reader.counts()
+        try:
+            batch = self.reader.batch()
+            status = f"{batch.get('backend', '')} | {batch.get('status', '')} | {batch.get('started', '')}"
+        except BackendError as e:
+            status = e.message
+        text = f"{status}：共 {counts['total']} 张，NG {counts['NG']} 张，OK {counts['OK']} 张"
+        if self.reader.broken_lines:
+            text += f"，{self.reader.broken_lines} 行无法解析"
+        self.batch_label.setText(text)
+
+    def search(self):
+        """按当前条件重新筛选（只用索引）"""
+        if self.reader is None:
+            return
+        self._rows = self.reader.select(label=self.label_combo.currentData(), min_score=self.min_spin.value() or None,
+                                        max_score=self.max_spin.value() if self.max_check.isChecked() else None,
+                                        sort_by_score=self.sort_check.isChecked())
+        self._offset = 0
+        self.table.setRowCount(0)
+        self.load_more()
+
+    def load_more(self):
+        if self.reader is None:
+            return
+        entries = self.reader.read(self._rows[self._offset:self._offset + PAGE_SIZE])
+        self._offset += len(entries)
+        start = self.table.rowCount()
+        self.table.setRowCount(start + len(entries))
+        for i, entry in enumerate(entries, start):
+            path = entry.get('image_path') or ''
+            score = entry.get('score')
+            values = [os.path.basename(path), entry.get('label') or '', "" if score is None else f"{score:.4f}", path]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column == 2:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(i, column, item)
+        self.more_btn.setEnabled(self._offset < len(self._rows))
+        self.count_label.setText(f"已显示 {self.table.rowCount()} / {len(self._rows)} 张")
+
+    def on_show_images(self):
+        paths = [self.table.item(i, 3).text() for i in range(self.table.rowCount())]
+        if not paths:
+            QMessageBox.information(self, "提示", "没有可显示的图像，请先查询")
+            return
+        self.show_images.emit(paths)
+
+    def on_relabel(self):
+        """筛选结果（不限于已显示的页）按页读取后送标注"""
+        if self.reader is None or not len(self._rows):
+            QMessageBox.information(self, "提示", "没有可送标注的图像，请先查询")
+            return
+        items = []
+        for start in range(0, len(self._rows), PAGE_SIZE):
+            items.extend(items_from_manifest(self.reader.read(self._rows[start:start + PAGE_SIZE])))
+        if not items:
+            QMessageBox.information(self, "提示", "筛选结果中没有 NG 或临界图像")
+            return
+        self.relabel_items.emit(items)
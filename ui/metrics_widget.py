@@ -0,0 +1,143 @@
+"""
+运行监控界面 - 实时显示各环节的计数、速率与耗时分位数，并可开启 Prometheus 导出服务
+"""
+import time
+
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QGroupBox, QLabel,
+                             QSpinBox, QCheckBox, QTableWidget, QTableWidgetItem, QHeaderView)
+
+from business import metrics
+
+REFRESH_MS = 1000
+
+
+def _format_seconds(value):
+    if value is None:
+        return '-'
+    if value < 1:
+        return f"{value * 1000:.1f} ms"
+    return f"{value:.2f} s"
+
+
+class MetricsWidget(QWidget):
+    """运行监控界面（仅在可见时刷新）"""
+
+    def __init__(self, product_manager=None):
+        super().__init__()
+        self.product_manager = product_manager
+        # (名称, 标签) -> (时间, 计数)，用于计算速率
+        self._last_values = {}
+        self.timer = QTimer(self)
+        self.timer.setInterval(REFRESH_MS)
+        self.timer.timeout.connect(self.refresh)
+        self.init_ui()
+
+    def init_ui(self):
+        """初始化UI"""
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(10, 10, 10, 10)
+
+        # 采集与导出设置
+        settings_group = QGroupBox("采集与导出")
+        settings_layout = QHBoxLayout()
+        self.enabled_check = QCheckBox("采集运行指标")
+        self.enabled_check.setChecked(metrics.is_enabled())
+        self.enabled_check.toggled.connect(metrics.set_enabled)
+        settings_layout.addWidget(self.enabled_check)
+        settings_layout.addSpacing(20)
+
+        settings_layout.addWidget(QLabel("Prometheus 端口:"))
+        self.port_spin = QSpinBox()
+        self.port_spin.setRange(1024, 65535)
+        self.port_spin.setValue(metrics.DEFAULT_PORT)
+        settings_layout.addWidget(self.port_spin)
+        self.server_btn = QPushButton()
+        self.server_btn.clicked.connect(self.toggle_server)
+        settings_layout.addWidget(self.server_btn)
+        self.server_label = QLabel()
+        self.server_label.setStyleSheet("color: #7f8c8d;")
+        settings_layout.addWidget(self.server_label)
+        settings_layout.addStretch()
+        settings_group.setLayout(settings_layout)
+        layout.addWidget(settings_group)
+
+        # 指标表
+        self.table = QTableWidget(0, 6)
+        self.table.setHorizontalHeaderLabels(['指标', '标签', '当前值', '速率 (/秒)', 'P50', 'P95'])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table.verticalHeader().setVisible(False)
+        layout.addWidget(self.table, 1)
+
+        self.update_server_status()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.timer.start()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.timer.stop()
+
+    def refresh(self):
+        """刷新指标表"""
+        now = time.monotonic()
+        rows = []
+        for name, kind, help_text, items in metrics.get_registry().families():
+            for metric in items:
+                labels = ', '.join(f"{k}={v}" for k, v in metric.labels)
+                if kind == metrics.HISTOGRAM:
+                    count = metric.count
+                    value = f"{count} 次，均值 {_format_seconds(metric.sum / count if count else None)}"
+                    p50, p95 = _format_seconds(metric.quantile(0.5)), _format_seconds(metric.quantile(0.95))
+                else:
+                    count = metric.value
+                    value = f"{metric.value:g}"
+                    p50 = p95 = ''
+                rate = ''
+                if kind != metrics.GAUGE:
+                    key = (name, metric.labels)
+                    last = self._last_values.get(key)
+                    if last is not None and now > last[0]:
+                        rate = f"{(count - last[1]) / (now - last[0]):.2f}"
+                    self._last_values[key] = (now, count)
+                rows.append((help_text or name, labels, value, rate, p50, p95, name))
+
+        self.table.setRowCount(len(rows))
+        for row, values in enumerate(rows):
+            for col, text in enumerate(values[:6]):
+                item = self.table.item(row, col)
+                if item is None:
+                    item = QTableWidgetItem()
+                    self.table.setItem(row, col, item)
+                item.setText(text)
+                if col == 0:
+                    item.setToolTip(values[6])
+                elif col >= 2:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+
+    def toggle_server(self):
+        """启动/停止 Prometheus 导出服务"""
+        if metrics.running_server() is not None:
+            metrics.stop_server()
+        else:
+            try:
+                metrics.start_server(self.port_spin.value())
+            except OSError as e:
+                self.server_label.setText(f"启动失败: {e}")
+                return
+        self.update_server_status()
+
+    def update_server_status(self):
+        server = metrics.running_server()
+        self.port_spin.setEnabled(server is None)
+        if server is None:
+            self.server_btn.setText("启动导出")
+            self.server_label.setText("未启动")
+        else:
+            self.port_spin.setValue(server.port)
+            self.server_btn.setText("停止导出")
+            self.server_label.setText(f"http://{server.host}:{server.port}/metrics")
@@ -3,19 +3,63 @@
 """
 import os
 
-import cv2
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from PyQt5.QtGui import QPixmap, QImage
+from PyQt5.QtCore import Qt, QThread, QSize, QTimer, pyqtSignal
+from PyQt5.QtGui import QPixmap
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
-                             QGroupBox, QLabel, QLineEdit, QFileDialog, QMessageBox, QSlider, QListWidget, QSplitter, QComboBox)
+                             QGroupBox, QLabel, QLineEdit, QFileDialog, QMessageBox, QSlider, QListView, QSplitter, QComboBox,
+                             QCheckBox, QDoubleSpinBox)
+
+from business import metrics
+from business.decision import LABEL_NG, MODE_AREA, MODE_SCORE, DecisionEngine, DecisionRules
+from business.cascade import CascadeConfig
+from business.detections import RAW_CONF, RAW_IOU, RAW_MAX_DET, draw_detections
+from business.ensemble import MODE_ENSEMBLE, MODE_ENSEMBLE_TTA, MODE_NAMES, MODE_SINGLE, EnsembleConfig
+from business.image_cache import get_image_cache
+from business.backend_router import ANOMALY_BACKENDS, DETECTION_BACKENDS, backend_for_model, get_router
+from business.image_hash import read_image
+from business.model_backends.base import STATUS_STOPPED, STATUS_SUCCESS
+from business.predict_manager import PredictManager
+from business.profiler import get_profiler, name_thread, span
+from business.relabel_queue import UNCERTAIN_BAND, RelabelQueue, items_from_detections, items_from_review
+from business.results_store import DEFAULT_DB_FILE, RUN_FAILED, RUN_FINISHED, STORE_MIN_CONF, ResultsStore
+from ui.image_list_model import (FolderScanThread, ImageListModel, SORT_MTIME, SORT_NAME, SORT_NONE,
+                                 SORT_PATH)
+from ui.thumbnail_loader import bgr_to_qimage
+
+# 图像列表排序选项：(显示文字, 排序键, 是否降序)
+SORT_OPTIONS = [
+    ("加入顺序", SORT_NONE, False),
+    ("文件名", SORT_NAME, False),
+    ("完整路径", SORT_PATH, False),
+    ("修改时间（新→旧）", SORT_MTIME, True),
+]
+# 调节参数后延迟写配置文件（毫秒），连续调节只写一次
+SETTINGS_SAVE_DELAY_MS = 500
+
+IMAGES_PREDICTED = metrics.counter('sldmv_predict_images_total', '已预测的图像数')
+PREDICT_ERRORS = metrics.counter('sldmv_predict_errors_total', '预测任务失败次数')
+PENDING_IMAGES = metrics.gauge('sldmv_predict_pending_images', '本次预测尚未推理的图像数')
+PENDING_RESULTS = metrics.gauge('sldmv_predict_pending_results', '已推理、等待界面显示的结果数')
+ESCALATED_IMAGES = metrics.counter('sldmv_predict_escalated_images_total', '级联推理中升级到重模型的图像数')
+
+
+INFERENCE_SECONDS = metrics.stage_timer('predict', 'inference')
+RENDER_SECONDS = metrics.stage_timer('predict', 'render')
+
+
+def _mode_timer(mode):
+    """按推理模式统计的每张图像耗时（批量推理时为整批耗时按张均摊），用于比较各模式的延迟"""
+    return metrics.histogram('sldmv_predict_image_seconds', '每张图像预测耗时（秒，按推理模式）', {'mode': mode})
 
 
 class PredictThread(QThread):
-    """预测线程"""
-    result_signal = pyqtSignal(object, str)  # results, image_path
+    """预测线程（经 PredictManager 调用模型后端）"""
+    result_signal = pyqtSignal(object, str)  # 原始检测框 Detections, image_path
+    anomaly_signal = pyqtSignal(object, str)  # 异常检测的清单条目（分数、判定、叠加图）, image_path
     finished_signal = pyqtSignal(bool, str)
 
-    def __init__(self, model_path, image_paths, conf_threshold, iou_threshold, device, imgsz, max_det):
+    def __init__(self, model_path, image_paths, conf_threshold, iou_threshold, device, imgsz, max_det,
+                 results_db=None, ensemble=None, cascade=None, backend=None, decision_rules=None):
         super().__init__()
         self.model_path = model_path
         self.image_paths = image_paths
@@ -24,31 +68,132 @@ class PredictThread(QThread):
         self.device = device
         self.imgsz = imgsz
         self.max_det = max_det
+        # 结果库文件，为 None 时不入库
+        self.results_db = results_db
+        # 推理模式（EnsembleConfig），为 None 时单模型推理
+        self.ensemble = ensemble
+        # 级联设置（CascadeConfig），为 None 时全部图像直接用上面的模型推理
+        self.cascade = cascade
+        self.writer = None
+        # 异常检测后端时 model_path 为模型目录；其余按模型文件类型选择后端（.pt / .onnx / OpenVINO 目录）
+        self.backend = backend
+        # 写入预测清单的判定规则（DecisionRules.to_dict()），为 None 时有检出即 NG
+        self.decision_rules = decision_rules
+        # 本次预测的输出目录（预测清单所在目录）
+        self.output_dir = None
+        # 预测失败的图像数（原因记录在预测清单的 batch.json）
+        self.failed_images = 0
+        self.manager = PredictManager()
+
+    def _open_writer(self):
+        """登记本次预测任务并返回批量写入器"""
+        store = ResultsStore(self.results_db)
+        params = {
+            'conf': self.conf_threshold,
+            'iou': self.iou_threshold,
+            'imgsz': self.imgsz,
+            'max_det': self.max_det,
+            'device': self.device,
+            'mode': self.ensemble.mode if self.ensemble is not None else MODE_SINGLE,
+            'cascade': self.cascade.to_dict() if self.cascade is not None else None,
+        }
+        try:
+            name = os.path.basename(os.path.commonpath(self.image_paths))
+        except ValueError:
+            name = ''
+        run_id = store.start_run(name or '预测', self.model_path, params)
+        # 低于预测阈值的检测框也入库（不低于入库下限），之后可放宽置信度查询
+        return store.writer(run_id, min(self.conf_threshold, STORE_MIN_CONF))
 
     def run(self):
+        name_thread("PredictThread")
+        self.writer = None
         try:
-            from ultralytics import YOLO
-
-            # 加载模型
-            model = YOLO(self.model_path)
-
-            # 预测每张图像
-            for img_path in self.image_paths:
-                results = model.predict(
-                    img_path,
-                    conf=self.conf_threshold,
-                    iou=self.iou_threshold,
-                    device=self.device,
-                    imgsz=self.imgsz,
-                    max_det=self.max_det,
-                    verbose=False
-                )
-                self.result_signal.emit(results[0], img_path)
-
-            self.finished_signal.emit(True, f"成功预测 {len(self.image_paths)} 张图像")
-
+            if self.results_db:
+                with span("登记结果库任务", "predict"):
+                    self.writer = self._open_writer()
         except Exception as e:
+            PREDICT_ERRORS.inc()
             self.finished_signal.emit(False, f"预测出错: {str(e)}")
+            return
+
+        if self.backend in ANOMALY_BACKENDS:
+            # 异常检测按模型训练时的阈值判定，结果写入预测目录的清单
+            config = {'backend': self.backend, 'model_dir': self.model_path, 'images': self.image_paths}
+        else:
+            # 以低置信度、宽松 IoU 推理并返回原始检测框，界面上调整阈值时只需重新过滤
+            config = {
+                'model': self.model_path,
+                'images': self.image_paths,
+                'conf': min(self.conf_threshold, RAW_CONF),
+                'iou': max(self.iou_threshold, RAW_IOU),
+                'device': self.device,
+                'imgsz': self.imgsz,
+                'max_det': max(self.max_det, RAW_MAX_DET),
+                'ensemble': self.ensemble.to_dict() if self.ensemble is not None else None,
+                'cascade': self.cascade.to_dict() if self.cascade is not None else None,
+                'decision': {'conf': self.conf_threshold, 'iou': self.iou_threshold, 'max_det': self.max_det,
+                             'rules': self.decision_rules},
+            }
+        PENDING_IMAGES.set(len(self.image_paths))
+        event = self.manager.predict(config, self.on_event)
+        self.output_dir = event.get('output_dir')
+        success = event['status'] == STATUS_SUCCESS
+        if not success:
+            PREDICT_ERRORS.inc()
+            PENDING_IMAGES.set(0)
+            detail = (event.get('error') or {}).get('detail')
+            if detail:
+                print(detail)
+
+        if self.writer is not None:
+            try:
+                self.writer.close(RUN_FINISHED if success else RUN_FAILED)
+                self.writer.store.close()
+            except Exception as db_error:
+                print(f"写入结果库失败: {db_error}")
+        message = event['message'] if success or event['status'] == STATUS_STOPPED else f"预测出错: {event['message']}"
+        if self.failed_images:
+            message += f"\n{self.failed_images} 张图像预测失败（原因见预测清单）"
+        self.finished_signal.emit(success, message)
+
+    def on_event(self, event):
+        """后端事件：记录阶段耗时，逐张入库并发送检测结果"""
+        kind = event['type']
+        if kind == 'progress' and 'seconds' in event:
+            metrics.stage_timer('predict', event['stage']).observe(event['seconds'])
+        elif kind == 'result' and 'error' in event:
+            self.failed_images += 1
+            PENDING_IMAGES.dec()
+            print(f"预测失败 {event['entry']['image_path']}: {event['error']}")
+        elif kind == 'result':
+            detections = event.get('detections')
+            img_path = event['entry']['image_path']
+            raw_meta = event['entry']['raw_meta']
+            inference_ms = raw_meta['inference_ms']
+            INFERENCE_SECONDS.observe(inference_ms / 1000)
+            mode = raw_meta.get('mode', MODE_SINGLE)
+            if mode == 'cascade':
+                # 级联时分别统计只经过门控与升级的图像
+                mode = 'cascade_escalated' if raw_meta.get('escalated') else 'cascade_gate'
+                if raw_meta.get('escalated'):
+                    ESCALATED_IMAGES.inc()
+            _mode_timer(mode).observe(inference_ms / 1000)
+            IMAGES_PREDICTED.inc()
+            PENDING_IMAGES.dec()
+            PENDING_RESULTS.inc()
+            if detections is None:
+                # 异常检测后端没有检测框，发送清单条目
+                self.anomaly_signal.emit(event['entry'], img_path)
+                return
+            if self.writer is not None:
+                # 入库按本次的 IoU/最大检测数做 NMS 后的结果
+                stored = detections.filter(self.writer.min_conf, self.iou_threshold, self.max_det)
+                self.writer.add(img_path, stored, inference_ms)
+            self.result_signal.emit(detections, img_path)
+
+    def stop(self):
+        self.manager.stop()
 
 
 class PredictWidget(QWidget):
@@ -60,6 +205,31 @@ class PredictWidget(QWidget):
         self.predict_thread = None
         self.current_results = None
         self.current_image_path = None
+        # 图像路径 -> 原始检测框；按当前阈值过滤后的结果
+        self.raw_detections = {}
+        self._filtered = {}
+        # 图像路径 -> 异常检测的清单条目
+        self.anomaly_entries = {}
+        self.results_store = None
+        self.evaluation_dialog = None
+        self.manifest_dialog = None
+        # 最近一次预测的输出目录（预测清单）
+        self.last_run_dir = None
+        self.relabel_queue = None
+        self.relabel_dialog = None
+        # OK/NG 判定（规则保存在 config/decision_rules.json，按类别阈值、ROI 等直接编辑该文件）
+        self.decision_engine = DecisionEngine(DecisionRules.load())
+        self._decisions = {}
+        self._rules_save_timer = QTimer(self)
+        self._rules_save_timer.setSingleShot(True)
+        self._rules_save_timer.setInterval(SETTINGS_SAVE_DELAY_MS)
+        self._rules_save_timer.timeout.connect(self.save_decision_rules)
+        # 级联设置延迟保存到调节时所在的产品
+        self._cascade_save_key = None
+        self._cascade_save_timer = QTimer(self)
+        self._cascade_save_timer.setSingleShot(True)
+        self._cascade_save_timer.setInterval(SETTINGS_SAVE_DELAY_MS)
+        self._cascade_save_timer.timeout.connect(self.save_cascade_config)
         self.init_ui()
 
     def init_ui(self):
@@ -80,6 +250,16 @@ class PredictWidget(QWidget):
         model_group = QGroupBox("模型配置")
         model_layout = QVBoxLayout()
 
+        # 模型类型（异常检测模型为训练输出的目录）
+        model_type_layout = QHBoxLayout()
+        model_type_layout.addWidget(QLabel("模型类型:"))
+        self.model_type_combo = QComboBox()
+        self.model_type_combo.addItem("目标检测（YOLO / ONNX / OpenVINO）", False)
+        self.model_type_combo.addItem("异常检测（PatchCore）", True)
+        self.model_type_combo.currentIndexChanged.connect(self.on_model_type_changed)
+        model_type_layout.addWidget(self.model_type_combo, 1)
+        model_layout.addLayout(model_type_layout)
+
         # 模型文件
         model_file_layout = QHBoxLayout()
         model_file_layout.addWidget(QLabel("模型文件:"))
@@ -112,6 +292,7 @@ class PredictWidget(QWidget):
         maxdet_layout = QHBoxLayout()
         maxdet_layout.addWidget(QLabel("最大检测数:"))
         self.maxdet_combo = QComboBox(); self.maxdet_combo.addItems(['100','300','1000'])
+        self.maxdet_combo.currentIndexChanged.connect(self.on_thresholds_changed)
         maxdet_layout.addWidget(self.maxdet_combo)
         model_layout.addLayout(maxdet_layout)
 
@@ -122,6 +303,7 @@ class PredictWidget(QWidget):
         self.conf_slider.setRange(0, 100)
         self.conf_slider.setValue(25)
         self.conf_slider.valueChanged.connect(self.update_conf_label)
+        self.conf_slider.valueChanged.connect(self.on_thresholds_changed)
         conf_layout.addWidget(self.conf_slider)
 
         self.conf_label = QLabel("0.25")
@@ -136,6 +318,7 @@ class PredictWidget(QWidget):
         self.iou_slider.setRange(0, 100)
         self.iou_slider.setValue(45)
         self.iou_slider.valueChanged.connect(self.update_iou_label)
+        self.iou_slider.valueChanged.connect(self.on_thresholds_changed)
         iou_layout.addWidget(self.iou_slider)
 
         self.iou_label = QLabel("0.45")
@@ -143,8 +326,53 @@ class PredictWidget(QWidget):
         iou_layout.addWidget(self.iou_label)
         model_layout.addLayout(iou_layout)
 
+        # 推理模式（按产品保存在 config/inference_modes.json，翻转、尺度、模型权重等直接编辑该文件）
+        product_layout = QHBoxLayout()
+        product_layout.addWidget(QLabel("产品:"))
+        self.product_combo = QComboBox()
+        self.product_combo.currentIndexChanged.connect(self.on_product_changed)
+        product_layout.addWidget(self.product_combo, 1)
+        model_layout.addLayout(product_layout)
+        mode_row = QHBoxLayout()
+        mode_row.addWidget(QLabel("推理模式:"))
+        self.inference_mode_combo = QComboBox()
+        for mode, title in MODE_NAMES.items():
+            self.inference_mode_combo.addItem(title, mode)
+        self.inference_mode_combo.setToolTip("TTA（翻转/多尺度）与多模型集成的结果用加权框融合合并，召回更高、耗时更长；"
+                                             "各模式的每张耗时见运行监控")
+        self.inference_mode_combo.currentIndexChanged.connect(self.on_inference_mode_changed)
+        mode_row.addWidget(self.inference_mode_combo, 1)
+        self.ensemble_models_btn = QPushButton("附加模型")
+        self.ensemble_models_btn.setToolTip("多模型集成时与上面的模型一起推理的模型（如通用模型）")
+        self.ensemble_models_btn.clicked.connect(self.select_ensemble_models)
+        mode_row.addWidget(self.ensemble_models_btn)
+        model_layout.addLayout(mode_row)
+        self.inference_mode_label = QLabel("")
+        self.inference_mode_label.setWordWrap(True)
+        self.inference_mode_label.setStyleSheet("color: #7f8c8d;")
+        model_layout.addWidget(self.inference_mode_label)
+        # 级联：门控模型先筛查，只有可疑图像才用上面的模型（及推理模式）复检
+        cascade_row = QHBoxLayout()
+        self.cascade_check = QCheckBox("级联门控")
+        self.cascade_check.setToolTip("轻量模型先筛查全部图像，门控分数不低于升级阈值的图像才用上面的模型推理；"
+                                      "门控尺寸、类别、重模型尺寸等在 config/cascade.json 中编辑")
+        self.cascade_check.toggled.connect(self.on_cascade_changed)
+        cascade_row.addWidget(self.cascade_check)
+        cascade_row.addWidget(QLabel("升级阈值:"))
+        self.escalate_spin = QDoubleSpinBox()
+        self.escalate_spin.setRange(0.0, 1.0)
+        self.escalate_spin.setSingleStep(0.05)
+        self.escalate_spin.setDecimals(2)
+        self.escalate_spin.valueChanged.connect(self.on_cascade_changed)
+        cascade_row.addWidget(self.escalate_spin)
+        self.gate_model_btn = QPushButton("门控模型")
+        self.gate_model_btn.clicked.connect(self.select_gate_model)
+        cascade_row.addWidget(self.gate_model_btn)
+        model_layout.addLayout(cascade_row)
+
         model_group.setLayout(model_layout)
         left_layout.addWidget(model_group)
+        self.load_products()
 
         # 图像选择
         image_group = QGroupBox("图像选择")
@@ -160,18 +388,92 @@ class PredictWidget(QWidget):
         btn_layout.addWidget(self.select_folder_btn)
         image_layout.addLayout(btn_layout)
 
-        # 图像列表
-        self.image_list = QListWidget()
-        self.image_list.itemClicked.connect(self.on_image_selected)
+        # 过滤与排序
+        filter_layout = QHBoxLayout()
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("按路径过滤（空格分隔多个关键字）")
+        self.filter_edit.textChanged.connect(self.on_filter_changed)
+        filter_layout.addWidget(self.filter_edit)
+        self.sort_combo = QComboBox()
+        self.sort_combo.addItems([text for text, _, _ in SORT_OPTIONS])
+        self.sort_combo.currentIndexChanged.connect(self.on_sort_changed)
+        filter_layout.addWidget(self.sort_combo)
+        image_layout.addLayout(filter_layout)
+
+        # 图像列表（model/view，只为显示中的条目生成缩略图）
+        self.image_model = ImageListModel(self)
+        self.image_list = QListView()
+        self.image_list.setModel(self.image_model)
+        self.image_list.setUniformItemSizes(True)
+        self.image_list.setLayoutMode(QListView.Batched)
+        self.image_list.setBatchSize(200)
+        self.image_list.setIconSize(QSize(48, 48))
+        self.image_list.clicked.connect(self.on_image_selected)
         image_layout.addWidget(self.image_list)
+        self.image_count_label = QLabel("共 0 张")
+        self.image_count_label.setStyleSheet("color: #7f8c8d;")
+        image_layout.addWidget(self.image_count_label)
+        self.image_model.rowsInserted.connect(self.update_image_count)
+        self.image_model.modelReset.connect(self.update_image_count)
+        self.scan_thread = None
+        self._scanning = False
+        # 过滤输入防抖
+        self._filter_timer = QTimer(self)
+        self._filter_timer.setSingleShot(True)
+        self._filter_timer.setInterval(250)
+        self._filter_timer.timeout.connect(lambda: self.image_model.set_filter(self.filter_edit.text()))
+        # 拖动阈值滑块时合并重绘
+        self._rethreshold_timer = QTimer(self)
+        self._rethreshold_timer.setSingleShot(True)
+        self._rethreshold_timer.setInterval(30)
+        self._rethreshold_timer.timeout.connect(self.refresh_result)
 
         clear_btn = QPushButton("🗑️ 清空列表")
-        clear_btn.clicked.connect(self.image_list.clear)
+        clear_btn.clicked.connect(self.clear_images)
         image_layout.addWidget(clear_btn)
 
         image_group.setLayout(image_layout)
         left_layout.addWidget(image_group)
 
+        # OK/NG 判定
+        rules = self.decision_engine.rules
+        decision_group = QGroupBox("OK/NG 判定")
+        decision_layout = QVBoxLayout()
+        mode_layout = QHBoxLayout()
+        self.decision_check = QCheckBox("启用")
+        self.decision_check.setChecked(True)
+        self.decision_check.toggled.connect(self.refresh_result)
+        mode_layout.addWidget(self.decision_check)
+        mode_layout.addWidget(QLabel("模式:"))
+        self.decision_mode_combo = QComboBox()
+        self.decision_mode_combo.addItem("有缺陷即 NG", MODE_SCORE)
+        self.decision_mode_combo.addItem("缺陷面积占比", MODE_AREA)
+        self.decision_mode_combo.setCurrentIndex(self.decision_mode_combo.findData(rules.mode))
+        self.decision_mode_combo.currentIndexChanged.connect(self.on_decision_rules_changed)
+        mode_layout.addWidget(self.decision_mode_combo)
+        decision_layout.addLayout(mode_layout)
+
+        area_layout = QHBoxLayout()
+        area_layout.addWidget(QLabel("最小框面积:"))
+        self.min_area_spin = QDoubleSpinBox()
+        self.min_area_spin.setRange(0, 1e7)
+        self.min_area_spin.setDecimals(0)
+        self.min_area_spin.setSuffix(" px²")
+        self.min_area_spin.setValue(rules.min_box_area)
+        self.min_area_spin.valueChanged.connect(self.on_decision_rules_changed)
+        area_layout.addWidget(self.min_area_spin)
+        area_layout.addWidget(QLabel("面积占比:"))
+        self.area_ratio_spin = QDoubleSpinBox()
+        self.area_ratio_spin.setRange(0, 100)
+        self.area_ratio_spin.setDecimals(2)
+        self.area_ratio_spin.setSuffix(" %")
+        self.area_ratio_spin.setValue(rules.area_threshold * 100)
+        self.area_ratio_spin.valueChanged.connect(self.on_decision_rules_changed)
+        area_layout.addWidget(self.area_ratio_spin)
+        decision_layout.addLayout(area_layout)
+        decision_group.setLayout(decision_layout)
+        left_layout.addWidget(decision_group)
+
         # 预测按钮
         self.predict_btn = QPushButton("🔍 开始预测")
         self.predict_btn.setStyleSheet("""
@@ -194,6 +496,28 @@ class PredictWidget(QWidget):
         self.predict_btn.clicked.connect(self.start_predict)
         left_layout.addWidget(self.predict_btn)
 
+        # 结果库
+        results_layout = QHBoxLayout()
+        self.store_check = QCheckBox("保存到结果库")
+        self.store_check.setChecked(True)
+        self.store_check.setToolTip(f"预测结果写入 {DEFAULT_DB_FILE}，可按类别/置信度/无检出等条件查询")
+        results_layout.addWidget(self.store_check)
+        results_btn = QPushButton("🗂️ 结果查询")
+        results_btn.clicked.connect(self.open_results)
+        results_layout.addWidget(results_btn)
+        manifest_btn = QPushButton("📑 预测清单")
+        manifest_btn.setToolTip("浏览预测输出的清单（manifest.jsonl），按判定与分数筛选；默认打开最近一次预测")
+        manifest_btn.clicked.connect(self.open_manifest)
+        results_layout.addWidget(manifest_btn)
+        evaluate_btn = QPushButton("📊 模型评估")
+        evaluate_btn.clicked.connect(self.open_evaluation)
+        results_layout.addWidget(evaluate_btn)
+        relabel_btn = QPushButton("📝 送标注")
+        relabel_btn.setToolTip("把 NG 与置信度接近阈值的图像加入复标队列，分批在标注工具中打开")
+        relabel_btn.clicked.connect(self.send_to_relabel)
+        results_layout.addWidget(relabel_btn)
+        left_layout.addLayout(results_layout)
+
         # 保存结果按钮
         self.save_btn = QPushButton("💾 保存当前结果")
         self.save_btn.setStyleSheet("""
@@ -313,6 +637,12 @@ class PredictWidget(QWidget):
         image_group.setLayout(image_layout)
         right_layout.addWidget(image_group)
 
+        # 判定结论
+        self.verdict_label = QLabel("")
+        self.verdict_label.setAlignment(Qt.AlignCenter)
+        self.verdict_label.hide()
+        right_layout.addWidget(self.verdict_label)
+
         # 检测统计
         self.stats_label = QLabel("就绪")
         self.stats_label.setStyleSheet("""
@@ -341,16 +671,133 @@ class PredictWidget(QWidget):
         """更新IOU标签"""
         self.iou_label.setText(f"{value / 100:.2f}")
 
+    def is_anomaly_model(self):
+        """当前选择的是异常检测模型"""
+        return bool(self.model_type_combo.currentData())
+
+    def on_model_type_changed(self, *args):
+        """切换模型类型：只对检测模型有效的参数随之禁用"""
+        anomaly = self.is_anomaly_model()
+        self.model_edit.clear()
+        self.model_edit.setPlaceholderText("选择 PatchCore 模型目录（含 model.json）" if anomaly
+                                           else "选择训练好的模型文件 (.pt)")
+        for widget in (self.device_combo, self.imgsz_combo, self.maxdet_combo, self.conf_slider, self.iou_slider,
+                       self.inference_mode_combo, self.cascade_check, self.store_check, self.decision_mode_combo,
+                       self.min_area_spin, self.area_ratio_spin):
+            widget.setEnabled(not anomaly)
+        self.update_inference_mode_label()
+
     def select_model(self):
-        """选择模型文件"""
+        """选择模型文件（异常检测模型选择目录）"""
+        if self.is_anomaly_model():
+            directory = QFileDialog.getExistingDirectory(self, "选择 PatchCore 模型目录", os.path.expanduser("~"))
+            if directory:
+                self.model_edit.setText(directory)
+            return
         file_path, _ = QFileDialog.getOpenFileName(
             self, "选择模型文件",
             os.path.expanduser("~"),
-            "PyTorch Models (*.pt)"
+            "检测模型 (*.pt *.onnx *.xml);;PyTorch Models (*.pt);;ONNX Models (*.onnx);;OpenVINO Models (*.xml)"
         )
         if file_path:
             self.model_edit.setText(file_path)
 
+    # ---------- 推理模式 ----------
+    def load_products(self):
+        """刷新产品列表（保持当前选择）"""
+        current = self.product_combo.currentData()
+        self.product_combo.blockSignals(True)
+        self.product_combo.clear()
+        self.product_combo.addItem("默认", None)
+        for product in self.product_manager.get_products():
+            self.product_combo.addItem(product['name'], product['id'])
+        index = self.product_combo.findData(current)
+        self.product_combo.setCurrentIndex(max(index, 0))
+        self.product_combo.blockSignals(False)
+        self.on_product_changed()
+
+    def on_config_changed(self, changes):
+        """产品增删改后刷新产品列表"""
+        if any(c['entity'] in ('all', 'product') for c in changes):
+            self.load_products()
+
+    def _product_key(self):
+        product_id = self.product_combo.currentData()
+        return 'default' if product_id is None else product_id
+
+    def on_product_changed(self, *args):
+        """切换产品：载入该产品的推理模式"""
+        if self._cascade_save_timer.isActive():
+            self.save_cascade_config()
+        self.ensemble_config = EnsembleConfig.load(self._product_key())
+        self.inference_mode_combo.blockSignals(True)
+        self.inference_mode_combo.setCurrentIndex(max(self.inference_mode_combo.findData(self.ensemble_config.mode), 0))
+        self.inference_mode_combo.blockSignals(False)
+        self.cascade_config = CascadeConfig.load(self._product_key())
+        for widget in (self.cascade_check, self.escalate_spin):
+            widget.blockSignals(True)
+        self.cascade_check.setChecked(self.cascade_config.enabled)
+        self.escalate_spin.setValue(self.cascade_config.escalate_threshold)
+        for widget in (self.cascade_check, self.escalate_spin):
+            widget.blockSignals(False)
+        self.update_inference_mode_label()
+
+    def on_inference_mode_changed(self, *args):
+        self.ensemble_config.mode = self.inference_mode_combo.currentData()
+        self.ensemble_config.save(self._product_key())
+        self.update_inference_mode_label()
+
+    def select_ensemble_models(self):
+        """选择多模型集成的附加模型（已有的权重保留，新模型权重为 1）"""
+        files, _ = QFileDialog.getOpenFileNames(self, "选择附加模型", "", "模型文件 (*.pt *.onnx *.xml)")
+        if not files:
+            return
+        weights = {item['path']: item['weight'] for item in self.ensemble_config.models}
+        self.ensemble_config.models = [{'path': path, 'weight': weights.get(path, 1.0)} for path in files]
+        self.ensemble_config.save(self._product_key())
+        self.update_inference_mode_label()
+
+    def on_cascade_changed(self, *args):
+        self.cascade_config.enabled = self.cascade_check.isChecked()
+        self.cascade_config.escalate_threshold = self.escalate_spin.value()
+        self._cascade_save_key = self._product_key()
+        self._cascade_save_timer.start()
+        self.update_inference_mode_label()
+
+    def save_cascade_config(self):
+        self._cascade_save_timer.stop()
+        self.cascade_config.save(self._cascade_save_key)
+
+    def select_gate_model(self):
+        """选择级联的门控模型（小检测模型或分类模型）"""
+        file_path, _ = QFileDialog.getOpenFileName(self, "选择门控模型", os.path.dirname(self.cascade_config.gate_model),
+                                                   "模型文件 (*.pt *.onnx *.xml)")
+        if file_path:
+            self.cascade_config.gate_model = file_path
+            self._cascade_save_key = self._product_key()
+            self.save_cascade_config()
+            self.update_inference_mode_label()
+
+    def update_inference_mode_label(self):
+        config = self.ensemble_config
+        ensemble_mode = config.mode in (MODE_ENSEMBLE, MODE_ENSEMBLE_TTA)
+        detection = not self.is_anomaly_model()
+        self.ensemble_models_btn.setEnabled(ensemble_mode and detection)
+        text = config.describe(self.model_edit.text().strip(), int(self.imgsz_combo.currentText()))
+        if ensemble_mode:
+            if config.models:
+                text += "，附加模型: " + "、".join(os.path.basename(item['path']) for item in config.models)
+            else:
+                text += "，未选择附加模型"
+        cascade = self.cascade_config
+        self.escalate_spin.setEnabled(cascade.enabled and detection)
+        self.gate_model_btn.setEnabled(cascade.enabled and detection)
+        if cascade.enabled:
+            text += f"；级联门控: {os.path.basename(cascade.gate_model) or '未选择门控模型'}（{cascade.gate_imgsz}）"
+        if not detection:
+            text = "异常检测：逐张计算异常分数，按模型训练时确定的阈值判定 OK/NG"
+        self.inference_mode_label.setText(text)
+
     def select_images(self):
         """选择图像文件"""
         file_paths, _ = QFileDialog.getOpenFileNames(
@@ -358,10 +805,7 @@ class PredictWidget(QWidget):
             os.path.expanduser("~"),
             "Images (*.jpg *.jpeg *.png *.bmp)"
         )
-        for file_path in file_paths:
-            if file_path not in [self.image_list.item(i).text()
-                                 for i in range(self.image_list.count())]:
-                self.image_list.addItem(file_path)
+        self.image_model.add_paths(file_paths)
 
     def select_folder(self):
         """选择文件夹"""
@@ -370,18 +814,85 @@ class PredictWidget(QWidget):
             os.path.expanduser("~")
         )
         if folder_path:
-            extensions = ['.jpg', '.jpeg', '.png', '.bmp']
-            for file_name in os.listdir(folder_path):
-                if any(file_name.lower().endswith(ext) for ext in extensions):
-                    file_path = os.path.join(folder_path, file_name)
-                    if file_path not in [self.image_list.item(i).text()
-                                         for i in range(self.image_list.count())]:
-                        self.image_list.addItem(file_path)
-
-    def on_image_selected(self, item):
-        """图像被选中"""
-        # 可以预览原图
-        pass
+            self.cancel_scan()
+            # 后台递归扫描，找到的图像分批加入列表
+            thread = FolderScanThread(folder_path, parent=self)
+            # 已取消的扫描可能仍有排队中的信号，按发出的线程过滤
+            thread.batch_found.connect(lambda paths, mtimes, t=thread: self.on_scan_batch(t, paths, mtimes))
+            thread.scan_finished.connect(lambda total, t=thread: self.on_scan_finished(t, total))
+            self.scan_thread = thread
+            self._scan_started = get_profiler().now_ms()
+            self.select_folder_btn.setEnabled(False)
+            self._scanning = True
+            self.image_count_label.setText("正在扫描……")
+            self.scan_thread.start()
+
+    def cancel_scan(self):
+        if self.scan_thread is not None and self.scan_thread.isRunning():
+            self.scan_thread.cancel()
+            self.scan_thread.wait()
+        self.scan_thread = None
+        self._scanning = False
+
+    def on_scan_batch(self, thread, paths, mtimes):
+        if thread is self.scan_thread:
+            self.image_model.add_paths(paths, mtimes)
+
+    def on_scan_finished(self, thread, total):
+        """扫描结束：按当前排序方式整理列表"""
+        if thread is not self.scan_thread:
+            return
+        profiler = get_profiler()
+        profiler.record("扫描图像文件夹", self._scan_started, profiler.now_ms() - self._scan_started,
+                        "scan", images=total)
+        self._scanning = False
+        self.select_folder_btn.setEnabled(True)
+        if self.sort_combo.currentIndex() > 0:
+            self.image_model.apply_view()
+        self.update_image_count()
+
+    def clear_images(self):
+        """清空图像列表"""
+        self.cancel_scan()
+        self.select_folder_btn.setEnabled(True)
+        self.image_model.clear()
+
+    def on_filter_changed(self, _text):
+        self._filter_timer.start()
+
+    def on_sort_changed(self, index):
+        _, key, descending = SORT_OPTIONS[index]
+        self.image_model.set_sort(key, descending)
+
+    def update_image_count(self, *args):
+        shown, total = self.image_model.rowCount(), self.image_model.total_count()
+        text = f"共 {total} 张" if shown == total else f"显示 {shown} / 共 {total} 张"
+        self.image_count_label.setText(text + ("（扫描中……）" if self._scanning else ""))
+
+    def _preview_side(self):
+        """预览解码尺寸：按显示区域取整到 256 的倍数，窗口微调大小时仍能命中缓存"""
+        side = max(self.original_label.width(), self.original_label.height(), 256)
+        return (side + 255) // 256 * 256
+
+    def _show_preview(self, label, image_path):
+        frame = get_image_cache().frame(image_path, self._preview_side())
+        if frame is None:
+            return False
+        pixmap = QPixmap.fromImage(bgr_to_qimage(frame))
+        label.setPixmap(pixmap.scaled(label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        return True
+
+    def on_image_selected(self, index):
+        """图像被选中：预览原图（缓存的缩小图像），并预取相邻图像"""
+        row = index.row()
+        image_path = self.image_model.path_at(row)
+        if not self._show_preview(self.original_label, image_path):
+            self.original_label.setText("无法读取图像")
+        if image_path in self.raw_detections or image_path in self.anomaly_entries:
+            self.current_image_path = image_path
+            self.refresh_result()
+        neighbours = [self.image_model.path_at(i) for i in (row - 1, row + 1, row + 2)]
+        get_image_cache().prefetch_frames([p for p in neighbours if p], self._preview_side())
 
     def start_predict(self):
         """开始预测"""
@@ -394,13 +905,41 @@ class PredictWidget(QWidget):
             QMessageBox.warning(self, "警告", "模型文件不存在！")
             return
 
-        if self.image_list.count() == 0:
+        backend = backend_for_model(self.model_edit.text())
+        anomaly = self.is_anomaly_model()
+        if anomaly and backend not in ANOMALY_BACKENDS:
+            QMessageBox.warning(self, "警告", f"{self.model_edit.text()} 不是异常检测模型目录（缺少 model.json）！")
+            return
+        if not anomaly and backend not in DETECTION_BACKENDS:
+            QMessageBox.warning(self, "警告", f"{self.model_edit.text()} 不是检测模型（{backend}）！")
+            return
+        ok, message = get_router().healthcheck(backend)
+        if not ok:
+            QMessageBox.warning(self, "运行环境不可用", message)
+            return
+        if self.image_model.rowCount() == 0:
             QMessageBox.warning(self, "警告", "请选择要预测的图像！")
             return
+        if anomaly:
+            # 检测阈值与推理模式不用于异常检测
+            self._start_thread(PredictThread(self.model_edit.text(), self.image_model.visible_paths(), 0.0, 0.0, '',
+                                             0, 0, backend=backend))
+            return
+
+        ensemble = EnsembleConfig.from_dict(self.ensemble_config.to_dict())
+        if ensemble.use_ensemble:
+            missing = [item['path'] for item in ensemble.models if not os.path.exists(item['path'])]
+            if missing:
+                QMessageBox.warning(self, "警告", "附加模型不存在：\n" + "\n".join(missing))
+                return
+
+        cascade = CascadeConfig.from_dict(self.cascade_config.to_dict())
+        if cascade.enabled and not os.path.exists(cascade.gate_model):
+            QMessageBox.warning(self, "警告", "请选择级联的门控模型！")
+            return
 
         # 获取图像列表
-        image_paths = [self.image_list.item(i).text()
-                       for i in range(self.image_list.count())]
+        image_paths = self.image_model.visible_paths()
 
         # 获取参数
         conf_threshold = self.conf_slider.value() / 100
@@ -415,80 +954,206 @@ class PredictWidget(QWidget):
         imgsz = int(self.imgsz_combo.currentText())
         max_det = int(self.maxdet_combo.currentText())
 
-        # 禁用按钮
-        self.predict_btn.setEnabled(False)
-        self.stats_label.setText("正在预测...")
-
-        # 创建预测线程
-        self.predict_thread = PredictThread(
+        self._start_thread(PredictThread(
             self.model_edit.text(),
             image_paths,
             conf_threshold,
             iou_threshold,
             device,
             imgsz,
-            max_det
-        )
+            max_det,
+            DEFAULT_DB_FILE if self.store_check.isChecked() else None,
+            None if ensemble.is_single else ensemble,
+            cascade if cascade.active else None,
+            decision_rules=self.decision_engine.rules.to_dict() if self.decision_check.isChecked() else None
+        ))
+
+    def _start_thread(self, thread):
+        """清空上次的结果并启动预测线程"""
+        self.raw_detections.clear()
+        self.anomaly_entries.clear()
+        self._filtered.clear()
+        self._decisions.clear()
+        # 禁用按钮
+        self.predict_btn.setEnabled(False)
+        self.stats_label.setText("正在预测...")
+
+        self.predict_thread = thread
         self.predict_thread.result_signal.connect(self.show_result)
+        self.predict_thread.anomaly_signal.connect(self.show_anomaly_result)
         self.predict_thread.finished_signal.connect(self.on_predict_finished)
         self.predict_thread.start()
 
     def show_result(self, results, image_path):
         """显示预测结果"""
-        self.current_results = results
+        PENDING_RESULTS.dec()
+        with RENDER_SECONDS.time():
+            self._show_result(results, image_path)
+
+    def _show_result(self, detections, image_path):
+        self.raw_detections[image_path] = detections
         self.current_image_path = image_path
 
-        # 显示原图像
-        original_img = cv2.imread(image_path)
-        if original_img is not None:
-            original_rgb = cv2.cvtColor(original_img, cv2.COLOR_BGR2RGB)
-            h, w, ch = original_rgb.shape
-            bytes_per_line = ch * w
-            original_qt = QImage(original_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            original_pixmap = QPixmap.fromImage(original_qt)
-            original_scaled = original_pixmap.scaled(
-                self.original_label.size(),
+        # 显示原图像（缓存的缩小图像）
+        self._show_preview(self.original_label, image_path)
+        self.refresh_result()
+
+    def show_anomaly_result(self, entry, image_path):
+        """显示异常检测结果"""
+        PENDING_RESULTS.dec()
+        with RENDER_SECONDS.time():
+            self.anomaly_entries[image_path] = entry
+            self.current_image_path = image_path
+            self._show_preview(self.original_label, image_path)
+            self.refresh_anomaly_result()
+
+    def refresh_anomaly_result(self):
+        """显示当前图像的热力图叠加图、异常分数与判定"""
+        entry = self.anomaly_entries[self.current_image_path]
+        self.current_results = None
+        self.save_btn.setEnabled(False)
+        overlay = entry.get('overlay_path')
+        if not overlay or not self._show_preview(self.result_label, overlay):
+            self.result_label.setText("没有热力图")
+        stats_text = f"异常分数: {entry['score']:.4f}（阈值 {entry['threshold_value']:g}）"
+        if len(self.anomaly_entries) > 1:
+            ng_count = sum(1 for item in self.anomaly_entries.values() if item['label'] == LABEL_NG)
+            stats_text += (f"\n已预测 {len(self.anomaly_entries)} 张，"
+                           f"OK {len(self.anomaly_entries) - ng_count} 张 / NG {ng_count} 张")
+        self.stats_label.setText(stats_text)
+        if not self.decision_check.isChecked():
+            self._show_verdict_text(None, '')
+            return
+        reasons = entry['raw_meta'].get('reasons') or []
+        self._show_verdict_text(entry['label'], f"{entry['label']}（{'；'.join(reasons)}）" if reasons
+                                else entry['label'])
+
+    def current_thresholds(self):
+        """当前的 (置信度, IoU, 最大检测数)"""
+        return self.conf_slider.value() / 100, self.iou_slider.value() / 100, int(self.maxdet_combo.currentText())
+
+    def on_thresholds_changed(self, *args):
+        """阈值变化：丢弃按旧阈值过滤的结果，稍后在缓存的原始检测框上重新过滤"""
+        self._filtered.clear()
+        self._decisions.clear()
+        if self.raw_detections:
+            self._rethreshold_timer.start()
+
+    def filtered_detections(self, image_path):
+        """按当前阈值过滤后的检测框（同一组阈值下只计算一次）"""
+        detections = self._filtered.get(image_path)
+        if detections is None:
+            raw = self.raw_detections.get(image_path)
+            if raw is None:
+                return None
+            detections = self._filtered[image_path] = raw.filter(*self.current_thresholds())
+        return detections
+
+    def on_decision_rules_changed(self, *args):
+        """界面上的判定参数写回规则（保留文件中的类别阈值、ROI 等设置）并重新判定"""
+        rules = self.decision_engine.rules
+        rules.mode = self.decision_mode_combo.currentData()
+        rules.min_box_area = self.min_area_spin.value()
+        rules.area_threshold = self.area_ratio_spin.value() / 100
+        self.decision_engine.set_rules(rules)
+        self._rules_save_timer.start()
+        self._decisions.clear()
+        if self.raw_detections:
+            self._rethreshold_timer.start()
+
+    def save_decision_rules(self):
+        self._rules_save_timer.stop()
+        self.decision_engine.rules.save()
+
+    def flush_settings(self):
+        """立即写出尚未保存的设置（退出前调用）"""
+        if self._rules_save_timer.isActive():
+            self.save_decision_rules()
+        if self._cascade_save_timer.isActive():
+            self.save_cascade_config()
+
+    def decision_for(self, image_path):
+        """当前阈值与规则下的 OK/NG 判定（直接在缓存的检测框上计算，同一组参数下只计算一次）"""
+        decision = self._decisions.get(image_path)
+        if decision is None:
+            raw = self.raw_detections.get(image_path)
+            if raw is None:
+                return None
+            conf, iou, max_det = self.current_thresholds()
+            # 规则中某些类别的阈值低于界面阈值时，判定需要保留到更低置信度的检测框
+            floor = self.decision_engine.rules.min_conf(conf)
+            detections = raw.filter(floor, iou, max_det) if floor < conf else self.filtered_detections(image_path)
+            decision = self._decisions[image_path] = self.decision_engine.decide(detections, conf)
+        return decision
+
+    def _show_verdict(self, decision):
+        if decision is None:
+            self._show_verdict_text(None, '')
+            return
+        self._show_verdict_text(decision.label, decision.summary())
+
+    def _show_verdict_text(self, label, text):
+        if label is None:
+            self.verdict_label.hide()
+            return
+        color = '#e74c3c' if label == LABEL_NG else '#27ae60'
+        self.verdict_label.setStyleSheet(f"""
+            QLabel {{
+                background: {color};
+                color: white;
+                padding: 8px;
+                border-radius: 4px;
+                font-size: 20px;
+                font-weight: bold;
+            }}
+        """)
+        self.verdict_label.setText(text)
+        self.verdict_label.show()
+
+    def refresh_result(self):
+        """按当前阈值重绘当前图像的检测结果并更新统计（不重新推理）"""
+        if self.current_image_path in self.anomaly_entries:
+            self.refresh_anomaly_result()
+            return
+        detections = self.filtered_detections(self.current_image_path) if self.current_image_path else None
+        if detections is None:
+            return
+        self.current_results = detections
+
+        # 在缓存的缩小图像上绘制检测框
+        frame = get_image_cache().frame(self.current_image_path, self._preview_side())
+        if frame is not None:
+            scale = frame.shape[1] / detections.image_shape[1] if detections.image_shape else 1.0
+            result_pixmap = QPixmap.fromImage(bgr_to_qimage(draw_detections(frame, detections, scale)))
+            self.result_label.setPixmap(result_pixmap.scaled(
+                self.result_label.size(),
                 Qt.KeepAspectRatio,
                 Qt.SmoothTransformation
-            )
-            self.original_label.setPixmap(original_scaled)
-
-        # 显示预测结果
-        result_img = results.plot()
-        result_rgb = cv2.cvtColor(result_img, cv2.COLOR_BGR2RGB)
-        h, w, ch = result_rgb.shape
-        bytes_per_line = ch * w
-        result_qt = QImage(result_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        result_pixmap = QPixmap.fromImage(result_qt)
-        result_scaled = result_pixmap.scaled(
-            self.result_label.size(),
-            Qt.KeepAspectRatio,
-            Qt.SmoothTransformation
-        )
-        self.result_label.setPixmap(result_scaled)
+            ))
 
         # 统计信息
-        boxes = results.boxes
-        if boxes is not None and len(boxes) > 0:
-            num_detections = len(boxes)
-            class_counts = {}
-            for box in boxes:
-                cls_id = int(box.cls[0])
-                cls_name = results.names[cls_id]
-                class_counts[cls_name] = class_counts.get(cls_name, 0) + 1
-
-            stats_text = f"检测到 {num_detections} 个目标\n"
-            for cls_name, count in class_counts.items():
+        if len(detections) > 0:
+            stats_text = f"检测到 {len(detections)} 个目标\n"
+            for cls_name, count in detections.class_counts().items():
                 stats_text += f"  • {cls_name}: {count}\n"
-            self.stats_label.setText(stats_text)
         else:
-            self.stats_label.setText("未检测到目标")
+            stats_text = "未检测到目标\n"
+        if len(self.raw_detections) > 1:
+            with_objects = sum(1 for path in self.raw_detections if len(self.filtered_detections(path)) > 0)
+            stats_text += f"已预测 {len(self.raw_detections)} 张，其中 {with_objects} 张有检出"
+            if self.decision_check.isChecked():
+                ng_count = sum(1 for path in self.raw_detections if self.decision_for(path).label == LABEL_NG)
+                stats_text += f"，OK {len(self.raw_detections) - ng_count} 张 / NG {ng_count} 张"
+        self.stats_label.setText(stats_text.rstrip())
+        self._show_verdict(self.decision_for(self.current_image_path) if self.decision_check.isChecked() else None)
 
         self.save_btn.setEnabled(True)
 
     def on_predict_finished(self, success, message):
         """预测完成"""
         self.predict_btn.setEnabled(True)
+        if self.predict_thread is not None and self.predict_thread.output_dir:
+            self.last_run_dir = self.predict_thread.output_dir
 
         if success:
             QMessageBox.information(self, "预测完成", message)
@@ -496,6 +1161,101 @@ class PredictWidget(QWidget):
             QMessageBox.warning(self, "预测失败", message)
             self.stats_label.setText("预测失败")
 
+    def _open_results_store(self):
+        """按需打开结果库（失败时提示并返回 None）"""
+        try:
+            if self.results_store is None:
+                self.results_store = ResultsStore(DEFAULT_DB_FILE)
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"打开结果库失败: {str(e)}")
+        return self.results_store
+
+    def open_results(self):
+        """打开结果查询对话框"""
+        from ui.results_dialog import ResultsDialog
+
+        if self._open_results_store() is None:
+            return
+        dialog = ResultsDialog(self.results_store, self)
+        dialog.show_images.connect(self.show_query_images)
+        dialog.exec_()
+
+    def open_manifest(self):
+        """打开预测清单浏览对话框（非模态，送标注后可同时操作复标队列）"""
+        from ui.manifest_dialog import ManifestDialog
+
+        if self.manifest_dialog is None:
+            self.manifest_dialog = ManifestDialog('runs', self)
+            self.manifest_dialog.show_images.connect(self.show_query_images)
+            self.manifest_dialog.relabel_items.connect(self._enqueue_relabel)
+        # 默认显示最近一次预测的清单
+        if self.last_run_dir and self.manifest_dialog.run_dir != self.last_run_dir:
+            self.manifest_dialog.open_dir(self.last_run_dir)
+        self.manifest_dialog.show()
+        self.manifest_dialog.raise_()
+
+    def open_evaluation(self):
+        """打开模型评估对话框（对话框保留，再次评估时只重新匹配有变化的图像）"""
+        from ui.evaluation_dialog import EvaluationDialog
+
+        if self.evaluation_dialog is None:
+            self.evaluation_dialog = EvaluationDialog(self.evaluation_predictions, self._open_results_store(), self)
+            self.evaluation_dialog.show_images.connect(self.show_query_images)
+            self.evaluation_dialog.relabel_images.connect(self.relabel_review_rows)
+        self.evaluation_dialog.show()
+        self.evaluation_dialog.raise_()
+
+    def evaluation_predictions(self):
+        """当前原始检测框及界面上的 NMS 参数"""
+        _, iou, max_det = self.current_thresholds()
+        return dict(self.raw_detections), iou, max_det
+
+    def _open_relabel_queue(self):
+        """按需打开复标队列（失败时提示并返回 None）"""
+        try:
+            if self.relabel_queue is None:
+                self.relabel_queue = RelabelQueue()
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"打开复标队列失败: {str(e)}")
+        return self.relabel_queue
+
+    def _enqueue_relabel(self, items):
+        """加入复标队列并打开队列对话框"""
+        from ui.relabel_dialog import RelabelDialog
+
+        if self._open_relabel_queue() is None:
+            return
+        added = self.relabel_queue.add(items)
+        if self.relabel_dialog is None:
+            self.relabel_dialog = RelabelDialog(self.relabel_queue, self.product_manager.get_category_names, self)
+        self.relabel_dialog.refresh()
+        self.relabel_dialog.sync_label.setText(f"新加入 {added} 张（已在队列中的 {len(items) - added} 张不重复加入）")
+        self.relabel_dialog.show()
+        self.relabel_dialog.raise_()
+
+    def send_to_relabel(self):
+        """当前预测结果中的 NG 与置信度临界图像送标注（没有预测结果时只打开队列继续标注）"""
+        if not self.raw_detections:
+            self._enqueue_relabel([])
+            return
+        # 检测框按界面 NMS 参数保留到阈值以下 UNCERTAIN_BAND，用于找出临界图像
+        conf, iou, max_det = self.current_thresholds()
+        floor = max(conf - UNCERTAIN_BAND, 0.0)
+        predictions = {path: raw.filter(floor, iou, max_det) for path, raw in self.raw_detections.items()}
+        decisions = {path: self.decision_for(path) for path in self.raw_detections} \
+            if self.decision_check.isChecked() else None
+        self._enqueue_relabel(items_from_detections(predictions, conf, decisions))
+
+    def relabel_review_rows(self, rows):
+        """评估对话框中的误检/漏检图像送标注"""
+        self._enqueue_relabel(items_from_review(rows))
+
+    def show_query_images(self, paths):
+        """用查询结果替换图像列表"""
+        self.clear_images()
+        self.image_model.add_paths(p for p in paths if os.path.exists(p))
+        self.update_image_count()
+
     def save_result(self):
         """保存预测结果"""
         if self.current_results is None:
@@ -508,21 +1268,24 @@ class PredictWidget(QWidget):
         )
 
         if save_path:
-            # 保存结果图像
-            img = self.current_results.plot()
-            cv2.imwrite(save_path, img)
+            import cv2
+
+            # 保存结果图像（原分辨率，按当前阈值）
+            detections = self.current_results
+            original = read_image(self.current_image_path)
+            if original is None:
+                QMessageBox.warning(self, "保存失败", "无法读取原图像")
+                return
+            ok, buffer = cv2.imencode(os.path.splitext(save_path)[1] or '.jpg', draw_detections(original, detections))
+            if ok:
+                buffer.tofile(save_path)
 
             # 同时保存检测结果为txt
             txt_path = os.path.splitext(save_path)[0] + '_results.txt'
             with open(txt_path, 'w', encoding='utf-8') as f:
-                boxes = self.current_results.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        cls_id = int(box.cls[0])
-                        cls_name = self.current_results.names[cls_id]
-                        conf = float(box.conf[0])
-                        xyxy = box.xyxy[0].cpu().numpy()
-                        f.write(f"{cls_name} {conf:.2f} {xyxy[0]:.1f} {xyxy[1]:.1f} {xyxy[2]:.1f} {xyxy[3]:.1f}\n")
+                for xyxy, conf, cls_id in zip(detections.boxes, detections.scores, detections.classes):
+                    cls_name = detections.class_name(cls_id)
+                    f.write(f"{cls_name} {conf:.2f} {xyxy[0]:.1f} {xyxy[1]:.1f} {xyxy[2]:.1f} {xyxy[3]:.1f}\n")
 
             QMessageBox.information(
                 self, "保存成功",
@@ -4,7 +4,8 @@
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
                              QTableWidget, QTableWidgetItem, QHeaderView,
                              QDialog, QLabel, QLineEdit, QTextEdit, QMessageBox,
-                             QGroupBox, QComboBox, QSplitter, QListWidget, QListWidgetItem)
+                             QGroupBox, QComboBox, QSplitter, QListWidget, QListWidgetItem,
+                             QFileDialog)
 from PyQt5.QtCore import Qt
 
 
@@ -229,9 +230,35 @@ class ProductWidget(QWidget):
             }
         """)
 
+        # 批量导入/导出
+        io_btn_style = """
+            QPushButton {
+                background: #95a5a6;
+                color: white;
+                border: none;
+                padding: 8px 14px;
+                border-radius: 4px;
+                font-size: 14px;
+            }
+            QPushButton:hover {
+                background: #7f8c8d;
+            }
+        """
+        self.import_btn = QPushButton("📥 导入")
+        self.import_btn.setToolTip("从 CSV/JSON 批量导入产品及缺陷类别")
+        self.import_btn.clicked.connect(self.import_catalog)
+        self.import_btn.setStyleSheet(io_btn_style)
+
+        self.export_btn = QPushButton("📤 导出")
+        self.export_btn.setToolTip("导出全部产品及缺陷类别为 CSV/JSON")
+        self.export_btn.clicked.connect(self.export_catalog)
+        self.export_btn.setStyleSheet(io_btn_style)
+
         product_btn_layout.addWidget(self.add_product_btn)
         product_btn_layout.addWidget(self.edit_product_btn)
         product_btn_layout.addWidget(self.delete_product_btn)
+        product_btn_layout.addWidget(self.import_btn)
+        product_btn_layout.addWidget(self.export_btn)
         product_btn_layout.addStretch()
 
         left_layout.addLayout(product_btn_layout)
@@ -412,6 +439,14 @@ class ProductWidget(QWidget):
             self.product_list.addItem(item)
 
         self.product_stats_label.setText(f"共 {len(products)} 个产品")
+        # 保持当前选中的产品
+        if self.current_product_id is not None:
+            for row in range(self.product_list.count()):
+                if self.product_list.item(row).data(Qt.UserRole) == self.current_product_id:
+                    self.product_list.blockSignals(True)
+                    self.product_list.setCurrentRow(row)
+                    self.product_list.blockSignals(False)
+                    break
         # 若存在产品且未选择，默认选中新添加或第一个
         if self.product_list.count() > 0 and self.current_product_id is None:
             self.product_list.setCurrentRow(self.product_list.count() - 1)
@@ -452,6 +487,28 @@ class ProductWidget(QWidget):
             self.detail_defects.setText("缺陷类别数：0")
             self.add_defect_btn.setEnabled(False)
 
+    def on_config_changed(self, changes):
+        """产品数据变更（含其他工作站/进程的修改）后只刷新受影响的部分"""
+        reload_all = any(c['entity'] == 'all' for c in changes)
+        product_changed = reload_all or any(c['entity'] == 'product' for c in changes)
+        affected = {c['product_id'] for c in changes}
+
+        if product_changed:
+            self.load_products()
+        if self.current_product_id is None:
+            return
+        if self.product_manager.get_product_by_id(self.current_product_id) is None:
+            # 当前产品已被删除
+            self.current_product_id = None
+            self.current_product_label.setText("请先选择一个产品")
+            self.add_defect_btn.setEnabled(False)
+            self.defect_table.setRowCount(0)
+            self.defect_stats_label.setText("共 0 个缺陷类别")
+        elif reload_all or self.current_product_id in affected:
+            current_item = self.product_list.currentItem()
+            if current_item is not None and current_item.data(Qt.UserRole) == self.current_product_id:
+                self.on_product_selected(current_item)
+
     def on_product_selection_changed(self):
         """产品选择变化（用于按钮状态）"""
         has_selection = len(self.product_list.selectedItems()) > 0
@@ -515,6 +572,7 @@ class ProductWidget(QWidget):
         if not product:
             return
 
+        version = product.get('version')
         dialog = ProductDialog(self, product)
         # 预填充路径
         dialog.path_edit.setText(product.get('path',''))
@@ -524,14 +582,15 @@ class ProductWidget(QWidget):
                 QMessageBox.warning(self, "警告", "产品名称不能为空！")
                 return
 
-            if self.product_manager.update_product(product_id, data['name'], data['description'], data.get('path','')):
+            if self.product_manager.update_product(product_id, data['name'], data['description'], data.get('path',''),
+                                                   expected_version=version):
                 QMessageBox.information(self, "成功", "产品更新成功！")
                 self.load_products()
                 # 如果编辑的是当前产品，更新显示
                 if product_id == self.current_product_id:
                     self.current_product_label.setText(f"当前产品: {data['name']}")
             else:
-                QMessageBox.warning(self, "失败", "产品名称已存在或更新失败！")
+                QMessageBox.warning(self, "失败", "产品名称已存在、已被其他工作站修改或更新失败！")
 
     def delete_product(self):
         """删除产品"""
@@ -562,6 +621,37 @@ class ProductWidget(QWidget):
             else:
                 QMessageBox.warning(self, "失败", "产品删除失败！")
 
+    def import_catalog(self):
+        """批量导入产品目录"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "导入产品目录", "", "产品目录 (*.csv *.json);;CSV Files (*.csv);;JSON Files (*.json)"
+        )
+        if not file_path:
+            return
+        success, message = self.product_manager.import_catalog(file_path)
+        if success:
+            QMessageBox.information(self, "导入完成", message)
+            self.load_products()
+            if self.current_product_id is not None:
+                self.load_defect_categories()
+        else:
+            QMessageBox.warning(self, "导入失败", message)
+
+    def export_catalog(self):
+        """导出产品目录"""
+        file_path, selected = QFileDialog.getSaveFileName(
+            self, "导出产品目录", "products.csv", "CSV Files (*.csv);;JSON Files (*.json)"
+        )
+        if not file_path:
+            return
+        if not file_path.lower().endswith(('.csv', '.json')):
+            file_path += '.json' if 'JSON' in selected else '.csv'
+        success, message = self.product_manager.export_catalog(file_path)
+        if success:
+            QMessageBox.information(self, "导出完成", message)
+        else:
+            QMessageBox.warning(self, "导出失败", message)
+
     def add_defect_category(self):
         """添加缺陷类别"""
         if self.current_product_id is None:
@@ -610,11 +700,12 @@ class ProductWidget(QWidget):
                 QMessageBox.warning(self, "警告", "缺陷类别名称不能为空！")
                 return
 
-            if self.product_manager.update_defect_category(self.current_product_id, category_id, data['name'], data['description']):
+            if self.product_manager.update_defect_category(self.current_product_id, category_id, data['name'],
+                                                           data['description'], expected_version=category.get('version')):
                 QMessageBox.information(self, "成功", "缺陷类别更新成功！")
                 self.load_defect_categories()
             else:
-                QMessageBox.warning(self, "失败", "缺陷类别名称已存在或更新失败！")
+                QMessageBox.warning(self, "失败", "缺陷类别名称已存在、已被其他工作站修改或更新失败！")
 
     def delete_defect_category(self):
         """删除缺陷类别"""
@@ -0,0 +1,139 @@
+"""
+复标队列对话框 - 按队列顺序分批在标注工具中打开，保存的标注自动写回原数据集
+"""
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QSpinBox, QPushButton, QMessageBox)
+
+from business.relabel_queue import DEFAULT_BATCH_SIZE, REASON_NAMES, RelabelQueue
+from ui.labelme_launcher import shared_launcher
+
+# 对话框显示期间自动回写的间隔（毫秒）
+SYNC_INTERVAL_MS = 3000
+
+
+class RelabelDialog(QDialog):
+    """复标队列对话框"""
+
+    def __init__(self, queue: RelabelQueue, labels_provider, parent=None):
+        """labels_provider() 返回标注工具的标签候选（缺陷类别名称）"""
+        super().__init__(parent)
+        self.queue = queue
+        self.labels_provider = labels_provider
+        self.current_dir = None
+        self._sync_timer = QTimer(self)
+        self._sync_timer.setInterval(SYNC_INTERVAL_MS)
+        self._sync_timer.timeout.connect(self.sync)
+        self.init_ui()
+        self.refresh()
+
+    def init_ui(self):
+        """初始化UI"""
+        self.setWindowTitle("复标队列")
+        self.resize(520, 260)
+
+        layout = QVBoxLayout(self)
+        self.counts_label = QLabel("")
+        self.counts_label.setWordWrap(True)
+        layout.addWidget(self.counts_label)
+        self.reasons_label = QLabel("")
+        self.reasons_label.setWordWrap(True)
+        layout.addWidget(self.reasons_label)
+        self.sync_label = QLabel("")
+        self.sync_label.setStyleSheet("color: #7f8c8d;")
+        layout.addWidget(self.sync_label)
+
+        batch_layout = QHBoxLayout()
+        batch_layout.addWidget(QLabel("每批张数："))
+        self.batch_spin = QSpinBox()
+        self.batch_spin.setRange(10, 5000)
+        self.batch_spin.setSingleStep(100)
+        self.batch_spin.setValue(DEFAULT_BATCH_SIZE)
+        self.batch_spin.setToolTip("标注工具一次只打开一批，队列再大也不会拖慢标注工具")
+        batch_layout.addWidget(self.batch_spin)
+        batch_layout.addStretch()
+        layout.addLayout(batch_layout)
+
+        btn_layout = QHBoxLayout()
+        open_btn = QPushButton("▶ 打开下一批")
+        open_btn.clicked.connect(self.open_next_batch)
+        btn_layout.addWidget(open_btn)
+        sync_btn = QPushButton("⟳ 回写")
+        sync_btn.setToolTip("把已保存的标注写回原图所在目录（对话框打开期间自动进行）")
+        sync_btn.clicked.connect(self.sync)
+        btn_layout.addWidget(sync_btn)
+        skip_btn = QPushButton("⏭ 跳过本批剩余")
+        skip_btn.clicked.connect(self.skip_current)
+        btn_layout.addWidget(skip_btn)
+        cleanup_btn = QPushButton("🧹 清理已完成批次")
+        cleanup_btn.clicked.connect(self.cleanup)
+        btn_layout.addWidget(cleanup_btn)
+        layout.addLayout(btn_layout)
+
+    def refresh(self):
+        """刷新队列统计"""
+        counts = self.queue.counts()
+        self.counts_label.setText(
+            f"待标注 {counts['pending'] + counts['open']} 张（已打开 {counts['open']} 张），"
+            f"已写回 {counts['done']} 张，跳过 {counts['skipped']} 张，冲突 {counts['conflict']} 张")
+        reasons = self.queue.reason_counts()
+        self.reasons_label.setText("未打开：" + ("，".join(f"{REASON_NAMES.get(reason, reason)} {count} 张"
+                                                        for reason, count in reasons.items()) or "无"))
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self._sync_timer.start()
+
+    def hideEvent(self, event):
+        self._sync_timer.stop()
+        self.sync()
+        super().hideEvent(event)
+
+    def sync(self):
+        """回写已保存的标注"""
+        try:
+            result = self.queue.sync()
+        except Exception as e:
+            print(f"复标回写失败: {e}")
+            return
+        if result['done'] or result['conflict']:
+            text = f"本次写回 {result['done']} 张"
+            if result['conflict']:
+                text += f"，{result['conflict']} 张的原标注已被修改，未覆盖"
+            self.sync_label.setText(text)
+            self.refresh()
+
+    def open_next_batch(self):
+        """在标注工具中打开最早未完成的一批（没有时物化下一批）"""
+        try:
+            directory = self.queue.next_batch(self.batch_spin.value())
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"准备标注批次失败: {str(e)}")
+            return
+        self.refresh()
+        if directory is None:
+            QMessageBox.information(self, "提示", "队列中没有待标注的图像")
+            return
+        if self.queue.link_modes.get('copy'):
+            self.sync_label.setText("部分图像无法建立链接，已复制到工作目录")
+        self.current_dir = directory
+        try:
+            shared_launcher().show(self.labels_provider(), directory)
+        except ImportError as e:
+            QMessageBox.warning(self, "labelme 未安装", f"无法导入 labelme 模块：{str(e)}\n\n标注目录：{directory}")
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"打开标注工具时出错：\n{str(e)}")
+
+    def skip_current(self):
+        """跳过当前批次中尚未保存的图像"""
+        batches = self.queue.open_batches()
+        if not batches:
+            return
+        skipped = self.queue.skip_batch(batches[0])
+        self.sync_label.setText(f"已跳过 {skipped} 张")
+        self.refresh()
+
+    def cleanup(self):
+        """删除已处理完的批次目录"""
+        removed = self.queue.cleanup()
+        self.sync_label.setText(f"已清理 {removed} 个批次目录")
+        self.refresh()
@@ -0,0 +1,168 @@
+"""
+预测结果查询对话框 - 按任务、类别、置信度、无检出、路径关键字筛选结果库中的图像
+"""
+import os
+
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QDoubleSpinBox, QCheckBox,
+                             QLineEdit, QPushButton, QTableWidget, QTableWidgetItem, QHeaderView, QMessageBox)
+
+from business.results_store import RUN_FINISHED, ResultsStore
+
+# 每页查询的图像数（"加载更多"按页追加）
+PAGE_SIZE = 1000
+
+
+class ResultsDialog(QDialog):
+    """预测结果查询对话框"""
+
+    # 将筛选出的图像路径显示到预测界面的图像列表
+    show_images = pyqtSignal(list)
+
+    def __init__(self, store: ResultsStore, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self._offset = 0
+        self._query = {}
+        self.init_ui()
+        self.load_runs()
+
+    def init_ui(self):
+        """初始化UI"""
+        self.setWindowTitle("预测结果查询")
+        self.resize(900, 600)
+
+        layout = QVBoxLayout(self)
+
+        # 筛选条件
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("任务："))
+        self.run_combo = QComboBox()
+        self.run_combo.setMinimumWidth(260)
+        self.run_combo.currentIndexChanged.connect(self.on_run_changed)
+        filter_layout.addWidget(self.run_combo)
+
+        filter_layout.addWidget(QLabel("类别："))
+        self.class_combo = QComboBox()
+        filter_layout.addWidget(self.class_combo)
+
+        filter_layout.addWidget(QLabel("最低置信度："))
+        self.conf_spin = QDoubleSpinBox()
+        self.conf_spin.setRange(0.0, 1.0)
+        self.conf_spin.setSingleStep(0.05)
+        self.conf_spin.setValue(0.25)
+        filter_layout.addWidget(self.conf_spin)
+
+        self.empty_check = QCheckBox("只看无检出")
+        self.empty_check.toggled.connect(self.class_combo.setDisabled)
+        filter_layout.addWidget(self.empty_check)
+        layout.addLayout(filter_layout)
+
+        search_layout = QHBoxLayout()
+        self.path_edit = QLineEdit()
+        self.path_edit.setPlaceholderText("路径包含（可选）")
+        self.path_edit.returnPressed.connect(self.search)
+        search_layout.addWidget(self.path_edit)
+        search_btn = QPushButton("🔍 查询")
+        search_btn.clicked.connect(self.search)
+        search_layout.addWidget(search_btn)
+        delete_btn = QPushButton("🗑️ 删除任务")
+        delete_btn.clicked.connect(self.delete_run)
+        search_layout.addWidget(delete_btn)
+        layout.addLayout(search_layout)
+
+        # 结果表格
+        self.table = QTableWidget(0, 5)
+        self.table.setHorizontalHeaderLabels(["图像", "检测数", "最高置信度", "推理耗时(ms)", "完整路径"])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        layout.addWidget(self.table)
+
+        bottom_layout = QHBoxLayout()
+        self.count_label = QLabel("")
+        bottom_layout.addWidget(self.count_label)
+        bottom_layout.addStretch()
+        self.more_btn = QPushButton("加载更多")
+        self.more_btn.clicked.connect(self.load_more)
+        self.more_btn.setEnabled(False)
+        bottom_layout.addWidget(self.more_btn)
+        show_btn = QPushButton("📋 显示到图像列表")
+        show_btn.clicked.connect(self.on_show_images)
+        bottom_layout.addWidget(show_btn)
+        layout.addLayout(bottom_layout)
+
+    def load_runs(self):
+        """刷新任务列表"""
+        self.run_combo.blockSignals(True)
+        self.run_combo.clear()
+        self.run_combo.addItem("全部任务", None)
+        for run in self.store.list_runs():
+            text = (f"#{run['id']} {run['name']} | {os.path.basename(run['model_path'])} | "
+                    f"{run['image_count']} 张 | {run['started_at']}")
+            if run['status'] != RUN_FINISHED:
+                text += f" [{run['status']}]"
+            self.run_combo.addItem(text, run['id'])
+        self.run_combo.blockSignals(False)
+        self.on_run_changed()
+
+    def on_run_changed(self, *args):
+        self.class_combo.clear()
+        self.class_combo.addItem("任意类别", None)
+        for name in self.store.class_names(self.run_combo.currentData()):
+            self.class_combo.addItem(name, name)
+
+    def search(self):
+        """按当前条件重新查询"""
+        class_name = self.class_combo.currentData()
+        self._query = {
+            'run_id': self.run_combo.currentData(),
+            'class_names': [class_name] if class_name else None,
+            'min_conf': self.conf_spin.value(),
+            'no_detections': self.empty_check.isChecked(),
+            'path_contains': self.path_edit.text().strip() or None,
+        }
+        self._offset = 0
+        self.table.setRowCount(0)
+        self.load_more()
+
+    def load_more(self):
+        if not self._query:
+            return
+        rows = self.store.query_images(limit=PAGE_SIZE, offset=self._offset, **self._query)
+        self._offset += len(rows)
+        start = self.table.rowCount()
+        self.table.setRowCount(start + len(rows))
+        for i, row in enumerate(rows, start):
+            inference_ms = row['inference_ms']
+            values = [os.path.basename(row['path']), str(row['detection_count']), f"{row['max_conf']:.3f}",
+                      "" if inference_ms is None else f"{inference_ms:.1f}", row['path']]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column in (1, 2, 3):
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(i, column, item)
+        self.more_btn.setEnabled(len(rows) == PAGE_SIZE)
+        suffix = "（还有更多）" if len(rows) == PAGE_SIZE else ""
+        self.count_label.setText(f"已显示 {self.table.rowCount()} 张{suffix}")
+
+    def on_show_images(self):
+        paths = [self.table.item(i, 4).text() for i in range(self.table.rowCount())]
+        if not paths:
+            QMessageBox.information(self, "提示", "没有可显示的图像，请先查询")
+            return
+        self.show_images.emit(paths)
+
+    def delete_run(self):
+        run_id = self.run_combo.currentData()
+        if run_id is None:
+            QMessageBox.information(self, "提示", "请先选择要删除的任务")
+            return
+        reply = QMessageBox.question(self, "确认删除", f"确定要删除任务 #{run_id} 的全部预测结果吗？",
+                                     QMessageBox.Yes | QMessageBox.No)
+        if reply == QMessageBox.Yes:
+            self.store.delete_run(run_id)
+            self.table.setRowCount(0)
+            self._query = {}
+            self.load_runs()
@@ -0,0 +1,44 @@
+"""
+缩略图加载 - 在图像缓存的后台线程中生成缩略图，以信号通知界面线程（图像列表、图库等共用）
+"""
+from typing import Iterable
+
+import numpy as np
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtGui import QImage
+
+from business.image_cache import get_image_cache
+
+
+def bgr_to_qimage(img: np.ndarray) -> QImage:
+    """BGR/灰度数组转为独立持有数据的 QImage（可在非界面线程调用）"""
+    if img.ndim == 2:
+        gray = np.ascontiguousarray(img)
+        h, w = gray.shape
+        return QImage(gray.data, w, h, w, QImage.Format_Grayscale8).copy()
+    rgb = np.ascontiguousarray(img[..., 2::-1])
+    h, w = rgb.shape[:2]
+    return QImage(rgb.data, w, h, 3 * w, QImage.Format_RGB888).copy()
+
+
+class ThumbnailLoader(QObject):
+    """缩略图加载器：request() 立即返回，生成完成后发出 thumbnail_ready(路径, 缩略图)；cancel() 丢弃之前的请求"""
+
+    thumbnail_ready = pyqtSignal(str, QImage)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.cache = get_image_cache()
+        self._generation = 0
+
+    def request(self, paths: Iterable[str]):
+        generation = self._generation
+        self.cache.request_thumbnails(paths, self._on_thumbnail, lambda: generation != self._generation)
+
+    def cancel(self):
+        """尚未生成的缩略图不再生成（已在生成中的一张仍会发出信号）"""
+        self._generation += 1
+
+    def _on_thumbnail(self, path, thumb):
+        if thumb is not None:
+            self.thumbnail_ready.emit(path, bgr_to_qimage(thumb))
@@ -22,64 +22,83 @@ from PyQt5.QtWidgets import (
     QSizePolicy,
     QScrollArea,
     QFrame,
+    QCheckBox,
 )
 
+from business import metrics
+from business.model_backends.base import STATUS_FAILED, STATUS_STOPPED, STATUS_SUCCESS
+from business.profiler import name_thread
+from business.train_manager import TrainManager
+
+EPOCHS_DONE = metrics.counter('sldmv_train_epochs_total', '已完成的训练轮数')
+TRAIN_ERRORS = metrics.counter('sldmv_train_errors_total', '训练任务失败次数')
+TRAIN_RUNNING = metrics.gauge('sldmv_train_running', '正在运行的训练任务数')
+TRAIN_LOSS = metrics.gauge('sldmv_train_loss', '最近一轮的训练损失')
+
+
+# 训练阶段耗时较长，使用更大的分桶
+TRAIN_STAGE_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 600, 1800, 3600)
+
+# 可选的训练后端：(显示文字, 后端名)
+TRAIN_BACKENDS = [
+    ("YOLO 目标检测", 'yolo'),
+    ("PatchCore 异常检测（只用良品训练）", 'anomalib'),
+]
+# PatchCore 骨干网络（节拍紧张时选 resnet18）
+ANOMALY_BACKBONES = ['wide_resnet50_2', 'resnet18']
+
 
 class TrainThread(QThread):
-    """训练线程"""
+    """训练线程（经 TrainManager 调用模型后端，后端事件转换为界面信号）"""
 
     log_signal = pyqtSignal(str)
     progress_signal = pyqtSignal(int, int, float)  # current_epoch, total_epochs, loss
+    stage_signal = pyqtSignal(str, int, int)  # 非逐轮的阶段进度：stage, current, total
     finished_signal = pyqtSignal(bool, str)
 
     def __init__(self, config):
         super().__init__()
         self.config = config
-        self.is_running = True
+        self.manager = TrainManager()
+        # 结束状态：success / failed / stopped
+        self.status = None
+        # 结束状态事件（含后端返回的模型目录等）
+        self.event = None
 
     def run(self):
+        name_thread("TrainThread")
+        TRAIN_RUNNING.inc()
         try:
-            from ultralytics import YOLO
-
-            # 加载模型
-            self.log_signal.emit(f"正在加载模型: {self.config['model']}...")
-            model = YOLO(self.config['model'])
-
-            # 训练参数日志
-            self.log_signal.emit("开始训练...")
-            self.log_signal.emit(f"数据: {self.config['data']}")
-            self.log_signal.emit(f"训练轮数: {self.config['epochs']}")
-            self.log_signal.emit(f"批次大小: {self.config['batch']}")
-            self.log_signal.emit(f"图像尺寸: {self.config['imgsz']}")
-            self.log_signal.emit("-" * 50)
-
-            # 开始训练
-            results = model.train(
-                data=self.config['data'],
-                epochs=self.config['epochs'],
-                imgsz=self.config['imgsz'],
-                batch=self.config['batch'],
-                device=self.config['device'],
-                workers=self.config['workers'],
-                project=self.config['project'],
-                name=self.config['name'],
-                exist_ok=True,
-                patience=50,
-                save=True,
-                plots=True,
-                verbose=True,
-            )
-
-            if self.is_running:
-                save_dir = os.path.join(self.config['project'], self.config['name'])
-                self.finished_signal.emit(True, f"训练完成！模型已保存到: {save_dir}")
-
-        except Exception as e:
-            self.finished_signal.emit(False, f"训练出错: {str(e)}")
+            event = self.event = self.manager.train(self.config, self.on_event)
+            self.status = event['status']
+            if self.status == STATUS_FAILED:
+                TRAIN_ERRORS.inc()
+                detail = (event.get('error') or {}).get('detail')
+                if detail:
+                    print(detail)
+            self.finished_signal.emit(self.status == STATUS_SUCCESS, event['message'])
+        finally:
+            TRAIN_RUNNING.dec()
+
+    def on_event(self, event):
+        """后端事件：日志、阶段耗时与每轮进度"""
+        kind = event['type']
+        if kind == 'log':
+            self.log_signal.emit(event['message'])
+        elif kind == 'progress':
+            if 'seconds' in event:
+                metrics.stage_timer('train', event['stage'], TRAIN_STAGE_BUCKETS).observe(event['seconds'])
+            if event['stage'] == 'epoch':
+                EPOCHS_DONE.inc()
+                loss = event.get('loss', 0.0)
+                TRAIN_LOSS.set(loss)
+                self.progress_signal.emit(event['current'], event['total'], loss)
+            else:
+                self.stage_signal.emit(event['stage'], event['current'], event['total'])
 
     def stop(self):
-        """停止训练"""
-        self.is_running = False
+        """停止训练（当前轮结束后停止）"""
+        self.manager.stop()
 
 
 class TrainWidget(QWidget):
@@ -104,13 +123,21 @@ class TrainWidget(QWidget):
         config_layout.setRowWrapPolicy(QFormLayout.DontWrapRows)
         config_layout.setFieldGrowthPolicy(QFormLayout.AllNonFixedFieldsGrow)
         config_layout.setFormAlignment(Qt.AlignLeft | Qt.AlignTop)
+        self.config_layout = config_layout
+
+        # 训练后端
+        self.backend_combo = QComboBox()
+        self.backend_combo.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        for title, name in TRAIN_BACKENDS:
+            self.backend_combo.addItem(title, name)
+        self.backend_combo.currentIndexChanged.connect(self.on_backend_changed)
+        config_layout.addRow("模型类型: ", self.backend_combo)
 
         # 数据集配置文件
         data_layout = QHBoxLayout()
         self.data_edit = QLineEdit()
         self.data_edit.setMinimumWidth(360)
         self.data_edit.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
-        self.data_edit.setPlaceholderText("选择数据集配置文件 (data.yaml)")
         data_layout.addWidget(self.data_edit)
 
         self.data_btn = QPushButton("浏览")
@@ -133,6 +160,19 @@ class TrainWidget(QWidget):
         self.model_combo.setCurrentIndex(0)
         config_layout.addRow("预训练模型: ", self.model_combo)
 
+        # PatchCore：数据目录结构与骨干网络
+        from business.model_backends.anomalib_backend import DATA_ADAPTER, DATA_STANDARD
+
+        self.data_mode_combo = QComboBox()
+        self.data_mode_combo.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        self.data_mode_combo.addItem("标准目录（train/good、test/<缺陷类别>）", DATA_STANDARD)
+        self.data_mode_combo.addItem("现有标注目录（无标注形状的图像为良品）", DATA_ADAPTER)
+        config_layout.addRow("数据结构: ", self.data_mode_combo)
+        self.backbone_combo = QComboBox()
+        self.backbone_combo.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        self.backbone_combo.addItems(ANOMALY_BACKBONES)
+        config_layout.addRow("骨干网络: ", self.backbone_combo)
+
         # 训练轮数
         self.epochs_spin = QSpinBox()
         self.epochs_spin.setMaximumWidth(140)
@@ -156,6 +196,13 @@ class TrainWidget(QWidget):
         self.imgsz_combo.setCurrentIndex(3)  # 默认640
         config_layout.addRow("图像尺寸: ", self.imgsz_combo)
 
+        # 预缩放图像缓存
+        self.resize_cache_check = QCheckBox("训练前按图像尺寸预缩放图像（按尺寸缓存，可复用）")
+        self.resize_cache_check.setToolTip(
+            "原图远大于训练尺寸时，预先缩放可避免每个 epoch 解码全分辨率图像，CPU 训练提速明显"
+        )
+        config_layout.addRow("图像缓存: ", self.resize_cache_check)
+
         # 设备选择
         self.device_combo = QComboBox()
         self.device_combo.setMinimumWidth(180)
@@ -194,6 +241,7 @@ class TrainWidget(QWidget):
         config_layout.addRow("任务名称: ", self.name_edit)
 
         config_group.setLayout(config_layout)
+        self.on_backend_changed()
 
         # 滚动容器，避免缩放导致布局过分折叠
         config_scroll = QScrollArea()
@@ -345,13 +393,49 @@ class TrainWidget(QWidget):
         log_group.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
         layout.addWidget(log_group)
 
+    def is_anomaly(self):
+        """当前选择的是 PatchCore 异常检测"""
+        return self.backend_combo.currentData() == 'anomalib'
+
+    def _set_row_visible(self, field, visible):
+        label = self.config_layout.labelForField(field)
+        if label is not None:
+            label.setVisible(visible)
+        field.setVisible(visible)
+
+    def on_backend_changed(self, *args):
+        """切换训练后端：只显示该后端使用的参数"""
+        anomaly = self.is_anomaly()
+        for field in (self.model_combo, self.epochs_spin, self.imgsz_combo, self.resize_cache_check,
+                      self.device_combo, self.workers_spin):
+            self._set_row_visible(field, not anomaly)
+        for field in (self.data_mode_combo, self.backbone_combo):
+            self._set_row_visible(field, anomaly)
+        self.data_edit.clear()
+        if anomaly:
+            self.data_edit.setPlaceholderText("选择训练数据目录")
+            self.batch_spin.setValue(8)
+        else:
+            from business.shard_dataset import SHARD_INDEX_FILENAME
+
+            self.data_edit.setPlaceholderText(f"选择数据集配置文件 (data.yaml) 或分片索引 ({SHARD_INDEX_FILENAME})")
+            self.batch_spin.setValue(16)
+
     def select_data_file(self):
-        """选择数据集配置文件"""
+        """选择数据集配置文件（PatchCore 选择数据目录）"""
+        if self.is_anomaly():
+            directory = QFileDialog.getExistingDirectory(self, "选择训练数据目录", os.path.expanduser("~"),
+                                                         QFileDialog.ShowDirsOnly)
+            if directory:
+                self.data_edit.setText(directory)
+            return
+        from business.shard_dataset import SHARD_INDEX_FILENAME
+
         file_path, _ = QFileDialog.getOpenFileName(
             self,
             "选择数据集配置文件",
             os.path.expanduser("~"),
-            "YAML Files (*.yaml *.yml)",
+            f"数据集 (*.yaml *.yml {SHARD_INDEX_FILENAME});;YAML Files (*.yaml *.yml);;分片索引 ({SHARD_INDEX_FILENAME})",
         )
         if file_path:
             self.data_edit.setText(file_path)
@@ -378,11 +462,15 @@ class TrainWidget(QWidget):
             return
 
         # 确认开始
+        if self.is_anomaly():
+            summary = f'骨干网络: {self.backbone_combo.currentText()}\n'
+        else:
+            summary = f'训练轮数: {self.epochs_spin.value()}\n'
         reply = QMessageBox.question(
             self,
             '确认训练',
             f'确定要开始训练吗？\n'
-            f'训练轮数: {self.epochs_spin.value()}\n'
+            f'{summary}'
             f'批次大小: {self.batch_spin.value()}\n'
             f'这可能需要较长时间。',
             QMessageBox.Yes | QMessageBox.No,
@@ -390,6 +478,16 @@ class TrainWidget(QWidget):
         )
         if reply == QMessageBox.No:
             return
+        if self.is_anomaly():
+            self._start_thread({
+                'backend': 'anomalib',
+                'data_dir': self.data_edit.text(),
+                'data_mode': self.data_mode_combo.currentData(),
+                'backbone': self.backbone_combo.currentText(),
+                'batch_size': self.batch_spin.value(),
+                'output_dir': os.path.join(self.save_edit.text(), self.name_edit.text()),
+            })
+            return
 
         # 准备配置
         model_text = self.model_combo.currentText()
@@ -413,8 +511,12 @@ class TrainWidget(QWidget):
             'workers': self.workers_spin.value(),
             'project': self.save_edit.text(),
             'name': self.name_edit.text(),
+            'resize_cache': self.resize_cache_check.isChecked(),
         }
+        self._start_thread(config)
 
+    def _start_thread(self, config):
+        """创建并启动训练线程"""
         # 清空日志并重置进度
         self.log_text.clear()
         self.progress_bar.setValue(0)
@@ -427,6 +529,7 @@ class TrainWidget(QWidget):
         self.train_thread = TrainThread(config)
         self.train_thread.log_signal.connect(self.append_log)
         self.train_thread.progress_signal.connect(self.update_progress)
+        self.train_thread.stage_signal.connect(self.update_stage)
         self.train_thread.finished_signal.connect(self.on_training_finished)
         self.train_thread.start()
 
@@ -441,10 +544,8 @@ class TrainWidget(QWidget):
                 QMessageBox.No,
             )
             if reply == QMessageBox.Yes:
-                self.append_log("正在停止训练...")
+                self.append_log("正在停止训练（当前轮结束后停止）...")
                 self.train_thread.stop()
-                self.train_thread.wait()
-                self.start_btn.setEnabled(True)
                 self.stop_btn.setEnabled(False)
 
     def append_log(self, text):
@@ -463,11 +564,23 @@ class TrainWidget(QWidget):
                 f"训练进度: {current}/{total} 轮, 损失: {loss:.4f}"
             )
 
+    def update_stage(self, stage, current, total):
+        """更新非逐轮的阶段进度（PatchCore 的特征提取、核心集采样与阈值计算）"""
+        if total > 0 and self.train_thread is not None and self.train_thread.config.get('backend') == 'anomalib':
+            self.progress_bar.setValue(int((current / total) * 100))
+            self.progress_label.setText(f"{stage}: {current}/{total}")
+
     def on_training_finished(self, success, message):
         """训练完成"""
         self.start_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
+        if self.train_thread is not None and self.train_thread.status == STATUS_STOPPED:
+            self.append_log("训练已停止，已完成轮次的权重已保存")
+            return
         if success:
+            model_dir = (self.train_thread.event or {}).get('model_dir') if self.train_thread is not None else None
+            if model_dir:
+                message += f"\n模型目录: {model_dir}（预测时选择异常检测并打开该目录）"
             self.progress_bar.setValue(100)
             self.append_log("=" * 50)
             self.append_log(message)